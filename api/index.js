@@ -57,14 +57,17 @@ const kvClient = new kvProto.KeyValue(
 // KV store: support PUT (idempotent) and keep POST as alias for compatibility
 function handlePutKey(req, res) {
   const { key } = req.params;
-  const { value } = req.body;
+  const { value, consistency = "ONE" } = req.body;
 
   if (typeof value !== "string") {
     return res.status(400).json({ error: "value must be string" });
   }
+  if (!["ONE", "QUORUM", "ALL"].includes(consistency)) {
+    return res.status(400).json({ error: "consistency must be ONE, QUORUM or ALL" });
+  }
 
   kvClient.Put(
-    { key, value, modified_at: Date.now() },
+    { key, value, modified_at: Date.now(), consistency },
     (err) => {
       if (err) return res.status(500).json({ error: err.message });
       res.json({ status: "ok" });
@@ -78,13 +81,49 @@ app.post("/api/kv/:key", handlePutKey); // keep POST working for older callers
 // GET
 app.get("/api/kv/:key", (req, res) => {
   const { key } = req.params;
+  const { consistency = "ONE" } = req.query;
+
+  if (!["ONE", "QUORUM", "ALL"].includes(consistency)) {
+    return res.status(400).json({ error: "consistency must be ONE, QUORUM or ALL" });
+  }
 
-  kvClient.Get({ key }, (err, response) => {
+  kvClient.Get({ key, consistency }, (err, response) => {
     if (err) return res.status(500).json({ error: err.message });
     res.json(response);
   });
 });
 
+// Batches: one gRPC round trip instead of one per key
+app.post("/api/kv-batch/get", (req, res) => {
+  const { keys } = req.body;
+
+  if (!Array.isArray(keys) || !keys.every((key) => typeof key === "string")) {
+    return res.status(400).json({ error: "keys must be an array of strings" });
+  }
+
+  kvClient.MultiGet({ keys }, (err, response) => {
+    if (err) return res.status(500).json({ error: err.message });
+    res.json({ items: response.items.map((item, i) => ({ key: keys[i], ...item })) });
+  });
+});
+
+app.post("/api/kv-batch/put", (req, res) => {
+  const { items } = req.body;
+
+  if (!Array.isArray(items) || !items.every((item) => item && typeof item.key === "string" && typeof item.value === "string")) {
+    return res.status(400).json({ error: "items must be an array of { key, value } strings" });
+  }
+
+  const modified_at = Date.now();
+  kvClient.BatchPut(
+    { items: items.map(({ key, value }) => ({ key, value, modified_at })) },
+    (err, response) => {
+      if (err) return res.status(500).json({ error: err.message });
+      res.json({ status: "ok", stored: response.stored });
+    }
+  );
+});
+
 /* ------------------ CLUSTER ROUTES ------------------ */
 // Nodes (from gossip)
 app.get("/api/cluster/nodes", async (_, res) => {
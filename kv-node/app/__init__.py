@@ -1,18 +1,75 @@
 from .interfaces import StorageBackend, PeerClient
 from .storage import SQLiteStorage, Storage
 from .memory_storage import InMemoryStorage
+from .lsm_storage import LSMStorage
+from .bitcask_storage import BitcaskStorage
+from .cached_storage import CachedStorage
 from .gossip import start_gossip_loop, membership
 from .grpc_server import serve_grpc
-from .grpc_client import GrpcPeerClient, put_to_peer, get_from_peer, replicate_to_peer
+from .aio_server import serve_grpc_aio
+from .grpc_client import GrpcPeerClient, put_to_peer, get_from_peer, get_from_replicas, delete_from_peer, replicate_to_peer, fetch_snapshot, multi_get_from_peer, batch_put_to_peer, put_stream_to_peer
 from .anti_entropy import AntiEntropyService, start_anti_entropy
+from .tombstone_gc import TombstoneGC
+from .expiry import ExpirySweeper
+from .snapshot import bootstrap as bootstrap_from_snapshot
+from .hints import HintStore, HintedHandoff
+from .replication import ReplicationPipeline, PeerSender
+from .channels import ChannelPool, channel_pool
 from .metrics import (
     node_up,
     grpc_requests,
     grpc_latency,
     grpc_errors,
+    grpc_batch_keys,
+    grpc_inflight,
+    grpc_channels_open,
+    grpc_channels_created,
+    grpc_channels_evicted,
+    grpc_channel_ready,
+    grpc_channel_failures,
     replication_attempts,
     replication_failures,
+    replication_queue_depth,
+    replication_lag_seconds,
+    replication_batch_size,
+    replication_coalesced,
+    replication_queue_full,
+    put_latency,
+    put_unavailable,
+    get_latency,
+    get_unavailable,
+    read_repairs,
+    read_hedges,
+    read_hedge_wins,
+    read_hedges_throttled,
+    read_hedge_delay,
+    storage_commits,
+    storage_keys_written,
+    group_commit_batch_size,
+    group_commit_wait,
+    storage_pages_reclaimed,
+    tombstones_purged,
+    tombstone_gc_seconds,
+    keys_expired,
+    hints_stored,
+    hints_dropped,
+    hints_replayed,
+    hints_pending,
+    compression_input_bytes,
+    compression_output_bytes,
+    compression_seconds,
+    cache_hits,
+    cache_misses,
+    cache_evictions,
+    cache_entries,
     anti_entropy_runs,
     anti_entropy_repairs,
+    anti_entropy_leaves_fetched,
+    snapshot_bytes_sent,
+    snapshot_bytes_received,
+    snapshot_keys_restored,
+    snapshot_restore_seconds,
     gossip_messages,
+    ring_nodes,
+    ring_rebuilds,
 )
@@ -0,0 +1,248 @@
+import asyncio
+from concurrent import futures
+
+import grpc
+import kv_pb2
+import kv_pb2_grpc
+
+from grpc_server import KeyValueServicer, PutStreamBatch
+from channels import AsyncChannelPool, server_options
+from value_codec import CODEC_NONE, COMPRESS_THRESHOLD
+
+from metrics import (
+    grpc_requests, grpc_latency, grpc_errors, grpc_inflight,
+    http_requests_total, put_latency, get_latency,
+)
+
+STORAGE_WORKERS = 32          # threads running storage work for the aio server
+MAX_CONCURRENT_RPCS = 4096    # in-flight RPCs; more are refused with RESOURCE_EXHAUSTED
+STREAM_CHUNK = 256            # items a streaming RPC reads per hop to the storage executor
+
+
+class _Aborted(Exception):
+    def __init__(self, code, details):
+        super().__init__(details)
+        self.code = code
+        self.details = details
+
+
+class _ExecutorContext:
+    """
+    The context KeyValueServicer handlers see on an executor thread. The
+    aio context's abort is a coroutine, so this one raises and the event
+    loop side makes the real call.
+    """
+
+    def abort(self, code, details):
+        raise _Aborted(code, details)
+
+
+def _take(items, n):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == n:
+            break
+    return chunk
+
+
+def _unary(name):
+    async def handler(self, request, context):
+        return await self.call(getattr(self.servicer, name), request, context)
+    handler.__name__ = name
+    return handler
+
+
+def _server_streaming(name):
+    async def handler(self, request, context):
+        async for item in self.stream(getattr(self.servicer, name), request, context):
+            yield item
+    handler.__name__ = name
+    return handler
+
+
+class AsyncKeyValueServicer(kv_pb2_grpc.KeyValueServicer):
+    """
+    grpc.aio front end for a KeyValueServicer. Storage work runs on a
+    bounded executor while the event loop holds the waiting RPCs, so
+    in-flight requests cost a coroutine each instead of a thread.
+    Streaming RPCs read `stream_chunk` items per executor hop.
+
+    Puts and Gets above ONE do only their local storage work on the
+    executor; the calls to the other replicas are grpc.aio calls awaited
+    on the event loop, so a slow replica holds no storage thread.
+    """
+
+    def __init__(self, servicer, executor, stream_chunk=STREAM_CHUNK, peers=None):
+        self.servicer = servicer
+        self.executor = executor
+        self.stream_chunk = stream_chunk
+        self._peers = peers
+
+    def peers(self):
+        # created on first use unless given, so only servers that fan out
+        # add a pool to the eviction pass
+        if self._peers is None:
+            self._peers = AsyncChannelPool()
+        return self._peers
+
+    async def call(self, handler, request, context):
+        grpc_inflight.inc()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, handler, request, _ExecutorContext())
+        except _Aborted as e:
+            await context.abort(e.code, e.details)
+        finally:
+            grpc_inflight.dec()
+
+    async def stream(self, handler, request, context):
+        grpc_inflight.inc()
+        loop = asyncio.get_running_loop()
+        items = handler(request, _ExecutorContext())
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, _take, items, self.stream_chunk)
+                for item in chunk:
+                    yield item
+                if len(chunk) < self.stream_chunk:
+                    return
+        except _Aborted as e:
+            await context.abort(e.code, e.details)
+        finally:
+            grpc_inflight.dec()
+            try:
+                # runs the handler's cleanup (peer streams, snapshot files)
+                await loop.run_in_executor(self.executor, items.close)
+            except ValueError:
+                # cancelled mid-chunk: still running, closed once collected
+                pass
+
+    async def quorum(self, name, method, latency, request, context, work):
+        """
+        Run `await work(loop)` for a Put or Get that waits on peers, with the
+        bookkeeping the servicer's own handler does.
+        """
+        grpc_requests.labels(name).inc()
+        http_requests_total.labels(method=method, path="/kv").inc()
+        level = kv_pb2.Consistency.Name(request.consistency)
+        grpc_inflight.inc()
+        try:
+            with grpc_latency.labels(name).time(), latency.labels(level).time():
+                try:
+                    return await work(asyncio.get_running_loop())
+                except Exception:
+                    grpc_errors.labels(name).inc()
+                    raise
+        except _Aborted as e:
+            await context.abort(e.code, e.details)
+        finally:
+            grpc_inflight.dec()
+
+    async def Put(self, request, context):
+        if request.consistency == kv_pb2.ONE:
+            return await self.call(self.servicer.Put, request, context)
+
+        async def work(loop):
+            write = await loop.run_in_executor(self.executor, self.servicer.put_local, request, _ExecutorContext())
+            acks = write.local + await self.servicer.replicator.replicate_acked_aio(
+                self.peers(), write.peers, write.key, write.payload, write.modified_at, write.codec, write.expires_at,
+                needed=max(write.needed - write.local, 0)
+            )
+            return self.servicer.put_acked(_ExecutorContext(), write, acks)
+
+        return await self.quorum("Put", "PUT", put_latency, request, context, work)
+
+    async def Get(self, request, context):
+        if request.consistency == kv_pb2.ONE and self.servicer.is_replica(request.key):
+            return await self.call(self.servicer.Get, request, context)
+
+        async def work(loop):
+            needed, peers, answers = await loop.run_in_executor(
+                self.executor, self.servicer.read_local, request.key, request.consistency
+            )
+            if len(answers) < needed:
+                answers += await self.servicer.reader.read_aio(
+                    self.peers(), peers, request.key, needed=needed - len(answers)
+                )
+            # read repair writes locally
+            return await loop.run_in_executor(
+                self.executor, self.servicer.read_result, _ExecutorContext(), request, needed, answers
+            )
+
+        return await self.quorum("Get", "GET", get_latency, request, context, work)
+
+    Delete = _unary("Delete")
+    MultiGet = _unary("MultiGet")
+    BatchPut = _unary("BatchPut")
+    Replicate = _unary("Replicate")
+    ReplicateBatch = _unary("ReplicateBatch")
+    GetChunkHash = _unary("GetChunkHash")
+    GetMerkleNodes = _unary("GetMerkleNodes")
+    FetchRange = _server_streaming("FetchRange")
+    FetchLeaves = _server_streaming("FetchLeaves")
+    Scan = _server_streaming("Scan")
+    Snapshot = _server_streaming("Snapshot")
+
+    async def PutStream(self, request_iterator, context):
+        grpc_requests.labels("PutStream").inc()
+        grpc_inflight.inc()
+        loop = asyncio.get_running_loop()
+        try:
+            with grpc_latency.labels("PutStream").time():
+                pending = PutStreamBatch()
+                async for record in request_iterator:
+                    try:
+                        ready = pending.add(record)
+                    except ValueError as e:
+                        raise _Aborted(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+                    if ready:
+                        yield await loop.run_in_executor(
+                            self.executor, self.servicer.commit_stream_batch, _ExecutorContext(), pending
+                        )
+                if pending.items:
+                    yield await loop.run_in_executor(
+                        self.executor, self.servicer.commit_stream_batch, _ExecutorContext(), pending
+                    )
+        except _Aborted as e:
+            await context.abort(e.code, e.details)
+        except Exception:
+            grpc_errors.labels("PutStream").inc()
+            raise
+        finally:
+            grpc_inflight.dec()
+
+
+def create_aio_server(
+    servicer,
+    port,
+    storage_workers=STORAGE_WORKERS,
+    max_concurrent_rpcs=MAX_CONCURRENT_RPCS,
+    options=None,
+    peers=None
+):
+    """
+    An unstarted grpc.aio server for `servicer` (a KeyValueServicer), and
+    the port it bound (port 0 picks a free one). `peers` is the
+    AsyncChannelPool its QUORUM and ALL requests call the replicas on.
+    """
+    executor = futures.ThreadPoolExecutor(max_workers=storage_workers, thread_name_prefix="kv-storage")
+    server = grpc.aio.server(
+        options=server_options() if options is None else options,
+        maximum_concurrent_rpcs=max_concurrent_rpcs
+    )
+    kv_pb2_grpc.add_KeyValueServicer_to_server(AsyncKeyValueServicer(servicer, executor, peers=peers), server)
+    bound = server.add_insecure_port(f"[::]:{port}")
+    return server, bound
+
+
+async def serve_grpc_aio(port, storage, own_addr, replication_factor=2, replicate_codec=CODEC_NONE, compress_threshold=COMPRESS_THRESHOLD, snapshot_dir=None, hints=None, replicator=None, options=None, storage_workers=STORAGE_WORKERS, max_concurrent_rpcs=MAX_CONCURRENT_RPCS, reader=None, is_alive=None):
+    servicer = KeyValueServicer(storage, own_addr, replication_factor, replicate_codec, compress_threshold, snapshot_dir, hints, replicator, reader, is_alive)
+    peers = AsyncChannelPool()
+    server, _ = create_aio_server(servicer, port, storage_workers, max_concurrent_rpcs, options, peers)
+    await server.start()
+    print(f"[grpc] aio server started on port {port}")
+    try:
+        await server.wait_for_termination()
+    finally:
+        await peers.close()
@@ -1,21 +1,28 @@
 import logging
 import os
-import hashlib
 import time
 import threading
 import json
 import sys
 
 try:
-    from metrics import anti_entropy_runs, anti_entropy_repairs
+    from metrics import anti_entropy_runs, anti_entropy_repairs, anti_entropy_leaves_fetched
+    from chunking import CHUNK_COUNT
+    from merkle import differing_leaves
+    from value_codec import CODEC_NONE, decode_value
+    from interfaces import lww_version
 except ImportError:
-    from app.metrics import anti_entropy_runs, anti_entropy_repairs
+    from app.metrics import anti_entropy_runs, anti_entropy_repairs, anti_entropy_leaves_fetched
+    from app.chunking import CHUNK_COUNT
+    from app.merkle import differing_leaves
+    from app.value_codec import CODEC_NONE, decode_value
+    from app.interfaces import lww_version
 
 
-CHUNK_COUNT = 16         # number of partitions (should match storage & hashing)
 SYNC_INTERVAL = 30       # seconds between full anti-entropy passes
 CHUNK_TIMEOUT = 5        # timeout for chunk hash RPC
 RANGE_TIMEOUT = 10       # timeout for FetchRange RPC
+REPAIR_BATCH_SIZE = 1000 # repaired keys written per storage transaction
 
 # Logging switch - set DEBUG_LOG=true to enable detailed logging
 DEBUG_LOG = os.environ.get("DEBUG_LOG", "false").lower() == "true"
@@ -68,19 +75,41 @@ def sorted_chunk_items(storage, chunk_id, chunk_count):
         yield item
 
 
+def remote_item(kv):
+    """
+    (key, codec, payload, modified_at, expires_at) from a KeyValuePair or a
+    plain (key, value, modified_at[, expires_at]) tuple. A tombstone has
+    payload None; expires_at is None for a key without a TTL.
+    """
+    if isinstance(kv, (tuple, list)):
+        key, value, modified_at, *expires_at = kv
+        return key, CODEC_NONE, value, modified_at or 0, (expires_at or [None])[0]
+    if getattr(kv, "deleted", False):
+        return kv.key, CODEC_NONE, None, kv.modified_at, None
+    expires_at = getattr(kv, "expires_at", 0) or None
+    codec = getattr(kv, "codec", CODEC_NONE)
+    if codec != CODEC_NONE:
+        return kv.key, codec, kv.compressed_value, kv.modified_at, expires_at
+    return kv.key, CODEC_NONE, kv.value, kv.modified_at, expires_at
+
+
+def is_unimplemented(exc):
+    """
+    True when the peer does not know an RPC (an older node mid rolling upgrade).
+    """
+    if isinstance(exc, NotImplementedError):
+        return True
+    code = getattr(exc, "code", None)
+    return callable(code) and getattr(code(), "name", None) == "UNIMPLEMENTED"
+
+
 def compute_chunk_hash(storage, chunk_id):
     """
-    Compute deterministic hash of all key-value pairs in this chunk.
+    Order-independent digest of all key-value pairs in this chunk.
+    Backends keep it up to date on every put, so this is a lookup rather
+    than a scan; see chunking.py for the combine rule.
     """
-    h = hashlib.sha256()
-    for key, value, modified_at in sorted_chunk_items(storage, chunk_id, CHUNK_COUNT):
-        h.update(key.encode("utf-8"))
-        h.update(b"\x00")
-        h.update(value.encode("utf-8"))
-        h.update(b"\x00")
-        h.update(str(modified_at).encode("utf-8"))
-        h.update(b"\x00")
-    return h.digest()
+    return storage.chunk_digest(chunk_id, CHUNK_COUNT)
 
 
 class AntiEntropyService:
@@ -105,27 +134,21 @@ class AntiEntropyService:
     def repair_chunk_from_peer(self, peer_addr, chunk_id):
         """
         Pull differing keys from peer node and merge into local storage.
-        Used when chunk hashes mismatch.
+        Used when chunk hashes mismatch. Only the merkle leaves that differ
+        are fetched; peers without the merkle RPCs stream the whole chunk.
         """
         try:
             log_ae(f"Fetching chunk {chunk_id} data from {peer_addr}...", Colors.CYAN)
             log_ae_event("repair_start", peer_addr, chunk_id, keys=0)
-            stream = self.peer_client.fetch_range(peer_addr, chunk_id, timeout=RANGE_TIMEOUT)
-            repaired_count = 0
-            for kv in stream:
-                key = getattr(kv, 'key', None) or (kv[0] if isinstance(kv, (tuple, list)) else None)
-                value = getattr(kv, 'value', None) or (kv[1] if isinstance(kv, (tuple, list)) else None)
-                modified_at = getattr(kv, 'modified_at', None) or (kv[2] if isinstance(kv, (tuple, list)) else 0)
-
-                # compare with local
-                local_val, local_ts = self.storage.get(key)
-
-                # last-write-wins policy
-                if (local_ts is None) or (modified_at > local_ts):
-                    log_ae(f"Repairing key={key} from {peer_addr} (remote_ts={modified_at}, local_ts={local_ts})", Colors.YELLOW)
-                    self.storage.put(key, value, modified_at)
-                    repaired_count += 1
-            
+            try:
+                repaired_count = self.repair_leaves_from_peer(peer_addr, chunk_id)
+            except Exception as e:
+                if not is_unimplemented(e):
+                    raise
+                log_ae(f"{peer_addr} has no merkle RPCs, fetching whole chunk {chunk_id}", Colors.YELLOW)
+                stream = self.peer_client.fetch_range(peer_addr, chunk_id, timeout=RANGE_TIMEOUT)
+                repaired_count = self.merge_remote_items(peer_addr, stream)
+
             if repaired_count > 0:
                 log_ae(f"Repaired {repaired_count} keys from chunk {chunk_id} via {peer_addr}", Colors.GREEN)
                 log_ae_event("repair_complete", peer_addr, chunk_id, keys=repaired_count)
@@ -136,6 +159,74 @@ class AntiEntropyService:
             log_ae(f"Repair chunk {chunk_id} from {peer_addr} failed: {e}", Colors.RED)
             raise e
 
+    def repair_leaves_from_peer(self, peer_addr, chunk_id):
+        """
+        Walk the chunk's merkle tree with the peer (one RPC per level) and
+        fetch only the leaves whose hashes differ.
+        """
+        leaf_ids = differing_leaves(
+            self.storage.leaf_digests(chunk_id),
+            lambda level, indices: self.peer_client.get_merkle_nodes(
+                peer_addr, chunk_id, level, indices, timeout=CHUNK_TIMEOUT
+            )
+        )
+        if not leaf_ids:
+            return 0
+
+        log_ae(f"Chunk {chunk_id} differs from {peer_addr} in leaves {leaf_ids}", Colors.CYAN)
+        anti_entropy_leaves_fetched.inc(len(leaf_ids))
+
+        local_versions = {}
+        local_tombstones = set()
+        for key, value, modified_at in self.storage.scan_leaves_with_ts(chunk_id, leaf_ids):
+            local_versions[key] = modified_at
+            if value is None:
+                local_tombstones.add(key)
+        stream = self.peer_client.fetch_leaves(peer_addr, chunk_id, leaf_ids, timeout=RANGE_TIMEOUT)
+        return self.merge_remote_items(peer_addr, stream, local_versions, local_tombstones)
+
+    def merge_remote_items(self, peer_addr, stream, local_versions=None, local_tombstones=()):
+        """
+        Last-write-wins merge of (key, value, modified_at) items from a peer.
+        `local_versions` maps key -> local modified_at when the caller has
+        already read them, with `local_tombstones` the keys deleted locally;
+        otherwise each key is looked up. Newer items (tombstones included,
+        see lww_version) are written through put_encoded_many,
+        REPAIR_BATCH_SIZE keys per transaction; compressed values are
+        stored without recompressing. A value with a TTL goes through
+        put_expiring so the repaired copy expires with the remote one.
+        """
+        repaired_count = 0
+        batch = []
+        for kv in stream:
+            key, codec, payload, modified_at, expires_at = remote_item(kv)
+
+            # compare with local
+            if local_versions is None:
+                local_value, local_ts = self.storage.get(key)
+                local_deleted = local_value is None
+            else:
+                local_ts = local_versions.get(key, 0)
+                local_deleted = key in local_tombstones or key not in local_versions
+
+            # last-write-wins policy
+            if (local_ts is None) or (
+                lww_version(modified_at, payload is None) > lww_version(local_ts, local_deleted)
+            ):
+                log_ae(f"Repairing key={key} from {peer_addr} (remote_ts={modified_at}, local_ts={local_ts})", Colors.YELLOW)
+                if payload is not None and expires_at is not None:
+                    value = decode_value(codec, payload)
+                    repaired_count += self.storage.put_expiring(key, value, modified_at, expires_at)
+                    continue
+                batch.append((key, codec, payload, modified_at))
+                if len(batch) >= REPAIR_BATCH_SIZE:
+                    repaired_count += self.storage.put_encoded_many(batch)
+                    batch = []
+
+        if batch:
+            repaired_count += self.storage.put_encoded_many(batch)
+        return repaired_count
+
     def process_single_peer(self, peer_addr):
         """
         Compare and repair all chunks with a single peer.
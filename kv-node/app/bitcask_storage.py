@@ -0,0 +1,593 @@
+import bisect
+import heapq
+import os
+import struct
+import threading
+import time
+
+try:
+    from interfaces import StorageBackend, lww_version
+    from value_codec import CODEC_NONE, as_buffer
+    from log_records import (
+        record_size,
+        encode_record,
+        iter_fd_records,
+        read_record_at,
+        SharedFile,
+        EXPIRES,
+        FLAG_TOMBSTONE,
+        FLAG_EXPIRES,
+    )
+    from chunking import (
+        CHUNK_COUNT,
+        LEAF_COUNT,
+        chunk_for_key,
+        leaf_for_key,
+        combine_digest,
+        entry_digest,
+        sum_digests,
+        digest_to_bytes,
+        digest_from_bytes,
+        DIGEST_SIZE,
+    )
+except ImportError:
+    from app.interfaces import StorageBackend, lww_version
+    from app.value_codec import CODEC_NONE, as_buffer
+    from app.log_records import (
+        record_size,
+        encode_record,
+        iter_fd_records,
+        read_record_at,
+        SharedFile,
+        EXPIRES,
+        FLAG_TOMBSTONE,
+        FLAG_EXPIRES,
+    )
+    from app.chunking import (
+        CHUNK_COUNT,
+        LEAF_COUNT,
+        chunk_for_key,
+        leaf_for_key,
+        combine_digest,
+        entry_digest,
+        sum_digests,
+        digest_to_bytes,
+        digest_from_bytes,
+        DIGEST_SIZE,
+    )
+
+
+SEGMENT_LIMIT = 64 << 20       # bytes in the active segment before it is rotated
+MERGE_DEAD_RATIO = 0.5         # dead/total bytes in immutable segments that wakes the merger
+SCAN_PAGE_SIZE = 500           # keys resolved per lock hold during a range scan
+
+SEGMENT_PREFIX = "seg-"
+DATA_SUFFIX = ".data"
+HINT_SUFFIX = ".hint"
+MERGED_SUFFIX = ".merged"      # segments a finished merge replaced, removed on restart
+
+# key_len, offset, size, modified_at, flags, entry digest; with
+# FLAG_EXPIRES, expires_at follows. Flags are the record's own, so hint
+# files written before TTLs (flags 0 or FLAG_TOMBSTONE) still read.
+HINT = struct.Struct(f"<IQIqB{DIGEST_SIZE}s")
+
+
+class KeyDirEntry:
+    __slots__ = ("file_id", "offset", "size", "modified_at", "digest", "tombstone", "expires_at")
+
+    def __init__(self, file_id, offset, size, modified_at, digest, tombstone=False, expires_at=None):
+        self.file_id = file_id
+        self.offset = offset
+        self.size = size
+        self.modified_at = modified_at
+        self.digest = digest
+        self.tombstone = tombstone
+        self.expires_at = expires_at
+
+    @property
+    def version(self):
+        return lww_version(self.modified_at, self.tombstone)
+
+    def expired(self, now):
+        return not self.tombstone and self.expires_at is not None and self.expires_at <= now
+
+    def purgeable(self, older_than):
+        # a tombstone left by an expired TTL counts from its expires_at
+        return self.tombstone and self.modified_at < older_than and (
+            self.expires_at is None or self.expires_at < older_than
+        )
+
+    def newer_than(self, other):
+        if self.version != other.version:
+            return self.version > other.version
+        return (self.file_id, self.offset) > (other.file_id, other.offset)
+
+
+class BitcaskStorage(StorageBackend):
+    """
+    Bitcask-style store: values live in append-only segment files and an
+    in-memory key directory maps every key to (file, offset, size,
+    modified_at). A get is one pread; the last-write-wins check on put is a
+    dict lookup. Immutable segments get hint files so restarts do not read
+    values, and merge() rewrites live records to reclaim dead space.
+    """
+
+    def __init__(
+        self,
+        data_dir,
+        segment_limit=SEGMENT_LIMIT,
+        merge_dead_ratio=MERGE_DEAD_RATIO,
+        background_merge=True
+    ):
+        self.data_dir = data_dir
+        self.segment_limit = segment_limit
+        self.merge_dead_ratio = merge_dead_ratio
+        os.makedirs(data_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._keydir = {}
+        self._files = {}
+        self._digests = {}
+        self._dead = {}
+        # min-heap of (expires_at, key, modified_at), rebuilt on startup;
+        # entries that were overwritten since are skipped when they come up
+        self._expiry = []
+
+        file_ids = self._load_segments()
+        # key directory in sorted order, for range scans
+        self._keys = sorted(self._keydir)
+        self._expiry = [
+            (entry.expires_at, key, entry.modified_at)
+            for key, entry in self._keydir.items()
+            if entry.expires_at is not None and not entry.tombstone
+        ]
+        heapq.heapify(self._expiry)
+        self._active_id = (max(file_ids) + 1) if file_ids else 0
+        self._next_id = self._active_id + 1
+        self._active = self._open_segment(self._active_id, "ab")
+
+        self._closed = False
+        self._merge_wanted = threading.Event()
+        self._merger = None
+        if background_merge:
+            self._merger = threading.Thread(target=self._merge_loop, daemon=True)
+            self._merger.start()
+
+    # ---------- files ----------
+
+    def _data_path(self, file_id):
+        return os.path.join(self.data_dir, f"{SEGMENT_PREFIX}{file_id:08d}{DATA_SUFFIX}")
+
+    def _hint_path(self, file_id):
+        return os.path.join(self.data_dir, f"{SEGMENT_PREFIX}{file_id:08d}{HINT_SUFFIX}")
+
+    def _open_segment(self, file_id, mode):
+        # reads go through one shared handle per segment; the active
+        # segment also gets its own appender
+        f = open(self._data_path(file_id), mode) if mode != "rb" else None
+        self._files[file_id] = SharedFile(self._data_path(file_id))
+        return f
+
+    def _merged_path(self, file_id):
+        return os.path.join(self.data_dir, f"{SEGMENT_PREFIX}{file_id:08d}{MERGED_SUFFIX}")
+
+    def _remove_segment(self, file_id):
+        for path in (self._data_path(file_id), self._hint_path(file_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _finish_merges(self):
+        # a crash after a merge committed but before its inputs were all
+        # removed: drop the rest now, before they are loaded
+        for name in os.listdir(self.data_dir):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(MERGED_SUFFIX):
+                path = os.path.join(self.data_dir, name)
+                with open(path) as f:
+                    for line in f.read().split():
+                        self._remove_segment(int(line))
+                os.remove(path)
+
+    def _segment_ids(self):
+        ids = []
+        for name in os.listdir(self.data_dir):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.data_dir, name))
+            elif name.startswith(SEGMENT_PREFIX) and name.endswith(DATA_SUFFIX):
+                ids.append(int(name[len(SEGMENT_PREFIX):-len(DATA_SUFFIX)]))
+        return sorted(ids)
+
+    # ---------- startup ----------
+
+    def _load_segments(self):
+        self._finish_merges()
+        file_ids = self._segment_ids()
+        for file_id in file_ids:
+            self._open_segment(file_id, "rb")
+            if os.path.exists(self._hint_path(file_id)):
+                entries = self._read_hints(file_id)
+            else:
+                entries = self._scan_segment(file_id)
+            for key, entry in entries:
+                self._load_entry(key, entry)
+        return file_ids
+
+    def _scan_segment(self, file_id):
+        fd = self._files[file_id].fileno()
+        end = None
+        for offset, key, value, modified_at, expires_at, _ in iter_fd_records(fd):
+            size = record_size(key, value, expires_at)
+            end = offset + size
+            digest = entry_digest(key, value, modified_at)
+            yield key, KeyDirEntry(file_id, offset, size, modified_at, digest, value is None, expires_at)
+
+        # drop a torn tail so later appends start on a record boundary
+        size = os.fstat(fd).st_size
+        if (end or 0) < size:
+            with open(self._data_path(file_id), "r+b") as f:
+                f.truncate(end or 0)
+
+    def _read_hints(self, file_id):
+        with open(self._hint_path(file_id), "rb") as f:
+            raw = f.read()
+
+        pos = 0
+        while pos + HINT.size <= len(raw):
+            key_len, offset, size, modified_at, flags, digest = HINT.unpack_from(raw, pos)
+            pos += HINT.size
+            expires_at = None
+            if flags & FLAG_EXPIRES:
+                (expires_at,) = EXPIRES.unpack_from(raw, pos)
+                pos += EXPIRES.size
+            key = raw[pos:pos + key_len].decode("utf-8")
+            pos += key_len
+            yield key, KeyDirEntry(
+                file_id, offset, size, modified_at, digest_from_bytes(digest),
+                bool(flags & FLAG_TOMBSTONE), expires_at
+            )
+
+    def _write_hints(self, file_id, entries):
+        tmp_path = self._hint_path(file_id) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for key, entry in entries:
+                key_bytes = key.encode("utf-8")
+                flags = FLAG_TOMBSTONE if entry.tombstone else 0
+                if entry.expires_at is not None:
+                    flags |= FLAG_EXPIRES
+                f.write(HINT.pack(
+                    len(key_bytes), entry.offset, entry.size, entry.modified_at,
+                    flags, digest_to_bytes(entry.digest)
+                ))
+                if entry.expires_at is not None:
+                    f.write(EXPIRES.pack(entry.expires_at))
+                f.write(key_bytes)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._hint_path(file_id))
+
+    def _load_entry(self, key, entry):
+        current = self._keydir.get(key)
+        if current is not None and not entry.newer_than(current):
+            self._mark_dead(entry)
+            return
+        if current is not None:
+            self._mark_dead(current)
+        self._keydir[key] = entry
+        self._apply_digest(key, entry.digest, current.digest if current else 0)
+
+    def _mark_dead(self, entry):
+        self._dead[entry.file_id] = self._dead.get(entry.file_id, 0) + entry.size
+
+    def _apply_digest(self, key, added, removed):
+        leaves = self._digests.get(chunk_for_key(key))
+        if leaves is None:
+            leaves = self._digests[chunk_for_key(key)] = [0] * LEAF_COUNT
+        leaf_id = leaf_for_key(key)
+        leaves[leaf_id] = combine_digest(leaves[leaf_id], added, removed)
+
+    # ---------- writes ----------
+
+    def put(self, key: str, value, modified_at: int) -> bool:
+        return self.put_many([(key, value, modified_at)]) == 1
+
+    def put_many(self, items) -> int:
+        return self._put_records((key, value, modified_at, None) for key, value, modified_at in items)
+
+    def put_expiring(self, key: str, value, modified_at: int, expires_at: int) -> bool:
+        with self._lock:
+            if not self._put_records([(key, value, modified_at, expires_at)]):
+                return False
+            heapq.heappush(self._expiry, (expires_at, key, modified_at))
+            return True
+
+    def expire(self, now: int, limit: int) -> list:
+        with self._lock:
+            expired = []
+            while self._expiry and self._expiry[0][0] <= now and len(expired) < limit:
+                expires_at, key, modified_at = heapq.heappop(self._expiry)
+                current = self._keydir.get(key)
+                if current is None or current.modified_at != modified_at or not current.expired(now):
+                    continue
+                # the tombstone keeps expires_at, so its grace period runs from then
+                if self._put_records([(key, None, modified_at, expires_at)]):
+                    expired.append(key)
+            return expired
+
+    def _put_records(self, items) -> int:
+        with self._lock:
+            offset = self._active.tell()
+            chunks = []
+            accepted = []
+            pending = {}
+            for key, value, modified_at, expires_at in items:
+                current = pending.get(key) or self._keydir.get(key)
+                if current is not None and current.version >= lww_version(modified_at, value is None):
+                    continue
+
+                value = as_buffer(value)
+                record = encode_record(key, value, modified_at, expires_at=expires_at)
+                entry = KeyDirEntry(
+                    self._active_id, offset, len(record), modified_at,
+                    entry_digest(key, value, modified_at), value is None, expires_at
+                )
+                pending[key] = entry
+                accepted.append((key, entry))
+                chunks.append(record)
+                offset += len(record)
+
+            if not accepted:
+                return 0
+
+            self._active.write(b"".join(chunks))
+            self._active.flush()
+
+            for key, entry in accepted:
+                current = self._keydir.get(key)
+                if current is not None:
+                    self._mark_dead(current)
+                else:
+                    bisect.insort(self._keys, key)
+                self._keydir[key] = entry
+                self._apply_digest(key, entry.digest, current.digest if current else 0)
+
+            if offset >= self.segment_limit:
+                self._rotate()
+
+            return len(accepted)
+
+    def purge_tombstones(self, older_than: int) -> int:
+        """
+        Drop expired tombstones by merging: merge() leaves them out of the
+        merged segment, so they leave the disk together with the older
+        records they shadow and a restart cannot bring those back. An
+        expired tombstone in the active segment seals it first.
+        """
+        with self._lock:
+            expired = [entry for entry in self._keydir.values() if entry.purgeable(older_than)]
+            if not expired:
+                return 0
+            if any(entry.file_id == self._active_id for entry in expired):
+                self._rotate()
+        return self.merge(purge_before=older_than)
+
+    def _rotate(self):
+        """
+        Seal the active segment (writing its hint file) and start a new one.
+        """
+        sealed_id = self._active_id
+        self._active.flush()
+        os.fsync(self._active.fileno())
+        self._active.close()
+        self._write_hints(sealed_id, [
+            (key, entry) for key, entry in self._keydir.items() if entry.file_id == sealed_id
+        ])
+
+        self._active_id = self._next_id
+        self._next_id += 1
+        self._active = self._open_segment(self._active_id, "ab")
+
+        if self._needs_merge():
+            self._merge_wanted.set()
+
+    def _needs_merge(self):
+        immutable = [file_id for file_id in self._files if file_id != self._active_id]
+        total = sum(os.path.getsize(self._data_path(file_id)) for file_id in immutable)
+        dead = sum(self._dead.get(file_id, 0) for file_id in immutable)
+        return total > 0 and dead / total >= self.merge_dead_ratio
+
+    # ---------- merge ----------
+
+    def _merge_loop(self):
+        while True:
+            self._merge_wanted.wait()
+            self._merge_wanted.clear()
+            if self._closed:
+                return
+            self.merge()
+
+    def merge(self, purge_before=None) -> int:
+        """
+        Copy the live records of every immutable segment into a fresh
+        segment (plus hint file), repoint the key directory and delete the
+        old files. Keys rewritten by a concurrent put keep their new entry.
+        Tombstones older than `purge_before` are left out; returns how many.
+
+        The old segments are listed in a marker file before the first is
+        removed, so a crash part-way through finishes the removal on
+        restart instead of loading a value whose tombstone is gone.
+        """
+        with self._merge_lock:
+            with self._lock:
+                old_ids = [file_id for file_id in self._files if file_id != self._active_id]
+                if not old_ids:
+                    return 0
+                live = [
+                    (key, entry) for key, entry in self._keydir.items()
+                    if entry.file_id in old_ids
+                ]
+                merged_id = self._next_id
+                self._next_id += 1
+
+            moved = []
+            dropped = []
+            offset = 0
+            with open(self._data_path(merged_id), "wb") as out:
+                for key, entry in live:
+                    if purge_before is not None and entry.purgeable(purge_before):
+                        dropped.append((key, entry))
+                        continue
+                    raw = os.pread(self._files[entry.file_id].fileno(), entry.size, entry.offset)
+                    out.write(raw)
+                    moved.append((key, entry, KeyDirEntry(
+                        merged_id, offset, entry.size, entry.modified_at, entry.digest,
+                        entry.tombstone, entry.expires_at
+                    )))
+                    offset += entry.size
+                out.flush()
+                os.fsync(out.fileno())
+            self._write_hints(merged_id, [(key, new) for key, _, new in moved])
+
+            tmp_path = self._merged_path(merged_id) + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write("\n".join(str(file_id) for file_id in old_ids))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._merged_path(merged_id))
+
+            purged = 0
+            with self._lock:
+                self._open_segment(merged_id, "rb")
+                for key, old, new in moved:
+                    if self._keydir.get(key) is old:
+                        self._keydir[key] = new
+                    else:
+                        self._mark_dead(new)
+                for key, old in dropped:
+                    if self._keydir.get(key) is old:
+                        del self._keydir[key]
+                        del self._keys[bisect.bisect_left(self._keys, key)]
+                        self._apply_digest(key, 0, old.digest)
+                        purged += 1
+                for file_id in old_ids:
+                    # closed once the reads still using it are done
+                    self._files.pop(file_id).retire()
+                    self._dead.pop(file_id, None)
+
+            for file_id in old_ids:
+                self._remove_segment(file_id)
+            os.remove(self._merged_path(merged_id))
+            return purged
+
+    def close(self):
+        self._closed = True
+        self._merge_wanted.set()
+        if self._merger is not None:
+            self._merger.join()
+        with self._lock:
+            self._active.close()
+            for f in self._files.values():
+                f.retire()
+
+    # ---------- reads ----------
+
+    def _read(self, segment, entry):
+        _, value, modified_at, _, _, _ = read_record_at(segment.fileno(), entry.offset, entry.size)
+        return value, modified_at
+
+    def get_with_expiry(self, key: str):
+        with self._lock:
+            entry = self._keydir.get(key)
+            if entry is None:
+                return (None, 0, None)
+            if entry.tombstone or entry.expired(time.time()):
+                # an expired value not swept yet reads as the tombstone it becomes
+                return (None, entry.modified_at, entry.expires_at)
+            segment = self._files[entry.file_id].acquire()
+        try:
+            return (*self._read(segment, entry), entry.expires_at)
+        finally:
+            segment.release()
+
+    def scan_range(
+        self,
+        start: str,
+        end=None
+    ):
+        lower = bisect.bisect_left
+        while True:
+            with self._lock:
+                i = lower(self._keys, start)
+                page = self._keys[i:i + SCAN_PAGE_SIZE]
+                if end is not None:
+                    page = page[:bisect.bisect_left(page, end)]
+                entries = []
+                for key in page:
+                    entry = self._keydir[key]
+                    entries.append((key, entry, self._files[entry.file_id].acquire()))
+
+            now = time.time()
+            try:
+                for key, entry, segment in entries:
+                    if entry.tombstone or entry.expired(now):
+                        yield (key, None, entry.modified_at)
+                    else:
+                        yield (key, *self._read(segment, entry))
+            finally:
+                for _, _, segment in entries:
+                    segment.release()
+
+            if len(page) < SCAN_PAGE_SIZE:
+                return
+            lower = bisect.bisect_right
+            start = page[-1]
+
+    def _chunk_entries(self, chunk_id, chunk_count):
+        # (key, value, modified_at, expires_at) read off the pinned segments
+        with self._lock:
+            entries = [
+                (key, entry, self._files[entry.file_id].acquire())
+                for key, entry in self._keydir.items()
+                if chunk_for_key(key, chunk_count) == chunk_id
+            ]
+
+        try:
+            for key, entry, segment in entries:
+                value, modified_at = self._read(segment, entry)
+                yield (key, value, modified_at, entry.expires_at)
+        finally:
+            for _, _, segment in entries:
+                segment.release()
+
+    def scan_chunk_with_ts(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ):
+        for key, value, modified_at, _ in self._chunk_entries(chunk_id, chunk_count):
+            yield (key, value, modified_at)
+
+    def scan_chunk_encoded(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ):
+        for key, value, modified_at, expires_at in self._chunk_entries(chunk_id, chunk_count):
+            yield (key, CODEC_NONE, value, modified_at, expires_at)
+
+    def chunk_digest(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ) -> bytes:
+        if chunk_count != CHUNK_COUNT:
+            return super().chunk_digest(chunk_id, chunk_count)
+
+        with self._lock:
+            return digest_to_bytes(sum_digests(self._digests.get(chunk_id, ())))
+
+    def leaf_digests(
+        self,
+        chunk_id: int
+    ) -> list:
+        with self._lock:
+            return list(self._digests.get(chunk_id) or [0] * LEAF_COUNT)
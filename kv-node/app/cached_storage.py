@@ -0,0 +1,301 @@
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from interfaces import StorageBackend, SNAPSHOT_RECORDS, lww_version
+    from value_codec import as_bytes
+    from metrics import cache_hits, cache_misses, cache_evictions, cache_entries
+except ImportError:
+    from app.interfaces import StorageBackend, SNAPSHOT_RECORDS, lww_version
+    from app.value_codec import as_bytes
+    from app.metrics import cache_hits, cache_misses, cache_evictions, cache_entries
+
+
+CACHE_MAX_ENTRIES = 100_000
+PROTECTED_RATIO = 0.8          # share of the cache reserved for keys hit more than once
+
+
+def _expired(entry, now):
+    # entry: (value, modified_at, expires_at)
+    value, _, expires_at = entry
+    return value is not None and expires_at is not None and expires_at <= now
+
+
+class CachedStorage(StorageBackend):
+    """
+    Read cache in front of any StorageBackend.
+
+    Eviction is segmented LRU: a key enters a probationary segment on its
+    first read and moves to a protected segment when it is hit again, so a
+    burst of one-off reads cannot flush the hot set. With
+    negative_cache=True, misses are cached too.
+
+    Every write goes through put/put_many here, including Replicate and
+    anti-entropy repair, so the cache never serves a value older than the
+    backend's. A read that races a write on the same key does not fill.
+    Entries keep the key's expires_at, and one whose value has expired is
+    read as a miss.
+    """
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        max_entries=CACHE_MAX_ENTRIES,
+        negative_cache=False
+    ):
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive")
+
+        self.backend = backend
+        self.max_entries = max_entries
+        self.protected_limit = max(1, int(max_entries * PROTECTED_RATIO))
+        self.negative_cache = negative_cache
+
+        self._lock = threading.Lock()
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        # key -> token of the read currently filling it; a write drops the token
+        self._filling = {}
+
+    def __getattr__(self, name):
+        # backend-specific extras (close, flush, merge, ...)
+        if name == "backend":
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    def __len__(self):
+        return len(self._probation) + len(self._protected)
+
+    # ---------- reads ----------
+
+    def get_with_expiry(self, key: str):
+        with self._lock:
+            cached = self._lookup(key, time.time())
+            if cached is not None:
+                cache_hits.inc()
+                return cached
+            token = object()
+            self._filling[key] = token
+
+        cache_misses.inc()
+        try:
+            result = self.backend.get_with_expiry(key)
+        except Exception:
+            with self._lock:
+                if self._filling.get(key) is token:
+                    del self._filling[key]
+            raise
+
+        with self._lock:
+            if self._filling.get(key) is token:
+                del self._filling[key]
+                if result[0] is not None or self.negative_cache:
+                    self._insert(key, result)
+
+        return result
+
+    def get_many_with_expiry(self, keys) -> dict:
+        results = {}
+        tokens = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                if key in results or key in tokens:
+                    continue
+                cached = self._lookup(key, now)
+                if cached is not None:
+                    results[key] = cached
+                else:
+                    tokens[key] = self._filling[key] = object()
+
+        cache_hits.inc(len(results))
+        if not tokens:
+            return results
+
+        cache_misses.inc(len(tokens))
+        try:
+            fetched = self.backend.get_many_with_expiry(list(tokens))
+        except Exception:
+            with self._lock:
+                for key, token in tokens.items():
+                    if self._filling.get(key) is token:
+                        del self._filling[key]
+            raise
+
+        with self._lock:
+            for key, token in tokens.items():
+                result = fetched[key]
+                if self._filling.get(key) is token:
+                    del self._filling[key]
+                    if result[0] is not None or self.negative_cache:
+                        self._insert(key, result)
+                results[key] = result
+
+        return results
+
+    def _lookup(self, key, now):
+        for segment in (self._protected, self._probation):
+            entry = segment.get(key)
+            if entry is not None and _expired(entry, now):
+                del segment[key]
+                cache_entries.set(len(self))
+                return None
+
+        if key in self._protected:
+            self._protected.move_to_end(key)
+            return self._protected[key]
+
+        if key in self._probation:
+            value = self._probation.pop(key)
+            self._protected[key] = value
+            if len(self._protected) > self.protected_limit:
+                demoted, demoted_value = self._protected.popitem(last=False)
+                self._probation[demoted] = demoted_value
+            return value
+
+        return None
+
+    def _insert(self, key, value):
+        self._probation[key] = value
+        while len(self) > self.max_entries:
+            if self._probation:
+                self._probation.popitem(last=False)
+            else:
+                self._protected.popitem(last=False)
+            cache_evictions.inc()
+        cache_entries.set(len(self))
+
+    # ---------- writes ----------
+
+    def put(self, key: str, value, modified_at: int) -> bool:
+        applied = self.backend.put(key, value, modified_at)
+        with self._lock:
+            self._filling.pop(key, None)
+            if applied:
+                # refresh in place, unless a put that raced this one already
+                # cached a newer version; new keys are filled by the next read
+                version = lww_version(modified_at, value is None)
+                for segment in (self._probation, self._protected):
+                    cached = segment.get(key)
+                    if cached is not None and lww_version(cached[1], cached[0] is None) < version:
+                        segment[key] = (as_bytes(value), modified_at, None)
+        return applied
+
+    def put_expiring(self, key: str, value, modified_at: int, expires_at: int) -> bool:
+        try:
+            return self.backend.put_expiring(key, value, modified_at, expires_at)
+        finally:
+            self.invalidate([key])
+
+    def expire(self, now: int, limit: int) -> list:
+        expired = self.backend.expire(now, limit)
+        self.invalidate(expired)
+        return expired
+
+    def put_many(self, items) -> int:
+        items = list(items)
+        try:
+            return self.backend.put_many(items)
+        finally:
+            # put_many does not say which items won LWW, so drop them all
+            self.invalidate(key for key, _, _ in items)
+
+    def put_encoded_many(self, items) -> int:
+        items = list(items)
+        try:
+            return self.backend.put_encoded_many(items)
+        finally:
+            self.invalidate(key for key, _, _, _ in items)
+
+    def purge_tombstones(self, older_than: int) -> int:
+        purged = self.backend.purge_tombstones(older_than)
+        if purged:
+            with self._lock:
+                for segment in (self._probation, self._protected):
+                    expired = [
+                        key for key, (value, modified_at, expires_at) in segment.items()
+                        if value is None and modified_at < older_than
+                        and (expires_at is None or expires_at < older_than)
+                    ]
+                    for key in expired:
+                        del segment[key]
+                cache_entries.set(len(self))
+        return purged
+
+    def restore_from(self, path: str, fmt: str) -> int:
+        try:
+            return self.backend.restore_from(path, fmt)
+        finally:
+            self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._filling.clear()
+            self._probation.clear()
+            self._protected.clear()
+            cache_entries.set(0)
+
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                self._filling.pop(key, None)
+                self._probation.pop(key, None)
+                self._protected.pop(key, None)
+            cache_entries.set(len(self))
+
+    # ---------- pass-through ----------
+
+    def scan_range(
+        self,
+        start: str,
+        end=None
+    ):
+        return self.backend.scan_range(start, end)
+
+    def snapshot_formats(self) -> list:
+        return self.backend.snapshot_formats()
+
+    def snapshot_to(self, path: str, formats=(SNAPSHOT_RECORDS,)) -> str:
+        return self.backend.snapshot_to(path, formats)
+
+    def scan_chunk_with_ts(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ):
+        return self.backend.scan_chunk_with_ts(chunk_id, chunk_count)
+
+    def chunk_digest(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ) -> bytes:
+        return self.backend.chunk_digest(chunk_id, chunk_count)
+
+    def leaf_digests(
+        self,
+        chunk_id: int
+    ) -> list:
+        return self.backend.leaf_digests(chunk_id)
+
+    def scan_leaves_with_ts(
+        self,
+        chunk_id: int,
+        leaf_ids
+    ):
+        return self.backend.scan_leaves_with_ts(chunk_id, leaf_ids)
+
+    def scan_chunk_encoded(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ):
+        return self.backend.scan_chunk_encoded(chunk_id, chunk_count)
+
+    def scan_leaves_encoded(
+        self,
+        chunk_id: int,
+        leaf_ids
+    ):
+        return self.backend.scan_leaves_encoded(chunk_id, leaf_ids)
@@ -0,0 +1,241 @@
+import asyncio
+import threading
+
+import grpc
+
+try:
+    import kv_pb2_grpc
+    from metrics import (
+        grpc_channels_open,
+        grpc_channels_created,
+        grpc_channels_evicted,
+        grpc_channel_ready,
+        grpc_channel_failures,
+    )
+except ImportError:
+    from app import kv_pb2_grpc
+    from app.metrics import (
+        grpc_channels_open,
+        grpc_channels_created,
+        grpc_channels_evicted,
+        grpc_channel_ready,
+        grpc_channel_failures,
+    )
+
+
+KEEPALIVE_MS = 30_000            # idle time before a channel pings its peer
+KEEPALIVE_TIMEOUT_MS = 10_000    # a ping unanswered this long drops the connection
+MAX_MESSAGE_BYTES = 16 << 20     # largest gRPC message sent or received
+EVICT_INTERVAL = 10.0            # seconds between passes over the pooled peers
+EVICT_AFTER = 60.0               # seconds without gossip before a peer's channel is closed
+
+COMPRESSION = {
+    "none": grpc.Compression.NoCompression,
+    "gzip": grpc.Compression.Gzip,
+    "deflate": grpc.Compression.Deflate,
+}
+
+
+def compression_from_name(name):
+    try:
+        return COMPRESSION[name.lower()]
+    except KeyError:
+        raise ValueError(f"unknown gRPC compression {name!r}, expected one of {sorted(COMPRESSION)}")
+
+
+def channel_options(keepalive_ms=KEEPALIVE_MS, max_message_bytes=MAX_MESSAGE_BYTES):
+    return [
+        ("grpc.keepalive_time_ms", keepalive_ms),
+        ("grpc.keepalive_timeout_ms", KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+        ("grpc.max_send_message_length", max_message_bytes),
+        ("grpc.max_receive_message_length", max_message_bytes),
+    ]
+
+
+def server_options(keepalive_ms=KEEPALIVE_MS, max_message_bytes=MAX_MESSAGE_BYTES):
+    # a server sends GOAWAY to clients pinging more often than it allows;
+    # half the client interval leaves room for timer jitter, so peers'
+    # keepalive pings are never counted as abuse
+    return [
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.min_ping_interval_without_data_ms", keepalive_ms // 2),
+        ("grpc.max_send_message_length", max_message_bytes),
+        ("grpc.max_receive_message_length", max_message_bytes),
+    ]
+
+
+class ChannelPool:
+    """
+    One long-lived channel and stub per peer address, shared by every
+    peer RPC in the process (client calls, replication, scans, repair).
+
+    Channels reconnect on their own, so a peer that restarts keeps its
+    channel. One that gossip has not heard from in a while is evicted,
+    closing its connection; its next call opens a fresh channel.
+    """
+
+    def __init__(self, options=None, compression=None):
+        self.options = channel_options() if options is None else options
+        self.compression = compression
+        self._entries = {}   # peer_addr -> (channel, stub, on_state)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._attached = []  # AsyncChannelPools evicted along with this pool
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def peers(self) -> list:
+        with self._lock:
+            return sorted(self._entries)
+
+    def configure(self, options=None, compression=None):
+        """
+        Change the options of channels opened from now on; call it before
+        the first RPC, open channels keep theirs.
+        """
+        with self._lock:
+            if options is not None:
+                self.options = options
+            self.compression = compression
+
+    def channel(self, peer_addr):
+        return self._entry(peer_addr)[0]
+
+    def stub(self, peer_addr):
+        return self._entry(peer_addr)[1]
+
+    def _entry(self, peer_addr):
+        with self._lock:
+            entry = self._entries.get(peer_addr)
+            if entry is None:
+                channel = grpc.insecure_channel(peer_addr, options=self.options, compression=self.compression)
+                on_state = self._state_watcher(peer_addr)
+                channel.subscribe(on_state)
+                entry = self._entries[peer_addr] = (channel, kv_pb2_grpc.KeyValueStub(channel), on_state)
+                grpc_channels_created.inc()
+                grpc_channels_open.set(len(self._entries))
+            return entry
+
+    @staticmethod
+    def _state_watcher(peer_addr):
+        def on_state(state):
+            grpc_channel_ready.labels(peer_addr).set(1 if state == grpc.ChannelConnectivity.READY else 0)
+            if state == grpc.ChannelConnectivity.TRANSIENT_FAILURE:
+                grpc_channel_failures.labels(peer_addr).inc()
+        return on_state
+
+    def evict(self, peer_addr) -> bool:
+        """
+        Close the channel to `peer_addr`, cancelling its in-flight calls.
+        """
+        with self._lock:
+            entry = self._entries.pop(peer_addr, None)
+            grpc_channels_open.set(len(self._entries))
+        if entry is None:
+            return False
+        channel, _, on_state = entry
+        channel.unsubscribe(on_state)
+        channel.close()
+        grpc_channel_ready.labels(peer_addr).set(0)
+        grpc_channels_evicted.inc()
+        return True
+
+    def evict_dead(self, is_alive) -> list:
+        """
+        Evict every pooled peer for which is_alive(peer) is False.
+        """
+        evicted = [peer for peer in self.peers() if not is_alive(peer)]
+        for peer in evicted:
+            self.evict(peer)
+        return evicted
+
+    def close(self):
+        for peer in self.peers():
+            self.evict(peer)
+
+    def attach(self, pool):
+        with self._lock:
+            self._attached.append(pool)
+
+    def detach(self, pool):
+        with self._lock:
+            if pool in self._attached:
+                self._attached.remove(pool)
+
+    def start(self, is_alive, interval=EVICT_INTERVAL):
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    with self._lock:
+                        pools = [self] + self._attached
+                    for pool in pools:
+                        for peer in pool.evict_dead(is_alive):
+                            print(f"[channels] Closed channel to {peer}, gone from gossip")
+                except Exception as e:
+                    print(f"[channels] eviction pass failed: {e}")
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+        print("[channels] Background eviction thread started")
+
+    def stop(self):
+        self._stop.set()
+
+
+class AsyncChannelPool:
+    """
+    grpc.aio channels for peer calls made on an event loop (the aio
+    server's QUORUM and ALL requests), so waiting for a peer holds a
+    coroutine instead of a thread. Channels belong to the loop that
+    opened them. Options and compression come from `pool`, and its
+    eviction pass closes these channels too.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool if pool is not None else channel_pool
+        self._entries = {}   # peer_addr -> (channel, stub)
+        self._lock = threading.Lock()
+        self._loop = None
+        self.pool.attach(self)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stub(self, peer_addr):
+        # call from the event loop
+        with self._lock:
+            entry = self._entries.get(peer_addr)
+            if entry is None:
+                self._loop = asyncio.get_running_loop()
+                channel = grpc.aio.insecure_channel(
+                    peer_addr, options=self.pool.options, compression=self.pool.compression
+                )
+                entry = self._entries[peer_addr] = (channel, kv_pb2_grpc.KeyValueStub(channel))
+            return entry[1]
+
+    def evict_dead(self, is_alive) -> list:
+        with self._lock:
+            evicted = [peer for peer in self._entries if not is_alive(peer)]
+            channels = [self._entries.pop(peer)[0] for peer in evicted]
+        for channel in channels:
+            # runs on the pool's eviction thread: close on the channel's loop
+            asyncio.run_coroutine_threadsafe(channel.close(), self._loop)
+        return evicted
+
+    async def close(self):
+        self.pool.detach(self)
+        with self._lock:
+            channels = [channel for channel, _ in self._entries.values()]
+            self._entries.clear()
+        for channel in channels:
+            await channel.close()
+
+
+# the process-wide pool
+channel_pool = ChannelPool()
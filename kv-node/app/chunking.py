@@ -0,0 +1,92 @@
+import hashlib
+import zlib
+
+
+CHUNK_COUNT = 16         # number of anti-entropy partitions (storage & hashing)
+MERKLE_FANOUT = 4        # children per merkle node inside a chunk
+MERKLE_DEPTH = 3         # levels below the chunk root
+LEAF_COUNT = MERKLE_FANOUT ** MERKLE_DEPTH
+
+
+def chunk_for_key(key: str, chunk_count: int = CHUNK_COUNT) -> int:
+    """
+    Map a key to its anti-entropy chunk. Every node and every storage
+    backend must agree on this, so it is the single place the rule lives.
+    """
+    return zlib.crc32(key.encode("utf-8")) % chunk_count
+
+
+def leaf_for_key(key: str, chunk_count: int = CHUNK_COUNT) -> int:
+    """
+    Merkle leaf of a key inside its chunk, taken from the crc32 bits that
+    chunk_for_key does not already use.
+    """
+    return (zlib.crc32(key.encode("utf-8")) // chunk_count) % LEAF_COUNT
+
+
+# ---------- order-independent chunk digests ----------
+# A chunk digest is the sum (mod 2**256) of the SHA-256 of every entry in
+# the chunk. Addition commutes, so the digest needs no sort and can be
+# kept up to date incrementally: an overwrite subtracts the old entry's
+# hash and adds the new one. Storage keeps one such sum per merkle leaf;
+# every inner node (and the chunk itself) is the sum of its children.
+
+DIGEST_SIZE = 32
+_DIGEST_MOD = 1 << (DIGEST_SIZE * 8)
+TOMBSTONE_PREFIX = b"\xfftombstone\x00"   # 0xff never starts a UTF-8 key
+
+
+def entry_digest(key: str, value, modified_at: int) -> int:
+    # value is bytes-like; str is hashed as its UTF-8 bytes, so both agree.
+    # None is a tombstone: it hashes under its own prefix, never like a value
+    h = hashlib.sha256()
+    if value is None:
+        h.update(TOMBSTONE_PREFIX)
+    h.update(key.encode("utf-8"))
+    h.update(b"\x00")
+    if value is not None:
+        h.update(value.encode("utf-8") if isinstance(value, str) else value)
+        h.update(b"\x00")
+    h.update(str(modified_at).encode("utf-8"))
+    h.update(b"\x00")
+    return int.from_bytes(h.digest(), "big")
+
+
+def combine_digest(digest: int, added: int = 0, removed: int = 0) -> int:
+    return (digest + added - removed) % _DIGEST_MOD
+
+
+def digest_of_items(items) -> int:
+    """
+    Full recompute over (key, value, modified_at) items, in any order.
+    """
+    digest = 0
+    for key, value, modified_at in items:
+        digest = combine_digest(digest, entry_digest(key, value, modified_at))
+    return digest
+
+
+def digest_to_bytes(digest: int) -> bytes:
+    return digest.to_bytes(DIGEST_SIZE, "big")
+
+
+def digest_from_bytes(raw) -> int:
+    return int.from_bytes(raw, "big") if raw else 0
+
+
+def leaf_digests_of_items(items) -> list:
+    """
+    Full recompute of the LEAF_COUNT leaf digests of one chunk.
+    """
+    leaves = [0] * LEAF_COUNT
+    for key, value, modified_at in items:
+        leaf_id = leaf_for_key(key)
+        leaves[leaf_id] = combine_digest(leaves[leaf_id], entry_digest(key, value, modified_at))
+    return leaves
+
+
+def sum_digests(digests) -> int:
+    total = 0
+    for digest in digests:
+        total = combine_digest(total, digest)
+    return total
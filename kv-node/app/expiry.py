@@ -0,0 +1,53 @@
+import threading
+import time
+
+try:
+    from metrics import keys_expired
+except ImportError:
+    from app.metrics import keys_expired
+
+
+SWEEP_INTERVAL = 1.0     # seconds between expiry sweeps
+SWEEP_BATCH_SIZE = 500   # keys expired per storage call
+
+
+class ExpirySweeper:
+    """
+    Background sweep that turns values past their TTL into tombstones.
+    Backends find due keys through an expiry index (SQLite: a partial
+    index on expires_at, the other engines: a heap), so a sweep costs the
+    number of expired keys, not the size of the store. get already hides expired
+    values; the sweep makes the expiry durable and visible to repair.
+    """
+
+    def __init__(self, storage, interval=SWEEP_INTERVAL, batch_size=SWEEP_BATCH_SIZE):
+        self.storage = storage
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, now=None):
+        now = int(now if now is not None else time.time())
+        total = 0
+        while True:
+            expired = self.storage.expire(now, self.batch_size)
+            keys_expired.inc(len(expired))
+            total += len(expired)
+            if len(expired) < self.batch_size:
+                return total
+
+    def start(self):
+        def loop():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"[expiry] sweep failed: {e}")
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+        print("[expiry] Background sweep thread started")
+
+    def stop(self):
+        self._stop.set()
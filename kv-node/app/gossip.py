@@ -12,11 +12,23 @@ app = FastAPI()
 
 membership = {}
 
+ALIVE_TIMEOUT = 5.0   # seconds without gossip after which a peer counts as down
+
 def ensure_self_in_membership(own_id: str, own_addr: str, hb: int = 0):
     """
     Ensure the local node is present in the membership map.
     """
-    membership[own_id] = {"addr": own_addr, "hb": hb}
+    membership[own_id] = {"addr": own_addr, "hb": hb, "seen": time.time()}
+
+def is_alive(addr: str, timeout: float = ALIVE_TIMEOUT) -> bool:
+    """
+    Whether the node at gRPC address `addr` gossiped within `timeout` seconds.
+    """
+    now = time.time()
+    return any(
+        node.get("addr") == addr and now - node.get("seen", 0) < timeout
+        for node in list(membership.values())
+    )
 
 # Logging switch - set DEBUG_LOG=true to enable detailed logging
 DEBUG_LOG = os.environ.get("DEBUG_LOG", "false").lower() == "true"
@@ -81,9 +93,12 @@ def receive_gossip(payload: GossipPayload):
 
     if (existing is None) or (payload.heartbeat > existing.get("hb", 0)):
         is_new = existing is None
-        membership[payload.node_id] = {"addr": payload.addr, "hb": payload.heartbeat,}
+        membership[payload.node_id] = {"addr": payload.addr, "hb": payload.heartbeat, "seen": time.time()}
         if is_new and DEBUG_LOG:
             print(f"{Colors.GREEN}[GOSSIP]{Colors.RESET} New node discovered: {payload.node_id} @ {payload.addr}")
+    else:
+        # a restarted node counts its heartbeat from 0 again, but it is alive
+        existing["seen"] = time.time()
 
     return {"status": "ok"}
 
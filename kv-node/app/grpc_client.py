@@ -1,34 +1,114 @@
-import grpc
 try:
-    import kv_pb2, kv_pb2_grpc
+    import kv_pb2
 except ImportError:
-    from app import kv_pb2, kv_pb2_grpc
+    from app import kv_pb2
 
 try:
     from interfaces import PeerClient
+    from value_codec import available_codecs, as_bytes
+    from channels import channel_pool
+    from ring import ConsistentHashRing
+    from reads import ReplicaReader
 except ImportError:
     from app.interfaces import PeerClient
+    from app.value_codec import available_codecs, as_bytes
+    from app.channels import channel_pool
+    from app.ring import ConsistentHashRing
+    from app.reads import ReplicaReader
 
 
 def get_stub(peer_addr):
-    channel = grpc.insecure_channel(peer_addr)
-    return kv_pb2_grpc.KeyValueStub(channel)
+    # shared with the rest of the process, see channels.ChannelPool
+    return channel_pool.stub(peer_addr)
 
-def put_to_peer(peer_addr, key, value, modified_at=None, timeout=2):
+_ring = ConsistentHashRing()
+
+def replicas_for_key(nodes, key, replication_factor):
+    """
+    The replicas the cluster places `key` on, primary first, from the
+    same ring the nodes use. Sending a request to the primary saves the
+    hop a node makes when it is not one of the key's replicas. The ring
+    is rebuilt only when `nodes` changes.
+    """
+    global _ring
+    nodes = frozenset(nodes)
+    ring = _ring
+    if nodes != ring.nodes:
+        ring = _ring = ConsistentHashRing(nodes)
+    return ring.get_nodes(key, replication_factor)
+
+def put_request(key, value, modified_at=None, ttl_seconds=0):
+    # text travels as value, anything else as value_bytes
+    if isinstance(value, str):
+        return kv_pb2.PutRequest(key=key, value=value, modified_at=modified_at or 0, ttl_seconds=ttl_seconds)
+    return kv_pb2.PutRequest(key=key, value_bytes=as_bytes(value), modified_at=modified_at or 0, ttl_seconds=ttl_seconds)
+
+def put_to_peer(peer_addr, key, value, modified_at=None, timeout=2, ttl_seconds=0, consistency=kv_pb2.ONE):
     stub = get_stub(peer_addr)
-    req = kv_pb2.PutRequest(key=key, value=value, modified_at=modified_at or 0)
+    req = put_request(key, value, modified_at, ttl_seconds)
+    req.consistency = consistency
     return stub.Put(req, timeout=timeout)
 
+def delete_from_peer(peer_addr, key, modified_at=None, timeout=2):
+    stub = get_stub(peer_addr)
+    req = kv_pb2.DeleteRequest(key=key, modified_at=modified_at or 0)
+    return stub.Delete(req, timeout=timeout)
+
 def replicate_to_peer(peer_addr, key, value, modified_at=None, timeout=2):
+    # value None replicates a tombstone
     stub = get_stub(peer_addr)
-    req = kv_pb2.PutRequest(key=key, value=value, modified_at=modified_at or 0)
+    if value is None:
+        req = kv_pb2.ReplicateRequest(key=key, modified_at=modified_at or 0, deleted=True)
+    else:
+        req = kv_pb2.ReplicateRequest(key=key, value=as_bytes(value), modified_at=modified_at or 0)
     return stub.Replicate(req, timeout=timeout)
 
-def get_from_peer(peer_addr, key, timeout=2):
+def get_from_peer(peer_addr, key, timeout=2, want_bytes=False, consistency=kv_pb2.ONE):
     stub = get_stub(peer_addr)
-    req = kv_pb2.GetRequest(key=key)
+    req = kv_pb2.GetRequest(key=key, want_bytes=want_bytes, consistency=consistency)
     return stub.Get(req, timeout=timeout)
 
+# latencies and hedge budget shared by this process's replica reads
+_reader = ReplicaReader()
+
+def get_from_replicas(nodes, key, replication_factor, timeout=2, reader=None):
+    """
+    A ONE read of `key` from its replicas among `nodes`, hedged the way
+    the nodes hedge their own reads (see reads.ReplicaReader): a replica
+    slower than usual is backed up by the next one. Returns the first
+    (peer, value, modified_at, expires_at) answer, value None for a
+    missing or deleted key, or None when no replica answered in time.
+    """
+    reader = reader or _reader
+    replicas = replicas_for_key(nodes, key, replication_factor)
+    answers = reader.read(replicas, key, needed=1, timeout=timeout)
+    return answers[0] if answers else None
+
+def multi_get_from_peer(peer_addr, keys, timeout=5, want_bytes=False):
+    stub = get_stub(peer_addr)
+    req = kv_pb2.MultiGetRequest(keys=keys, want_bytes=want_bytes)
+    return stub.MultiGet(req, timeout=timeout).items
+
+def batch_put_to_peer(peer_addr, items, timeout=5, ttl_seconds=0):
+    # items: (key, value) or (key, value, modified_at)
+    stub = get_stub(peer_addr)
+    reqs = [put_request(key, value, rest[0] if rest else 0, ttl_seconds) for key, value, *rest in items]
+    return stub.BatchPut(kv_pb2.BatchPutRequest(items=reqs), timeout=timeout)
+
+def put_stream_to_peer(peer_addr, records, timeout=None, ttl_seconds=0):
+    """
+    Bulk load over PutStream. records: (seq, key, value) or (seq, key,
+    value, modified_at), seq increasing from 1. Returns the iterator of
+    PutStreamAcks; after a failure, resend from the last committed_seq + 1.
+    """
+    stub = get_stub(peer_addr)
+
+    def requests():
+        for seq, key, value, *rest in records:
+            yield kv_pb2.PutStreamRecord(seq=seq, item=put_request(key, value, rest[0] if rest else 0, ttl_seconds))
+
+    return stub.PutStream(requests(), timeout=timeout)
+
 def get_chunk_hash(peer_addr, chunk_id, timeout=5):
     stub = get_stub(peer_addr)
     req = kv_pb2.ChunkRequest(chunk_id=chunk_id)
@@ -36,9 +116,30 @@ def get_chunk_hash(peer_addr, chunk_id, timeout=5):
 
 def fetch_range(peer_addr, chunk_id, timeout=10):
     stub = get_stub(peer_addr)
-    req = kv_pb2.RangeRequest(chunk_id=chunk_id)
+    req = kv_pb2.RangeRequest(chunk_id=chunk_id, accept_codecs=available_codecs())
     return stub.FetchRange(req, timeout=timeout)  # returns iterator
 
+def get_merkle_nodes(peer_addr, chunk_id, level, indices, timeout=5):
+    stub = get_stub(peer_addr)
+    req = kv_pb2.MerkleRequest(chunk_id=chunk_id, level=level, indices=indices)
+    return stub.GetMerkleNodes(req, timeout=timeout).hashes
+
+def fetch_leaves(peer_addr, chunk_id, leaf_ids, timeout=10):
+    stub = get_stub(peer_addr)
+    req = kv_pb2.LeafRequest(chunk_id=chunk_id, leaf_ids=leaf_ids, accept_codecs=available_codecs())
+    return stub.FetchLeaves(req, timeout=timeout)  # returns iterator
+
+def scan_from_peer(peer_addr, start="", end="", prefix="", limit=0, page_token="", timeout=10):
+    stub = get_stub(peer_addr)
+    req = kv_pb2.ScanRequest(start=start, end=end, prefix=prefix, limit=limit, page_token=page_token)
+    return stub.Scan(req, timeout=timeout)  # returns iterator of ScanItem
+
+def fetch_snapshot(peer_addr, accept_formats, block_size=0, timeout=3600):
+    # block_size 0: the server's default
+    stub = get_stub(peer_addr)
+    req = kv_pb2.SnapshotRequest(accept_formats=accept_formats, block_size=block_size)
+    return stub.Snapshot(req, timeout=timeout)  # returns iterator of SnapshotBlock
+
 
 class GrpcPeerClient(PeerClient):
 
@@ -93,3 +194,33 @@ class GrpcPeerClient(PeerClient):
             chunk_id,
             timeout
         )
+
+    def get_merkle_nodes(
+        self,
+        peer_addr,
+        chunk_id,
+        level,
+        indices,
+        timeout=5
+    ):
+        return get_merkle_nodes(
+            peer_addr,
+            chunk_id,
+            level,
+            indices,
+            timeout
+        )
+
+    def fetch_leaves(
+        self,
+        peer_addr,
+        chunk_id,
+        leaf_ids,
+        timeout=10
+    ):
+        return fetch_leaves(
+            peer_addr,
+            chunk_id,
+            leaf_ids,
+            timeout
+        )
@@ -1,18 +1,34 @@
 import os
+import tempfile
 import time
-import threading
 import grpc
+from collections import namedtuple
 from concurrent import futures
 import kv_pb2, kv_pb2_grpc
 
 from gossip import membership
 from anti_entropy import CHUNK_COUNT, compute_chunk_hash
+from chunking import LEAF_COUNT
+from merkle import node_hashes, valid_node_request
+from value_codec import CODEC_NONE, COMPRESS_THRESHOLD, encode_value, decode_value
+from scan import scan_bounds, merge_scans, encode_page_token
+from snapshot import SNAPSHOT_BLOCK_SIZE, MAX_SNAPSHOT_BLOCK_SIZE, snapshot_blocks
+from interfaces import SNAPSHOT_RECORDS
+from replication import ReplicationPipeline, replicate_request, send_replicates
+from reads import ReplicaReader, newest
+from channels import channel_pool, server_options
+from ring import ConsistentHashRing
 
-from metrics import grpc_requests, grpc_latency, grpc_errors, replication_attempts, replication_failures, http_requests_total
+from metrics import grpc_requests, grpc_latency, grpc_errors, grpc_batch_keys, put_latency, put_unavailable, get_latency, get_unavailable, read_repairs, ring_rebuilds, ring_nodes, replication_attempts, replication_failures, http_requests_total, snapshot_bytes_sent
 
 # Logging switch - set DEBUG_LOG=true to enable detailed logging
 DEBUG_LOG = os.environ.get("DEBUG_LOG", "false").lower() == "true"
 
+SCAN_PEER_TIMEOUT = 30  # seconds a peer's part of a scan may stream for
+MAX_BATCH_KEYS = 10_000  # keys per MultiGet or BatchPut request
+PUT_STREAM_BATCH_SIZE = 1000  # PutStream records stored per batch
+PUT_STREAM_ACK_INTERVAL = 1.0  # seconds; a slower stream is stored and acked at this pace
+
 class Colors:
     GREEN = '\033[92m'
     YELLOW = '\033[93m'
@@ -26,6 +42,10 @@ def log_write(node_addr, key, value, modified_at):
     if DEBUG_LOG:
         print(f"{Colors.GREEN}[WRITE]{Colors.RESET} Node={node_addr} | Key={key} | Value={value} | Timestamp={modified_at}")
 
+def log_delete(node_addr, key, modified_at):
+    if DEBUG_LOG:
+        print(f"{Colors.RED}[DELETE]{Colors.RESET} Node={node_addr} | Key={key} | Timestamp={modified_at}")
+
 def log_replicate_send(from_addr, to_addr, key):
     if DEBUG_LOG:
         print(f"{Colors.YELLOW}[REPLICATE→]{Colors.RESET} {from_addr} → {to_addr} | Key={key}")
@@ -46,67 +66,386 @@ def log_read(node_addr, key, found, value=None):
 def sorted_peers():
     return sorted([node["addr"] for node in membership.values() if "addr" in node])
 
+_ring = ConsistentHashRing()
+
+def replica_ring():
+    """
+    The ring over the current membership, rebuilt only when the set of
+    addresses changes (heartbeats alone leave it as is).
+    """
+    global _ring
+    addrs = frozenset(node["addr"] for node in list(membership.values()) if "addr" in node)
+    if addrs != _ring.nodes:
+        _ring = ConsistentHashRing(addrs)
+        ring_rebuilds.inc()
+        ring_nodes.set(len(addrs))
+    return _ring
+
 def pick_replicas_for_key(key, replication_factor):
-    peers = sorted_peers()
-    if not peers:
-        return []
-    # simple hash-based selection: rotate through peers
-    idx = abs(hash(key)) % len(peers)
-    selected = []
-    for i in range(replication_factor):
-        selected.append(peers[(idx + i) % len(peers)])
-    return selected
+    # distinct nodes, primary first; every node picks the same ones
+    return replica_ring().get_nodes(key, replication_factor)
+
+def required_acks(consistency, replica_count):
+    """
+    Replica acks a write at `consistency` needs out of `replica_count`.
+    """
+    if consistency == kv_pb2.ALL:
+        return replica_count
+    if consistency == kv_pb2.QUORUM:
+        return replica_count // 2 + 1
+    return min(1, replica_count)
 
 # ---------- helper for replication ----------
-def replicate_to_peer(peer_addr, key, value, modified_at, own_addr):
+def send_replicate(peer_addr, key, value, modified_at, codec=CODEC_NONE, expires_at=None, timeout=2):
+    """
+    One Replicate call; raises when it fails. `value` is the payload for
+    `codec`: compressed bytes are shipped as-is. None replicates a tombstone.
+    """
+    channel_pool.stub(peer_addr).Replicate(replicate_request(key, value, modified_at, codec, expires_at), timeout=timeout)
+
+
+def replicate_to_peer(peer_addr, key, value, modified_at, own_addr, codec=CODEC_NONE, expires_at=None, hints=None):
+    """
+    send_replicate that never raises. A failed write is queued in `hints`
+    (a HintStore) for replay once the peer is back.
+    """
     replication_attempts.inc() # -- prometheus metric
     log_replicate_send(own_addr, peer_addr, key)
     try:
-        channel = grpc.insecure_channel(peer_addr)
-        stub = kv_pb2_grpc.KeyValueStub(channel)
-        req = kv_pb2.PutRequest(key=key, value=value, modified_at=modified_at)
-        stub.Replicate(req, timeout=2)
+        send_replicate(peer_addr, key, value, modified_at, codec, expires_at)
         if DEBUG_LOG:
             print(f"{Colors.GREEN}[REPLICATE✓]{Colors.RESET} Successfully replicated key={key} to {peer_addr}")
     except Exception as e:
         replication_failures.inc() # -- prometheus metric
         if DEBUG_LOG:
             print(f"{Colors.RED}[REPLICATE✗]{Colors.RESET} Failed to replicate key={key} to {peer_addr}: {e}")
+        if hints is not None:
+            hints.add(peer_addr, key, value, modified_at, codec, expires_at)
+
+
+# peers that answered ReplicateBatch with UNIMPLEMENTED
+_batch_unsupported = set()
+
+def send_hints(peer_addr, hints):
+    # HintedHandoff's send: the whole batch in one ReplicateBatch call
+    requests = [replicate_request(h.key, h.payload, h.modified_at, h.codec, h.expires_at) for h in hints]
+    if not send_replicates(channel_pool.stub(peer_addr), requests, batch=peer_addr not in _batch_unsupported):
+        _batch_unsupported.add(peer_addr)
+
+def scan_peer_items(peer_addr, start, end):
+    """
+    A peer's local (key, value, modified_at) stream for [start, end),
+    tombstones as value None. A failing peer ends its stream early, so the
+    scan carries on with the replicas that answer.
+    """
+    call = channel_pool.stub(peer_addr).Scan(
+        kv_pb2.ScanRequest(start=start, end=end or "", local_only=True),
+        timeout=SCAN_PEER_TIMEOUT
+    )
+    try:
+        for item in call:
+            yield (item.key, None if item.deleted else item.value, item.modified_at)
+    except grpc.RpcError as e:
+        if DEBUG_LOG:
+            print(f"{Colors.RED}[SCAN✗]{Colors.RESET} Peer {peer_addr} failed mid-scan: {e}")
+    finally:
+        # the merge may stop early (limit, client gone); end the peer's stream too
+        call.cancel()
+
+
+def request_value(request):
+    """
+    The bytes of a PutRequest, whichever way the client sent them.
+    """
+    if request.WhichOneof("payload") == "value_bytes":
+        return request.value_bytes
+    return request.value.encode("utf-8")
+
+
+def get_response(value, modified_at, own_id, want_bytes, expires_at=None):
+    """
+    GetResponse for a found value: raw bytes when asked for, text for
+    older clients unless the value is not valid UTF-8.
+    """
+    response = kv_pb2.GetResponse(found=True, modified_at=modified_at, own_id=own_id, expires_at=expires_at or 0)
+    if not want_bytes:
+        try:
+            response.value = str(value, "utf-8")
+            return response
+        except UnicodeDecodeError:
+            pass
+    response.value_bytes = value
+    return response
+
+
+def key_value_pair(key, codec, payload, modified_at, accept_codecs=(), expires_at=None):
+    """
+    KeyValuePair for a stored (codec, payload). Compressed payloads are
+    passed through when the caller accepts the codec and decoded otherwise.
+    """
+    if payload is None:
+        return kv_pb2.KeyValuePair(key=key, modified_at=modified_at, deleted=True)
+    if codec != CODEC_NONE and codec not in accept_codecs:
+        codec, payload = CODEC_NONE, decode_value(codec, payload)
+    if codec == CODEC_NONE:
+        return kv_pb2.KeyValuePair(key=key, value=payload, modified_at=modified_at, expires_at=expires_at or 0)
+    return kv_pb2.KeyValuePair(
+        key=key, modified_at=modified_at, codec=codec, compressed_value=payload, expires_at=expires_at or 0
+    )
+
+
+class PutStreamBatch:
+    """
+    The PutStream records read since the last ack. A batch is ready once
+    it holds PUT_STREAM_BATCH_SIZE records or PUT_STREAM_ACK_INTERVAL has
+    passed since the last ack.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.seq = 0
+        self.stored = 0
+        self.acked_at = time.monotonic()
+
+    def add(self, record) -> bool:
+        # raises ValueError on a sequence number that does not increase
+        if record.seq <= self.seq:
+            raise ValueError(f"seq {record.seq} after {self.seq}: sequence numbers must increase")
+        self.seq = record.seq
+        self.items.append(record.item)
+        return (
+            len(self.items) >= PUT_STREAM_BATCH_SIZE
+            or time.monotonic() - self.acked_at >= PUT_STREAM_ACK_INTERVAL
+        )
+
+    def commit(self):
+        # call once the batch is stored; the ack for it
+        self.items = []
+        self.acked_at = time.monotonic()
+        return kv_pb2.PutStreamAck(committed_seq=self.seq, stored=self.stored)
+
+
+# a Put above ONE, stored locally and waiting for `needed` replica acks;
+# `local` is 1 when this node is one of the replicas
+QuorumWrite = namedtuple("QuorumWrite", "level key payload modified_at codec expires_at peers needed local")
+
 
 # ---------- gRPC Service Implementation ----------
 class KeyValueServicer(kv_pb2_grpc.KeyValueServicer):
-    def __init__(self, storage, own_addr, replication_factor=2):
+    def __init__(
+        self,
+        storage,
+        own_addr,
+        replication_factor=2,
+        replicate_codec=CODEC_NONE,
+        compress_threshold=COMPRESS_THRESHOLD,
+        snapshot_dir=None,
+        hints=None,
+        replicator=None,
+        reader=None,
+        is_alive=None
+    ):
         self.storage = storage
         self.own_addr = own_addr
         self.replication_factor = replication_factor
+        # replicate_codec != CODEC_NONE: Put compresses once and ships the
+        # compressed bytes to replicas (every node must understand the codec)
+        self.replicate_codec = replicate_codec
+        self.compress_threshold = compress_threshold
+        # where Snapshot writes its temporary copy (None: the system temp dir)
+        self.snapshot_dir = snapshot_dir
+        # HintStore for replications that fail (None: they are only counted)
+        self.hints = hints
+        # per-peer senders with bounded, coalescing queues (see replication.py)
+        self.replicator = replicator if replicator is not None else ReplicationPipeline(hints=hints)
+        # parallel replica reads for Gets above ONE (see reads.py)
+        self.reader = reader if reader is not None else ReplicaReader()
+        # is_alive(peer) -> bool, to leave down peers out of a Scan (None: all up)
+        self.is_alive = is_alive
 
     def Put(self, request, context):
         grpc_requests.labels("Put").inc() # -- prometheus metric
         http_requests_total.labels(method="PUT", path="/kv").inc()
-        with grpc_latency.labels("Put").time():
+        level = kv_pb2.Consistency.Name(request.consistency)
+        with grpc_latency.labels("Put").time(), put_latency.labels(level).time():
+            try:
+                write = self.put_local(request, context)
+                if write is None:
+                    return kv_pb2.PutResponse(ok=True, message="stored")
+                acks = write.local + self.replicator.replicate_acked(
+                    write.peers, write.key, write.payload, write.modified_at, write.codec, write.expires_at,
+                    needed=max(write.needed - write.local, 0)
+                )
+                return self.put_acked(context, write, acks)
+            except Exception:
+                grpc_errors.labels("Put").inc() # -- prometheus metric
+                raise
+
+    def put_local(self, request, context):
+        """
+        Store a Put on this node. At ONE it is also queued for the peer
+        replicas and None is returned; above ONE, the QuorumWrite still
+        to be sent to them.
+        """
+        key = request.key
+        value = request_value(request)
+        modified_at = request.modified_at or int(time.time())
+        if request.ttl_seconds < 0:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "ttl_seconds must not be negative")
+        # absolute, so every replica expires the key at the same moment
+        expires_at = modified_at + request.ttl_seconds if request.ttl_seconds else None
+
+        log_write(self.own_addr, key, value, modified_at)
+
+        codec, payload = encode_value(value, self.replicate_codec, self.compress_threshold)
+        if expires_at is not None:
+            self.storage.put_expiring(key, value, modified_at, expires_at)
+        elif codec == CODEC_NONE:
+            self.storage.put(key, value, modified_at)
+        else:
+            self.storage.put_encoded_many([(key, codec, payload, modified_at)])
+
+        replicas = pick_replicas_for_key(key, self.replication_factor)
+        if DEBUG_LOG:
+            print(f"{Colors.MAGENTA}[REPLICAS]{Colors.RESET} Key={key} will replicate to: {replicas}")
+
+        # first replica is primary (could be this node). replicate to others
+        peers = [p for p in replicas if p != self.own_addr]
+        for p in peers:
+            log_replicate_send(self.own_addr, p, key)
+
+        if request.consistency == kv_pb2.ONE:
+            # queued on each peer's sender
+            for p in peers:
+                self.replicator.replicate(p, key, payload, modified_at, codec, expires_at)
+            return None
+
+        # the local write counts when this node is one of the replicas
+        return QuorumWrite(
+            kv_pb2.Consistency.Name(request.consistency), key, payload, modified_at, codec, expires_at,
+            peers, required_acks(request.consistency, len(replicas)), int(self.own_addr in replicas)
+        )
+
+    def put_acked(self, context, write, acks):
+        """
+        The PutResponse for a QuorumWrite that `acks` replicas stored, or
+        UNAVAILABLE when that is too few.
+        """
+        if acks < write.needed:
+            put_unavailable.labels(write.level).inc()
+            context.abort(grpc.StatusCode.UNAVAILABLE, f"{write.level}: {acks} of {write.needed} replicas acknowledged the write")
+            return
+        return kv_pb2.PutResponse(ok=True, message=f"stored on {acks} replicas")
+
+    def BatchPut(self, request, context):
+        grpc_requests.labels("BatchPut").inc()
+        grpc_batch_keys.labels("BatchPut").observe(len(request.items))
+        with grpc_latency.labels("BatchPut").time():
+            try:
+                if len(request.items) > MAX_BATCH_KEYS:
+                    context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"at most {MAX_BATCH_KEYS} items per BatchPut")
+                stored = self.put_batch(context, request.items)
+                return kv_pb2.BatchPutResponse(ok=True, stored=stored)
+            except Exception:
+                grpc_errors.labels("BatchPut").inc()
+                raise
+
+    def PutStream(self, request_iterator, context):
+        """
+        Records are read only as fast as their batches are stored, so
+        gRPC flow control holds back a loader that outruns the node.
+        """
+        grpc_requests.labels("PutStream").inc()
+        with grpc_latency.labels("PutStream").time():
+            try:
+                pending = PutStreamBatch()
+                for record in request_iterator:
+                    try:
+                        ready = pending.add(record)
+                    except ValueError as e:
+                        context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+                        return
+                    if ready:
+                        yield self.commit_stream_batch(context, pending)
+                if pending.items:
+                    yield self.commit_stream_batch(context, pending)
+            except Exception:
+                grpc_errors.labels("PutStream").inc()
+                raise
+
+    def commit_stream_batch(self, context, pending):
+        grpc_batch_keys.labels("PutStream").observe(len(pending.items))
+        pending.stored += self.put_batch(context, pending.items)
+        return pending.commit()
+
+    def put_batch(self, context, items):
+        """
+        Store PutRequests as one batch: plain values through one
+        put_many, compressed ones through one put_encoded_many, values
+        with a TTL one by one. Each peer's share is queued on its sender
+        in one step. Returns how many won last-write-wins.
+        """
+        if any(item.ttl_seconds < 0 for item in items):
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "ttl_seconds must not be negative")
+
+        now = int(time.time())
+        plain = []
+        encoded = []
+        expiring = []
+        by_peer = {}
+        for item in items:
+            key = item.key
+            value = request_value(item)
+            modified_at = item.modified_at or now
+            expires_at = modified_at + item.ttl_seconds if item.ttl_seconds else None
+            log_write(self.own_addr, key, value, modified_at)
+
+            codec, payload = encode_value(value, self.replicate_codec, self.compress_threshold)
+            if expires_at is not None:
+                expiring.append((key, value, modified_at, expires_at))
+            elif codec == CODEC_NONE:
+                plain.append((key, value, modified_at))
+            else:
+                encoded.append((key, codec, payload, modified_at))
+
+            for p in pick_replicas_for_key(key, self.replication_factor):
+                if p != self.own_addr:
+                    by_peer.setdefault(p, []).append((key, payload, modified_at, codec, expires_at))
+
+        stored = 0
+        if plain:
+            stored += self.storage.put_many(plain)
+        if encoded:
+            stored += self.storage.put_encoded_many(encoded)
+        for key, value, modified_at, expires_at in expiring:
+            stored += bool(self.storage.put_expiring(key, value, modified_at, expires_at))
+
+        # one hand-off per peer; its sender ships them as batches
+        for p, writes in by_peer.items():
+            self.replicator.replicate_many(p, writes)
+        return stored
+
+    def Delete(self, request, context):
+        grpc_requests.labels("Delete").inc()
+        http_requests_total.labels(method="DELETE", path="/kv").inc()
+        with grpc_latency.labels("Delete").time():
             try:
                 key = request.key
-                value = request.value
                 modified_at = request.modified_at or int(time.time())
-                
-                log_write(self.own_addr, key, value, modified_at)
-                
-                self.storage.put(key, value, modified_at)
-
-                # replicate to other nodes (fire-and-forget threads)
-                replicas = pick_replicas_for_key(key, self.replication_factor)
-                if DEBUG_LOG:
-                    print(f"{Colors.MAGENTA}[REPLICAS]{Colors.RESET} Key={key} will replicate to: {replicas}")
-                
-                # first replica is primary (could be this node). replicate to others
-                for p in replicas:
+
+                log_delete(self.own_addr, key, modified_at)
+                self.storage.delete(key, modified_at)
+
+                # the tombstone replicates like a value
+                for p in pick_replicas_for_key(key, self.replication_factor):
                     if p == self.own_addr:
                         continue
-                    threading.Thread(target=replicate_to_peer, args=(p, key, value, modified_at, self.own_addr), daemon=True).start()
+                    log_replicate_send(self.own_addr, p, key)
+                    self.replicator.replicate(p, key, None, modified_at)
 
-                return kv_pb2.PutResponse(ok=True, message="stored")
+                return kv_pb2.PutResponse(ok=True, message="deleted")
             except Exception:
-                grpc_errors.labels("Put").inc() # -- prometheus metric
+                grpc_errors.labels("Delete").inc()
                 raise
 
     def Replicate(self, request, context):
@@ -114,28 +453,155 @@ class KeyValueServicer(kv_pb2_grpc.KeyValueServicer):
         with grpc_latency.labels("Replicate").time():
             try:
                 log_replicate_recv(self.own_addr, request.key, request.value)
-                self.storage.put(request.key, request.value, request.modified_at or int(time.time()))
+                self.apply_replicated(context, [request])
                 return kv_pb2.PutResponse(ok=True, message="replicated")
             except Exception:
                 grpc_errors.labels("Replicate").inc()
                 raise
 
+    def ReplicateBatch(self, request, context):
+        grpc_requests.labels("ReplicateBatch").inc()
+        with grpc_latency.labels("ReplicateBatch").time():
+            try:
+                for item in request.items:
+                    log_replicate_recv(self.own_addr, item.key, item.value)
+                applied = self.apply_replicated(context, request.items)
+                return kv_pb2.ReplicateBatchResponse(applied=applied)
+            except Exception:
+                grpc_errors.labels("ReplicateBatch").inc()
+                raise
+
+    def apply_replicated(self, context, requests):
+        """
+        Store ReplicateRequests last-write-wins: plain values and tombstones
+        through one put_many, compressed payloads through one
+        put_encoded_many, values with a TTL one by one. Returns how many
+        were applied.
+        """
+        plain = []
+        encoded = []
+        applied = 0
+        for request in requests:
+            modified_at = request.modified_at or int(time.time())
+            if request.deleted:
+                plain.append((request.key, None, modified_at))
+            elif request.expires_at:
+                value = request.value if request.codec == CODEC_NONE else decode_value(request.codec, request.compressed_value)
+                applied += bool(self.storage.put_expiring(request.key, value, modified_at, request.expires_at))
+            elif request.codec == CODEC_NONE:
+                plain.append((request.key, request.value, modified_at))
+            else:
+                encoded.append((request.key, request.codec, request.compressed_value, modified_at))
+
+        if plain:
+            applied += self.storage.put_many(plain)
+        if encoded:
+            applied += self.storage.put_encoded_many(encoded)
+        return applied
+
     def Get(self, request, context):
         grpc_requests.labels("Get").inc()
         http_requests_total.labels(method="GET", path="/kv").inc()
-        with grpc_latency.labels("Get").time():
+        level = kv_pb2.Consistency.Name(request.consistency)
+        with grpc_latency.labels("Get").time(), get_latency.labels(level).time():
             try:
-                result = self.storage.get(request.key)
-                if result[0] is None:
-                    log_read(self.own_addr, request.key, False)
-                    return kv_pb2.GetResponse(value="", found=False, modified_at=0, own_id=self.own_addr)
-                val, modified_at = result
-                log_read(self.own_addr, request.key, True, val)
-                return kv_pb2.GetResponse(value=val, found=True, modified_at=modified_at, own_id=self.own_addr)
+                needed, peers, answers = self.read_local(request.key, request.consistency)
+                if len(answers) < needed:
+                    answers += self.reader.read(peers, request.key, needed=needed - len(answers))
+                return self.read_result(context, request, needed, answers)
             except Exception:
                 grpc_errors.labels("Get").inc()
                 raise
 
+    def get_reply(self, request, result):
+        val, modified_at, expires_at = result
+        if val is None:
+            log_read(self.own_addr, request.key, False)
+            # modified_at is the tombstone's for a deleted key, else 0
+            return kv_pb2.GetResponse(value="", found=False, modified_at=modified_at or 0, own_id=self.own_addr)
+        log_read(self.own_addr, request.key, True, val)
+        return get_response(val, modified_at, self.own_addr, request.want_bytes, expires_at)
+
+    def is_replica(self, key):
+        """
+        True when this node stores `key`: it is one of the key's replicas,
+        or there is no ring to place the key on yet.
+        """
+        replicas = pick_replicas_for_key(key, self.replication_factor)
+        return not replicas or self.own_addr in replicas
+
+    def read_local(self, key, consistency):
+        """
+        How many of the key's replicas a read at `consistency` needs, the
+        peer replicas to ask, and this node's own (peer, value,
+        modified_at, expires_at) answer when it is a replica. A ONE read
+        on a node that is not one is answered by a replica.
+        """
+        replicas = pick_replicas_for_key(key, self.replication_factor)
+        needed = required_acks(consistency, len(replicas))
+        answers = []
+        if not replicas or self.own_addr in replicas:
+            value, modified_at, expires_at = self.storage.get_with_expiry(key)
+            answers.append((self.own_addr, value, modified_at or 0, expires_at))
+        return needed, [p for p in replicas if p != self.own_addr], answers
+
+    def read_result(self, context, request, needed, answers):
+        """
+        The GetResponse once the replica answers are in: the newest
+        version after read repair, or UNAVAILABLE when too few replicas
+        answered.
+        """
+        if len(answers) < needed:
+            level = kv_pb2.Consistency.Name(request.consistency)
+            get_unavailable.labels(level).inc()
+            context.abort(grpc.StatusCode.UNAVAILABLE, f"{level}: {len(answers)} of {needed} replicas answered the read")
+            return
+        return self.get_reply(request, self.read_repair(request.key, answers))
+
+    def read_repair(self, key, answers):
+        """
+        The newest (value, modified_at, expires_at) among `answers`.
+        Replicas that answered with an older version get the newest one,
+        TTL included: this node's store is written in place, peers through
+        their replication queues.
+        """
+        (_, value, modified_at, expires_at), stale = newest(answers)
+        if value is None:
+            expires_at = None
+        for peer, *_ in stale:
+            read_repairs.inc()
+            if peer == self.own_addr:
+                if expires_at is None:
+                    self.storage.put_many([(key, value, modified_at)])
+                else:
+                    self.storage.put_expiring(key, value, modified_at, expires_at)
+                continue
+            codec, payload = encode_value(value, self.replicate_codec, self.compress_threshold)
+            self.replicator.replicate(peer, key, payload, modified_at, codec, expires_at)
+        return value, modified_at, expires_at
+
+    def MultiGet(self, request, context):
+        grpc_requests.labels("MultiGet").inc()
+        grpc_batch_keys.labels("MultiGet").observe(len(request.keys))
+        with grpc_latency.labels("MultiGet").time():
+            try:
+                if len(request.keys) > MAX_BATCH_KEYS:
+                    context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"at most {MAX_BATCH_KEYS} keys per MultiGet")
+
+                results = self.storage.get_many(request.keys)
+                items = []
+                for key in request.keys:
+                    value, modified_at = results[key]
+                    log_read(self.own_addr, key, value is not None, value)
+                    if value is None:
+                        items.append(kv_pb2.GetResponse(value="", found=False, modified_at=modified_at or 0, own_id=self.own_addr))
+                    else:
+                        items.append(get_response(value, modified_at, self.own_addr, request.want_bytes))
+                return kv_pb2.MultiGetResponse(items=items)
+            except Exception:
+                grpc_errors.labels("MultiGet").inc()
+                raise
+
     def GetChunkHash(self, request, context):
         chunk_id = request.chunk_id
         h = compute_chunk_hash(self.storage, chunk_id)
@@ -143,13 +609,110 @@ class KeyValueServicer(kv_pb2_grpc.KeyValueServicer):
 
     def FetchRange(self, request, context):
         chunk_id = request.chunk_id
-        for k, v, modified_at in self.storage.scan_chunk_with_ts(chunk_id, CHUNK_COUNT):
-            yield kv_pb2.KeyValuePair(key=k, value=v, modified_at=modified_at)
+        accept_codecs = set(request.accept_codecs)
+        for k, codec, payload, modified_at, expires_at in self.storage.scan_chunk_encoded(chunk_id, CHUNK_COUNT):
+            yield key_value_pair(k, codec, payload, modified_at, accept_codecs, expires_at)
+
+    def GetMerkleNodes(self, request, context):
+        indices = list(request.indices)
+        if not (0 <= request.chunk_id < CHUNK_COUNT and valid_node_request(request.level, indices)):
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "merkle node out of range")
+        leaves = self.storage.leaf_digests(request.chunk_id)
+        return kv_pb2.MerkleResponse(hashes=node_hashes(leaves, request.level, indices))
+
+    def FetchLeaves(self, request, context):
+        if not (0 <= request.chunk_id < CHUNK_COUNT and all(0 <= leaf < LEAF_COUNT for leaf in request.leaf_ids)):
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "merkle leaf out of range")
+        accept_codecs = set(request.accept_codecs)
+        for k, codec, payload, modified_at, expires_at in self.storage.scan_leaves_encoded(request.chunk_id, request.leaf_ids):
+            yield key_value_pair(k, codec, payload, modified_at, accept_codecs, expires_at)
+
+    def Scan(self, request, context):
+        grpc_requests.labels("Scan").inc()
+        with grpc_latency.labels("Scan").time():
+            try:
+                try:
+                    start, end = scan_bounds(request.start, request.end, request.prefix, request.page_token)
+                except ValueError as e:
+                    context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+                    return
+
+                local = self.storage.scan_range(start, end)
+                if request.local_only:
+                    for key, value, modified_at in local:
+                        if value is None:
+                            yield kv_pb2.ScanItem(key=key, modified_at=modified_at, deleted=True)
+                        else:
+                            yield kv_pb2.ScanItem(key=key, value=value, modified_at=modified_at)
+                    return
+
+                # keys are placed by hash, so any range is spread over the
+                # whole ring: read the nodes that cover every replica set
+                # once, newest version wins where several hold a key
+                owners = self.scan_owners()
+                streams = [local] if not owners or self.own_addr in owners else []
+                streams += [scan_peer_items(p, start, end) for p in owners if p != self.own_addr]
+                merged = merge_scans(streams)
+                returned = 0
+                try:
+                    for key, value, modified_at in merged:
+                        if value is None:
+                            continue
+                        yield kv_pb2.ScanItem(
+                            key=key, value=value, modified_at=modified_at,
+                            page_token=encode_page_token(key)
+                        )
+                        returned += 1
+                        if returned == request.limit:
+                            return
+                finally:
+                    merged.close()
+                    for stream in streams:
+                        stream.close()
+            except Exception:
+                grpc_errors.labels("Scan").inc()
+                raise
+
+    def scan_owners(self):
+        """
+        The members a Scan reads: a cover of the ring (see
+        ConsistentHashRing.cover) that starts with this node and leaves
+        out peers that are down, so their keys come from other replicas.
+        """
+        down = ()
+        if self.is_alive is not None:
+            down = [p for p in sorted_peers() if p != self.own_addr and not self.is_alive(p)]
+        return replica_ring().cover(self.replication_factor, prefer=self.own_addr, skip=down)
+
+    def Snapshot(self, request, context):
+        grpc_requests.labels("Snapshot").inc()
+        with grpc_latency.labels("Snapshot").time():
+            fd, path = tempfile.mkstemp(prefix="snapshot-", dir=self.snapshot_dir)
+            os.close(fd)
+            try:
+                try:
+                    fmt = self.storage.snapshot_to(path, list(request.accept_formats) or [SNAPSHOT_RECORDS])
+                except ValueError as e:
+                    context.abort(grpc.StatusCode.FAILED_PRECONDITION, str(e))
+                    return
+
+                block_size = min(request.block_size or SNAPSHOT_BLOCK_SIZE, MAX_SNAPSHOT_BLOCK_SIZE)
+                for block in snapshot_blocks(path, fmt, block_size):
+                    snapshot_bytes_sent.inc(len(block.data))
+                    yield block
+            except Exception:
+                grpc_errors.labels("Snapshot").inc()
+                raise
+            finally:
+                os.remove(path)
 
 
-def serve_grpc(port, storage, own_addr, replication_factor=2):
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=20))
-    servicer = KeyValueServicer(storage, own_addr, replication_factor)
+def serve_grpc(port, storage, own_addr, replication_factor=2, replicate_codec=CODEC_NONE, compress_threshold=COMPRESS_THRESHOLD, snapshot_dir=None, hints=None, replicator=None, options=None, reader=None, is_alive=None):
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=20),
+        options=server_options() if options is None else options
+    )
+    servicer = KeyValueServicer(storage, own_addr, replication_factor, replicate_codec, compress_threshold, snapshot_dir, hints, replicator, reader, is_alive)
     kv_pb2_grpc.add_KeyValueServicer_to_server(servicer, server)
     server.add_insecure_port(f"[::]:{port}")
     server.start()
@@ -0,0 +1,219 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+try:
+    from value_codec import CODEC_NONE
+    from metrics import hints_stored, hints_dropped, hints_replayed, hints_pending
+except ImportError:
+    from app.value_codec import CODEC_NONE
+    from app.metrics import hints_stored, hints_dropped, hints_replayed, hints_pending
+
+
+HINTS_MAX_PER_PEER = 100_000   # keys queued per peer before new hints are dropped
+REPLAY_INTERVAL = 5.0          # seconds between replay passes
+REPLAY_BATCH_SIZE = 100        # hints read and delivered per round trip to the store
+HINT_MAX_AGE = 86400           # seconds; older hints are left to anti-entropy
+
+# payload None is a tombstone; payload is encoded with codec (see value_codec)
+Hint = namedtuple("Hint", "id key codec payload modified_at expires_at")
+
+
+class HintStore:
+    """
+    Disk-backed queue of the replications each peer missed.
+
+    One row per (peer, key) holds the newest missed version of that key,
+    last-write-wins like the store itself, so a key rewritten during an
+    outage is delivered once. Rows replay in the order they were first
+    queued. A full queue drops new hints; anti-entropy still repairs them.
+    """
+
+    def __init__(self, path, max_per_peer=HINTS_MAX_PER_PEER):
+        self.path = path
+        self.max_per_peer = max_per_peer
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS hints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                peer TEXT NOT NULL,
+                key TEXT NOT NULL,
+                codec INTEGER NOT NULL DEFAULT 0,
+                payload BLOB,
+                modified_at INTEGER NOT NULL,
+                expires_at INTEGER,
+                UNIQUE (peer, key)
+            );
+        """)
+        self._counts = dict(self._conn.execute("SELECT peer, COUNT(*) FROM hints GROUP BY peer"))
+        for peer, count in self._counts.items():
+            hints_pending.labels(peer).set(count)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add(self, peer, key, payload, modified_at, codec=CODEC_NONE, expires_at=None) -> bool:
+        """
+        Queue a missed replication. Returns False when the peer's queue is
+        full and the hint was dropped.
+        """
+        with self._lock:
+            existing = self._conn.execute(
+                "SELECT 1 FROM hints WHERE peer = ? AND key = ?", (peer, key)
+            ).fetchone()
+            if existing is None and self._counts.get(peer, 0) >= self.max_per_peer:
+                hints_dropped.inc()
+                return False
+
+            # a tombstone (NULL payload) wins a tie, see interfaces.lww_version
+            self._conn.execute(
+                """
+                INSERT INTO hints (peer, key, codec, payload, modified_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (peer, key) DO UPDATE SET
+                    codec = excluded.codec,
+                    payload = excluded.payload,
+                    modified_at = excluded.modified_at,
+                    expires_at = excluded.expires_at
+                WHERE excluded.modified_at > hints.modified_at
+                   OR (excluded.modified_at = hints.modified_at
+                       AND excluded.payload IS NULL AND hints.payload IS NOT NULL)
+                """,
+                (peer, key, codec, payload, modified_at, expires_at)
+            )
+            if existing is None:
+                self._set_count(peer, self._counts.get(peer, 0) + 1)
+        hints_stored.inc()
+        return True
+
+    def peek(self, peer, limit) -> list:
+        """
+        The oldest `limit` hints queued for `peer`.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT id, key, codec, payload, modified_at, expires_at FROM hints
+                WHERE peer = ? ORDER BY id LIMIT ?
+                """,
+                (peer, limit)
+            ).fetchall()
+        return [Hint(*row) for row in rows]
+
+    def remove(self, peer, hints) -> int:
+        """
+        Drop delivered hints. A hint replaced by a newer version since it
+        was read stays queued.
+        """
+        with self._lock:
+            removed = 0
+            for hint in hints:
+                removed += self._conn.execute(
+                    "DELETE FROM hints WHERE id = ? AND modified_at = ? AND payload IS ?",
+                    (hint.id, hint.modified_at, hint.payload)
+                ).rowcount
+            self._set_count(peer, self._counts.get(peer, 0) - removed)
+        return removed
+
+    def drop_older_than(self, modified_before) -> int:
+        with self._lock:
+            dropped = self._conn.execute(
+                "DELETE FROM hints WHERE modified_at < ?", (modified_before,)
+            ).rowcount
+            if dropped:
+                counts = dict(self._conn.execute("SELECT peer, COUNT(*) FROM hints GROUP BY peer"))
+                for peer in list(self._counts):
+                    self._set_count(peer, counts.get(peer, 0))
+        hints_dropped.inc(dropped)
+        return dropped
+
+    def peers(self) -> list:
+        with self._lock:
+            return sorted(peer for peer, count in self._counts.items() if count)
+
+    def pending(self, peer) -> int:
+        with self._lock:
+            return self._counts.get(peer, 0)
+
+    def _set_count(self, peer, count):
+        self._counts[peer] = count
+        hints_pending.labels(peer).set(count)
+
+
+class HintedHandoff:
+    """
+    Background replay of queued hints. A peer's hints are sent, oldest
+    first and `batch_size` per call, once gossip reports it alive again.
+    A failed send stops that peer's replay until the next pass, and the
+    batch stays queued to be sent whole again.
+
+    Hints older than `max_age` are dropped unsent: a tombstone they lose
+    to may already be purged on the peer (see tombstone_gc), so keep
+    `max_age` at or below the tombstone grace period.
+    """
+
+    def __init__(
+        self,
+        hints,
+        send,
+        is_alive,
+        interval=REPLAY_INTERVAL,
+        batch_size=REPLAY_BATCH_SIZE,
+        max_age=HINT_MAX_AGE
+    ):
+        self.hints = hints
+        self.send = send              # send(peer, hints); raises on failure
+        self.is_alive = is_alive      # is_alive(peer) -> bool
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, now=None):
+        now = int(now if now is not None else time.time())
+        self.hints.drop_older_than(now - self.max_age)
+
+        delivered = 0
+        for peer in self.hints.peers():
+            if self.is_alive(peer):
+                delivered += self.replay(peer)
+        return delivered
+
+    def replay(self, peer):
+        delivered = 0
+        while not self._stop.is_set():
+            batch = self.hints.peek(peer, self.batch_size)
+            if not batch:
+                break
+
+            try:
+                self.send(peer, batch)
+            except Exception as e:
+                print(f"[hints] Replay to {peer} stopped: {e}")
+                break
+
+            self.hints.remove(peer, batch)
+            hints_replayed.inc(len(batch))
+            delivered += len(batch)
+        return delivered
+
+    def start(self):
+        def loop():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"[hints] replay pass failed: {e}")
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+        print("[hints] Background replay thread started")
+
+    def stop(self):
+        self._stop.set()
@@ -1,5 +1,8 @@
 import requests
-from app.ring import ConsistentHashRing
+try:
+    from ring import ConsistentHashRing
+except ImportError:
+    from app.ring import ConsistentHashRing
 
 nodes = ["127.0.0.1:8000", "127.0.0.1:8001", "127.0.0.1:8002"]
 ring = ConsistentHashRing(nodes)
@@ -7,11 +10,8 @@ ring = ConsistentHashRing(nodes)
 REPLICATION_FACTOR = 2
 
 def put(key, value):
-    primary = ring.get_node(key)
-
-    # find replica (next in ring)
-    idx = nodes.index(primary)
-    replicas = [nodes[(idx+i) % len(nodes)] for i in range(1, REPLICATION_FACTOR+1)]
+    # primary, then the next distinct nodes clockwise on the ring
+    primary, *replicas = ring.get_nodes(key, REPLICATION_FACTOR + 1)
 
     # send to primary
     requests.put(f"http://{primary}/key/{key}", params={"value": value})
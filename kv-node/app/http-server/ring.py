@@ -1,33 +1,17 @@
-import hashlib
-import bisect
+# The prototype's ring is the one the nodes place replicas with now, so
+# this client and the cluster agree on where a key lives. The node's
+# ring.py is loaded by path: the prototype runs from this directory,
+# where the app package is not importable, and importing it would pull
+# in gRPC and every storage engine anyway.
+import importlib.util
+import os
 
-class ConsistentHashRing:
-    def __init__(self, nodes=None, replicas=3):
-        self.replicas = replicas
-        self.ring = {}
-        self.sorted_keys = []
-        if nodes:
-            for node in nodes:
-                self.add_node(node)
+_spec = importlib.util.spec_from_file_location(
+    "kv_node_ring", os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "ring.py")
+)
+_ring = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_ring)
 
-    def hash_fn(self, key):
-        return int(hashlib.md5(key.encode()).hexdigest(), 16)
-
-    def add_node(self, node):
-        for i in range(self.replicas):
-            key = self.hash_fn(f"{node}:{i}")
-            self.ring[key] = node
-            bisect.insort(self.sorted_keys, key)
-
-    def remove_node(self, node):
-        for i in range(self.replicas):
-            key = self.hash_fn(f"{node}:{i}")
-            self.ring.pop(key)
-            self.sorted_keys.remove(key)
-
-    def get_node(self, key):
-        h = self.hash_fn(key)
-        idx = bisect.bisect(self.sorted_keys, h)
-        if idx == len(self.sorted_keys):
-            idx = 0
-        return self.ring[self.sorted_keys[idx]]
+ConsistentHashRing = _ring.ConsistentHashRing
+ring_hash = _ring.ring_hash
+VNODES = _ring.VNODES
@@ -1,16 +1,122 @@
+import os
 from abc import ABC, abstractmethod
 from typing import Iterable
 
+try:
+    from chunking import CHUNK_COUNT, leaf_for_key, leaf_digests_of_items, digest_of_items, digest_to_bytes
+    from value_codec import CODEC_NONE, decode_value
+    from log_records import encode_record, iter_records
+except ImportError:
+    from app.chunking import CHUNK_COUNT, leaf_for_key, leaf_digests_of_items, digest_of_items, digest_to_bytes
+    from app.value_codec import CODEC_NONE, decode_value
+    from app.log_records import encode_record, iter_records
+
+
+SNAPSHOT_RECORDS = "records"   # snapshot format every backend reads and writes
+RESTORE_BATCH_SIZE = 1000      # snapshot keys written per put_many
+
+
+def lww_version(modified_at: int, deleted: bool = False):
+    """
+    What last-write-wins compares: the newer modified_at wins, and on a tie
+    a tombstone beats a value, so a delete in the same second as the put it
+    follows still lands. Every backend and the anti-entropy merge use this
+    rule, otherwise replicas that tie would never converge.
+    """
+    return (modified_at, deleted)
+
 
 class StorageBackend(ABC):
+    """
+    Values are bytes: put accepts any bytes-like value (str is stored as its
+    UTF-8 encoding) and get/scans return bytes.
+
+    A value of None is a tombstone. It is versioned like any other write,
+    so a delete replicates and is repaired by anti-entropy, and scans and
+    digests include it. get returns (None, modified_at) for a deleted key
+    and (None, 0) for one that was never written.
+    """
 
     @abstractmethod
-    def put(self, key: str, value: str, modified_at: int) -> bool:
+    def put(self, key: str, value, modified_at: int) -> bool:
         pass
 
+    def put_many(self, items) -> int:
+        """
+        Last-write-wins put of (key, value, modified_at) items; returns how
+        many were applied. Backends override this to use one transaction.
+        """
+        applied = 0
+        for key, value, modified_at in items:
+            if self.put(key, value, modified_at):
+                applied += 1
+        return applied
+
+    def put_encoded_many(self, items) -> int:
+        """
+        put_many for (key, codec, payload, modified_at) items as shipped by
+        peers (see value_codec). Backends that store compressed values
+        override this to keep the payload as-is.
+        """
+        return self.put_many([
+            (key, decode_value(codec, payload), modified_at)
+            for key, codec, payload, modified_at in items
+        ])
+
+    def delete(self, key: str, modified_at: int) -> bool:
+        """
+        Write a tombstone for `key` at `modified_at` (last-write-wins).
+        """
+        return self.put(key, None, modified_at)
+
+    def purge_tombstones(self, older_than: int) -> int:
+        """
+        Forget tombstones with modified_at < older_than and return how many
+        went. Only safe once every replica has seen them (see tombstone_gc).
+        A tombstone left by an expired TTL counts from its expires_at.
+        Backends that cannot purge keep them and return 0.
+        """
+        return 0
+
+    @abstractmethod
+    def put_expiring(self, key: str, value, modified_at: int, expires_at: int) -> bool:
+        """
+        put that stops being visible to get at `expires_at` (unix seconds)
+        and is then turned into a tombstone by expire().
+        """
+
     @abstractmethod
+    def expire(self, now: int, limit: int) -> list:
+        """
+        Turn up to `limit` values whose expires_at <= now into tombstones
+        and return their keys. The tombstone keeps the value's modified_at:
+        it wins the tie against exactly that version (see lww_version) and
+        loses to any newer write, so every replica expires a key to the
+        same state and anti-entropy cannot bring it back.
+        """
+
     def get(self, key: str):
-        pass
+        return self.get_with_expiry(key)[:2]
+
+    @abstractmethod
+    def get_with_expiry(self, key: str):
+        """
+        get plus the key's expires_at (None without a TTL), so a cache can
+        stop serving the value once it expires.
+        """
+
+    def get_many(self, keys) -> dict:
+        """
+        key -> get(key) for each of `keys`.
+        """
+        return {key: result[:2] for key, result in self.get_many_with_expiry(keys).items()}
+
+    def get_many_with_expiry(self, keys) -> dict:
+        """
+        key -> get_with_expiry(key) for each of `keys`. Backends override
+        this to read them in one query.
+        """
+        return {key: self.get_with_expiry(key) for key in keys}
 
     @abstractmethod
     def scan_chunk_with_ts(
@@ -20,6 +126,118 @@ class StorageBackend(ABC):
     ) -> Iterable:
         pass
 
+    def scan_range(
+        self,
+        start: str,
+        end=None
+    ) -> Iterable:
+        """
+        (key, value, modified_at) for start <= key < end (end None: no
+        bound) in key order, tombstones included as value None. Backends
+        keep an ordered key index and yield lazily; this fallback sorts a
+        full scan.
+        """
+        items = [
+            item
+            for chunk_id in range(CHUNK_COUNT)
+            for item in self.scan_chunk_with_ts(chunk_id, CHUNK_COUNT)
+            if item[0] >= start and (end is None or item[0] < end)
+        ]
+        items.sort(key=lambda item: item[0])
+        return iter(items)
+
+    def chunk_digest(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ) -> bytes:
+        # backends that keep running digests override this
+        return digest_to_bytes(
+            digest_of_items(self.scan_chunk_with_ts(chunk_id, chunk_count))
+        )
+
+    def leaf_digests(
+        self,
+        chunk_id: int
+    ) -> list:
+        # merkle leaves of one of the CHUNK_COUNT chunks
+        return leaf_digests_of_items(
+            self.scan_chunk_with_ts(chunk_id, CHUNK_COUNT)
+        )
+
+    def scan_leaves_with_ts(
+        self,
+        chunk_id: int,
+        leaf_ids
+    ) -> Iterable:
+        wanted = set(leaf_ids)
+        for item in self.scan_chunk_with_ts(chunk_id, CHUNK_COUNT):
+            if leaf_for_key(item[0]) in wanted:
+                yield item
+
+    def scan_chunk_encoded(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ) -> Iterable:
+        # (key, codec, payload, modified_at, expires_at), without decompressing
+        for key, value, modified_at in self.scan_chunk_with_ts(chunk_id, chunk_count):
+            yield (key, CODEC_NONE, value, modified_at, self._expires_at(key, value))
+
+    def scan_leaves_encoded(
+        self,
+        chunk_id: int,
+        leaf_ids
+    ) -> Iterable:
+        wanted = set(leaf_ids)
+        for item in self.scan_chunk_encoded(chunk_id, CHUNK_COUNT):
+            if leaf_for_key(item[0]) in wanted:
+                yield item
+
+    def _expires_at(self, key: str, value):
+        # backends that keep expires_at next to the value override the scans
+        return None if value is None else self.get_with_expiry(key)[2]
+
+    def snapshot_formats(self) -> list:
+        """
+        Snapshot formats restore_from reads, preferred first.
+        """
+        return [SNAPSHOT_RECORDS]
+
+    def snapshot_to(self, path: str, formats=(SNAPSHOT_RECORDS,)) -> str:
+        """
+        Write a copy of the whole store, tombstones included, to `path` in
+        one of `formats` and return the one used. This fallback writes log
+        records in key order; writes that land during the copy may be
+        missed, which anti-entropy catches up afterwards.
+        """
+        if SNAPSHOT_RECORDS not in formats:
+            raise ValueError(f"{type(self).__name__} cannot write snapshot formats {list(formats)}")
+
+        with open(path, "wb") as f:
+            for key, value, modified_at in self.scan_range(""):
+                f.write(encode_record(key, value, modified_at))
+            f.flush()
+            os.fsync(f.fileno())
+        return SNAPSHOT_RECORDS
+
+    def restore_from(self, path: str, fmt: str) -> int:
+        """
+        Merge a snapshot into the store last-write-wins and return how many
+        keys were applied.
+        """
+        if fmt != SNAPSHOT_RECORDS:
+            raise ValueError(f"{type(self).__name__} cannot read snapshot format {fmt!r}")
+
+        applied = 0
+        batch = []
+        for _, key, value, modified_at, _, _ in iter_records(path):
+            batch.append((key, value, modified_at))
+            if len(batch) >= RESTORE_BATCH_SIZE:
+                applied += self.put_many(batch)
+                batch = []
+        return applied + self.put_many(batch)
+
 
 class PeerClient(ABC):
 
@@ -28,7 +246,7 @@ class PeerClient(ABC):
         self,
         peer_addr: str,
         key: str,
-        value: str,
+        value,
         modified_at: int,
         timeout: int = 2
     ):
@@ -60,3 +278,24 @@ class PeerClient(ABC):
         timeout: int = 10
     ):
         pass
+
+    @abstractmethod
+    def get_merkle_nodes(
+        self,
+        peer_addr: str,
+        chunk_id: int,
+        level: int,
+        indices,
+        timeout: int = 5
+    ):
+        pass
+
+    @abstractmethod
+    def fetch_leaves(
+        self,
+        peer_addr: str,
+        chunk_id: int,
+        leaf_ids,
+        timeout: int = 10
+    ):
+        pass
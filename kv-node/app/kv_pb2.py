@@ -24,29 +24,65 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x08kv.proto\x12\x02kv\"=\n\nPutRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\x12\x13\n\x0bmodified_at\x18\x03 \x01(\x03\"*\n\x0bPutResponse\x12\n\n\x02ok\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"\x19\n\nGetRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\"P\n\x0bGetResponse\x12\r\n\x05value\x18\x01 \x01(\t\x12\r\n\x05\x66ound\x18\x02 \x01(\x08\x12\x13\n\x0bmodified_at\x18\x03 \x01(\x03\x12\x0e\n\x06own_id\x18\x04 \x01(\t\"?\n\x0cKeyValuePair\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\x12\x13\n\x0bmodified_at\x18\x03 \x01(\x03\" \n\x0c\x43hunkRequest\x12\x10\n\x08\x63hunk_id\x18\x01 \x01(\x05\"!\n\x11\x43hunkHashResponse\x12\x0c\n\x04hash\x18\x01 \x01(\x0c\" \n\x0cRangeRequest\x12\x10\n\x08\x63hunk_id\x18\x01 \x01(\x05\x32\xf5\x01\n\x08KeyValue\x12&\n\x03Put\x12\x0e.kv.PutRequest\x1a\x0f.kv.PutResponse\x12&\n\x03Get\x12\x0e.kv.GetRequest\x1a\x0f.kv.GetResponse\x12,\n\tReplicate\x12\x0e.kv.PutRequest\x1a\x0f.kv.PutResponse\x12\x37\n\x0cGetChunkHash\x12\x10.kv.ChunkRequest\x1a\x15.kv.ChunkHashResponse\x12\x32\n\nFetchRange\x12\x10.kv.RangeRequest\x1a\x10.kv.KeyValuePair0\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x08kv.proto\x12\x02kv\"\x9c\x01\n\nPutRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0f\n\x05value\x18\x02 \x01(\tH\x00\x12\x15\n\x0bvalue_bytes\x18\x06 \x01(\x0cH\x00\x12\x13\n\x0bmodified_at\x18\x03 \x01(\x03\x12\x13\n\x0bttl_seconds\x18\x04 \x01(\x03\x12$\n\x0b\x63onsistency\x18\x05 \x01(\x0e\x32\x0f.kv.ConsistencyB\t\n\x07payload\"\x91\x01\n\x10ReplicateRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x0c\x12\x13\n\x0bmodified_at\x18\x03 \x01(\x03\x12\r\n\x05\x63odec\x18\x04 \x01(\r\x12\x18\n\x10\x63ompressed_value\x18\x05 \x01(\x0c\x12\x0f\n\x07\x64\x65leted\x18\x06 \x01(\x08\x12\x12\n\nexpires_at\x18\x07 \x01(\x03\"*\n\x0bPutResponse\x12\n\n\x02ok\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"<\n\x15ReplicateBatchRequest\x12#\n\x05items\x18\x01 \x03(\x0b\x32\x14.kv.ReplicateRequest\")\n\x16ReplicateBatchResponse\x12\x0f\n\x07\x61pplied\x18\x01 \x01(\r\"S\n\nGetRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x12\n\nwant_bytes\x18\x02 \x01(\x08\x12$\n\x0b\x63onsistency\x18\x03 \x01(\x0e\x32\x0f.kv.Consistency\"1\n\rDeleteRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x13\n\x0bmodified_at\x18\x02 \x01(\x03\"\x88\x01\n\x0bGetResponse\x12\x0f\n\x05value\x18\x01 \x01(\tH\x00\x12\x15\n\x0bvalue_bytes\x18\x05 \x01(\x0cH\x00\x12\r\n\x05\x66ound\x18\x02 \x01(\x08\x12\x13\n\x0bmodified_at\x18\x03 \x01(\x03\x12\x0e\n\x06own_id\x18\x04 \x01(\t\x12\x12\n\nexpires_at\x18\x06 \x01(\x03\x42\t\n\x07payload\"3\n\x0fMultiGetRequest\x12\x0c\n\x04keys\x18\x01 \x03(\t\x12\x12\n\nwant_bytes\x18\x02 \x01(\x08\"2\n\x10MultiGetResponse\x12\x1e\n\x05items\x18\x01 \x03(\x0b\x32\x0f.kv.GetResponse\"0\n\x0f\x42\x61tchPutRequest\x12\x1d\n\x05items\x18\x01 \x03(\x0b\x32\x0e.kv.PutRequest\".\n\x10\x42\x61tchPutResponse\x12\n\n\x02ok\x18\x01 \x01(\x08\x12\x0e\n\x06stored\x18\x02 \x01(\r\"<\n\x0fPutStreamRecord\x12\x0b\n\x03seq\x18\x01 \x01(\x04\x12\x1c\n\x04item\x18\x02 \x01(\x0b\x32\x0e.kv.PutRequest\"5\n\x0cPutStreamAck\x12\x15\n\rcommitted_seq\x18\x01 \x01(\x04\x12\x0e\n\x06stored\x18\x02 \x01(\x04\"\x8d\x01\n\x0cKeyValuePair\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x0c\x12\x13\n\x0bmodified_at\x18\x03 \x01(\x03\x12\r\n\x05\x63odec\x18\x04 \x01(\r\x12\x18\n\x10\x63ompressed_value\x18\x05 \x01(\x0c\x12\x0f\n\x07\x64\x65leted\x18\x06 \x01(\x08\x12\x12\n\nexpires_at\x18\x07 \x01(\x03\" \n\x0c\x43hunkRequest\x12\x10\n\x08\x63hunk_id\x18\x01 \x01(\x05\"!\n\x11\x43hunkHashResponse\x12\x0c\n\x04hash\x18\x01 \x01(\x0c\"7\n\x0cRangeRequest\x12\x10\n\x08\x63hunk_id\x18\x01 \x01(\x05\x12\x15\n\raccept_codecs\x18\x02 \x03(\r\"A\n\rMerkleRequest\x12\x10\n\x08\x63hunk_id\x18\x01 \x01(\x05\x12\r\n\x05level\x18\x02 \x01(\x05\x12\x0f\n\x07indices\x18\x03 \x03(\x05\" \n\x0eMerkleResponse\x12\x0e\n\x06hashes\x18\x01 \x03(\x0c\"H\n\x0bLeafRequest\x12\x10\n\x08\x63hunk_id\x18\x01 \x01(\x05\x12\x10\n\x08leaf_ids\x18\x02 \x03(\x05\x12\x15\n\raccept_codecs\x18\x03 \x03(\r\"p\n\x0bScanRequest\x12\r\n\x05start\x18\x01 \x01(\t\x12\x0b\n\x03\x65nd\x18\x02 \x01(\t\x12\x0e\n\x06prefix\x18\x03 \x01(\t\x12\r\n\x05limit\x18\x04 \x01(\r\x12\x12\n\npage_token\x18\x05 \x01(\t\x12\x12\n\nlocal_only\x18\x06 \x01(\x08\"`\n\x08ScanItem\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x0c\x12\x13\n\x0bmodified_at\x18\x03 \x01(\x03\x12\x12\n\npage_token\x18\x04 \x01(\t\x12\x0f\n\x07\x64\x65leted\x18\x05 \x01(\x08\"=\n\x0fSnapshotRequest\x12\x16\n\x0e\x61\x63\x63\x65pt_formats\x18\x01 \x03(\t\x12\x12\n\nblock_size\x18\x02 \x01(\r\"j\n\rSnapshotBlock\x12\x0e\n\x06offset\x18\x01 \x01(\x04\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\x0c\x12\r\n\x05\x63rc32\x18\x03 \x01(\x07\x12\x0c\n\x04\x64one\x18\x04 \x01(\x08\x12\x0e\n\x06sha256\x18\x05 \x01(\x0c\x12\x0e\n\x06\x66ormat\x18\x06 \x01(\t*+\n\x0b\x43onsistency\x12\x07\n\x03ONE\x10\x00\x12\n\n\x06QUORUM\x10\x01\x12\x07\n\x03\x41LL\x10\x02\x32\xe4\x05\n\x08KeyValue\x12&\n\x03Put\x12\x0e.kv.PutRequest\x1a\x0f.kv.PutResponse\x12&\n\x03Get\x12\x0e.kv.GetRequest\x1a\x0f.kv.GetResponse\x12\x35\n\x08MultiGet\x12\x13.kv.MultiGetRequest\x1a\x14.kv.MultiGetResponse\x12\x35\n\x08\x42\x61tchPut\x12\x13.kv.BatchPutRequest\x1a\x14.kv.BatchPutResponse\x12\x36\n\tPutStream\x12\x13.kv.PutStreamRecord\x1a\x10.kv.PutStreamAck(\x01\x30\x01\x12,\n\x06\x44\x65lete\x12\x11.kv.DeleteRequest\x1a\x0f.kv.PutResponse\x12\x32\n\tReplicate\x12\x14.kv.ReplicateRequest\x1a\x0f.kv.PutResponse\x12G\n\x0eReplicateBatch\x12\x19.kv.ReplicateBatchRequest\x1a\x1a.kv.ReplicateBatchResponse\x12\x37\n\x0cGetChunkHash\x12\x10.kv.ChunkRequest\x1a\x15.kv.ChunkHashResponse\x12\x32\n\nFetchRange\x12\x10.kv.RangeRequest\x1a\x10.kv.KeyValuePair0\x01\x12\x37\n\x0eGetMerkleNodes\x12\x11.kv.MerkleRequest\x1a\x12.kv.MerkleResponse\x12\x32\n\x0b\x46\x65tchLeaves\x12\x0f.kv.LeafRequest\x1a\x10.kv.KeyValuePair0\x01\x12\'\n\x04Scan\x12\x0f.kv.ScanRequest\x1a\x0c.kv.ScanItem0\x01\x12\x34\n\x08Snapshot\x12\x13.kv.SnapshotRequest\x1a\x11.kv.SnapshotBlock0\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'kv_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_PUTREQUEST']._serialized_start=16
-  _globals['_PUTREQUEST']._serialized_end=77
-  _globals['_PUTRESPONSE']._serialized_start=79
-  _globals['_PUTRESPONSE']._serialized_end=121
-  _globals['_GETREQUEST']._serialized_start=123
-  _globals['_GETREQUEST']._serialized_end=148
-  _globals['_GETRESPONSE']._serialized_start=150
-  _globals['_GETRESPONSE']._serialized_end=230
-  _globals['_KEYVALUEPAIR']._serialized_start=232
-  _globals['_KEYVALUEPAIR']._serialized_end=295
-  _globals['_CHUNKREQUEST']._serialized_start=297
-  _globals['_CHUNKREQUEST']._serialized_end=329
-  _globals['_CHUNKHASHRESPONSE']._serialized_start=331
-  _globals['_CHUNKHASHRESPONSE']._serialized_end=364
-  _globals['_RANGEREQUEST']._serialized_start=366
-  _globals['_RANGEREQUEST']._serialized_end=398
-  _globals['_KEYVALUE']._serialized_start=401
-  _globals['_KEYVALUE']._serialized_end=646
+  _globals['_CONSISTENCY']._serialized_start=1895
+  _globals['_CONSISTENCY']._serialized_end=1938
+  _globals['_PUTREQUEST']._serialized_start=17
+  _globals['_PUTREQUEST']._serialized_end=173
+  _globals['_REPLICATEREQUEST']._serialized_start=176
+  _globals['_REPLICATEREQUEST']._serialized_end=321
+  _globals['_PUTRESPONSE']._serialized_start=323
+  _globals['_PUTRESPONSE']._serialized_end=365
+  _globals['_REPLICATEBATCHREQUEST']._serialized_start=367
+  _globals['_REPLICATEBATCHREQUEST']._serialized_end=427
+  _globals['_REPLICATEBATCHRESPONSE']._serialized_start=429
+  _globals['_REPLICATEBATCHRESPONSE']._serialized_end=470
+  _globals['_GETREQUEST']._serialized_start=472
+  _globals['_GETREQUEST']._serialized_end=555
+  _globals['_DELETEREQUEST']._serialized_start=557
+  _globals['_DELETEREQUEST']._serialized_end=606
+  _globals['_GETRESPONSE']._serialized_start=609
+  _globals['_GETRESPONSE']._serialized_end=745
+  _globals['_MULTIGETREQUEST']._serialized_start=747
+  _globals['_MULTIGETREQUEST']._serialized_end=798
+  _globals['_MULTIGETRESPONSE']._serialized_start=800
+  _globals['_MULTIGETRESPONSE']._serialized_end=850
+  _globals['_BATCHPUTREQUEST']._serialized_start=852
+  _globals['_BATCHPUTREQUEST']._serialized_end=900
+  _globals['_BATCHPUTRESPONSE']._serialized_start=902
+  _globals['_BATCHPUTRESPONSE']._serialized_end=948
+  _globals['_PUTSTREAMRECORD']._serialized_start=950
+  _globals['_PUTSTREAMRECORD']._serialized_end=1010
+  _globals['_PUTSTREAMACK']._serialized_start=1012
+  _globals['_PUTSTREAMACK']._serialized_end=1065
+  _globals['_KEYVALUEPAIR']._serialized_start=1068
+  _globals['_KEYVALUEPAIR']._serialized_end=1209
+  _globals['_CHUNKREQUEST']._serialized_start=1211
+  _globals['_CHUNKREQUEST']._serialized_end=1243
+  _globals['_CHUNKHASHRESPONSE']._serialized_start=1245
+  _globals['_CHUNKHASHRESPONSE']._serialized_end=1278
+  _globals['_RANGEREQUEST']._serialized_start=1280
+  _globals['_RANGEREQUEST']._serialized_end=1335
+  _globals['_MERKLEREQUEST']._serialized_start=1337
+  _globals['_MERKLEREQUEST']._serialized_end=1402
+  _globals['_MERKLERESPONSE']._serialized_start=1404
+  _globals['_MERKLERESPONSE']._serialized_end=1436
+  _globals['_LEAFREQUEST']._serialized_start=1438
+  _globals['_LEAFREQUEST']._serialized_end=1510
+  _globals['_SCANREQUEST']._serialized_start=1512
+  _globals['_SCANREQUEST']._serialized_end=1624
+  _globals['_SCANITEM']._serialized_start=1626
+  _globals['_SCANITEM']._serialized_end=1722
+  _globals['_SNAPSHOTREQUEST']._serialized_start=1724
+  _globals['_SNAPSHOTREQUEST']._serialized_end=1785
+  _globals['_SNAPSHOTBLOCK']._serialized_start=1787
+  _globals['_SNAPSHOTBLOCK']._serialized_end=1893
+  _globals['_KEYVALUE']._serialized_start=1941
+  _globals['_KEYVALUE']._serialized_end=2681
 # @@protoc_insertion_point(module_scope)
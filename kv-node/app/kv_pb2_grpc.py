@@ -44,11 +44,36 @@ class KeyValueStub(object):
                 request_serializer=kv__pb2.GetRequest.SerializeToString,
                 response_deserializer=kv__pb2.GetResponse.FromString,
                 _registered_method=True)
+        self.MultiGet = channel.unary_unary(
+                '/kv.KeyValue/MultiGet',
+                request_serializer=kv__pb2.MultiGetRequest.SerializeToString,
+                response_deserializer=kv__pb2.MultiGetResponse.FromString,
+                _registered_method=True)
+        self.BatchPut = channel.unary_unary(
+                '/kv.KeyValue/BatchPut',
+                request_serializer=kv__pb2.BatchPutRequest.SerializeToString,
+                response_deserializer=kv__pb2.BatchPutResponse.FromString,
+                _registered_method=True)
+        self.PutStream = channel.stream_stream(
+                '/kv.KeyValue/PutStream',
+                request_serializer=kv__pb2.PutStreamRecord.SerializeToString,
+                response_deserializer=kv__pb2.PutStreamAck.FromString,
+                _registered_method=True)
+        self.Delete = channel.unary_unary(
+                '/kv.KeyValue/Delete',
+                request_serializer=kv__pb2.DeleteRequest.SerializeToString,
+                response_deserializer=kv__pb2.PutResponse.FromString,
+                _registered_method=True)
         self.Replicate = channel.unary_unary(
                 '/kv.KeyValue/Replicate',
-                request_serializer=kv__pb2.PutRequest.SerializeToString,
+                request_serializer=kv__pb2.ReplicateRequest.SerializeToString,
                 response_deserializer=kv__pb2.PutResponse.FromString,
                 _registered_method=True)
+        self.ReplicateBatch = channel.unary_unary(
+                '/kv.KeyValue/ReplicateBatch',
+                request_serializer=kv__pb2.ReplicateBatchRequest.SerializeToString,
+                response_deserializer=kv__pb2.ReplicateBatchResponse.FromString,
+                _registered_method=True)
         self.GetChunkHash = channel.unary_unary(
                 '/kv.KeyValue/GetChunkHash',
                 request_serializer=kv__pb2.ChunkRequest.SerializeToString,
@@ -59,6 +84,26 @@ class KeyValueStub(object):
                 request_serializer=kv__pb2.RangeRequest.SerializeToString,
                 response_deserializer=kv__pb2.KeyValuePair.FromString,
                 _registered_method=True)
+        self.GetMerkleNodes = channel.unary_unary(
+                '/kv.KeyValue/GetMerkleNodes',
+                request_serializer=kv__pb2.MerkleRequest.SerializeToString,
+                response_deserializer=kv__pb2.MerkleResponse.FromString,
+                _registered_method=True)
+        self.FetchLeaves = channel.unary_stream(
+                '/kv.KeyValue/FetchLeaves',
+                request_serializer=kv__pb2.LeafRequest.SerializeToString,
+                response_deserializer=kv__pb2.KeyValuePair.FromString,
+                _registered_method=True)
+        self.Scan = channel.unary_stream(
+                '/kv.KeyValue/Scan',
+                request_serializer=kv__pb2.ScanRequest.SerializeToString,
+                response_deserializer=kv__pb2.ScanItem.FromString,
+                _registered_method=True)
+        self.Snapshot = channel.unary_stream(
+                '/kv.KeyValue/Snapshot',
+                request_serializer=kv__pb2.SnapshotRequest.SerializeToString,
+                response_deserializer=kv__pb2.SnapshotBlock.FromString,
+                _registered_method=True)
 
 
 class KeyValueServicer(object):
@@ -76,12 +121,42 @@ class KeyValueServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def MultiGet(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchPut(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def PutStream(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Delete(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def Replicate(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ReplicateBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def GetChunkHash(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -94,6 +169,30 @@ class KeyValueServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetMerkleNodes(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def FetchLeaves(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Scan(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Snapshot(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_KeyValueServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -107,11 +206,36 @@ def add_KeyValueServicer_to_server(servicer, server):
                     request_deserializer=kv__pb2.GetRequest.FromString,
                     response_serializer=kv__pb2.GetResponse.SerializeToString,
             ),
+            'MultiGet': grpc.unary_unary_rpc_method_handler(
+                    servicer.MultiGet,
+                    request_deserializer=kv__pb2.MultiGetRequest.FromString,
+                    response_serializer=kv__pb2.MultiGetResponse.SerializeToString,
+            ),
+            'BatchPut': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchPut,
+                    request_deserializer=kv__pb2.BatchPutRequest.FromString,
+                    response_serializer=kv__pb2.BatchPutResponse.SerializeToString,
+            ),
+            'PutStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.PutStream,
+                    request_deserializer=kv__pb2.PutStreamRecord.FromString,
+                    response_serializer=kv__pb2.PutStreamAck.SerializeToString,
+            ),
+            'Delete': grpc.unary_unary_rpc_method_handler(
+                    servicer.Delete,
+                    request_deserializer=kv__pb2.DeleteRequest.FromString,
+                    response_serializer=kv__pb2.PutResponse.SerializeToString,
+            ),
             'Replicate': grpc.unary_unary_rpc_method_handler(
                     servicer.Replicate,
-                    request_deserializer=kv__pb2.PutRequest.FromString,
+                    request_deserializer=kv__pb2.ReplicateRequest.FromString,
                     response_serializer=kv__pb2.PutResponse.SerializeToString,
             ),
+            'ReplicateBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.ReplicateBatch,
+                    request_deserializer=kv__pb2.ReplicateBatchRequest.FromString,
+                    response_serializer=kv__pb2.ReplicateBatchResponse.SerializeToString,
+            ),
             'GetChunkHash': grpc.unary_unary_rpc_method_handler(
                     servicer.GetChunkHash,
                     request_deserializer=kv__pb2.ChunkRequest.FromString,
@@ -122,6 +246,26 @@ def add_KeyValueServicer_to_server(servicer, server):
                     request_deserializer=kv__pb2.RangeRequest.FromString,
                     response_serializer=kv__pb2.KeyValuePair.SerializeToString,
             ),
+            'GetMerkleNodes': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetMerkleNodes,
+                    request_deserializer=kv__pb2.MerkleRequest.FromString,
+                    response_serializer=kv__pb2.MerkleResponse.SerializeToString,
+            ),
+            'FetchLeaves': grpc.unary_stream_rpc_method_handler(
+                    servicer.FetchLeaves,
+                    request_deserializer=kv__pb2.LeafRequest.FromString,
+                    response_serializer=kv__pb2.KeyValuePair.SerializeToString,
+            ),
+            'Scan': grpc.unary_stream_rpc_method_handler(
+                    servicer.Scan,
+                    request_deserializer=kv__pb2.ScanRequest.FromString,
+                    response_serializer=kv__pb2.ScanItem.SerializeToString,
+            ),
+            'Snapshot': grpc.unary_stream_rpc_method_handler(
+                    servicer.Snapshot,
+                    request_deserializer=kv__pb2.SnapshotRequest.FromString,
+                    response_serializer=kv__pb2.SnapshotBlock.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'kv.KeyValue', rpc_method_handlers)
@@ -187,6 +331,114 @@ class KeyValue(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def MultiGet(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/kv.KeyValue/MultiGet',
+            kv__pb2.MultiGetRequest.SerializeToString,
+            kv__pb2.MultiGetResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BatchPut(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/kv.KeyValue/BatchPut',
+            kv__pb2.BatchPutRequest.SerializeToString,
+            kv__pb2.BatchPutResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def PutStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/kv.KeyValue/PutStream',
+            kv__pb2.PutStreamRecord.SerializeToString,
+            kv__pb2.PutStreamAck.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Delete(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/kv.KeyValue/Delete',
+            kv__pb2.DeleteRequest.SerializeToString,
+            kv__pb2.PutResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def Replicate(request,
             target,
@@ -202,7 +454,7 @@ class KeyValue(object):
             request,
             target,
             '/kv.KeyValue/Replicate',
-            kv__pb2.PutRequest.SerializeToString,
+            kv__pb2.ReplicateRequest.SerializeToString,
             kv__pb2.PutResponse.FromString,
             options,
             channel_credentials,
@@ -214,6 +466,33 @@ class KeyValue(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def ReplicateBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/kv.KeyValue/ReplicateBatch',
+            kv__pb2.ReplicateBatchRequest.SerializeToString,
+            kv__pb2.ReplicateBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def GetChunkHash(request,
             target,
@@ -267,3 +546,111 @@ class KeyValue(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def GetMerkleNodes(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/kv.KeyValue/GetMerkleNodes',
+            kv__pb2.MerkleRequest.SerializeToString,
+            kv__pb2.MerkleResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def FetchLeaves(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/kv.KeyValue/FetchLeaves',
+            kv__pb2.LeafRequest.SerializeToString,
+            kv__pb2.KeyValuePair.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Scan(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/kv.KeyValue/Scan',
+            kv__pb2.ScanRequest.SerializeToString,
+            kv__pb2.ScanItem.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Snapshot(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/kv.KeyValue/Snapshot',
+            kv__pb2.SnapshotRequest.SerializeToString,
+            kv__pb2.SnapshotBlock.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,169 @@
+import os
+import struct
+import threading
+import zlib
+
+
+# On-disk record shared by the append-only backends (LSM write-ahead log
+# and sorted runs, Bitcask segments):
+#
+#   crc32 | flags | key_len | value_len | modified_at | [expires_at] | key | value
+#
+# crc32 covers everything after itself, so a torn write at the tail of a
+# log is detected and ignored on replay. expires_at is only present on
+# records with FLAG_EXPIRES, so records written before TTLs still read.
+
+HEADER = struct.Struct("<IBIIq")
+EXPIRES = struct.Struct("<q")
+READ_SIZE = 1 << 20
+
+FLAG_TOMBSTONE = 0x01    # a delete: no value bytes, decoded as value None
+FLAG_EXPIRES = 0x02      # a TTL: expires_at follows the header
+
+
+def record_size(key: str, value, expires_at=None) -> int:
+    return (
+        HEADER.size
+        + (EXPIRES.size if expires_at is not None else 0)
+        + len(key.encode("utf-8"))
+        + (len(value) if value is not None else 0)
+    )
+
+
+def encode_record(key: str, value, modified_at: int, flags: int = 0, expires_at=None) -> bytes:
+    key_bytes = key.encode("utf-8")
+    if value is None:
+        value = b""
+        flags |= FLAG_TOMBSTONE
+    expires = b""
+    if expires_at is not None:
+        expires = EXPIRES.pack(expires_at)
+        flags |= FLAG_EXPIRES
+    body = b"".join((
+        HEADER.pack(0, flags, len(key_bytes), len(value), modified_at)[4:],
+        expires,
+        key_bytes,
+        value,
+    ))
+    return struct.pack("<I", zlib.crc32(body)) + body
+
+
+def decode_record(buf, offset=0):
+    """
+    Decode the record starting at `offset`. Returns
+    (key, value, modified_at, expires_at, flags, next_offset), or None when
+    the buffer ends mid-record or the checksum does not match. expires_at
+    is None for a record without a TTL.
+    """
+    if len(buf) - offset < HEADER.size:
+        return None
+
+    crc, flags, key_len, value_len, modified_at = HEADER.unpack_from(buf, offset)
+    key_start = offset + HEADER.size
+    expires_at = None
+    if flags & FLAG_EXPIRES:
+        if len(buf) - key_start < EXPIRES.size:
+            return None
+        (expires_at,) = EXPIRES.unpack_from(buf, key_start)
+        key_start += EXPIRES.size
+    end = key_start + key_len + value_len
+    if end > len(buf) or zlib.crc32(buf[offset + 4:end]) != crc:
+        return None
+
+    key = bytes(buf[key_start:key_start + key_len]).decode("utf-8")
+    value = None if flags & FLAG_TOMBSTONE else bytes(buf[key_start + key_len:end])
+    return key, value, modified_at, expires_at, flags, end
+
+
+def iter_records(path, end=None):
+    """
+    Yield (offset, key, value, modified_at, expires_at, flags) for every
+    intact record of a log file (up to byte `end`), stopping at the first
+    torn or corrupt one.
+    """
+    if not os.path.exists(path):
+        return
+
+    with open(path, "rb") as f:
+        yield from iter_fd_records(f.fileno(), end)
+
+
+def iter_fd_records(fd, end=None, start=0):
+    """
+    Same as iter_records on an already open descriptor, from byte `start`
+    (which must be a record boundary). Reads go through pread in READ_SIZE
+    pieces, so the file is never loaded whole and the descriptor's
+    position is untouched.
+    """
+    if end is None:
+        end = os.fstat(fd).st_size
+
+    base = start
+    buf = b""
+    while True:
+        want = min(READ_SIZE, end - base - len(buf))
+        piece = os.pread(fd, want, base + len(buf)) if want > 0 else b""
+        buf += piece
+
+        offset = 0
+        while True:
+            record = decode_record(buf, offset)
+            if record is None:
+                break
+            key, value, modified_at, expires_at, flags, next_offset = record
+            yield base + offset, key, value, modified_at, expires_at, flags
+            offset = next_offset
+
+        if not piece:
+            return
+        buf = buf[offset:]
+        base += offset
+
+
+def read_record_at(fd, offset, size):
+    """
+    One pread of a record whose location and size are already known.
+    """
+    record = decode_record(os.pread(fd, size, offset))
+    if record is None:
+        raise IOError(f"corrupt record at offset {offset}")
+    return record
+
+
+class SharedFile:
+    """
+    Read-only file that lookups and scans share with the compaction or
+    merge that replaces it. retire() closes it once the last reader has
+    released it, so a read in flight never sees its descriptor closed or
+    reused. Readers acquire it under the owner's lock, where they find it.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._refs = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def acquire(self):
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            if self._retired and self._refs == 0:
+                self._file.close()
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            if self._refs == 0:
+                self._file.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
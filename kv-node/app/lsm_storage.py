@@ -0,0 +1,638 @@
+import bisect
+import hashlib
+import heapq
+import os
+import struct
+import threading
+import time
+
+try:
+    from interfaces import StorageBackend, lww_version
+    from value_codec import CODEC_NONE, as_bytes
+    from log_records import encode_record, decode_record, iter_records, iter_fd_records, SharedFile
+    from chunking import (
+        CHUNK_COUNT,
+        LEAF_COUNT,
+        chunk_for_key,
+        leaf_for_key,
+        combine_digest,
+        entry_digest,
+        sum_digests,
+        digest_to_bytes,
+    )
+except ImportError:
+    from app.interfaces import StorageBackend, lww_version
+    from app.value_codec import CODEC_NONE, as_bytes
+    from app.log_records import encode_record, decode_record, iter_records, iter_fd_records, SharedFile
+    from app.chunking import (
+        CHUNK_COUNT,
+        LEAF_COUNT,
+        chunk_for_key,
+        leaf_for_key,
+        combine_digest,
+        entry_digest,
+        sum_digests,
+        digest_to_bytes,
+    )
+
+
+MEMTABLE_LIMIT = 4 << 20       # bytes buffered in the memtable before it is flushed
+COMPACTION_TRIGGER = 4         # sorted runs on disk that wake the compactor
+INDEX_INTERVAL = 16            # records between sparse index entries
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+
+WAL_NAME = "wal.log"
+RUN_PREFIX = "run-"
+RUN_SUFFIX = ".sst"
+
+# data_end, index_offset, bloom_offset, record_count, magic
+FOOTER = struct.Struct("<QQQQI")
+FOOTER_MAGIC = 0x4B56534C      # "KVSL"
+BASE_MAGIC = 0x4B565342        # "KVSB": a compaction output that replaces every lower run
+
+
+class BloomFilter:
+
+    def __init__(self, bit_count, bits=None):
+        self.bit_count = max(8, bit_count)
+        self.bits = bits if bits is not None else bytearray((self.bit_count + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bit_count for i in range(BLOOM_HASHES)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def might_contain(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def to_bytes(self):
+        return struct.pack("<I", self.bit_count) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, raw):
+        (bit_count,) = struct.unpack_from("<I", raw)
+        return cls(bit_count, bytearray(raw[4:]))
+
+
+class SortedRun:
+    """
+    Immutable sorted file: records in key order, then a sparse index (every
+    INDEX_INTERVAL-th key and its offset), a bloom filter and a footer.
+    The index and bloom filter stay in memory; a point lookup is at most
+    one pread of a single index block.
+
+    Readers outside the store's lock acquire() the run and release() it
+    when done; close() waits for them before closing the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = SharedFile(path)
+        fd = self._file.fileno()
+
+        size = os.fstat(fd).st_size
+        data_end, index_offset, bloom_offset, self.record_count, magic = FOOTER.unpack(
+            os.pread(fd, FOOTER.size, size - FOOTER.size)
+        )
+        if magic not in (FOOTER_MAGIC, BASE_MAGIC):
+            raise IOError(f"{path} is not a sorted run")
+        self.base = magic == BASE_MAGIC
+        self.data_end = data_end
+
+        raw_index = os.pread(fd, bloom_offset - index_offset, index_offset)
+        self._index_keys = []
+        self._index_offsets = []
+        pos = 0
+        while pos < len(raw_index):
+            key_len, offset = struct.unpack_from("<IQ", raw_index, pos)
+            pos += 12
+            self._index_keys.append(raw_index[pos:pos + key_len].decode("utf-8"))
+            self._index_offsets.append(offset)
+            pos += key_len
+
+        self._bloom = BloomFilter.from_bytes(
+            os.pread(fd, size - FOOTER.size - bloom_offset, bloom_offset)
+        )
+
+    @staticmethod
+    def write(path, items, count, base=False):
+        """
+        Write sorted (key, value, modified_at, expires_at) items to `path`
+        atomically. `count` sizes the bloom filter. A base run holds
+        everything of the runs numbered below it, which are deleted when it
+        is opened.
+        """
+        tmp_path = path + ".tmp"
+        bloom = BloomFilter(max(count, 1) * BLOOM_BITS_PER_KEY)
+        index = []
+        written = 0
+
+        with open(tmp_path, "wb") as f:
+            offset = 0
+            for key, value, modified_at, expires_at in items:
+                if written % INDEX_INTERVAL == 0:
+                    index.append((key, offset))
+                record = encode_record(key, value, modified_at, expires_at=expires_at)
+                f.write(record)
+                bloom.add(key)
+                offset += len(record)
+                written += 1
+
+            data_end = offset
+            for key, key_offset in index:
+                key_bytes = key.encode("utf-8")
+                f.write(struct.pack("<IQ", len(key_bytes), key_offset) + key_bytes)
+                offset += 12 + len(key_bytes)
+
+            bloom_offset = offset
+            f.write(bloom.to_bytes())
+            f.write(FOOTER.pack(data_end, data_end, bloom_offset, written, BASE_MAGIC if base else FOOTER_MAGIC))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        if not self._bloom.might_contain(key):
+            return None
+
+        i = bisect.bisect_right(self._index_keys, key) - 1
+        if i < 0:
+            return None
+
+        start = self._index_offsets[i]
+        end = self._index_offsets[i + 1] if i + 1 < len(self._index_offsets) else self.data_end
+        block = os.pread(self._file.fileno(), end - start, start)
+
+        offset = 0
+        while True:
+            record = decode_record(block, offset)
+            if record is None:
+                return None
+            found_key, value, modified_at, expires_at, _, offset = record
+            if found_key == key:
+                return (value, modified_at, expires_at)
+            if found_key > key:
+                return None
+
+    def acquire(self):
+        self._file.acquire()
+        return self
+
+    def release(self):
+        self._file.release()
+
+    def close(self):
+        self._file.retire()
+
+    def records(self):
+        for _, key, value, modified_at, expires_at, _ in iter_fd_records(self._file.fileno(), self.data_end):
+            yield key, value, modified_at, expires_at
+
+    def records_from(self, start):
+        """
+        Records with key >= `start`, reading from the index block that
+        holds it rather than from the top of the file.
+        """
+        i = bisect.bisect_right(self._index_keys, start) - 1
+        offset = self._index_offsets[i] if i >= 0 else 0
+        records = iter_fd_records(self._file.fileno(), self.data_end, offset)
+        for _, key, value, modified_at, expires_at, _ in records:
+            if key >= start:
+                yield key, value, modified_at, expires_at
+
+
+def _entry_bytes(key, value):
+    # rough memtable footprint of one entry
+    return len(key) + (len(value) if value is not None else 0) + 16
+
+
+def _newer(value, modified_at, current):
+    return current is None or (
+        lww_version(modified_at, value is None) > lww_version(current[1], current[0] is None)
+    )
+
+
+def _expired(value, expires_at, now):
+    return value is not None and expires_at is not None and expires_at <= now
+
+
+def _purgeable(value, modified_at, expires_at, purge_before):
+    # a tombstone left by an expired TTL counts from its expires_at
+    return value is None and modified_at < purge_before and (expires_at is None or expires_at < purge_before)
+
+
+def _ranked(items, rank):
+    for item in items:
+        yield item[0], rank, item
+
+
+def merge_sorted(streams):
+    """
+    Merge key-sorted (key, value, modified_at, ...) streams given oldest
+    first; for a key present in several streams the newest stream wins.
+    """
+    ranked = [_ranked(stream, -rank) for rank, stream in enumerate(streams)]
+    last = None
+    for key, _, item in heapq.merge(*ranked):
+        if key == last:
+            continue
+        last = key
+        yield item
+
+
+def _drop_tombstones(items, purge_before, purged):
+    for key, value, modified_at, expires_at in items:
+        if _purgeable(value, modified_at, expires_at, purge_before):
+            purged.append((key, modified_at))
+            continue
+        yield key, value, modified_at, expires_at
+
+
+class LSMStorage(StorageBackend):
+    """
+    Log-structured merge tree: puts append to a write-ahead log and land in
+    an in-memory memtable; full memtables are flushed as immutable sorted
+    runs, which a background thread compacts into one.
+    """
+
+    def __init__(
+        self,
+        data_dir,
+        memtable_limit=MEMTABLE_LIMIT,
+        compaction_trigger=COMPACTION_TRIGGER,
+        background_compaction=True
+    ):
+        self.data_dir = data_dir
+        self.memtable_limit = memtable_limit
+        self.compaction_trigger = compaction_trigger
+        os.makedirs(data_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        self._memtable = {}
+        self._memtable_bytes = 0
+        self._runs = []
+        self._next_seq = 0
+        self._digests = {}
+        # min-heap of (expires_at, key, modified_at), rebuilt on startup;
+        # entries that were overwritten since are skipped when they come up
+        self._expiry = []
+
+        self._open_runs()
+        self._replay_wal()
+        self._wal = open(self._wal_path(), "ab")
+        self._rebuild_indexes()
+
+        self._closed = False
+        self._compaction_wanted = threading.Event()
+        self._compactor = None
+        if background_compaction:
+            self._compactor = threading.Thread(target=self._compaction_loop, daemon=True)
+            self._compactor.start()
+
+    # ---------- startup ----------
+
+    def _wal_path(self):
+        return os.path.join(self.data_dir, WAL_NAME)
+
+    def _run_path(self, seq):
+        return os.path.join(self.data_dir, f"{RUN_PREFIX}{seq:08d}{RUN_SUFFIX}")
+
+    def _open_runs(self):
+        seqs = []
+        for name in os.listdir(self.data_dir):
+            if name.endswith(".tmp"):
+                # unfinished flush or compaction output
+                os.remove(os.path.join(self.data_dir, name))
+            elif name.startswith(RUN_PREFIX) and name.endswith(RUN_SUFFIX):
+                seqs.append(int(name[len(RUN_PREFIX):-len(RUN_SUFFIX)]))
+
+        for seq in sorted(seqs):
+            run = SortedRun(self._run_path(seq))
+            if run.base:
+                # a compaction committed before its inputs were all removed
+                for older in self._runs:
+                    older.close()
+                    os.remove(older.path)
+                self._runs = []
+            self._runs.append(run)
+        self._next_seq = (max(seqs) + 1) if seqs else 0
+
+    def _replay_wal(self):
+        for _, key, value, modified_at, expires_at, _ in iter_records(self._wal_path()):
+            if _newer(value, modified_at, self._memtable.get(key)):
+                self._memtable[key] = (value, modified_at, expires_at)
+                self._memtable_bytes += _entry_bytes(key, value)
+
+    def _rebuild_indexes(self):
+        for key, value, modified_at, expires_at in self._items():
+            leaves = self._leaves(chunk_for_key(key))
+            leaf_id = leaf_for_key(key)
+            leaves[leaf_id] = combine_digest(leaves[leaf_id], entry_digest(key, value, modified_at))
+            if value is not None and expires_at is not None:
+                self._expiry.append((expires_at, key, modified_at))
+        heapq.heapify(self._expiry)
+
+    def _leaves(self, chunk_id):
+        leaves = self._digests.get(chunk_id)
+        if leaves is None:
+            leaves = self._digests[chunk_id] = [0] * LEAF_COUNT
+        return leaves
+
+    # ---------- writes ----------
+
+    def put(self, key: str, value, modified_at: int) -> bool:
+        return self.put_many([(key, value, modified_at)]) == 1
+
+    def put_many(self, items) -> int:
+        return self._put_records((key, value, modified_at, None) for key, value, modified_at in items)
+
+    def put_expiring(self, key: str, value, modified_at: int, expires_at: int) -> bool:
+        with self._lock:
+            if not self._put_records([(key, value, modified_at, expires_at)]):
+                return False
+            heapq.heappush(self._expiry, (expires_at, key, modified_at))
+            return True
+
+    def _put_records(self, items) -> int:
+        with self._lock:
+            accepted = {}
+            records = []
+            for key, value, modified_at, expires_at in items:
+                value = as_bytes(value)
+                if not _newer(value, modified_at, accepted.get(key) or self._lookup(key)):
+                    continue
+                accepted[key] = (value, modified_at, expires_at)
+                records.append((key, value, modified_at, expires_at))
+
+            if not records:
+                return 0
+
+            # one sequential append for the whole batch
+            self._wal.write(b"".join(
+                encode_record(key, value, modified_at, expires_at=expires_at)
+                for key, value, modified_at, expires_at in records
+            ))
+            self._wal.flush()
+
+            for key, value, modified_at, expires_at in records:
+                previous = self._lookup(key)
+                self._memtable[key] = (value, modified_at, expires_at)
+                self._memtable_bytes += _entry_bytes(key, value)
+
+                leaves = self._leaves(chunk_for_key(key))
+                leaf_id = leaf_for_key(key)
+                leaves[leaf_id] = combine_digest(
+                    leaves[leaf_id],
+                    entry_digest(key, value, modified_at),
+                    entry_digest(key, previous[0], previous[1]) if previous else 0
+                )
+
+            if self._memtable_bytes >= self.memtable_limit:
+                self._flush_memtable()
+
+            return len(records)
+
+    def _flush_memtable(self):
+        if not self._memtable:
+            return
+
+        path = self._run_path(self._next_seq)
+        self._next_seq += 1
+        SortedRun.write(path, sorted((k, *entry) for k, entry in self._memtable.items()), len(self._memtable))
+        self._runs.append(SortedRun(path))
+
+        self._memtable = {}
+        self._memtable_bytes = 0
+        self._wal.close()
+        self._wal = open(self._wal_path(), "wb")
+
+        if len(self._runs) >= self.compaction_trigger:
+            self._compaction_wanted.set()
+
+    def flush(self):
+        with self._lock:
+            self._flush_memtable()
+
+    # ---------- compaction ----------
+
+    def _compaction_loop(self):
+        while True:
+            self._compaction_wanted.wait()
+            self._compaction_wanted.clear()
+            if self._closed:
+                return
+            self.compact()
+
+    def compact(self, purge_before=None):
+        """
+        Merge every current sorted run into one. Runs are immutable, so the
+        merge happens without blocking writers; only the swap takes the lock.
+        The output is a base run under a new number: it becomes visible in
+        one rename, and from then on a restart deletes every run below it.
+        A crash at any point therefore loses nothing, and never leaves an
+        input behind without the output that replaced it.
+
+        With purge_before, tombstones older than it are dropped from the
+        output. That is only safe because every run takes part: no older
+        version of the key is left on disk for the tombstone to shadow.
+        Returns the number of tombstones dropped.
+        """
+        with self._compaction_lock:
+            with self._lock:
+                inputs = [run.acquire() for run in self._runs]
+                # numbered before any run flushed during the merge
+                seq = self._next_seq
+                self._next_seq += 1
+            try:
+                if not inputs or (len(inputs) < 2 and not self._has_expired(inputs[0], purge_before)):
+                    return 0
+
+                purged = []
+                records = merge_sorted([run.records() for run in inputs])
+                if purge_before is not None:
+                    records = _drop_tombstones(records, purge_before, purged)
+
+                path = self._run_path(seq)
+                count = sum(run.record_count for run in inputs)
+                SortedRun.write(path, records, count, base=True)
+            finally:
+                for run in inputs:
+                    run.release()
+
+            with self._lock:
+                newer = self._runs[len(inputs):]
+                self._runs = [SortedRun(path)] + newer
+                for key, modified_at in purged:
+                    # a put that landed meanwhile already replaced the
+                    # tombstone's digest with its own
+                    if key in self._memtable or any(run.get(key) is not None for run in newer):
+                        continue
+                    leaves = self._leaves(chunk_for_key(key))
+                    leaf_id = leaf_for_key(key)
+                    leaves[leaf_id] = combine_digest(
+                        leaves[leaf_id],
+                        removed=entry_digest(key, None, modified_at)
+                    )
+
+            for run in inputs:
+                # closed once the reads still using it are done
+                run.close()
+                os.remove(run.path)
+            return len(purged)
+
+    @staticmethod
+    def _has_expired(run, purge_before):
+        if purge_before is None:
+            return False
+        return any(
+            _purgeable(value, modified_at, expires_at, purge_before)
+            for _, value, modified_at, expires_at in run.records()
+        )
+
+    def purge_tombstones(self, older_than: int) -> int:
+        """
+        Drop expired tombstones from the sorted runs with a full compaction.
+        Tombstones still in the memtable go on a later pass, after a flush.
+        """
+        return self.compact(purge_before=older_than)
+
+    def expire(self, now: int, limit: int) -> list:
+        with self._lock:
+            expired = []
+            while self._expiry and self._expiry[0][0] <= now and len(expired) < limit:
+                expires_at, key, modified_at = heapq.heappop(self._expiry)
+                current = self._lookup(key)
+                if current is None or current[1] != modified_at or not _expired(current[0], current[2], now):
+                    continue
+                # the tombstone keeps expires_at, so its grace period runs from then
+                if self._put_records([(key, None, modified_at, expires_at)]):
+                    expired.append(key)
+            return expired
+
+    def close(self):
+        self._closed = True
+        self._compaction_wanted.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._lock:
+            self._wal.close()
+            for run in self._runs:
+                run.close()
+
+    # ---------- reads ----------
+
+    def _lookup(self, key):
+        current = self._memtable.get(key)
+        if current is not None:
+            return current
+        for run in reversed(self._runs):
+            found = run.get(key)
+            if found is not None:
+                return found
+        return None
+
+    def get_with_expiry(self, key: str):
+        with self._lock:
+            found = self._memtable.get(key)
+            runs = [] if found is not None else [run.acquire() for run in self._runs]
+
+        try:
+            for run in reversed(runs):
+                found = run.get(key)
+                if found is not None:
+                    break
+        finally:
+            for run in runs:
+                run.release()
+
+        if found is None:
+            return (None, 0, None)
+        value, modified_at, expires_at = found
+        if _expired(value, expires_at, time.time()):
+            # expired but not swept yet: read it as the tombstone it becomes
+            return (None, modified_at, expires_at)
+        return found
+
+    def _items(self):
+        """
+        Every live (key, value, modified_at, expires_at) in key order,
+        merged across the sorted runs and the memtable.
+        """
+        with self._lock:
+            memtable = sorted((k, *entry) for k, entry in self._memtable.items())
+            runs = [run.acquire() for run in self._runs]
+        try:
+            yield from merge_sorted([run.records() for run in runs] + [memtable])
+        finally:
+            for run in runs:
+                run.release()
+
+    def scan_range(
+        self,
+        start: str,
+        end=None
+    ):
+        with self._lock:
+            memtable = sorted(
+                (k, *entry) for k, entry in self._memtable.items()
+                if k >= start and (end is None or k < end)
+            )
+            runs = [run.acquire() for run in self._runs]
+
+        try:
+            streams = [run.records_from(start) for run in runs] + [memtable]
+            now = time.time()
+            for key, value, modified_at, expires_at in merge_sorted(streams):
+                if end is not None and key >= end:
+                    return
+                if _expired(value, expires_at, now):
+                    value = None
+                yield (key, value, modified_at)
+        finally:
+            for run in runs:
+                run.release()
+
+    def scan_chunk_with_ts(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ):
+        # runs are ordered by key, not chunk: a chunk scan is one merged pass
+        for key, value, modified_at, _ in self._items():
+            if chunk_for_key(key, chunk_count) == chunk_id:
+                yield (key, value, modified_at)
+
+    def scan_chunk_encoded(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ):
+        for key, value, modified_at, expires_at in self._items():
+            if chunk_for_key(key, chunk_count) == chunk_id:
+                yield (key, CODEC_NONE, value, modified_at, expires_at)
+
+    def chunk_digest(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ) -> bytes:
+        if chunk_count != CHUNK_COUNT:
+            return super().chunk_digest(chunk_id, chunk_count)
+
+        with self._lock:
+            return digest_to_bytes(sum_digests(self._digests.get(chunk_id, ())))
+
+    def leaf_digests(
+        self,
+        chunk_id: int
+    ) -> list:
+        with self._lock:
+            return list(self._digests.get(chunk_id) or [0] * LEAF_COUNT)
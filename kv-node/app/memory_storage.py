@@ -1,49 +1,333 @@
+import bisect
+import heapq
+import itertools
+import struct
+import threading
+import time
 import zlib
 from typing import Iterable
 
 try:
-    from interfaces import StorageBackend
+    from interfaces import StorageBackend, lww_version
+    from value_codec import CODEC_NONE, as_bytes
+    from log_records import FLAG_TOMBSTONE, FLAG_EXPIRES, EXPIRES
+    from chunking import (
+        CHUNK_COUNT,
+        LEAF_COUNT,
+        leaf_for_key,
+        combine_digest,
+        entry_digest,
+        sum_digests,
+        digest_to_bytes,
+    )
 except ImportError:
-    from app.interfaces import StorageBackend
+    from app.interfaces import StorageBackend, lww_version
+    from app.value_codec import CODEC_NONE, as_bytes
+    from app.log_records import FLAG_TOMBSTONE, FLAG_EXPIRES, EXPIRES
+    from app.chunking import (
+        CHUNK_COUNT,
+        LEAF_COUNT,
+        leaf_for_key,
+        combine_digest,
+        entry_digest,
+        sum_digests,
+        digest_to_bytes,
+    )
 
 
-class InMemoryStorage(StorageBackend):
+SHARD_COUNT = 32
+SCAN_PAGE_SIZE = 500           # keys copied out of the index per lock hold
+
+
+# An entry is one bytes object: modified_at | flags | [expires_at] | value,
+# with the flags of log_records. Packed, a key's entry costs one object
+# header instead of a tuple, an int and the value's own bytes object.
+ENTRY = struct.Struct("<qB")
+
+
+def _pack(value, modified_at, expires_at):
+    flags = 0
+    if value is None:
+        value = b""
+        flags |= FLAG_TOMBSTONE
+    if expires_at is None:
+        return ENTRY.pack(modified_at, flags) + value
+    return ENTRY.pack(modified_at, flags | FLAG_EXPIRES) + EXPIRES.pack(expires_at) + value
+
+
+def _unpack(entry):
+    """
+    (value, modified_at, expires_at) of a packed entry; value None is a
+    tombstone.
+    """
+    modified_at, flags = ENTRY.unpack_from(entry)
+    start = ENTRY.size
+    expires_at = None
+    if flags & FLAG_EXPIRES:
+        (expires_at,) = EXPIRES.unpack_from(entry, start)
+        start += EXPIRES.size
+    value = None if flags & FLAG_TOMBSTONE else entry[start:]
+    return value, modified_at, expires_at
+
+
+def _expired(entry, now):
+    # entry unpacked
+    value, _, expires_at = entry
+    return value is not None and expires_at is not None and expires_at <= now
+
+
+class _Shard:
+    """
+    One lock stripe. Keys are held per chunk (chunk_id -> {key: entry}),
+    which doubles as the chunk index for anti-entropy scans.
+
+    The stripe's keys in sorted order, for range scans, are `sorted_keys`
+    plus the keys `added` since the last scan; a scan sorts those in, so
+    an insert costs an append instead of a shift of the whole index.
+    """
+    __slots__ = ("lock", "chunks", "digests", "sorted_keys", "added")
 
     def __init__(self):
-        self.data = {}
+        self.lock = threading.Lock()
+        self.chunks = {}
+        self.digests = {}
+        self.sorted_keys = []
+        self.added = []
 
-    def put(self, key: str, value: str, modified_at: int) -> bool:
-        current = self.data.get(key)
+    def key_index(self):
+        # call with the lock held
+        if self.added:
+            # sorted_keys then the sorted additions: two runs, which timsort merges in linear time
+            self.added.sort()
+            self.sorted_keys.extend(self.added)
+            self.sorted_keys.sort()
+            self.added.clear()
+        return self.sorted_keys
 
-        if current and current[1] >= modified_at:
+
+class InMemoryStorage(StorageBackend):
+    """
+    Dict-backed storage, striped over SHARD_COUNT locks so writers to
+    different keys do not contend and the LWW check-then-set is atomic.
+    """
+
+    def __init__(self, shard_count=SHARD_COUNT):
+        self.shard_count = shard_count
+        self.shards = [_Shard() for _ in range(shard_count)]
+        # min-heap of (expires_at, key, modified_at); entries that were
+        # overwritten since are skipped when they come up
+        self._expiry = []
+        self._expiry_lock = threading.Lock()
+
+    def _locate(self, key):
+        # one crc32 per call: the low bits pick the chunk (as chunk_for_key
+        # does), higher bits pick the shard so stripes span every chunk
+        hashed_key = zlib.crc32(key.encode("utf-8"))
+        shard = self.shards[(hashed_key >> 16) % self.shard_count]
+        return shard, hashed_key % CHUNK_COUNT
+
+    def __len__(self):
+        total = 0
+        for shard in self.shards:
+            with shard.lock:
+                total += sum(len(keys) for keys in shard.chunks.values())
+        return total
+
+    def put(self, key: str, value, modified_at: int) -> bool:
+        return self._put(key, as_bytes(value), modified_at, None)
+
+    def put_expiring(self, key: str, value, modified_at: int, expires_at: int) -> bool:
+        if not self._put(key, as_bytes(value), modified_at, expires_at):
             return False
+        with self._expiry_lock:
+            heapq.heappush(self._expiry, (expires_at, key, modified_at))
+        return True
+
+    def _put(self, key, value, modified_at, expires_at):
+        shard, chunk_id = self._locate(key)
+
+        with shard.lock:
+            keys = shard.chunks.get(chunk_id)
+            if keys is None:
+                keys = shard.chunks[chunk_id] = {}
+
+            current = keys.get(key)
+            if current is not None:
+                current = _unpack(current)
+            if current is not None and (
+                lww_version(current[1], current[0] is None)
+                >= lww_version(modified_at, value is None)
+            ):
+                return False
+
+            if current is None:
+                shard.added.append(key)
 
-        self.data[key] = (
-            value,
-            modified_at
-        )
+            removed = entry_digest(key, current[0], current[1]) if current else 0
+            keys[key] = _pack(value, modified_at, expires_at)
+
+            leaves = shard.digests.get(chunk_id)
+            if leaves is None:
+                leaves = shard.digests[chunk_id] = [0] * LEAF_COUNT
+            leaf_id = leaf_for_key(key)
+            leaves[leaf_id] = combine_digest(
+                leaves[leaf_id],
+                entry_digest(key, value, modified_at),
+                removed
+            )
 
         return True
 
-    def get(self, key: str):
-        return self.data.get(
-            key,
-            (None, 0)
-        )
+    def expire(self, now: int, limit: int) -> list:
+        due = []
+        with self._expiry_lock:
+            while self._expiry and self._expiry[0][0] <= now and len(due) < limit:
+                due.append(heapq.heappop(self._expiry))
+
+        expired = []
+        for expires_at, key, modified_at in due:
+            current = self.get_entry(key)
+            if current is None or current[1] != modified_at or not _expired(current, now):
+                continue
+            # the tombstone keeps expires_at, so its grace period runs from then
+            if self._put(key, None, modified_at, expires_at):
+                expired.append(key)
+        return expired
+
+    def get_entry(self, key):
+        """
+        The stored (value, modified_at, expires_at) of `key`, expired or
+        not, or None.
+        """
+        shard, chunk_id = self._locate(key)
+        with shard.lock:
+            entry = shard.chunks.get(chunk_id, {}).get(key)
+        return None if entry is None else _unpack(entry)
+
+    def get_with_expiry(self, key: str):
+        entry = self.get_entry(key)
+        if entry is None:
+            return (None, 0, None)
+        if _expired(entry, time.time()):
+            return (None,) + entry[1:]
+        return entry
+
+    def purge_tombstones(self, older_than: int) -> int:
+        purged = 0
+        for shard in self.shards:
+            with shard.lock:
+                purged_keys = set()
+                for chunk_id, keys in shard.chunks.items():
+                    expired = []
+                    for key, entry in keys.items():
+                        value, modified_at, expires_at = _unpack(entry)
+                        if (
+                            value is None and modified_at < older_than
+                            and (expires_at is None or expires_at < older_than)
+                        ):
+                            expired.append(key)
+                    if not expired:
+                        continue
+                    leaves = shard.digests[chunk_id]
+                    purged_keys.update(expired)
+                    for key in expired:
+                        _, modified_at, _ = _unpack(keys.pop(key))
+                        leaf_id = leaf_for_key(key)
+                        leaves[leaf_id] = combine_digest(
+                            leaves[leaf_id],
+                            removed=entry_digest(key, None, modified_at)
+                        )
+                    purged += len(expired)
+                if purged_keys:
+                    shard.sorted_keys = [key for key in shard.key_index() if key not in purged_keys]
+        return purged
+
+    def scan_range(
+        self,
+        start: str,
+        end=None
+    ):
+        lower = bisect.bisect_left
+        while True:
+            # the next page is within the next SCAN_PAGE_SIZE keys of each stripe
+            heads = []
+            for shard in self.shards:
+                with shard.lock:
+                    index = shard.key_index()
+                    i = lower(index, start)
+                    heads.append(index[i:i + SCAN_PAGE_SIZE])
+            page = list(itertools.islice(heapq.merge(*heads), SCAN_PAGE_SIZE))
+            if end is not None:
+                page = page[:bisect.bisect_left(page, end)]
+            if not page:
+                return
+
+            now = time.time()
+            for key in page:
+                entry = self.get_entry(key)
+                if entry is None:
+                    continue  # purged since the page was copied
+                value = None if _expired(entry, now) else entry[0]
+                yield (key, value, entry[1])
+
+            if len(page) < SCAN_PAGE_SIZE:
+                return
+            lower = bisect.bisect_right
+            start = page[-1]
+
+    def _chunk_entries(self, chunk_id, chunk_count):
+        # (key, value, modified_at, expires_at), copied out one shard at a time
+        for shard in self.shards:
+            with shard.lock:
+                if chunk_count == CHUNK_COUNT:
+                    items = [(key,) + _unpack(entry) for key, entry in shard.chunks.get(chunk_id, {}).items()]
+                else:
+                    items = [
+                        (key,) + _unpack(entry)
+                        for keys in shard.chunks.values()
+                        for key, entry in keys.items()
+                        if zlib.crc32(key.encode("utf-8")) % chunk_count == chunk_id
+                    ]
+
+            yield from items
 
     def scan_chunk_with_ts(
         self,
         chunk_id: int,
         chunk_count: int
     ) -> Iterable:
-        for key, (value, modified_at) in self.data.items():
-            hashed_key = zlib.crc32(
-                key.encode("utf-8")
-            )
+        for key, value, modified_at, _ in self._chunk_entries(chunk_id, chunk_count):
+            yield (key, value, modified_at)
+
+    def scan_chunk_encoded(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ) -> Iterable:
+        for key, value, modified_at, expires_at in self._chunk_entries(chunk_id, chunk_count):
+            yield (key, CODEC_NONE, value, modified_at, expires_at)
 
-            if hashed_key % chunk_count == chunk_id:
-                yield (
-                    key,
-                    value,
-                    modified_at
-                )
+    def chunk_digest(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ) -> bytes:
+        if chunk_count != CHUNK_COUNT:
+            return super().chunk_digest(chunk_id, chunk_count)
+
+        return digest_to_bytes(sum_digests(self.leaf_digests(chunk_id)))
+
+    def leaf_digests(
+        self,
+        chunk_id: int
+    ) -> list:
+        combined = [0] * LEAF_COUNT
+        for shard in self.shards:
+            with shard.lock:
+                leaves = shard.digests.get(chunk_id)
+                if leaves is None:
+                    continue
+                for leaf_id, digest in enumerate(leaves):
+                    if digest:
+                        combined[leaf_id] = combine_digest(combined[leaf_id], digest)
+        return combined
@@ -0,0 +1,62 @@
+try:
+    from chunking import MERKLE_FANOUT, MERKLE_DEPTH, sum_digests, digest_to_bytes
+except ImportError:
+    from app.chunking import MERKLE_FANOUT, MERKLE_DEPTH, sum_digests, digest_to_bytes
+
+
+# Tree layout inside one chunk:
+#   level 0            -> the chunk itself (same value as GetChunkHash)
+#   level d            -> MERKLE_FANOUT ** d nodes
+#   level MERKLE_DEPTH -> the storage-maintained leaves
+# Node `i` at level d has children i*FANOUT .. i*FANOUT+FANOUT-1 at d+1.
+
+
+def level_nodes(leaves, level):
+    """
+    Digests of every node at `level`, folded up from the leaf digests.
+    """
+    span = MERKLE_FANOUT ** (MERKLE_DEPTH - level)
+    return [
+        sum_digests(leaves[i * span:(i + 1) * span])
+        for i in range(MERKLE_FANOUT ** level)
+    ]
+
+
+def node_hashes(leaves, level, indices):
+    nodes = level_nodes(leaves, level)
+    return [digest_to_bytes(nodes[i]) for i in indices]
+
+
+def valid_node_request(level, indices):
+    width = MERKLE_FANOUT ** level if 0 <= level <= MERKLE_DEPTH else 0
+    return all(0 <= i < width for i in indices)
+
+
+def children(index):
+    return range(index * MERKLE_FANOUT, (index + 1) * MERKLE_FANOUT)
+
+
+def differing_leaves(local_leaves, fetch_remote):
+    """
+    Walk down from the chunk root, asking the peer only for the children
+    of nodes that differ. `fetch_remote(level, indices)` must return the
+    peer's node hashes for those indices, in order.
+
+    One round trip per level; returns the leaf ids whose hashes differ.
+    """
+    indices = list(children(0))
+    for level in range(1, MERKLE_DEPTH + 1):
+        local = node_hashes(local_leaves, level, indices)
+        remote = list(fetch_remote(level, indices))
+
+        differing = [
+            index
+            for index, mine, theirs in zip(indices, local, remote)
+            if mine != theirs
+        ]
+        if level == MERKLE_DEPTH or not differing:
+            return differing
+
+        indices = [child for index in differing for child in children(index)]
+
+    return []
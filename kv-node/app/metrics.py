@@ -19,11 +19,11 @@ def get_gauge(name, documentation, labelnames=()):
         return REGISTRY._names_to_collectors.get(name)
 
 
-def get_histogram(name, documentation, labelnames=()):
+def get_histogram(name, documentation, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS):
     if name in REGISTRY._names_to_collectors:
         return REGISTRY._names_to_collectors[name]
     try:
-        return Histogram(name, documentation, labelnames)
+        return Histogram(name, documentation, labelnames, buckets=buckets)
     except Exception:
         return REGISTRY._names_to_collectors.get(name)
 
@@ -60,6 +60,45 @@ grpc_errors = get_counter(
     ["method"]
 )
 
+grpc_inflight = get_gauge(
+    "kv_grpc_inflight",
+    "RPCs in progress on the aio server"
+)
+
+grpc_batch_keys = get_histogram(
+    "kv_grpc_batch_keys",
+    "Keys per MultiGet or BatchPut request",
+    ["method"],
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 5000, 10000)
+)
+
+grpc_channels_open = get_gauge(
+    "kv_grpc_channels_open",
+    "Pooled gRPC channels to peers"
+)
+
+grpc_channels_created = get_counter(
+    "kv_grpc_channels_created_total",
+    "gRPC channels opened to peers"
+)
+
+grpc_channels_evicted = get_counter(
+    "kv_grpc_channels_evicted_total",
+    "Pooled gRPC channels closed"
+)
+
+grpc_channel_ready = get_gauge(
+    "kv_grpc_channel_ready",
+    "Whether the pooled channel to a peer is connected",
+    ["peer"]
+)
+
+grpc_channel_failures = get_counter(
+    "kv_grpc_channel_failures_total",
+    "Times a pooled channel to a peer lost or failed its connection",
+    ["peer"]
+)
+
 # ---- Replication ----
 replication_attempts = get_counter(
     "kv_replication_attempts_total",
@@ -71,6 +110,192 @@ replication_failures = get_counter(
     "Replication failures"
 )
 
+replication_queue_depth = get_gauge(
+    "kv_replication_queue_depth",
+    "Writes waiting in a peer's replication queue",
+    ["peer"]
+)
+
+replication_lag_seconds = get_gauge(
+    "kv_replication_lag_seconds",
+    "Time the oldest write of the last delivered batch spent queued",
+    ["peer"]
+)
+
+replication_batch_size = get_histogram(
+    "kv_replication_batch_size",
+    "Writes per replication batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+
+replication_coalesced = get_counter(
+    "kv_replication_coalesced_total",
+    "Writes folded into a newer queued write to the same key"
+)
+
+replication_queue_full = get_counter(
+    "kv_replication_queue_full_total",
+    "Writes that found a peer's replication queue full",
+    ["peer"]
+)
+
+# ---- Consistency ----
+put_latency = get_histogram(
+    "kv_put_latency_seconds",
+    "Put latency by consistency level, replica acks included",
+    ["consistency"]
+)
+
+put_unavailable = get_counter(
+    "kv_put_unavailable_total",
+    "Puts that did not get the replica acks their consistency level needs",
+    ["consistency"]
+)
+
+get_latency = get_histogram(
+    "kv_get_latency_seconds",
+    "Get latency by consistency level, replica reads included",
+    ["consistency"]
+)
+
+get_unavailable = get_counter(
+    "kv_get_unavailable_total",
+    "Gets that did not hear from the replicas their consistency level needs",
+    ["consistency"]
+)
+
+read_repairs = get_counter(
+    "kv_read_repairs_total",
+    "Stale replicas a QUORUM or ALL read sent the newest version to"
+)
+
+read_hedges = get_counter(
+    "kv_read_hedges_total",
+    "Replica reads sent because another replica was slower than its usual latency"
+)
+
+read_hedge_wins = get_counter(
+    "kv_read_hedge_wins_total",
+    "Hedged replica reads that answered before the replica they were sent for"
+)
+
+read_hedges_throttled = get_counter(
+    "kv_read_hedges_throttled_total",
+    "Hedges not sent because the hedge budget was spent"
+)
+
+read_hedge_delay = get_gauge(
+    "kv_read_hedge_delay_seconds",
+    "How long a read waits for a peer before hedging (its latency percentile)",
+    ["peer"]
+)
+
+# ---- Storage ----
+storage_commits = get_counter(
+    "kv_storage_commits_total",
+    "Storage write transactions committed (one WAL sync each)"
+)
+
+storage_keys_written = get_counter(
+    "kv_storage_keys_written_total",
+    "Keys written by committed storage transactions"
+)
+
+group_commit_batch_size = get_histogram(
+    "kv_storage_group_commit_batch_size",
+    "Keys per group-commit transaction",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+)
+
+group_commit_wait = get_histogram(
+    "kv_storage_group_commit_wait_seconds",
+    "Time a put waits for its group commit"
+)
+
+storage_pages_reclaimed = get_counter(
+    "kv_storage_pages_reclaimed_total",
+    "Free database pages returned to the filesystem by incremental vacuum"
+)
+
+# ---- Deletes & TTL ----
+tombstones_purged = get_counter(
+    "kv_tombstones_purged_total",
+    "Tombstones dropped after their grace period"
+)
+
+tombstone_gc_seconds = get_histogram(
+    "kv_tombstone_gc_seconds",
+    "Duration of one tombstone GC pass"
+)
+
+keys_expired = get_counter(
+    "kv_keys_expired_total",
+    "Values turned into tombstones when their TTL ran out"
+)
+
+# ---- Hinted handoff ----
+hints_stored = get_counter(
+    "kv_hints_stored_total",
+    "Failed replications queued for a later replay"
+)
+
+hints_dropped = get_counter(
+    "kv_hints_dropped_total",
+    "Hints dropped unsent (queue full or too old); anti-entropy repairs them"
+)
+
+hints_replayed = get_counter(
+    "kv_hints_replayed_total",
+    "Hints delivered to their peer"
+)
+
+hints_pending = get_gauge(
+    "kv_hints_pending",
+    "Hints queued per target peer",
+    ["peer"]
+)
+
+# ---- Compression ----
+compression_input_bytes = get_counter(
+    "kv_compression_input_bytes_total",
+    "Value bytes before compression",
+    ["codec"]
+)
+
+compression_output_bytes = get_counter(
+    "kv_compression_output_bytes_total",
+    "Value bytes after compression (ratio = output / input)",
+    ["codec"]
+)
+
+compression_seconds = get_histogram(
+    "kv_compression_cpu_seconds",
+    "Thread CPU time spent compressing or decompressing one value",
+    ["codec", "op"],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+)
+
+# ---- Read cache ----
+cache_hits = get_counter(
+    "kv_cache_hits_total",
+    "Reads served from the storage read cache"
+)
+
+cache_misses = get_counter(
+    "kv_cache_misses_total",
+    "Reads that went to the storage backend"
+)
+
+cache_evictions = get_counter(
+    "kv_cache_evictions_total",
+    "Entries evicted from the storage read cache"
+)
+
+cache_entries = get_gauge(
+    "kv_cache_entries",
+    "Entries currently held by the storage read cache"
+)
+
 # ---- Anti-Entropy ----
 anti_entropy_runs = get_counter(
     "kv_anti_entropy_runs_total",
@@ -82,8 +307,45 @@ anti_entropy_repairs = get_counter(
     "Keys repaired"
 )
 
+anti_entropy_leaves_fetched = get_counter(
+    "kv_anti_entropy_leaves_fetched_total",
+    "Merkle leaves fetched from peers during repair"
+)
+
+# ---- Snapshots ----
+snapshot_bytes_sent = get_counter(
+    "kv_snapshot_bytes_sent_total",
+    "Snapshot bytes streamed to bootstrapping peers"
+)
+
+snapshot_bytes_received = get_counter(
+    "kv_snapshot_bytes_received_total",
+    "Snapshot bytes received while bootstrapping"
+)
+
+snapshot_keys_restored = get_counter(
+    "kv_snapshot_keys_restored_total",
+    "Keys applied from snapshots"
+)
+
+snapshot_restore_seconds = get_histogram(
+    "kv_snapshot_restore_seconds",
+    "Time to fetch, verify and restore a snapshot",
+    buckets=(1, 5, 15, 60, 300, 900, 3600, 10800)
+)
+
 # ----- Gossip -----
 gossip_messages = get_counter(
     "kv_gossip_messages_total",
     "Total gossip messages received"
 )
+
+ring_nodes = get_gauge(
+    "kv_ring_nodes",
+    "Nodes on the consistent-hash ring replicas are placed with"
+)
+
+ring_rebuilds = get_counter(
+    "kv_ring_rebuilds_total",
+    "Times the hash ring was rebuilt after a membership change"
+)
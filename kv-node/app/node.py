@@ -1,12 +1,25 @@
+import asyncio
 import os
 import threading
 import uvicorn
 
-from gossip import start_gossip_loop, membership, app as gossip_app
-from grpc_server import serve_grpc
+from gossip import start_gossip_loop, membership, is_alive, app as gossip_app
+from grpc_server import serve_grpc, send_hints
+from aio_server import serve_grpc_aio
 from anti_entropy import AntiEntropyService
+from tombstone_gc import TombstoneGC
+from expiry import ExpirySweeper
+from snapshot import bootstrap
+from hints import HintStore, HintedHandoff
+from replication import ReplicationPipeline
+from reads import ReplicaReader, PeerLatencies, HedgeBudget
+from channels import channel_pool, channel_options, server_options, compression_from_name
 from storage import SQLiteStorage
+from lsm_storage import LSMStorage
+from bitcask_storage import BitcaskStorage
+from cached_storage import CachedStorage
 from grpc_client import GrpcPeerClient
+from value_codec import CODEC_NONE, codec_from_name
 
 from metrics import node_up
 
@@ -51,6 +64,76 @@ GOSSIP_PEERS = [p for p in GOSSIP_PEERS if p != OWN_GOSSIP_ADDR]
 
 REPLICATION_FACTOR = int(os.environ.get("REPLICATION_FACTOR", "2"))
 
+# storage engine: sqlite | lsm | bitcask
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite").lower()
+
+# SQLite group commit (batch concurrent puts into one transaction)
+GROUP_COMMIT = os.environ.get("GROUP_COMMIT", "false").lower() == "true"
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get("GROUP_COMMIT_WINDOW_MS", "2"))
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", "256"))
+
+# value compression: codec for values of COMPRESS_THRESHOLD bytes or more
+# (none | zlib | zstd; zstd needs the zstandard package). With
+# COMPRESS_REPLICATION=true replicas receive the compressed bytes, so turn
+# it on only once every node runs a build that understands them.
+VALUE_CODEC = codec_from_name(os.environ.get("VALUE_CODEC", "zstd"))
+COMPRESS_THRESHOLD = int(os.environ.get("COMPRESS_THRESHOLD", "1024"))
+COMPRESS_REPLICATION = os.environ.get("COMPRESS_REPLICATION", "false").lower() == "true"
+
+# read cache in front of the storage engine (0 disables it)
+READ_CACHE_ENTRIES = int(os.environ.get("READ_CACHE_ENTRIES", "0"))
+READ_CACHE_NEGATIVE = os.environ.get("READ_CACHE_NEGATIVE", "false").lower() == "true"
+
+# deletes: tombstones are purged once older than the grace period, which
+# must outlast the longest time a replica can be down and still rejoin
+TOMBSTONE_GRACE_SECONDS = int(os.environ.get("TOMBSTONE_GRACE_SECONDS", "86400"))
+TOMBSTONE_GC_INTERVAL = float(os.environ.get("TOMBSTONE_GC_INTERVAL", "600"))
+# a SQLite file created before incremental vacuum only returns purged pages
+# to the filesystem after a one-off full VACUUM at startup (a blocking
+# rewrite that needs the file's size again in free disk)
+SQLITE_CONVERT_AUTO_VACUUM = os.environ.get("SQLITE_CONVERT_AUTO_VACUUM", "false").lower() == "true"
+
+# TTLs (PutRequest.ttl_seconds): seconds between sweeps of expired keys
+EXPIRY_SWEEP_INTERVAL = float(os.environ.get("EXPIRY_SWEEP_INTERVAL", "1"))
+
+# a node that starts with an empty store first copies a peer's snapshot,
+# waiting up to SNAPSHOT_BOOTSTRAP_WAIT seconds for gossip to find one
+SNAPSHOT_BOOTSTRAP = os.environ.get("SNAPSHOT_BOOTSTRAP", "true").lower() == "true"
+SNAPSHOT_BOOTSTRAP_WAIT = float(os.environ.get("SNAPSHOT_BOOTSTRAP_WAIT", "10"))
+
+# hinted handoff: failed replications are queued on disk per peer and
+# replayed once gossip sees the peer again (HINTS_MAX_PER_PEER=0 disables)
+HINTS_MAX_PER_PEER = int(os.environ.get("HINTS_MAX_PER_PEER", "100000"))
+HINT_REPLAY_INTERVAL = float(os.environ.get("HINT_REPLAY_INTERVAL", "5"))
+
+# replication: one sender per peer with a bounded queue of distinct keys;
+# a Put waits up to REPLICATION_ENQUEUE_TIMEOUT_MS for room in a full queue
+REPLICATION_QUEUE_SIZE = int(os.environ.get("REPLICATION_QUEUE_SIZE", "10000"))
+REPLICATION_BATCH_SIZE = int(os.environ.get("REPLICATION_BATCH_SIZE", "128"))
+REPLICATION_ENQUEUE_TIMEOUT_MS = float(os.environ.get("REPLICATION_ENQUEUE_TIMEOUT_MS", "1000"))
+
+# peer channels: one pooled channel per peer, pinged every GRPC_KEEPALIVE_MS
+# when idle and closed once gossip has not heard from the peer for
+# GRPC_CHANNEL_EVICT_AFTER seconds. GRPC_COMPRESSION: none | gzip | deflate
+# (values over COMPRESS_THRESHOLD are already compressed by VALUE_CODEC)
+GRPC_KEEPALIVE_MS = int(os.environ.get("GRPC_KEEPALIVE_MS", "30000"))
+GRPC_MAX_MESSAGE_MB = int(os.environ.get("GRPC_MAX_MESSAGE_MB", "16"))
+GRPC_COMPRESSION = os.environ.get("GRPC_COMPRESSION", "none").lower()
+GRPC_CHANNEL_EVICT_AFTER = float(os.environ.get("GRPC_CHANNEL_EVICT_AFTER", "60"))
+
+# gRPC server: "thread" runs each RPC on one of 20 threads; "aio" serves
+# them from an event loop, with storage work on GRPC_STORAGE_WORKERS
+# threads and at most GRPC_MAX_CONCURRENT_RPCS in flight
+GRPC_SERVER_MODE = os.environ.get("GRPC_SERVER_MODE", "thread").lower()
+GRPC_STORAGE_WORKERS = int(os.environ.get("GRPC_STORAGE_WORKERS", "32"))
+GRPC_MAX_CONCURRENT_RPCS = int(os.environ.get("GRPC_MAX_CONCURRENT_RPCS", "4096"))
+
+# QUORUM/ALL reads: a replica slower than READ_HEDGE_PERCENTILE of its
+# recent reads is hedged to the next replica; READ_HEDGE_BUDGET caps the
+# hedges at that share of reads (0 disables hedging)
+READ_HEDGE_PERCENTILE = int(os.environ.get("READ_HEDGE_PERCENTILE", "95"))
+READ_HEDGE_BUDGET = float(os.environ.get("READ_HEDGE_BUDGET", "0.1"))
+
 
 # ---------------------
 # GOSSIP HTTP SERVER
@@ -71,6 +154,33 @@ def start_gossip_http_server():
     t.start()
     print(f"[gossip] HTTP server running on port {GOSSIP_PORT}")
 
+def create_backend():
+    if STORAGE_BACKEND == "lsm":
+        return LSMStorage(os.path.join(DATA_DIR, "lsm"))
+    if STORAGE_BACKEND == "bitcask":
+        return BitcaskStorage(os.path.join(DATA_DIR, "bitcask"))
+    return SQLiteStorage(
+        os.path.join(DATA_DIR, "node.db"),
+        group_commit=GROUP_COMMIT,
+        group_commit_window=GROUP_COMMIT_WINDOW_MS / 1000.0,
+        group_commit_max_batch=GROUP_COMMIT_MAX_BATCH,
+        codec=VALUE_CODEC,
+        compress_threshold=COMPRESS_THRESHOLD,
+        convert_auto_vacuum=SQLITE_CONVERT_AUTO_VACUUM,
+    )
+
+
+def create_storage():
+    storage = create_backend()
+    if READ_CACHE_ENTRIES > 0:
+        storage = CachedStorage(
+            storage,
+            max_entries=READ_CACHE_ENTRIES,
+            negative_cache=READ_CACHE_NEGATIVE,
+        )
+    return storage
+
+
 def main():    
     print("--- Starting Distributed KV Node ---")
     print(f"Node ID: {OWN_ID}")
@@ -78,7 +188,19 @@ def main():
     print(f"Gossip HTTP port: {GOSSIP_PORT}")
     print(f"Address: {OWN_ADDR}")
     print(f"Data directory: {DATA_DIR}")
+    print(f"Storage backend: {STORAGE_BACKEND}")
     print(f"Replication factor: {REPLICATION_FACTOR}")
+    print(f"Value compression: {f'codec {VALUE_CODEC} from {COMPRESS_THRESHOLD} bytes' if VALUE_CODEC != CODEC_NONE else 'DISABLED'}")
+    print(f"Read cache: {f'{READ_CACHE_ENTRIES} entries' if READ_CACHE_ENTRIES > 0 else 'DISABLED'}")
+    print(f"Tombstone GC: grace {TOMBSTONE_GRACE_SECONDS}s, every {TOMBSTONE_GC_INTERVAL}s")
+    print(f"Expiry sweep: every {EXPIRY_SWEEP_INTERVAL}s")
+    print(f"Snapshot bootstrap: {'ENABLED' if SNAPSHOT_BOOTSTRAP else 'DISABLED'}")
+    print(f"Hinted handoff: {f'{HINTS_MAX_PER_PEER} keys per peer, replay every {HINT_REPLAY_INTERVAL}s' if HINTS_MAX_PER_PEER > 0 else 'DISABLED'}")
+    print(f"Replication queue: {REPLICATION_QUEUE_SIZE} keys per peer, batches of {REPLICATION_BATCH_SIZE}")
+    print(f"gRPC server: {f'aio, {GRPC_STORAGE_WORKERS} storage threads, {GRPC_MAX_CONCURRENT_RPCS} RPCs in flight' if GRPC_SERVER_MODE == 'aio' else 'thread pool'}")
+    print(f"Read hedging: {f'after p{READ_HEDGE_PERCENTILE}, budget {READ_HEDGE_BUDGET:.0%} of reads' if READ_HEDGE_BUDGET > 0 else 'DISABLED'}")
+    print(f"Peer channels: keepalive {GRPC_KEEPALIVE_MS}ms, {GRPC_MAX_MESSAGE_MB} MiB messages, compression {GRPC_COMPRESSION}, evict after {GRPC_CHANNEL_EVICT_AFTER}s")
+    print(f"Group commit: {f'{GROUP_COMMIT_WINDOW_MS}ms / {GROUP_COMMIT_MAX_BATCH} keys' if GROUP_COMMIT else 'DISABLED'}")
     print(f"Peers (gRPC): {PEERS}")
     print(f"Peers (Gossip HTTP): {GOSSIP_PEERS}")
     print(f"Debug logging: {'ENABLED' if DEBUG_LOG else 'DISABLED'}")
@@ -86,7 +208,13 @@ def main():
 
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR, exist_ok=True)
-    storage = SQLiteStorage(os.path.join(DATA_DIR, "node.db"))
+    storage = create_storage()
+
+    max_message_bytes = GRPC_MAX_MESSAGE_MB << 20
+    channel_pool.configure(
+        channel_options(GRPC_KEEPALIVE_MS, max_message_bytes),
+        compression_from_name(GRPC_COMPRESSION),
+    )
     peer_client = GrpcPeerClient()
 
     start_gossip_http_server()
@@ -94,6 +222,8 @@ def main():
     start_gossip_loop(OWN_ID, OWN_ADDR, GOSSIP_PEERS, interval=1.0)
     print("[gossip] Background gossip loop started.")
 
+    channel_pool.start(lambda peer: is_alive(peer, timeout=GRPC_CHANNEL_EVICT_AFTER))
+
     def get_peer_list():
         return [
             info["addr"]
@@ -101,6 +231,14 @@ def main():
             if info.get("addr") != OWN_ADDR
         ]
 
+    if SNAPSHOT_BOOTSTRAP:
+        bootstrap(
+            storage,
+            lambda: PEERS or get_peer_list(),
+            work_dir=DATA_DIR,
+            wait=SNAPSHOT_BOOTSTRAP_WAIT,
+        )
+
     anti_entropy = AntiEntropyService(
         storage=storage,
         peer_client=peer_client,
@@ -111,7 +249,52 @@ def main():
     anti_entropy.start()
     print("[repair] Anti-entropy background loop started.")
 
-    serve_grpc(GRPC_PORT, storage, OWN_ADDR, REPLICATION_FACTOR)
+    TombstoneGC(storage, grace=TOMBSTONE_GRACE_SECONDS, interval=TOMBSTONE_GC_INTERVAL).start()
+    ExpirySweeper(storage, interval=EXPIRY_SWEEP_INTERVAL).start()
+
+    hints = None
+    if HINTS_MAX_PER_PEER > 0:
+        hints = HintStore(os.path.join(DATA_DIR, "hints.db"), max_per_peer=HINTS_MAX_PER_PEER)
+        HintedHandoff(
+            hints,
+            send=send_hints,
+            is_alive=is_alive,
+            interval=HINT_REPLAY_INTERVAL,
+            max_age=TOMBSTONE_GRACE_SECONDS,
+        ).start()
+
+    replicator = ReplicationPipeline(
+        hints=hints,
+        queue_size=REPLICATION_QUEUE_SIZE,
+        batch_size=REPLICATION_BATCH_SIZE,
+        enqueue_timeout=REPLICATION_ENQUEUE_TIMEOUT_MS / 1000.0,
+    )
+
+    grpc_args = dict(
+        replicate_codec=VALUE_CODEC if COMPRESS_REPLICATION else CODEC_NONE,
+        compress_threshold=COMPRESS_THRESHOLD,
+        snapshot_dir=DATA_DIR,
+        hints=hints,
+        replicator=replicator,
+        reader=ReplicaReader(
+            latencies=PeerLatencies(percentile=READ_HEDGE_PERCENTILE),
+            budget=HedgeBudget(ratio=READ_HEDGE_BUDGET),
+        ),
+        is_alive=is_alive,
+        options=server_options(GRPC_KEEPALIVE_MS, max_message_bytes),
+    )
+    if GRPC_SERVER_MODE == "aio":
+        asyncio.run(serve_grpc_aio(
+            GRPC_PORT,
+            storage,
+            OWN_ADDR,
+            REPLICATION_FACTOR,
+            storage_workers=GRPC_STORAGE_WORKERS,
+            max_concurrent_rpcs=GRPC_MAX_CONCURRENT_RPCS,
+            **grpc_args
+        ))
+    else:
+        serve_grpc(GRPC_PORT, storage, OWN_ADDR, REPLICATION_FACTOR, **grpc_args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,300 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+
+try:
+    import kv_pb2
+    from interfaces import lww_version
+    from channels import channel_pool
+    from metrics import read_hedges, read_hedge_wins, read_hedges_throttled, read_hedge_delay
+except ImportError:
+    from app import kv_pb2
+    from app.interfaces import lww_version
+    from app.channels import channel_pool
+    from app.metrics import read_hedges, read_hedge_wins, read_hedges_throttled, read_hedge_delay
+
+
+# failed reads are replaced by spares; set DEBUG_LOG=true to print each one
+DEBUG_LOG = os.environ.get("DEBUG_LOG", "false").lower() == "true"
+
+READ_TIMEOUT = 2         # seconds a read waits for replica answers
+HEDGE_PERCENTILE = 95    # a peer slower than this percentile of its recent reads is hedged
+HEDGE_BUDGET = 0.1       # hedges per read, on average; 0 disables hedging
+HEDGE_BURST = 10         # hedges an unused budget can save up
+LATENCY_WINDOW = 256     # recent reads per peer the percentile is taken over
+LATENCY_MIN_SAMPLES = 20 # reads of a peer before it is hedged
+
+
+def response_value(response):
+    """
+    The bytes of a found GetResponse, whichever way the peer sent them.
+    """
+    if response.WhichOneof("payload") == "value_bytes":
+        return response.value_bytes
+    return response.value.encode("utf-8")
+
+
+def answer_version(answer):
+    # answer: (peer_addr, value, modified_at, expires_at); value None is a
+    # tombstone, or a key the replica never saw when modified_at is 0
+    _, value, modified_at, _ = answer
+    return lww_version(modified_at, value is None)
+
+
+def newest(answers):
+    """
+    The answer last-write-wins keeps, and the answers older than it.
+    """
+    winner = max(answers, key=answer_version)
+    stale = [answer for answer in answers if answer_version(answer) < answer_version(winner)]
+    return winner, stale
+
+
+class PeerLatencies:
+    """
+    Each peer's latest `window` read latencies, for a rolling percentile.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW, percentile=HEDGE_PERCENTILE, min_samples=LATENCY_MIN_SAMPLES):
+        self.window = window
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._samples = {}   # peer_addr -> deque of seconds
+        self._lock = threading.Lock()
+
+    def record(self, peer_addr, seconds):
+        with self._lock:
+            samples = self._samples.get(peer_addr)
+            if samples is None:
+                samples = self._samples[peer_addr] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def hedge_delay(self, peer_addr):
+        """
+        The peer's `percentile` latency in seconds, or None while it has
+        fewer than `min_samples` reads.
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(peer_addr, ()))
+        if len(samples) < self.min_samples:
+            return None
+        delay = samples[min(len(samples) - 1, len(samples) * self.percentile // 100)]
+        read_hedge_delay.labels(peer_addr).set(delay)
+        return delay
+
+
+class HedgeBudget:
+    """
+    Caps hedges at `ratio` of all reads: each read adds `ratio` of a
+    token, up to `burst`, and each hedge spends a whole one.
+    """
+
+    def __init__(self, ratio=HEDGE_BUDGET, burst=HEDGE_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class ReadCollector:
+    """
+    One read across its replicas, updated as the calls complete.
+    """
+
+    def __init__(self):
+        self.answers = []
+        self.in_flight = {}   # peer_addr -> when to hedge it (None: never)
+        self.covers = {}      # hedge peer_addr -> the slow peer it was sent for
+        self.cond = threading.Condition()
+
+    def done(self, peer_addr, answer):
+        # answer None: the call failed
+        with self.cond:
+            self.in_flight.pop(peer_addr, None)
+            if answer is not None:
+                self.answers.append(answer)
+                if self.covers.get(peer_addr) in self.in_flight:
+                    read_hedge_wins.inc()
+            self.cond.notify_all()
+
+
+class ReplicaReader:
+    """
+    Reads one key from several replicas over their pooled channels, for
+    a Get above ONE, a ONE Get on a node that is not one of the key's
+    replicas, and clients reading from the replicas directly. Peers are
+    asked at ONE, so each answers from its own storage.
+
+    Only as many peers as the read needs are asked, in replica order. One
+    that fails is replaced by the next peer at once. One still silent
+    after its `percentile` latency over its recent reads is hedged: the
+    read also goes to the next peer and whichever answers first counts.
+    `budget` caps the extra load hedges add.
+    """
+
+    def __init__(self, pool=channel_pool, timeout=READ_TIMEOUT, latencies=None, budget=None):
+        self.pool = pool
+        self.timeout = timeout
+        self.latencies = latencies if latencies is not None else PeerLatencies()
+        self.budget = budget if budget is not None else HedgeBudget()
+        # read_aio calls still running after their read returned
+        self._tasks = set()
+
+    def read(self, peers, key, needed=None, timeout=None) -> list:
+        """
+        Read `key` from `needed` of `peers` (default: all) and return once
+        they answered, or it is clear they will not. Returns the
+        (peer, value, modified_at, expires_at) answers received by then.
+        """
+        needed = len(peers) if needed is None else needed
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        request = kv_pb2.GetRequest(key=key, want_bytes=True)
+        collector = ReadCollector()
+        spares = list(peers)
+        self.budget.deposit()
+
+        with collector.cond:
+            while len(collector.answers) < needed:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+
+                # replace failed calls
+                missing = needed - len(collector.answers) - len(collector.in_flight)
+                if missing > 0:
+                    if not spares:
+                        break
+                    for peer in spares[:missing]:
+                        self._send(peer, request, collector, deadline)
+                    del spares[:missing]
+                    continue
+
+                wake, hedges = self._hedges(collector, spares, now, deadline)
+                for spare in hedges:
+                    self._send(spare, request, collector, deadline)
+                if not hedges:
+                    collector.cond.wait(wake - now)
+
+            return list(collector.answers)
+
+    async def read_aio(self, pool, peers, key, needed=None, timeout=None) -> list:
+        """
+        read for an event loop: the calls are grpc.aio calls on `pool` (an
+        AsyncChannelPool), and waiting for answers holds no thread. Same
+        replacement and hedging as read.
+        """
+        needed = len(peers) if needed is None else needed
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        request = kv_pb2.GetRequest(key=key, want_bytes=True)
+        collector = ReadCollector()
+        spares = list(peers)
+        tasks = []
+        self.budget.deposit()
+
+        while len(collector.answers) < needed:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+
+            # replace failed calls
+            missing = needed - len(collector.answers) - len(collector.in_flight)
+            if missing > 0:
+                if not spares:
+                    break
+                for peer in spares[:missing]:
+                    tasks.append(self._send_aio(pool, peer, request, collector, deadline))
+                del spares[:missing]
+                continue
+
+            wake, hedges = self._hedges(collector, spares, now, deadline)
+            for spare in hedges:
+                tasks.append(self._send_aio(pool, spare, request, collector, deadline))
+            if not hedges:
+                tasks = [task for task in tasks if not task.done()]
+                await asyncio.wait(tasks, timeout=wake - now, return_when=asyncio.FIRST_COMPLETED)
+
+        return list(collector.answers)
+
+    def _hedges(self, collector, spares, now, deadline):
+        """
+        The spares to send to now, one for each peer past its hedge time
+        that the budget allows, taken off `spares`; and when the next
+        peer is due.
+        """
+        wake = deadline
+        hedges = []
+        for peer, hedge_at in list(collector.in_flight.items()):
+            if hedge_at is None or not spares:
+                continue
+            if hedge_at > now:
+                wake = min(wake, hedge_at)
+                continue
+            # one hedge per slow peer
+            collector.in_flight[peer] = None
+            if not self.budget.spend():
+                read_hedges_throttled.inc()
+                continue
+            read_hedges.inc()
+            spare = spares.pop(0)
+            collector.covers[spare] = peer
+            hedges.append(spare)
+        return wake, hedges
+
+    def _sent(self, peer_addr, collector):
+        sent_at = time.monotonic()
+        delay = self.latencies.hedge_delay(peer_addr)
+        collector.in_flight[peer_addr] = None if delay is None else sent_at + delay
+        return sent_at
+
+    def _send(self, peer_addr, request, collector, deadline):
+        sent_at = self._sent(peer_addr, collector)
+        future = self.pool.stub(peer_addr).Get.future(request, timeout=deadline - sent_at)
+        future.add_done_callback(partial(self._answered, peer_addr, collector, sent_at))
+
+    def _send_aio(self, pool, peer_addr, request, collector, deadline):
+        sent_at = self._sent(peer_addr, collector)
+        call = pool.stub(peer_addr).Get(request, timeout=deadline - sent_at)
+        task = asyncio.ensure_future(self._answered_aio(peer_addr, collector, sent_at, call))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _answered(self, peer_addr, collector, sent_at, future):
+        try:
+            response = future.result()
+        except Exception as e:
+            if DEBUG_LOG:
+                print(f"[reads] Read from {peer_addr} failed: {e}")
+            collector.done(peer_addr, None)
+            return
+        collector.done(peer_addr, self._answer(peer_addr, sent_at, response))
+
+    async def _answered_aio(self, peer_addr, collector, sent_at, call):
+        try:
+            response = await call
+        except Exception as e:
+            if DEBUG_LOG:
+                print(f"[reads] Read from {peer_addr} failed: {e}")
+            collector.done(peer_addr, None)
+            return
+        collector.done(peer_addr, self._answer(peer_addr, sent_at, response))
+
+    def _answer(self, peer_addr, sent_at, response):
+        # late answers too, so a slow peer's percentile reflects it
+        self.latencies.record(peer_addr, time.monotonic() - sent_at)
+        value = response_value(response) if response.found else None
+        return (peer_addr, value, response.modified_at, response.expires_at or None)
@@ -0,0 +1,403 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import partial
+
+import grpc
+
+try:
+    import kv_pb2
+    from interfaces import lww_version
+    from channels import channel_pool
+    from value_codec import CODEC_NONE
+    from metrics import (
+        replication_attempts,
+        replication_failures,
+        replication_queue_depth,
+        replication_lag_seconds,
+        replication_batch_size,
+        replication_coalesced,
+        replication_queue_full,
+    )
+except ImportError:
+    from app import kv_pb2
+    from app.interfaces import lww_version
+    from app.channels import channel_pool
+    from app.value_codec import CODEC_NONE
+    from app.metrics import (
+        replication_attempts,
+        replication_failures,
+        replication_queue_depth,
+        replication_lag_seconds,
+        replication_batch_size,
+        replication_coalesced,
+        replication_queue_full,
+    )
+
+
+# failures are counted in replication_failures; set DEBUG_LOG=true to print each one
+DEBUG_LOG = os.environ.get("DEBUG_LOG", "false").lower() == "true"
+
+QUEUE_SIZE = 10_000      # distinct keys waiting per peer
+BATCH_SIZE = 128         # writes per ReplicateBatch call
+ENQUEUE_TIMEOUT = 1.0    # seconds a write waits for room in a full queue
+SEND_TIMEOUT = 5         # seconds per ReplicateBatch call
+ACK_TIMEOUT = 2          # seconds a QUORUM or ALL write waits for replica acks
+
+# payload None is a tombstone; payload is encoded with codec (see value_codec)
+Write = namedtuple("Write", "key payload modified_at codec expires_at queued_at")
+
+
+def replicate_request(key, value, modified_at, codec=CODEC_NONE, expires_at=None):
+    """
+    ReplicateRequest for a stored (codec, payload); value None is a tombstone.
+    """
+    if value is None:
+        return kv_pb2.ReplicateRequest(key=key, modified_at=modified_at, deleted=True)
+    if codec == CODEC_NONE:
+        return kv_pb2.ReplicateRequest(key=key, value=value, modified_at=modified_at, expires_at=expires_at or 0)
+    return kv_pb2.ReplicateRequest(
+        key=key, modified_at=modified_at, codec=codec, compressed_value=value, expires_at=expires_at or 0
+    )
+
+
+def send_replicates(stub, requests, timeout=SEND_TIMEOUT, batch=True) -> bool:
+    """
+    Send ReplicateRequests in one ReplicateBatch call, or one Replicate
+    each when `batch` is False or the peer predates ReplicateBatch
+    (UNIMPLEMENTED). Raises when a call fails. Returns whether to batch
+    the next send to this peer.
+    """
+    if batch:
+        try:
+            stub.ReplicateBatch(kv_pb2.ReplicateBatchRequest(items=requests), timeout=timeout)
+            return True
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                raise
+
+    for request in requests:
+        stub.Replicate(request, timeout=timeout)
+    return False
+
+
+class AckCounter:
+    """
+    Replica acks of one write, counted as the sends complete.
+    """
+
+    def __init__(self, needed, pending):
+        self.needed = needed
+        self.pending = pending
+        self.acks = 0
+        self._cond = threading.Condition()
+
+    def done(self, ok):
+        with self._cond:
+            self.pending -= 1
+            if ok:
+                self.acks += 1
+            self._cond.notify_all()
+
+    def wait(self, timeout) -> int:
+        """
+        Block until `needed` acks arrived, enough sends failed that they
+        never will, or `timeout` passed. Returns the acks so far.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.acks < self.needed and self.acks + self.pending >= self.needed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self.acks
+
+
+class PeerSender:
+    """
+    One thread replicating to a single peer over its pooled channel.
+
+    Writes wait in a bounded queue keyed by key, so a key rewritten before
+    it was sent goes out once, in its newest version. The sender ships up
+    to `batch_size` writes per ReplicateBatch call. Peers that predate the
+    RPC get one Replicate per write instead. A failed batch is handed to
+    `hints` (a HintStore) when there is one.
+    """
+
+    def __init__(
+        self,
+        peer_addr,
+        hints=None,
+        queue_size=QUEUE_SIZE,
+        batch_size=BATCH_SIZE,
+        enqueue_timeout=ENQUEUE_TIMEOUT,
+        pool=channel_pool
+    ):
+        self.peer_addr = peer_addr
+        self.pool = pool
+        self.hints = hints
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._batch_supported = True
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    def enqueue(self, key, payload, modified_at, codec=CODEC_NONE, expires_at=None) -> bool:
+        """
+        Queue a write. When the queue is full the caller waits up to
+        `enqueue_timeout` for room (backpressure on Put); after that the
+        write goes to the hint store and False is returned.
+        """
+        return self.enqueue_many([(key, payload, modified_at, codec, expires_at)]) == 1
+
+    def enqueue_many(self, writes) -> int:
+        """
+        enqueue for (key, payload, modified_at, codec, expires_at) writes
+        under one lock, sharing one `enqueue_timeout` wait. Returns how
+        many were queued; the rest went to the hint store.
+        """
+        now = time.monotonic()
+        deadline = now + self.enqueue_timeout
+        overflow = []
+        queued = 0
+        with self._cond:
+            for key, payload, modified_at, codec, expires_at in writes:
+                write = Write(key, payload, modified_at, codec, expires_at, now)
+                current = self._pending.get(key)
+                if current is not None:
+                    replication_coalesced.inc()
+                    if lww_version(modified_at, payload is None) > lww_version(current.modified_at, current.payload is None):
+                        # keeps its place in the queue and its age for the lag
+                        self._pending[key] = write._replace(queued_at=current.queued_at)
+                    queued += 1
+                    continue
+
+                if len(self._pending) >= self.queue_size:
+                    replication_queue_full.labels(self.peer_addr).inc()
+                    while len(self._pending) >= self.queue_size and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+
+                if len(self._pending) < self.queue_size and not self._closed:
+                    self._pending[key] = write
+                    queued += 1
+                else:
+                    overflow.append(write)
+
+            replication_queue_depth.labels(self.peer_addr).set(len(self._pending))
+            self._cond.notify_all()
+
+        if overflow:
+            replication_failures.inc(len(overflow))
+            self._hint(overflow)
+        return queued
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch = []
+                while self._pending and len(batch) < self.batch_size:
+                    batch.append(self._pending.popitem(last=False)[1])
+                replication_queue_depth.labels(self.peer_addr).set(len(self._pending))
+                # room for writers blocked on a full queue
+                self._cond.notify_all()
+
+            self._deliver(batch)
+
+    def _deliver(self, batch):
+        replication_attempts.inc(len(batch))
+        replication_batch_size.observe(len(batch))
+        try:
+            self._send(batch)
+        except Exception as e:
+            replication_failures.inc(len(batch))
+            if DEBUG_LOG:
+                print(f"[replication] Batch of {len(batch)} to {self.peer_addr} failed: {e}")
+            self._hint(batch)
+            return
+        oldest = min(write.queued_at for write in batch)
+        replication_lag_seconds.labels(self.peer_addr).set(time.monotonic() - oldest)
+
+    def _send(self, batch):
+        # fetched per batch: the pool replaces the channel after an eviction
+        stub = self.pool.stub(self.peer_addr)
+        requests = [
+            replicate_request(w.key, w.payload, w.modified_at, w.codec, w.expires_at)
+            for w in batch
+        ]
+        self._batch_supported = send_replicates(stub, requests, SEND_TIMEOUT, self._batch_supported)
+
+    def _hint(self, writes):
+        if self.hints is None:
+            return
+        for w in writes:
+            self.hints.add(self.peer_addr, w.key, w.payload, w.modified_at, w.codec, w.expires_at)
+
+    def close(self):
+        """
+        Send what is queued, then stop the thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+
+class ReplicationPipeline:
+    """
+    A PeerSender per peer, created on its first write.
+    """
+
+    def __init__(
+        self,
+        hints=None,
+        queue_size=QUEUE_SIZE,
+        batch_size=BATCH_SIZE,
+        enqueue_timeout=ENQUEUE_TIMEOUT,
+        pool=channel_pool
+    ):
+        self.hints = hints
+        self.pool = pool
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self._senders = {}
+        self._lock = threading.Lock()
+        # replicate_acked_aio sends still running after it returned
+        self._tasks = set()
+
+    def sender(self, peer_addr):
+        with self._lock:
+            sender = self._senders.get(peer_addr)
+            if sender is None:
+                sender = self._senders[peer_addr] = PeerSender(
+                    peer_addr,
+                    hints=self.hints,
+                    queue_size=self.queue_size,
+                    batch_size=self.batch_size,
+                    enqueue_timeout=self.enqueue_timeout,
+                    pool=self.pool,
+                )
+            return sender
+
+    def replicate(self, peer_addr, key, payload, modified_at, codec=CODEC_NONE, expires_at=None) -> bool:
+        return self.sender(peer_addr).enqueue(key, payload, modified_at, codec, expires_at)
+
+    def replicate_many(self, peer_addr, writes) -> int:
+        # writes: (key, payload, modified_at, codec, expires_at)
+        return self.sender(peer_addr).enqueue_many(writes)
+
+    def replicate_acked(
+        self,
+        peers,
+        key,
+        payload,
+        modified_at,
+        codec=CODEC_NONE,
+        expires_at=None,
+        needed=None,
+        timeout=ACK_TIMEOUT
+    ) -> int:
+        """
+        Send a write to every peer at once, bypassing the queues, and
+        return as soon as `needed` of them (default: all) acked, or it is
+        clear they will not. Returns the acks received by then. Sends
+        still in flight carry on; the ones that fail go to the hint store.
+        """
+        needed = len(peers) if needed is None else needed
+        request = replicate_request(key, payload, modified_at, codec, expires_at)
+        write = Write(key, payload, modified_at, codec, expires_at, time.monotonic())
+        counter = AckCounter(needed, len(peers))
+        for peer in peers:
+            replication_attempts.inc()
+            future = self.pool.stub(peer).Replicate.future(request, timeout=timeout)
+            future.add_done_callback(partial(self._acked, peer, write, counter))
+        return counter.wait(timeout)
+
+    def _acked(self, peer_addr, write, counter, future):
+        try:
+            future.result()
+        except Exception as e:
+            self._failed(peer_addr, write, e)
+            counter.done(False)
+            return
+        counter.done(True)
+
+    def _failed(self, peer_addr, write, e):
+        replication_failures.inc()
+        if DEBUG_LOG:
+            print(f"[replication] Write of {write.key} to {peer_addr} failed: {e}")
+        if self.hints is not None:
+            self.hints.add(peer_addr, write.key, write.payload, write.modified_at, write.codec, write.expires_at)
+
+    async def replicate_acked_aio(
+        self,
+        pool,
+        peers,
+        key,
+        payload,
+        modified_at,
+        codec=CODEC_NONE,
+        expires_at=None,
+        needed=None,
+        timeout=ACK_TIMEOUT
+    ) -> int:
+        """
+        replicate_acked for an event loop: the sends are grpc.aio calls on
+        `pool` (an AsyncChannelPool), and waiting for their acks holds no
+        thread. Failed sends are hinted on the loop's default executor.
+        """
+        needed = len(peers) if needed is None else needed
+        request = replicate_request(key, payload, modified_at, codec, expires_at)
+        write = Write(key, payload, modified_at, codec, expires_at, time.monotonic())
+        pending = set()
+        for peer in peers:
+            replication_attempts.inc()
+            task = asyncio.ensure_future(self._send_acked(pool.stub(peer), peer, request, write, timeout))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            pending.add(task)
+
+        acks = 0
+        deadline = time.monotonic() + timeout
+        while acks < needed and acks + len(pending) >= needed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            acks += sum(task.result() for task in done)
+        return acks
+
+    async def _send_acked(self, stub, peer_addr, request, write, timeout):
+        try:
+            await stub.Replicate(request, timeout=timeout)
+        except Exception as e:
+            await asyncio.get_running_loop().run_in_executor(None, self._failed, peer_addr, write, e)
+            return False
+        return True
+
+    def close(self):
+        with self._lock:
+            senders = list(self._senders.values())
+            self._senders.clear()
+        for sender in senders:
+            sender.close()
@@ -0,0 +1,114 @@
+import bisect
+import hashlib
+
+
+VNODES = 128    # points per node on the ring; every node must use the same number
+
+
+def ring_hash(key: str) -> int:
+    """
+    64-bit position of `key` on the ring. Unlike hash(), it is the same in
+    every process, so all nodes and clients place a key alike.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class ConsistentHashRing:
+    """
+    Consistent-hash ring with virtual nodes. Each node owns `vnodes`
+    points; a key belongs to the first distinct nodes clockwise from its
+    hash. Adding or removing one node moves only the keys next to its
+    points, about 1/n of them, instead of nearly all.
+
+    The ring is immutable once built, so threads can share one and swap
+    in a new ring when membership changes. Lookups are a binary search.
+    """
+
+    def __init__(self, nodes=(), vnodes=VNODES):
+        self.vnodes = vnodes
+        self.nodes = frozenset(nodes)
+        points = sorted(
+            (ring_hash(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(vnodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+        self._covers = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return node in self.nodes
+
+    def with_node(self, node):
+        return ConsistentHashRing(self.nodes | {node}, self.vnodes)
+
+    def without_node(self, node):
+        return ConsistentHashRing(self.nodes - {node}, self.vnodes)
+
+    def get_node(self, key: str):
+        """
+        The node that owns `key`, or None on an empty ring.
+        """
+        if not self._owners:
+            return None
+        idx = bisect.bisect(self._hashes, ring_hash(key)) % len(self._owners)
+        return self._owners[idx]
+
+    def get_nodes(self, key: str, count: int) -> list:
+        """
+        The first `count` distinct nodes clockwise from `key`, owner first;
+        fewer when the ring has fewer nodes.
+        """
+        count = min(count, len(self.nodes))
+        if count <= 0:
+            return []
+        return self._walk(bisect.bisect(self._hashes, ring_hash(key)), count)
+
+    def _walk(self, start, count):
+        # the first `count` distinct nodes from point `start` on
+        selected = []
+        for i in range(len(self._owners)):
+            node = self._owners[(start + i) % len(self._owners)]
+            if node not in selected:
+                selected.append(node)
+                if len(selected) == count:
+                    break
+        return selected
+
+    def cover(self, count: int, prefer=None, skip=()) -> list:
+        """
+        A few nodes that between them hold a copy of every key when each
+        key has `count` replicas: every arc between two points has one of
+        its replicas in the list. Picked greedily, `prefer` first, and
+        never a node in `skip`; an arc whose replicas are all skipped is
+        left out. The same arguments give the same nodes, cached per ring.
+        """
+        count = min(count, len(self.nodes))
+        if count <= 0:
+            return []
+        skip = frozenset(skip)
+        cached = self._covers.get((count, prefer, skip))
+        if cached is None:
+            cached = self._covers[(count, prefer, skip)] = self._cover(count, prefer, skip)
+        return list(cached)
+
+    def _cover(self, count, prefer, skip):
+        arcs = {}   # node -> arcs it holds a replica of
+        for start in range(len(self._owners)):
+            for node in self._walk(start, count):
+                if node not in skip:
+                    arcs.setdefault(node, set()).add(start)
+
+        uncovered = set().union(*arcs.values())
+        chosen = []
+        node = prefer if prefer in arcs else None
+        while uncovered:
+            if node is None:
+                node = max(sorted(arcs), key=lambda n: len(arcs[n] & uncovered))
+            chosen.append(node)
+            uncovered -= arcs.pop(node)
+            node = None
+        return chosen
@@ -0,0 +1,78 @@
+import base64
+import heapq
+import itertools
+
+try:
+    from interfaces import lww_version
+except ImportError:
+    from app.interfaces import lww_version
+
+
+# Range scans walk keys in code point order, which is also the byte order
+# of their UTF-8 encoding (what SQLite's BINARY collation compares), so
+# every backend and every node agree on it.
+
+_MAX_CHAR = 0x10FFFF
+_SURROGATES = range(0xD800, 0xE000)
+
+
+def key_successor(key: str) -> str:
+    """
+    The smallest key greater than `key`.
+    """
+    return key + "\x00"
+
+
+def prefix_end(prefix: str):
+    """
+    Exclusive upper bound of the keys starting with `prefix`, or None when
+    no such bound exists (empty prefix, or only U+10FFFF characters).
+    """
+    stripped = prefix.rstrip(chr(_MAX_CHAR))
+    if not stripped:
+        return None
+    last = ord(stripped[-1]) + 1
+    if last in _SURROGATES:
+        last = _SURROGATES.stop
+    return stripped[:-1] + chr(last)
+
+
+def encode_page_token(key: str) -> str:
+    # opaque to clients; resumes the scan right after `key`
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+
+def decode_page_token(token: str) -> str:
+    try:
+        return base64.b64decode(token.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+    except (ValueError, UnicodeError):
+        raise ValueError("malformed page_token")
+
+
+def scan_bounds(start="", end="", prefix="", page_token=""):
+    """
+    [start, end) of a scan request; end None means unbounded. A prefix
+    narrows the range to its keys and a page token moves start past the
+    last key already returned.
+    """
+    end = end or None
+    if prefix:
+        start = max(start, prefix)
+        upper = prefix_end(prefix)
+        if upper is not None and (end is None or upper < end):
+            end = upper
+    if page_token:
+        start = max(start, key_successor(decode_page_token(page_token)))
+    return start, end
+
+
+def merge_scans(streams):
+    """
+    Merge key-ordered (key, value, modified_at) streams from several
+    replicas into one, keeping the last-write-wins version of each key.
+    Tombstones (value None) are kept so the caller can drop them after
+    they have hidden older values. Streams are consumed lazily.
+    """
+    merged = heapq.merge(*streams, key=lambda item: item[0])
+    for _, versions in itertools.groupby(merged, key=lambda item: item[0]):
+        yield max(versions, key=lambda item: lww_version(item[2], item[1] is None))
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import tempfile
+import time
+import zlib
+
+try:
+    import kv_pb2
+    from grpc_client import fetch_snapshot
+    from metrics import snapshot_bytes_received, snapshot_keys_restored, snapshot_restore_seconds
+except ImportError:
+    from app import kv_pb2
+    from app.grpc_client import fetch_snapshot
+    from app.metrics import snapshot_bytes_received, snapshot_keys_restored, snapshot_restore_seconds
+
+
+SNAPSHOT_BLOCK_SIZE = 1 << 20       # bytes per streamed block
+MAX_SNAPSHOT_BLOCK_SIZE = 3 << 20   # stays under gRPC's default 4 MiB message limit
+BOOTSTRAP_WAIT = 10                 # seconds to wait for gossip to find a peer
+
+
+def snapshot_blocks(path, fmt, block_size=SNAPSHOT_BLOCK_SIZE):
+    """
+    SnapshotBlocks for the file at `path`: data blocks with their offset
+    and CRC-32, then a final block with the SHA-256 of the whole file.
+    """
+    digest = hashlib.sha256()
+    offset = 0
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            digest.update(data)
+            yield kv_pb2.SnapshotBlock(offset=offset, data=data, crc32=zlib.crc32(data))
+            offset += len(data)
+
+    yield kv_pb2.SnapshotBlock(offset=offset, done=True, sha256=digest.digest(), format=fmt)
+
+
+def receive_snapshot(blocks, path):
+    """
+    Write a streamed snapshot to `path`, checking every block, and return
+    its format. Raises IOError on a corrupt, out of order or truncated
+    stream.
+    """
+    digest = hashlib.sha256()
+    offset = 0
+    with open(path, "wb") as f:
+        for block in blocks:
+            if block.offset != offset:
+                raise IOError(f"snapshot block at offset {block.offset}, expected {offset}")
+            if block.done:
+                if block.sha256 != digest.digest():
+                    raise IOError("snapshot checksum mismatch")
+                f.flush()
+                os.fsync(f.fileno())
+                return block.format
+            if zlib.crc32(block.data) != block.crc32:
+                raise IOError(f"corrupt snapshot block at offset {offset}")
+
+            f.write(block.data)
+            digest.update(block.data)
+            offset += len(block.data)
+            snapshot_bytes_received.inc(len(block.data))
+
+    raise IOError(f"snapshot stream ended early after {offset} bytes")
+
+
+def restore_from_peer(storage, peer_addr, fetch=fetch_snapshot, work_dir=None):
+    """
+    Stream `peer_addr`'s snapshot to a temporary file in `work_dir`, merge
+    it into `storage` and return how many keys were applied.
+    """
+    fd, path = tempfile.mkstemp(prefix="snapshot-", suffix=".part", dir=work_dir)
+    os.close(fd)
+    try:
+        with snapshot_restore_seconds.time():
+            fmt = receive_snapshot(fetch(peer_addr, storage.snapshot_formats()), path)
+            applied = storage.restore_from(path, fmt)
+        snapshot_keys_restored.inc(applied)
+        return applied
+    finally:
+        os.remove(path)
+
+
+def is_empty(storage):
+    return next(iter(storage.scan_range("")), None) is None
+
+
+def bootstrap(storage, peer_provider, fetch=fetch_snapshot, work_dir=None, wait=BOOTSTRAP_WAIT):
+    """
+    Fill an empty store from the first peer that streams a snapshot, so a
+    new node starts from a disk-speed copy and anti-entropy only repairs
+    what changed since. Returns the peer used, or None when the store was
+    not empty or no peer could serve one.
+    """
+    if not is_empty(storage):
+        return None
+
+    deadline = time.monotonic() + wait
+    peers = peer_provider()
+    while not peers and time.monotonic() < deadline:
+        time.sleep(0.5)
+        peers = peer_provider()
+
+    for peer in peers:
+        try:
+            applied = restore_from_peer(storage, peer, fetch, work_dir)
+        except Exception as e:
+            print(f"[snapshot] Bootstrap from {peer} failed: {e}")
+            continue
+        print(f"[snapshot] Restored {applied} keys from {peer}")
+        return peer
+
+    if peers:
+        print("[snapshot] No peer could serve a snapshot; anti-entropy will fill the store")
+    return None
@@ -1,22 +1,134 @@
+import queue
 import sqlite3
 import threading
-import zlib
+import time
 
 try:
-    from interfaces import StorageBackend
+    from interfaces import StorageBackend, lww_version, SNAPSHOT_RECORDS, RESTORE_BATCH_SIZE
+    from metrics import (
+        storage_commits,
+        storage_keys_written,
+        group_commit_batch_size,
+        group_commit_wait,
+        storage_pages_reclaimed,
+    )
+    from chunking import (
+        CHUNK_COUNT,
+        LEAF_COUNT,
+        chunk_for_key,
+        leaf_for_key,
+        sum_digests,
+        combine_digest,
+        entry_digest,
+        digest_to_bytes,
+        digest_from_bytes,
+    )
+    from value_codec import CODEC_NONE, DEFAULT_CODEC, COMPRESS_THRESHOLD, as_buffer, encode_value, decode_value
 except ImportError:
-    from app.interfaces import StorageBackend
+    from app.interfaces import StorageBackend, lww_version, SNAPSHOT_RECORDS, RESTORE_BATCH_SIZE
+    from app.metrics import (
+        storage_commits,
+        storage_keys_written,
+        group_commit_batch_size,
+        group_commit_wait,
+        storage_pages_reclaimed,
+    )
+    from app.chunking import (
+        CHUNK_COUNT,
+        LEAF_COUNT,
+        chunk_for_key,
+        leaf_for_key,
+        sum_digests,
+        combine_digest,
+        entry_digest,
+        digest_to_bytes,
+        digest_from_bytes,
+    )
+    from app.value_codec import CODEC_NONE, DEFAULT_CODEC, COMPRESS_THRESHOLD, as_buffer, encode_value, decode_value
+
+
+SQL_BATCH_SIZE = 500     # keys per IN (...) lookup, well under SQLite's variable limit
+GROUP_COMMIT_WINDOW = 0.002    # seconds the writer waits for more puts to join a batch
+GROUP_COMMIT_MAX_BATCH = 256   # keys per group-commit transaction
+SCHEMA_VERSION = 1             # PRAGMA user_version; 1 = values stored as BLOBs
+PURGE_BATCH_SIZE = 500         # tombstones deleted per purge transaction
+VACUUM_PAGES = 256             # free pages handed back to the OS after each purge batch
+SCAN_PAGE_SIZE = 500           # rows per query of a range scan
+SNAPSHOT_SQLITE = "sqlite"     # snapshot format: a copy of the database file
+
+
+def _entry_digest_blob(key, value, modified_at):
+    return digest_to_bytes(entry_digest(key, value, modified_at or 0))
+
+
+def _decoded(rows):
+    for key, value, modified_at, codec, _ in rows:
+        yield (key, decode_value(codec, value), modified_at or 0)
+
+
+def _encoded(rows):
+    for key, value, modified_at, codec, expires_at in rows:
+        yield (key, codec or CODEC_NONE, value, modified_at or 0, expires_at)
+
+
+class _PendingWrite:
+    __slots__ = ("items", "applied", "error", "done")
+
+    def __init__(self, items):
+        self.items = items
+        self.applied = None
+        self.error = None
+        self.done = threading.Event()
 
 
 class SQLiteStorage(StorageBackend):
-    def __init__(self, db_path):
+    def __init__(
+        self,
+        db_path,
+        group_commit=False,
+        group_commit_window=GROUP_COMMIT_WINDOW,
+        group_commit_max_batch=GROUP_COMMIT_MAX_BATCH,
+        codec=DEFAULT_CODEC,
+        compress_threshold=COMPRESS_THRESHOLD,
+        convert_auto_vacuum=False
+    ):
         self.db_path = db_path
+        # a file created without auto_vacuum is rewritten by a full VACUUM
+        # to enable it only when asked: see _enable_incremental_vacuum
+        self.convert_auto_vacuum = convert_auto_vacuum
+        # values of compress_threshold bytes or more are stored compressed
+        # (flagged in the codec column); None turns compression off
+        self.codec = codec
+        self.compress_threshold = compress_threshold
         self._local = threading.local()
+        self._digests = {}
+        self._digest_lock = threading.Lock()
         self._init_db()
 
+        # group commit: one writer thread owns every write transaction and
+        # folds concurrent puts into a single commit
+        self.group_commit_window = group_commit_window
+        self.group_commit_max_batch = group_commit_max_batch
+        self._write_queue = None
+        self._writer = None
+        if group_commit:
+            self._write_queue = queue.Queue()
+            self._writer = threading.Thread(target=self._group_commit_loop, daemon=True)
+            self._writer.start()
+
+    def close(self):
+        """
+        Stop the group-commit writer after it drains queued puts.
+        """
+        if self._writer is not None:
+            self._write_queue.put(None)
+            self._writer.join()
+            self._writer = None
+
     def _conn(self):
         if not getattr(self._local, "conn", None):
             conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=5000;")
             conn.execute("PRAGMA journal_mode=WAL;")
             conn.execute("PRAGMA synchronous=NORMAL;")
             self._local.conn = conn
@@ -25,86 +137,640 @@ class SQLiteStorage(StorageBackend):
     def _init_db(self):
         conn = sqlite3.connect(self.db_path)
         conn.execute("PRAGMA busy_timeout=5000;")
+        # takes effect on a new file only; older files are converted below
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
         conn.execute("PRAGMA journal_mode=WAL;")
         conn.execute("""
             CREATE TABLE IF NOT EXISTS kv (
                 key TEXT PRIMARY KEY,
-                value TEXT,
-                modified_at INTEGER
+                value BLOB,
+                modified_at INTEGER,
+                chunk_id INTEGER,
+                leaf_id INTEGER,
+                entry_digest BLOB,
+                codec INTEGER NOT NULL DEFAULT 0,
+                expires_at INTEGER
             );
         """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS leaf_digests (
+                chunk_id INTEGER,
+                leaf_id INTEGER,
+                digest BLOB,
+                PRIMARY KEY (chunk_id, leaf_id)
+            );
+        """)
+        rebuild = self._migrate_columns(conn)
+        self._migrate_values(conn)
+        conn.execute("DROP TABLE IF EXISTS chunk_digests;")
+        conn.execute("DROP INDEX IF EXISTS idx_kv_chunk;")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_kv_leaf ON kv (chunk_id, leaf_id);"
+        )
+        # partial index: the purge finds expired tombstones without a scan
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_kv_tombstones ON kv (modified_at) WHERE value IS NULL;"
+        )
+        # only rows with a TTL are indexed; the sweeper reads this in order
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_kv_expiry ON kv (expires_at) WHERE expires_at IS NOT NULL;"
+        )
+        if rebuild or self._digests_missing(conn):
+            self._rebuild_digests(conn)
         conn.commit()
+        self._enable_incremental_vacuum(conn)
+        self._load_digests(conn)
         conn.close()
 
-    def put(self, key: str, value: str, modified_at: int) -> bool:
+    def _migrate_columns(self, conn):
+        """
+        Databases created before chunk_id, leaf_id or entry_digest existed
+        get the column added and back-filled once. Returns True when the
+        leaf digests have to be rebuilt.
+        """
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(kv)")}
+        if "codec" not in columns:
+            # every value written before compression existed is plain text
+            conn.execute("ALTER TABLE kv ADD COLUMN codec INTEGER NOT NULL DEFAULT 0")
+        if "expires_at" not in columns:
+            conn.execute("ALTER TABLE kv ADD COLUMN expires_at INTEGER")
+        backfills = {
+            "chunk_id": ("INTEGER", "kv_chunk_id(key)"),
+            "leaf_id": ("INTEGER", "kv_leaf_id(key)"),
+            "entry_digest": ("BLOB", "kv_entry_digest(key, value, modified_at)"),
+        }
+        missing = [name for name in backfills if name not in columns]
+        if not missing:
+            return False
+
+        conn.create_function("kv_chunk_id", 1, chunk_for_key, deterministic=True)
+        conn.create_function("kv_leaf_id", 1, leaf_for_key, deterministic=True)
+        conn.create_function("kv_entry_digest", 3, _entry_digest_blob, deterministic=True)
+        for name in missing:
+            column_type, expr = backfills[name]
+            conn.execute(f"ALTER TABLE kv ADD COLUMN {name} {column_type}")
+            conn.execute(f"UPDATE kv SET {name} = {expr}")
+        return True
+
+    def _migrate_values(self, conn):
+        """
+        Values used to be stored as TEXT; rewrite them as BLOBs once so
+        reads never have to transcode. Digests are unchanged (same bytes).
+        """
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        conn.execute("UPDATE kv SET value = CAST(value AS BLOB) WHERE typeof(value) = 'text'")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _enable_incremental_vacuum(self, conn):
+        """
+        auto_vacuum can only change on an existing file through a full
+        VACUUM, which rewrites the whole file, needs as much free disk
+        again and blocks until done. It runs only with
+        convert_auto_vacuum; otherwise pages freed by purges are reused
+        by later writes but not returned to the filesystem.
+        """
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        if not self.convert_auto_vacuum:
+            print(
+                f"[storage] {self.db_path} predates incremental vacuum: purged pages are reused, "
+                "not returned to the filesystem (SQLITE_CONVERT_AUTO_VACUUM=true converts it with one full VACUUM)"
+            )
+            return
+        print(f"[storage] Converting {self.db_path} to incremental vacuum with a full VACUUM...")
+        started = time.monotonic()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        conn.execute("VACUUM;")
+        print(f"[storage] Converted {self.db_path} in {time.monotonic() - started:.1f}s")
+
+    def _digests_missing(self, conn):
+        return (
+            conn.execute("SELECT 1 FROM kv LIMIT 1").fetchone() is not None
+            and conn.execute("SELECT 1 FROM leaf_digests LIMIT 1").fetchone() is None
+        )
+
+    def _rebuild_digests(self, conn):
+        digests = {}
+        for chunk_id, leaf_id, raw in conn.execute(
+            "SELECT chunk_id, leaf_id, entry_digest FROM kv"
+        ):
+            digests[(chunk_id, leaf_id)] = combine_digest(
+                digests.get((chunk_id, leaf_id), 0),
+                digest_from_bytes(raw)
+            )
+
+        conn.execute("DELETE FROM leaf_digests")
+        conn.executemany(
+            "INSERT INTO leaf_digests (chunk_id, leaf_id, digest) VALUES (?, ?, ?)",
+            [(c, l, digest_to_bytes(d)) for (c, l), d in digests.items()]
+        )
+
+    def _load_digests(self, conn):
+        self._digests = {}
+        for chunk_id, leaf_id, raw in conn.execute(
+            "SELECT chunk_id, leaf_id, digest FROM leaf_digests"
+        ):
+            self._leaves(chunk_id)[leaf_id] = digest_from_bytes(raw)
+
+    def _leaves(self, chunk_id):
+        leaves = self._digests.get(chunk_id)
+        if leaves is None:
+            leaves = self._digests[chunk_id] = [0] * LEAF_COUNT
+        return leaves
+
+    def _encode(self, key, value, modified_at, expires_at=None):
+        # buffers go straight to the hasher, compressor and sqlite binding
+        value = as_buffer(value)
+        codec, payload = encode_value(value, self.codec, self.compress_threshold)
+        return (key, codec, payload, modified_at, entry_digest(key, value, modified_at), expires_at)
+
+    def put(self, key: str, value, modified_at: int) -> bool:
+        return self._write([self._encode(key, value, modified_at)])[0]
+
+    def put_expiring(self, key: str, value, modified_at: int, expires_at: int) -> bool:
+        return self._write([self._encode(key, value, modified_at, expires_at)])[0]
+
+    def put_many(self, items) -> int:
+        return sum(self._write([self._encode(*item) for item in items]))
+
+    def put_encoded_many(self, items) -> int:
+        # payloads are stored as shipped; the digest is filled in for winners only
+        return sum(self._write([
+            (key, codec, payload, modified_at, None, None)
+            for key, codec, payload, modified_at in items
+        ]))
+
+    def expire(self, now: int, limit: int) -> list:
+        conn = self._conn()
+        rows = conn.execute(
+            """
+            SELECT key, modified_at, expires_at FROM kv
+            WHERE expires_at <= ? AND value IS NOT NULL
+            ORDER BY expires_at
+            LIMIT ?
+            """,
+            (now, limit)
+        ).fetchall()
+
+        # the tombstone keeps expires_at, so its grace period runs from then
+        applied = self._write([
+            (key, CODEC_NONE, None, modified_at, None, expires_at)
+            for key, modified_at, expires_at in rows
+        ])
+        return [row[0] for row, ok in zip(rows, applied) if ok]
+
+    def _write(self, items):
+        if self._writer is None or not items:
+            return self._write_batch(items)
+
+        pending = _PendingWrite(items)
+        started = time.perf_counter()
+        self._write_queue.put(pending)
+        pending.done.wait()
+        group_commit_wait.observe(time.perf_counter() - started)
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.applied
+
+    def _group_commit_loop(self):
+        stopping = False
+        while not stopping:
+            first = self._write_queue.get()
+            if first is None:
+                return
+
+            # collect until the window closes or the batch is full
+            batch = [first]
+            size = len(first.items)
+            deadline = time.monotonic() + self.group_commit_window
+            while size < self.group_commit_max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self._write_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if pending is None:
+                    stopping = True
+                    break
+                batch.append(pending)
+                size += len(pending.items)
+
+            items = [item for pending in batch for item in pending.items]
+            try:
+                applied = self._write_batch(items)
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+                    pending.done.set()
+                continue
+
+            group_commit_batch_size.observe(len(items))
+            offset = 0
+            for pending in batch:
+                pending.applied = applied[offset:offset + len(pending.items)]
+                offset += len(pending.items)
+                pending.done.set()
+
+    def _write_batch(self, items):
+        """
+        Apply (key, codec, payload, modified_at, digest, expires_at) items
+        last-write-wins inside a single transaction. Returns one applied flag per item,
+        exactly as if they had been put one by one. A digest of None is
+        computed from the decoded payload.
+        """
+        if not items:
+            return []
+
         conn = self._conn()
         cur = conn.cursor()
 
         cur.execute("BEGIN IMMEDIATE")
         try:
+            stored = self._stored_versions(cur, {item[0] for item in items})
+
+            versions = {key: lww_version(row[0], row[2]) for key, row in stored.items()}
+            winners = {}
+            applied = []
+            for key, codec, payload, modified_at, digest, expires_at in items:
+                version = lww_version(modified_at, payload is None)
+                if key in versions and versions[key] >= version:
+                    applied.append(False)
+                    continue
+                versions[key] = version
+                winners[key] = (codec, payload, modified_at, digest, expires_at)
+                applied.append(True)
+
+            rows = []
+            deltas = {}
+            for key, (codec, payload, modified_at, new_digest, expires_at) in winners.items():
+                chunk_id = chunk_for_key(key)
+                leaf_id = leaf_for_key(key)
+                old_digest = digest_from_bytes(stored[key][1]) if key in stored else 0
+                if new_digest is None:
+                    new_digest = entry_digest(key, decode_value(codec, payload), modified_at)
+
+                deltas[(chunk_id, leaf_id)] = combine_digest(
+                    deltas.get((chunk_id, leaf_id), 0),
+                    new_digest,
+                    old_digest
+                )
+                rows.append(
+                    (key, payload, modified_at, chunk_id, leaf_id, digest_to_bytes(new_digest), codec, expires_at)
+                )
+
+            if rows:
+                # conditional upsert: never let an older version overwrite
+                # (a tombstone is a NULL value and wins a tie, see lww_version)
+                cur.executemany(
+                    """
+                    INSERT INTO kv
+                    (key, value, modified_at, chunk_id, leaf_id, entry_digest, codec, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        value = excluded.value,
+                        modified_at = excluded.modified_at,
+                        entry_digest = excluded.entry_digest,
+                        codec = excluded.codec,
+                        expires_at = excluded.expires_at
+                    WHERE excluded.modified_at > kv.modified_at
+                       OR (excluded.modified_at = kv.modified_at
+                           AND excluded.value IS NULL AND kv.value IS NOT NULL)
+                    """,
+                    rows
+                )
+                self._apply_leaf_deltas(cur, deltas)
+
+            cur.execute("COMMIT")
+
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+
+        storage_commits.inc()
+        storage_keys_written.inc(len(winners))
+
+        # apply as deltas: concurrent commits may land here in any order
+        with self._digest_lock:
+            for (chunk_id, leaf_id), delta in deltas.items():
+                leaves = self._leaves(chunk_id)
+                leaves[leaf_id] = combine_digest(leaves[leaf_id], delta)
+        return applied
+
+    def _stored_versions(self, cur, keys):
+        """
+        key -> (modified_at, entry_digest, is_tombstone) for the keys that
+        already exist.
+        """
+        keys = list(keys)
+        stored = {}
+        for start in range(0, len(keys), SQL_BATCH_SIZE):
+            group = keys[start:start + SQL_BATCH_SIZE]
+            placeholders = ",".join("?" * len(group))
             cur.execute(
-                "SELECT modified_at FROM kv WHERE key = ?",
-                (key,)
+                f"SELECT key, modified_at, entry_digest, value IS NULL FROM kv WHERE key IN ({placeholders})",
+                group
             )
+            for key, modified_at, raw, tombstone in cur.fetchall():
+                stored[key] = (modified_at, raw, bool(tombstone))
+        return stored
 
-            row = cur.fetchone()
+    def _apply_leaf_deltas(self, cur, deltas):
+        rows = []
+        for (chunk_id, leaf_id), delta in deltas.items():
+            cur.execute(
+                "SELECT digest FROM leaf_digests WHERE chunk_id = ? AND leaf_id = ?",
+                (chunk_id, leaf_id)
+            )
+            leaf_row = cur.fetchone()
+            leaf_digest = combine_digest(
+                digest_from_bytes(leaf_row[0] if leaf_row else None),
+                delta
+            )
+            rows.append((chunk_id, leaf_id, digest_to_bytes(leaf_digest)))
+
+        cur.executemany(
+            "REPLACE INTO leaf_digests (chunk_id, leaf_id, digest) VALUES (?, ?, ?)",
+            rows
+        )
 
-            if row and row[0] >= modified_at:
-                cur.execute("COMMIT")
-                return False
+    def purge_tombstones(self, older_than: int) -> int:
+        """
+        Delete expired tombstones PURGE_BATCH_SIZE rows per transaction, so
+        writers are never held up for long, and after each batch return up
+        to VACUUM_PAGES free pages to the filesystem.
+        """
+        purged = 0
+        while True:
+            count = self._purge_batch(older_than)
+            purged += count
+            self._incremental_vacuum()
+            if count < PURGE_BATCH_SIZE:
+                return purged
 
+    def _purge_batch(self, older_than):
+        conn = self._conn()
+        cur = conn.cursor()
+
+        cur.execute("BEGIN IMMEDIATE")
+        try:
             cur.execute(
                 """
-                REPLACE INTO kv
-                (key, value, modified_at)
-                VALUES (?, ?, ?)
+                SELECT key, chunk_id, leaf_id, entry_digest FROM kv
+                WHERE value IS NULL AND modified_at < ?
+                  AND (expires_at IS NULL OR expires_at < ?)
+                LIMIT ?
                 """,
-                (key, value, modified_at)
+                (older_than, older_than, PURGE_BATCH_SIZE)
             )
+            rows = cur.fetchall()
+
+            deltas = {}
+            for _, chunk_id, leaf_id, raw in rows:
+                deltas[(chunk_id, leaf_id)] = combine_digest(
+                    deltas.get((chunk_id, leaf_id), 0),
+                    removed=digest_from_bytes(raw)
+                )
+            if rows:
+                cur.executemany("DELETE FROM kv WHERE key = ?", [(row[0],) for row in rows])
+                self._apply_leaf_deltas(cur, deltas)
 
             cur.execute("COMMIT")
-            return True
 
         except Exception:
             cur.execute("ROLLBACK")
             raise
 
-    def get(self, key: str):
+        with self._digest_lock:
+            for (chunk_id, leaf_id), delta in deltas.items():
+                leaves = self._leaves(chunk_id)
+                leaves[leaf_id] = combine_digest(leaves[leaf_id], delta)
+        return len(rows)
+
+    def _incremental_vacuum(self):
+        conn = self._conn()
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not before:
+            return
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})").fetchall()
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        storage_pages_reclaimed.inc(before - after)
+
+    def get_with_expiry(self, key: str):
         conn = self._conn()
         cur = conn.cursor()
 
         cur.execute(
-            "SELECT value, modified_at FROM kv WHERE key = ?",
+            "SELECT value, modified_at, codec, expires_at FROM kv WHERE key = ?",
             (key,)
         )
 
         row = cur.fetchone()
+        if row is None:
+            return (None, 0, None)
 
-        return (row[0], row[1]) if row else (None, 0)
+        value, modified_at, codec, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            # expired but not swept yet: read it as the tombstone it becomes
+            return (None, modified_at, expires_at)
+        return (decode_value(codec, value), modified_at, expires_at)
 
-    def scan_chunk_with_ts(
+    def get_many_with_expiry(self, keys) -> dict:
+        keys = list(dict.fromkeys(keys))
+        conn = self._conn()
+        now = time.time()
+        found = {}
+        for start in range(0, len(keys), SQL_BATCH_SIZE):
+            group = keys[start:start + SQL_BATCH_SIZE]
+            placeholders = ",".join("?" * len(group))
+            rows = conn.execute(
+                f"SELECT key, value, modified_at, codec, expires_at FROM kv WHERE key IN ({placeholders})",
+                group
+            ).fetchall()
+            for key, value, modified_at, codec, expires_at in rows:
+                if expires_at is not None and expires_at <= now:
+                    found[key] = (None, modified_at, expires_at)
+                else:
+                    found[key] = (decode_value(codec, value), modified_at, expires_at)
+        return {key: found.get(key, (None, 0, None)) for key in keys}
+
+    def scan_range(
         self,
-        chunk_id: int,
-        chunk_count: int
+        start: str,
+        end=None
     ):
+        """
+        Ordered walk of the primary key index, SCAN_PAGE_SIZE rows per
+        query, so memory stays bounded however long the range is.
+        """
+        upper = "" if end is None else "AND key < ?"
+        lower, op = start, ">="
+        while True:
+            # each page is one query on the connection of the thread that
+            # resumed the scan: the aio server resumes it on any executor
+            # thread, and a connection must not be shared across threads
+            rows = self._conn().execute(
+                f"""
+                SELECT key, value, modified_at, codec, expires_at FROM kv
+                WHERE key {op} ? {upper}
+                ORDER BY key
+                LIMIT ?
+                """,
+                (lower, SCAN_PAGE_SIZE) if end is None else (lower, end, SCAN_PAGE_SIZE)
+            ).fetchall()
+
+            now = time.time()
+            for key, value, modified_at, codec, expires_at in rows:
+                if expires_at is not None and expires_at <= now:
+                    value = None
+                yield (key, decode_value(codec, value), modified_at)
+
+            if len(rows) < SCAN_PAGE_SIZE:
+                return
+            lower, op = rows[-1][0], ">"
+
+    # ---------- snapshots ----------
+
+    def snapshot_formats(self) -> list:
+        return [SNAPSHOT_SQLITE, SNAPSHOT_RECORDS]
+
+    def snapshot_to(self, path: str, formats=(SNAPSHOT_RECORDS,)) -> str:
+        """
+        Copy the database with SQLite's online backup API. The copy runs as
+        one step, i.e. one read transaction: it is a single point in time,
+        and under WAL writers carry on meanwhile.
+        """
+        if SNAPSHOT_SQLITE not in formats:
+            return super().snapshot_to(path, formats)
+
+        source = sqlite3.connect(self.db_path)
+        target = sqlite3.connect(path)
+        try:
+            source.execute("PRAGMA busy_timeout=5000;")
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        return SNAPSHOT_SQLITE
+
+    def restore_from(self, path: str, fmt: str) -> int:
+        """
+        Merge a database snapshot row by row through the normal write path,
+        keeping the stored payloads, digests and TTLs as they are.
+        """
+        if fmt != SNAPSHOT_SQLITE:
+            return super().restore_from(path, fmt)
+
+        snapshot = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        applied = 0
+        try:
+            lower, op = "", ">="
+            while True:
+                rows = snapshot.execute(
+                    f"""
+                    SELECT key, codec, value, modified_at, entry_digest, expires_at FROM kv
+                    WHERE key {op} ?
+                    ORDER BY key
+                    LIMIT ?
+                    """,
+                    (lower, RESTORE_BATCH_SIZE)
+                ).fetchall()
+                if not rows:
+                    return applied
+
+                applied += sum(self._write([
+                    (key, codec, value, modified_at or 0,
+                     digest_from_bytes(raw) if raw is not None else None, expires_at)
+                    for key, codec, value, modified_at, raw, expires_at in rows
+                ]))
+                lower, op = rows[-1][0], ">"
+        finally:
+            snapshot.close()
+
+    def _chunk_rows(self, chunk_id, chunk_count):
         conn = self._conn()
         cur = conn.cursor()
 
+        if chunk_count == CHUNK_COUNT:
+            # indexed range read over idx_kv_leaf
+            cur.execute(
+                "SELECT key, value, modified_at, codec, expires_at FROM kv WHERE chunk_id = ?",
+                (chunk_id,)
+            )
+            return cur.fetchall()
+
+        # chunk_id is only persisted for CHUNK_COUNT partitions
         cur.execute(
-            "SELECT key, value, modified_at FROM kv"
+            "SELECT key, value, modified_at, codec, expires_at FROM kv"
         )
+        return [
+            row for row in cur.fetchall()
+            if chunk_for_key(row[0], chunk_count) == chunk_id
+        ]
 
-        for key, value, modified_at in cur.fetchall():
-            hashed_key = zlib.crc32(
-                key.encode("utf-8")
-            )
+    def _leaf_rows(self, chunk_id, leaf_ids):
+        leaf_ids = list(leaf_ids)
+        if not leaf_ids:
+            return []
 
-            if hashed_key % chunk_count == chunk_id:
-                yield (
-                    key,
-                    value,
-                    modified_at or 0
-                )
+        conn = self._conn()
+        placeholders = ",".join("?" * len(leaf_ids))
+        return conn.execute(
+            f"""
+            SELECT key, value, modified_at, codec, expires_at FROM kv
+            WHERE chunk_id = ? AND leaf_id IN ({placeholders})
+            """,
+            (chunk_id, *leaf_ids)
+        ).fetchall()
+
+    def scan_chunk_with_ts(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ):
+        return _decoded(self._chunk_rows(chunk_id, chunk_count))
+
+    def scan_chunk_encoded(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ):
+        return _encoded(self._chunk_rows(chunk_id, chunk_count))
+
+    def chunk_digest(
+        self,
+        chunk_id: int,
+        chunk_count: int
+    ) -> bytes:
+        if chunk_count != CHUNK_COUNT:
+            return super().chunk_digest(chunk_id, chunk_count)
+
+        with self._digest_lock:
+            return digest_to_bytes(sum_digests(self._digests.get(chunk_id, ())))
+
+    def leaf_digests(
+        self,
+        chunk_id: int
+    ) -> list:
+        with self._digest_lock:
+            return list(self._digests.get(chunk_id) or [0] * LEAF_COUNT)
+
+    def scan_leaves_with_ts(
+        self,
+        chunk_id: int,
+        leaf_ids
+    ):
+        return _decoded(self._leaf_rows(chunk_id, leaf_ids))
+
+    def scan_leaves_encoded(
+        self,
+        chunk_id: int,
+        leaf_ids
+    ):
+        return _encoded(self._leaf_rows(chunk_id, leaf_ids))
 
 
 Storage = SQLiteStorage
@@ -0,0 +1,51 @@
+import threading
+import time
+
+try:
+    from metrics import tombstones_purged, tombstone_gc_seconds
+except ImportError:
+    from app.metrics import tombstones_purged, tombstone_gc_seconds
+
+
+TOMBSTONE_GRACE = 86400  # seconds a tombstone is kept after the delete
+GC_INTERVAL = 600        # seconds between GC passes
+
+
+class TombstoneGC:
+    """
+    Background purge of tombstones older than `grace` seconds.
+
+    A tombstone has to outlive the time it takes to reach every replica,
+    through replication or anti-entropy. If a replica that missed the
+    delete comes back after the others purged it, its old value wins
+    repair again, so `grace` must exceed the longest expected node outage.
+    """
+
+    def __init__(self, storage, grace=TOMBSTONE_GRACE, interval=GC_INTERVAL):
+        self.storage = storage
+        self.grace = grace
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, now=None):
+        older_than = int(now if now is not None else time.time()) - self.grace
+        with tombstone_gc_seconds.time():
+            purged = self.storage.purge_tombstones(older_than)
+        tombstones_purged.inc(purged)
+        return purged
+
+    def start(self):
+        def loop():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"[tombstone-gc] pass failed: {e}")
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+        print("[tombstone-gc] Background purge thread started")
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,142 @@
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from metrics import compression_input_bytes, compression_output_bytes, compression_seconds
+except ImportError:
+    from app.metrics import compression_input_bytes, compression_output_bytes, compression_seconds
+
+
+# Values are bytes inside the node; str from text clients is encoded once
+# at the edge (as_bytes). A stored or shipped value is (codec, payload).
+# With CODEC_NONE the payload is the value itself; otherwise it is the
+# compressed bytes. Digests are always taken over the plain value, so
+# nodes with different codecs or thresholds still agree on chunk hashes.
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+CODEC_NAMES = {"none": CODEC_NONE, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+_LABELS = {code: name for name, code in CODEC_NAMES.items()}
+
+COMPRESS_THRESHOLD = 1024  # values shorter than this (in bytes) are stored as-is
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+DEFAULT_CODEC = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+# zstd contexts must not be shared between threads
+_zstd_local = threading.local()
+
+
+def as_buffer(value):
+    """
+    Any bytes-like value as-is (memoryviews included, no copy); str is
+    encoded as UTF-8. For paths that only read the value once, such as
+    hashing, compressing or binding it into SQLite.
+    """
+    return value.encode("utf-8") if isinstance(value, str) else value
+
+
+def as_bytes(value):
+    """
+    An immutable bytes object, for backends that keep the value in memory.
+    None (a tombstone) stays None.
+    """
+    if value is None or isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    return bytes(value)
+
+
+def available_codecs():
+    codecs = [CODEC_ZLIB]
+    if zstandard is not None:
+        codecs.append(CODEC_ZSTD)
+    return codecs
+
+
+def codec_from_name(name):
+    """
+    Resolve a configured codec name; zstd falls back to zlib when the
+    zstandard package is not installed.
+    """
+    codec = CODEC_NAMES.get(name.lower())
+    if codec is None:
+        raise ValueError(f"unknown codec {name!r}")
+    if codec == CODEC_ZSTD and zstandard is None:
+        return CODEC_ZLIB
+    return codec
+
+
+def _zstd(kind):
+    ctx = getattr(_zstd_local, kind, None)
+    if ctx is None:
+        if kind == "compressor":
+            ctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        else:
+            ctx = zstandard.ZstdDecompressor()
+        setattr(_zstd_local, kind, ctx)
+    return ctx
+
+
+def _compress(codec, raw):
+    if codec == CODEC_ZLIB:
+        return zlib.compress(raw, ZLIB_LEVEL)
+    if codec == CODEC_ZSTD:
+        return _zstd("compressor").compress(raw)
+    raise ValueError(f"unknown codec {codec}")
+
+
+def _decompress(codec, payload):
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed value but zstandard is not installed")
+        return _zstd("decompressor").decompress(payload)
+    raise ValueError(f"unknown codec {codec}")
+
+
+def encode_value(value, codec=DEFAULT_CODEC, threshold=COMPRESS_THRESHOLD):
+    """
+    (codec, payload) for a bytes-like value. Values under `threshold`
+    bytes, or that do not shrink, are kept as CODEC_NONE. threshold=None
+    disables compression. A tombstone (None) is (CODEC_NONE, None).
+    """
+    if value is None:
+        return CODEC_NONE, None
+
+    size = value.nbytes if isinstance(value, memoryview) else len(value)
+    if codec == CODEC_NONE or threshold is None or size < threshold:
+        return CODEC_NONE, value
+
+    started = time.thread_time()
+    payload = _compress(codec, value)
+    label = _LABELS[codec]
+    compression_seconds.labels(label, "compress").observe(time.thread_time() - started)
+
+    if len(payload) >= size:
+        return CODEC_NONE, value
+
+    compression_input_bytes.labels(label).inc(size)
+    compression_output_bytes.labels(label).inc(len(payload))
+    return codec, payload
+
+
+def decode_value(codec, payload):
+    if codec == CODEC_NONE or payload is None:
+        return payload
+
+    started = time.thread_time()
+    value = _decompress(codec, payload)
+    compression_seconds.labels(_LABELS[codec], "decompress").observe(time.thread_time() - started)
+    return value
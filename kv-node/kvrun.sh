@@ -28,6 +28,34 @@ print_check_config() {
 | DATA_DIR             | `data/node{N}`                                      | SQLite DB dir                                |
 | ANTI_ENTROPY_INTERVAL| `30`                                               | Anti-entropy interval (seconds)              |
 | DEBUG_LOG            | `false`                                             | Enable verbose logging                       |
+| GROUP_COMMIT         | `false`                                             | Batch concurrent SQLite puts per commit      |
+| GROUP_COMMIT_WINDOW_MS| `2`                                                | Max wait for a group commit batch (ms)       |
+| GROUP_COMMIT_MAX_BATCH| `256`                                              | Max keys per group commit                    |
+| STORAGE_BACKEND      | `sqlite`                                            | Storage engine: `sqlite`, `lsm` or `bitcask` |
+| READ_CACHE_ENTRIES   | `0`                                                 | Read cache size in keys (`0` disables it)    |
+| READ_CACHE_NEGATIVE  | `false`                                             | Also cache lookups of missing keys           |
+| VALUE_CODEC          | `zstd`                                              | Value compression: `none`, `zlib` or `zstd` (falls back to zlib) |
+| COMPRESS_THRESHOLD   | `1024`                                              | Compress values of at least this many bytes  |
+| COMPRESS_REPLICATION | `false`                                             | Ship compressed values on Replicate (all nodes upgraded) |
+| TOMBSTONE_GRACE_SECONDS | `86400`                                         | Age after which tombstones are purged        |
+| TOMBSTONE_GC_INTERVAL | `600`                                              | Seconds between tombstone GC passes          |
+| EXPIRY_SWEEP_INTERVAL | `1`                                                | Seconds between sweeps of expired TTL keys   |
+| SNAPSHOT_BOOTSTRAP | `true` | Copy a peer snapshot when starting with an empty store |
+| SNAPSHOT_BOOTSTRAP_WAIT | `10` | Seconds to wait for gossip to find a snapshot peer |
+| HINTS_MAX_PER_PEER | `100000` | Failed replications queued per peer (0 disables) |
+| HINT_REPLAY_INTERVAL | `5` | Seconds between hinted-handoff replay passes |
+| REPLICATION_QUEUE_SIZE | `10000` | Distinct keys queued per peer for replication |
+| REPLICATION_BATCH_SIZE | `128` | Writes per ReplicateBatch call |
+| REPLICATION_ENQUEUE_TIMEOUT_MS | `1000` | How long a Put waits on a full replication queue |
+| GRPC_KEEPALIVE_MS | `30000` | Keepalive ping interval on idle peer channels |
+| GRPC_MAX_MESSAGE_MB | `16` | Largest gRPC message sent or received between nodes |
+| GRPC_COMPRESSION | `none` | Channel compression for peer RPCs: `none`, `gzip` or `deflate` |
+| GRPC_CHANNEL_EVICT_AFTER | `60` | Seconds without gossip before a peer's channel is closed |
+| GRPC_SERVER_MODE | `thread` | gRPC server: `thread` (thread pool) or `aio` (asyncio event loop) |
+| GRPC_STORAGE_WORKERS | `32` | Threads running storage work in `aio` mode |
+| GRPC_MAX_CONCURRENT_RPCS | `4096` | RPCs in flight in `aio` mode before new ones are refused |
+| READ_HEDGE_PERCENTILE | `95` | Latency percentile of a replica after which a `QUORUM` read is hedged to the next replica |
+| READ_HEDGE_BUDGET | `0.1` | Hedged reads allowed per read, on average (`0` disables hedging) |
 EOF
 }
 
@@ -1,4 +1,6 @@
 from app.interfaces import PeerClient
+from app.merkle import node_hashes
+from app.value_codec import decode_value
 
 
 class FakePeerClient(PeerClient):
@@ -8,6 +10,9 @@ class FakePeerClient(PeerClient):
         self.hashes = {}
         self.ranges = {}
         self.get_responses = {}
+        # peer_addr -> StorageBackend answering merkle RPCs for that peer
+        self.peer_storages = {}
+        self.leaf_fetches = []
 
     def replicate(
         self,
@@ -56,3 +61,33 @@ class FakePeerClient(PeerClient):
         if isinstance(val, Exception):
             raise val
         return val
+
+    def get_merkle_nodes(
+        self,
+        peer_addr,
+        chunk_id,
+        level,
+        indices,
+        timeout=5
+    ):
+        storage = self.peer_storages.get(peer_addr)
+        if storage is None:
+            raise NotImplementedError("peer does not serve merkle nodes")
+        return node_hashes(storage.leaf_digests(chunk_id), level, indices)
+
+    def fetch_leaves(
+        self,
+        peer_addr,
+        chunk_id,
+        leaf_ids,
+        timeout=10
+    ):
+        storage = self.peer_storages.get(peer_addr)
+        if storage is None:
+            raise NotImplementedError("peer does not serve merkle leaves")
+        self.leaf_fetches.append((peer_addr, chunk_id, list(leaf_ids)))
+        # what FetchLeaves ships: expires_at rides along with the value
+        return [
+            (key, decode_value(codec, payload), modified_at, expires_at)
+            for key, codec, payload, modified_at, expires_at in storage.scan_leaves_encoded(chunk_id, leaf_ids)
+        ]
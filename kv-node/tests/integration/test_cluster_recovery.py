@@ -48,5 +48,5 @@ def test_cluster_anti_entropy_recovery():
 
     # Verify Node 1 was repaired and recovered key "user:100"
     val, ts = node1_storage.get("user:100")
-    assert val == "Bob"
+    assert val == b"Bob"
     assert ts == 300
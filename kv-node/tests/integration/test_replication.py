@@ -21,6 +21,6 @@ def test_replication_across_nodes():
     val1, ts1 = node1_storage.get("user:42")
     val2, ts2 = node2_storage.get("user:42")
 
-    assert val1 == val2 == "Alice"
+    assert val1 == val2 == b"Alice"
     assert ts1 == ts2 == 100
     assert len(peer_client.replications) == 1
@@ -0,0 +1,135 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import grpc
+import pytest
+
+from app import kv_pb2, kv_pb2_grpc
+from app.aio_server import create_aio_server
+from app.grpc_server import KeyValueServicer
+from app.memory_storage import InMemoryStorage
+from app.chunking import CHUNK_COUNT
+
+
+def run_against_server(storage, body, servicer=None):
+    """
+    Start an aio server for `storage` (or `servicer`) on a free port and
+    run `await body(stub)` against it.
+    """
+    async def main():
+        nonlocal servicer
+        if servicer is None:
+            servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=1, replicator=MagicMock())
+        server, port = create_aio_server(servicer, 0, storage_workers=2, peers=MagicMock())
+        await server.start()
+        try:
+            async with grpc.aio.insecure_channel(f"localhost:{port}") as channel:
+                return await body(kv_pb2_grpc.KeyValueStub(channel))
+        finally:
+            await server.stop(None)
+
+    return asyncio.run(main())
+
+
+def test_unary_rpcs_and_aborts():
+    storage = InMemoryStorage()
+
+    async def body(stub):
+        await stub.Put(kv_pb2.PutRequest(key="k", value="v", modified_at=100))
+        got = await stub.Get(kv_pb2.GetRequest(key="k"))
+        assert (got.found, got.value, got.modified_at) == (True, "v", 100)
+
+        with pytest.raises(grpc.aio.AioRpcError) as err:
+            await stub.Put(kv_pb2.PutRequest(key="k", value="v", ttl_seconds=-1))
+        assert err.value.code() == grpc.StatusCode.INVALID_ARGUMENT
+
+    run_against_server(storage, body)
+
+
+def test_many_requests_in_flight_on_two_storage_threads():
+    storage = InMemoryStorage()
+    storage.put_many([(f"k{i}", f"v{i}", 100) for i in range(500)])
+
+    async def body(stub):
+        return await asyncio.gather(*[stub.Get(kv_pb2.GetRequest(key=f"k{i}")) for i in range(500)])
+
+    responses = run_against_server(storage, body)
+    assert [r.value for r in responses] == [f"v{i}" for i in range(500)]
+
+
+def test_quorum_requests_wait_for_replicas_without_holding_storage_threads():
+    storage = InMemoryStorage()
+    replicator = MagicMock()
+    reader = MagicMock()
+    membership = {f"n{i}": {"addr": f"node{i}:50051"} for i in (1, 2, 3)}
+    servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=3, replicator=replicator, reader=reader)
+
+    async def body(stub):
+        release = asyncio.Event()
+
+        async def slow_acks(*args, **kwargs):
+            await release.wait()
+            return 1
+
+        async def slow_answers(*args, **kwargs):
+            await release.wait()
+            return [("node2:50051", b"new", 200, None)]
+
+        replicator.replicate_acked_aio = AsyncMock(side_effect=slow_acks)
+        reader.read_aio = AsyncMock(side_effect=slow_answers)
+        waiting = [
+            asyncio.ensure_future(stub.Put(kv_pb2.PutRequest(key=f"k{i}", value="v", modified_at=100, consistency=kv_pb2.QUORUM)))
+            for i in range(4)
+        ] + [asyncio.ensure_future(stub.Get(kv_pb2.GetRequest(key="k0", consistency=kv_pb2.QUORUM)))]
+
+        # more waiting requests than storage threads, and ONE still answers
+        while reader.read_aio.await_count + replicator.replicate_acked_aio.await_count < 5:
+            await asyncio.sleep(0.01)
+        local = await stub.Get(kv_pb2.GetRequest(key="k1"), timeout=1)
+        release.set()
+        return local, await asyncio.gather(*waiting)
+
+    with patch("app.grpc_server.membership", membership):
+        local, responses = run_against_server(storage, body, servicer)
+    assert (local.found, local.value) == (True, "v")
+    assert [r.message for r in responses[:4]] == ["stored on 2 replicas"] * 4
+    assert (responses[4].value, responses[4].modified_at) == ("new", 200)
+    assert replicator.replicate_acked_aio.call_args.kwargs["needed"] == 1
+    assert not replicator.replicate_acked.called and not reader.read.called
+
+
+def test_streaming_rpcs_cross_chunk_boundaries():
+    storage = InMemoryStorage()
+    storage.put_many([(f"k{i:04d}", b"v", 100) for i in range(600)])
+    storage.delete("k0001", 200)
+
+    async def body(stub):
+        scanned = [item async for item in stub.Scan(kv_pb2.ScanRequest(local_only=True))]
+        ranged = [item async for item in stub.FetchRange(kv_pb2.RangeRequest(chunk_id=0))]
+        return scanned, ranged
+
+    scanned, ranged = run_against_server(storage, body)
+    assert [item.key for item in scanned] == [f"k{i:04d}" for i in range(600)]
+    assert scanned[1].deleted
+    assert [item.key for item in ranged] == [key for key, _, _ in storage.scan_chunk_with_ts(0, CHUNK_COUNT)]
+
+
+def test_put_stream_acks_and_rejects_out_of_order_seq():
+    storage = InMemoryStorage()
+
+    def records(*seqs):
+        async def gen():
+            for seq in seqs:
+                yield kv_pb2.PutStreamRecord(seq=seq, item=kv_pb2.PutRequest(key=f"k{seq}", value="v", modified_at=100))
+        return gen()
+
+    async def body(stub):
+        acks = [(a.committed_seq, a.stored) async for a in stub.PutStream(records(1, 2, 3))]
+        assert acks == [(3, 3)]
+
+        with pytest.raises(grpc.aio.AioRpcError) as err:
+            [a async for a in stub.PutStream(records(4, 4))]
+        assert err.value.code() == grpc.StatusCode.INVALID_ARGUMENT
+
+    run_against_server(storage, body)
+    assert storage.get("k3") == (b"v", 100)
@@ -3,7 +3,11 @@ import pytest
 import zlib
 from unittest.mock import patch
 from app.memory_storage import InMemoryStorage
-from app.anti_entropy import AntiEntropyService, compute_chunk_hash, start_anti_entropy, log_ae, log_ae_event
+from app.anti_entropy import AntiEntropyService, compute_chunk_hash, is_unimplemented, start_anti_entropy, log_ae, log_ae_event
+from app.chunking import chunk_for_key, leaf_for_key
+from app.storage import SQLiteStorage
+from app.value_codec import CODEC_NONE, CODEC_ZLIB, encode_value
+from app import kv_pb2
 from tests.fakes import FakePeerClient
 
 
@@ -41,7 +45,7 @@ def test_anti_entropy_same_chunk_hash():
     service.process_single_peer(peer_addr)
 
     val, ts = storage.get("k1")
-    assert val == "v1"
+    assert val == b"v1"
     assert ts == 100
 
 
@@ -74,7 +78,7 @@ def test_anti_entropy_mismatch_remote_newer():
     service.process_single_peer(peer_addr)
 
     val, ts = storage.get("k1")
-    assert val == "v1_new"
+    assert val == b"v1_new"
     assert ts == 150
 
 
@@ -107,7 +111,7 @@ def test_anti_entropy_mismatch_remote_older():
     service.process_single_peer(peer_addr)
 
     val, ts = storage.get("k1")
-    assert val == "v1_new"
+    assert val == b"v1_new"
     assert ts == 200
 
 
@@ -152,3 +156,172 @@ def test_anti_entropy_start_service_thread():
     assert service._running is True
     service.stop()
     assert service._running is False
+
+
+def test_compute_chunk_hash_is_order_independent():
+    forward = InMemoryStorage()
+    backward = InMemoryStorage()
+    items = [(f"k{i}", f"v{i}", 100 + i) for i in range(40)]
+
+    for key, value, ts in items:
+        forward.put(key, value, ts)
+    for key, value, ts in reversed(items):
+        backward.put(key, value, ts)
+
+    for c in range(16):
+        assert compute_chunk_hash(forward, c) == compute_chunk_hash(backward, c)
+
+
+def test_anti_entropy_merkle_repair_fetches_only_differing_leaves():
+    storage = InMemoryStorage()
+    remote = InMemoryStorage()
+    for i in range(100):
+        storage.put(f"k{i}", f"v{i}", 100)
+        remote.put(f"k{i}", f"v{i}", 100)
+    remote.put("k5", "v5_new", 200)
+
+    peer_client = FakePeerClient()
+    peer_addr = "127.0.0.1:50052"
+    peer_client.peer_storages[peer_addr] = remote
+
+    service = AntiEntropyService(
+        storage=storage,
+        peer_client=peer_client,
+        peer_provider=lambda: [peer_addr],
+        own_id="node-1",
+        own_addr="127.0.0.1:50051"
+    )
+
+    chunk_id = chunk_for_key("k5")
+    assert service.repair_chunk_from_peer(peer_addr, chunk_id) == 1
+    assert peer_client.leaf_fetches == [(peer_addr, chunk_id, [leaf_for_key("k5")])]
+    assert storage.get("k5") == (b"v5_new", 200)
+    assert compute_chunk_hash(storage, chunk_id) == compute_chunk_hash(remote, chunk_id)
+
+
+def test_is_unimplemented():
+    class FakeCode:
+        name = "UNIMPLEMENTED"
+
+    class FakeRpcError(Exception):
+        def code(self):
+            return FakeCode()
+
+    assert is_unimplemented(NotImplementedError())
+    assert is_unimplemented(FakeRpcError())
+    assert not is_unimplemented(Exception("timeout"))
+
+
+def test_merge_remote_items_writes_in_batches():
+    storage = InMemoryStorage()
+    storage.put("k0", "local", 500)
+
+    calls = []
+    original = storage.put_many
+
+    def tracking_put_many(items):
+        calls.append(len(items))
+        return original(items)
+
+    storage.put_many = tracking_put_many
+
+    service = AntiEntropyService(
+        storage=storage,
+        peer_client=FakePeerClient(),
+        peer_provider=lambda: [],
+    )
+
+    remote = [(f"k{i}", f"v{i}", 100) for i in range(2500)]
+    with patch("app.anti_entropy.REPAIR_BATCH_SIZE", 1000):
+        repaired = service.merge_remote_items("peer", remote, local_versions={"k0": 500})
+
+    assert repaired == 2499
+    assert calls == [1000, 1000, 499]
+    assert storage.get("k0") == (b"local", 500)
+
+
+def test_merge_remote_items_keeps_compressed_payloads(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "node.db"), codec=CODEC_ZLIB, compress_threshold=64)
+    big = b"c" * 4000
+    codec, payload = encode_value(big, CODEC_ZLIB, threshold=64)
+    remote = [
+        kv_pb2.KeyValuePair(key="big", modified_at=100, codec=codec, compressed_value=payload),
+        kv_pb2.KeyValuePair(key="small", value=b"s", modified_at=100),
+    ]
+
+    service = AntiEntropyService(
+        storage=storage,
+        peer_client=FakePeerClient(),
+        peer_provider=lambda: [],
+    )
+
+    with patch("app.storage.encode_value") as encode:
+        assert service.merge_remote_items("peer", remote, local_versions={}) == 2
+    encode.assert_not_called()
+
+    assert storage.get("big") == (big, 100)
+    assert storage.get("small") == (b"s", 100)
+    stored = {key: (codec, payload) for key, codec, payload, _, _ in storage.scan_chunk_encoded(chunk_for_key("big"), 16)}
+    assert stored["big"] == (CODEC_ZLIB, payload)
+
+
+def test_merkle_repair_propagates_tombstones():
+    storage = InMemoryStorage()
+    remote = InMemoryStorage()
+    for i in range(20):
+        storage.put(f"k{i}", f"v{i}", 100)
+        remote.put(f"k{i}", f"v{i}", 100)
+    remote.delete("k5", 200)
+    # same second as the value it removes: the delete still wins
+    remote.delete("k6", 100)
+
+    peer_client = FakePeerClient()
+    peer_addr = "127.0.0.1:50052"
+    peer_client.peer_storages[peer_addr] = remote
+
+    service = AntiEntropyService(
+        storage=storage,
+        peer_client=peer_client,
+        peer_provider=lambda: [peer_addr],
+    )
+
+    for key in ("k5", "k6"):
+        chunk_id = chunk_for_key(key)
+        service.repair_chunk_from_peer(peer_addr, chunk_id)
+        assert compute_chunk_hash(storage, chunk_id) == compute_chunk_hash(remote, chunk_id)
+    assert storage.get("k5") == (None, 200)
+    assert storage.get("k6") == (None, 100)
+
+
+def test_merkle_repair_keeps_expires_at():
+    storage = InMemoryStorage()
+    remote = InMemoryStorage()
+    expires_at = int(time.time()) + 3600
+    remote.put_expiring("session", b"token", 100, expires_at)
+
+    peer_client = FakePeerClient()
+    peer_addr = "127.0.0.1:50052"
+    peer_client.peer_storages[peer_addr] = remote
+
+    service = AntiEntropyService(
+        storage=storage,
+        peer_client=peer_client,
+        peer_provider=lambda: [peer_addr],
+    )
+
+    service.repair_chunk_from_peer(peer_addr, chunk_for_key("session"))
+    assert storage.get_with_expiry("session") == (b"token", 100, expires_at)
+
+
+def test_merge_remote_items_reads_deleted_pairs():
+    storage = InMemoryStorage()
+    storage.put("k", "v", 100)
+    service = AntiEntropyService(
+        storage=storage,
+        peer_client=FakePeerClient(),
+        peer_provider=lambda: [],
+    )
+
+    remote = [kv_pb2.KeyValuePair(key="k", modified_at=100, deleted=True)]
+    assert service.merge_remote_items("peer", remote) == 1
+    assert storage.get("k") == (None, 100)
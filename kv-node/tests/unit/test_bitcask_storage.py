@@ -0,0 +1,232 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from app import bitcask_storage
+from app.bitcask_storage import BitcaskStorage
+from app.chunking import CHUNK_COUNT, chunk_for_key, digest_of_items, digest_to_bytes
+
+
+def _files(path, suffix):
+    return sorted(name for name in os.listdir(path) if name.endswith(suffix))
+
+
+def test_put_get_and_last_write_wins(tmp_path):
+    storage = BitcaskStorage(str(tmp_path / "bc"), background_merge=False)
+
+    assert storage.put("user:1", "Anas", 100)
+    assert storage.get("user:1") == (b"Anas", 100)
+    assert storage.get("missing") == (None, 0)
+    assert storage.put("user:1", "older", 50) is False
+    assert storage.put("user:1", "same-ts", 100) is False
+    assert storage.get("user:1") == (b"Anas", 100)
+
+
+def test_get_is_a_single_pread(tmp_path):
+    storage = BitcaskStorage(str(tmp_path / "bc"), background_merge=False)
+    storage.put_many([(f"k{i}", f"v{i}", 10) for i in range(20)])
+
+    with patch.object(bitcask_storage.os, "pread", wraps=os.pread) as pread:
+        assert storage.get("k7") == (b"v7", 10)
+
+    assert pread.call_count == 1
+
+
+def test_rotation_writes_hint_files(tmp_path):
+    path = str(tmp_path / "bc")
+    storage = BitcaskStorage(path, segment_limit=200, background_merge=False)
+
+    for i in range(40):
+        storage.put(f"k{i:03d}", f"v{i}", 10)
+
+    data = _files(path, ".data")
+    hints = _files(path, ".hint")
+    assert len(data) > 1
+    # every segment but the active one is sealed with a hint file
+    assert len(hints) == len(data) - 1
+
+
+def test_restart_rebuilds_keydir_from_hints(tmp_path):
+    path = str(tmp_path / "bc")
+    storage = BitcaskStorage(path, segment_limit=200, background_merge=False)
+    for i in range(40):
+        storage.put(f"k{i:03d}", f"v{i}", 10)
+    storage.put("k001", "newer", 20)
+    expected = [storage.chunk_digest(c, CHUNK_COUNT) for c in range(CHUNK_COUNT)]
+    storage.close()
+
+    # hint files must be enough; values are only read for the active segment
+    reopened = BitcaskStorage(path, segment_limit=200, background_merge=False)
+    assert reopened.get("k001") == (b"newer", 20)
+    assert reopened.get("k039") == (b"v39", 10)
+    assert [reopened.chunk_digest(c, CHUNK_COUNT) for c in range(CHUNK_COUNT)] == expected
+
+
+def test_torn_tail_is_truncated_on_restart(tmp_path):
+    path = str(tmp_path / "bc")
+    storage = BitcaskStorage(path, background_merge=False)
+    storage.put("a", "1", 10)
+    storage.put("b", "2", 10)
+    storage.close()
+
+    active = os.path.join(path, _files(path, ".data")[-1])
+    with open(active, "ab") as f:
+        f.write(b"\x01\x02\x03 half a record")
+
+    reopened = BitcaskStorage(path, background_merge=False)
+    assert reopened.get("a") == (b"1", 10)
+    assert reopened.get("b") == (b"2", 10)
+
+    assert reopened.put("c", "3", 10)
+    reopened.close()
+    assert BitcaskStorage(path, background_merge=False).get("c") == (b"3", 10)
+
+
+def test_merge_reclaims_dead_segments(tmp_path):
+    path = str(tmp_path / "bc")
+    storage = BitcaskStorage(path, segment_limit=200, background_merge=False)
+
+    for ts in range(1, 6):
+        for i in range(10):
+            storage.put(f"k{i}", f"v{i}-{ts}", ts)
+
+    before = _files(path, ".data")
+    digest_before = [storage.chunk_digest(c, CHUNK_COUNT) for c in range(CHUNK_COUNT)]
+    storage.merge()
+    after = _files(path, ".data")
+
+    # every sealed segment collapses into one merged segment + the active one
+    assert len(after) <= 2 < len(before)
+    for i in range(10):
+        assert storage.get(f"k{i}") == (f"v{i}-5".encode(), 5)
+    assert [storage.chunk_digest(c, CHUNK_COUNT) for c in range(CHUNK_COUNT)] == digest_before
+
+    storage.close()
+    reopened = BitcaskStorage(path, segment_limit=200, background_merge=False)
+    for i in range(10):
+        assert reopened.get(f"k{i}") == (f"v{i}-5".encode(), 5)
+
+
+def test_merge_closes_replaced_segments_after_running_scans_finish(tmp_path):
+    path = str(tmp_path / "bc")
+    storage = BitcaskStorage(path, segment_limit=200, background_merge=False)
+    for i in range(30):
+        storage.put(f"k{i:02d}", f"v{i}", 10)
+    old = [f for file_id, f in storage._files.items() if file_id != storage._active_id]
+    assert old
+
+    scan = storage.scan_range("k")
+    assert next(scan) == ("k00", b"v0", 10)
+    storage.merge()
+
+    assert not any(f.closed for f in old)
+    assert len(list(scan)) == 29
+    assert all(f.closed for f in old)
+
+    live = list(storage._files.values())
+    storage.close()
+    assert all(f.closed for f in live)
+
+
+def test_merge_keeps_writes_that_raced_it(tmp_path):
+    path = str(tmp_path / "bc")
+    storage = BitcaskStorage(path, segment_limit=100, background_merge=False)
+    for i in range(10):
+        storage.put(f"k{i}", "old", 1)
+
+    real_write_hints = storage._write_hints
+
+    def write_hints_then_race(file_id, entries):
+        real_write_hints(file_id, entries)
+        storage.put("k3", "raced", 2)
+
+    with patch.object(storage, "_write_hints", side_effect=write_hints_then_race):
+        storage.merge()
+
+    assert storage.get("k3") == (b"raced", 2)
+    assert storage.get("k4") == (b"old", 1)
+
+
+def test_digest_matches_recompute_after_overwrites(tmp_path):
+    storage = BitcaskStorage(str(tmp_path / "bc"), segment_limit=150, background_merge=False)
+    items = {}
+    for ts in range(1, 4):
+        for i in range(30):
+            storage.put(f"key-{i}", f"value-{i}-{ts}", ts)
+            items[f"key-{i}"] = (f"value-{i}-{ts}", ts)
+    storage.merge()
+
+    for chunk_id in range(CHUNK_COUNT):
+        expected = digest_to_bytes(digest_of_items(
+            (k, v, ts) for k, (v, ts) in items.items()
+            if chunk_for_key(k) == chunk_id
+        ))
+        assert storage.chunk_digest(chunk_id, CHUNK_COUNT) == expected
+
+
+def test_purged_tombstone_stays_gone_after_merge_and_restart(tmp_path):
+    path = str(tmp_path / "bc")
+    storage = BitcaskStorage(path, segment_limit=200, background_merge=False)
+    for i in range(20):
+        storage.put(f"k{i:03d}", f"v{i}", 10)
+    storage.delete("k001", 20)
+    assert storage.get("k001") == (None, 20)
+    for i in range(20, 40):
+        storage.put(f"k{i:03d}", f"v{i}", 10)
+
+    assert storage.purge_tombstones(30) == 1
+    assert storage.get("k001") == (None, 0)
+    storage.merge()
+    expected = [storage.chunk_digest(c, CHUNK_COUNT) for c in range(CHUNK_COUNT)]
+    storage.close()
+
+    reopened = BitcaskStorage(path, segment_limit=200, background_merge=False)
+    assert reopened.get("k001") == (None, 0)
+    assert reopened.get("k002") == (b"v2", 10)
+    assert [reopened.chunk_digest(c, CHUNK_COUNT) for c in range(CHUNK_COUNT)] == expected
+
+
+def test_purged_tombstone_does_not_bring_back_older_value_after_restart(tmp_path):
+    path = str(tmp_path / "bc")
+    storage = BitcaskStorage(path, background_merge=False)
+    storage.put("k", "vvvvvvvvvv", 5)
+    storage._rotate()
+    storage.delete("k", 10)
+
+    assert storage.purge_tombstones(30) == 1
+    storage._rotate()
+    storage.close()
+
+    reopened = BitcaskStorage(path, background_merge=False)
+    assert reopened.get("k") == (None, 0)
+
+
+def test_merge_interrupted_after_commit_finishes_on_restart(tmp_path):
+    path = str(tmp_path / "bc")
+    storage = BitcaskStorage(path, background_merge=False)
+    storage.put("k", "v", 5)
+    storage.put("other", "v", 5)
+    storage._rotate()
+    storage.delete("k", 10)
+    storage._rotate()
+
+    value_segment, tombstone_segment = sorted(storage._files)[:2]
+
+    def crash_after_tombstone_segment(file_id):
+        # the value's segment is still on disk when the process dies
+        if file_id == tombstone_segment:
+            os.remove(storage._data_path(file_id))
+            raise OSError("crash")
+
+    with patch.object(storage, "_remove_segment", side_effect=crash_after_tombstone_segment):
+        with pytest.raises(OSError):
+            storage.purge_tombstones(30)
+    assert os.path.exists(storage._data_path(value_segment))
+    assert _files(path, ".merged")
+    storage.close()
+
+    reopened = BitcaskStorage(path, background_merge=False)
+    assert reopened.get("k") == (None, 0)
+    assert reopened.get("other") == (b"v", 5)
+    assert not _files(path, ".merged")
@@ -0,0 +1,205 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.cached_storage import CachedStorage
+from app.memory_storage import InMemoryStorage
+from app.metrics import cache_hits, cache_misses, cache_evictions
+
+
+def _counted_backend():
+    backend = InMemoryStorage()
+    backend.get_with_expiry = MagicMock(side_effect=backend.get_with_expiry)
+    return backend
+
+
+def test_repeated_get_is_served_from_cache():
+    backend = _counted_backend()
+    storage = CachedStorage(backend, max_entries=10)
+    storage.put("a", "1", 10)
+
+    hits = cache_hits._value.get()
+    misses = cache_misses._value.get()
+
+    assert storage.get("a") == (b"1", 10)
+    assert storage.get("a") == (b"1", 10)
+    assert storage.get("a") == (b"1", 10)
+
+    assert backend.get_with_expiry.call_count == 1
+    assert cache_misses._value.get() == misses + 1
+    assert cache_hits._value.get() == hits + 2
+
+
+def test_get_many_reads_only_uncached_keys_from_the_backend():
+    backend = InMemoryStorage()
+    backend.get_many_with_expiry = MagicMock(side_effect=backend.get_many_with_expiry)
+    storage = CachedStorage(backend, max_entries=10)
+    storage.put_many([("a", "1", 10), ("b", "2", 10)])
+    storage.get("a")
+
+    hits = cache_hits._value.get()
+    misses = cache_misses._value.get()
+
+    assert storage.get_many(["a", "b", "c", "b"]) == {"a": (b"1", 10), "b": (b"2", 10), "c": (None, 0)}
+    assert backend.get_many_with_expiry.call_args.args[0] == ["b", "c"]
+    assert cache_hits._value.get() == hits + 1
+    assert cache_misses._value.get() == misses + 2
+
+    # b was filled, c (a miss) was not
+    assert storage.get_many(["a", "b"]) == {"a": (b"1", 10), "b": (b"2", 10)}
+    assert backend.get_many_with_expiry.call_count == 1
+
+
+def test_put_refreshes_cached_value():
+    storage = CachedStorage(InMemoryStorage(), max_entries=10)
+    storage.put("a", "1", 10)
+    storage.get("a")
+
+    assert storage.put("a", "2", 20)
+    assert storage.get("a") == (b"2", 20)
+
+    assert storage.put("a", "stale", 15) is False
+    assert storage.get("a") == (b"2", 20)
+
+
+def test_put_racing_a_newer_put_keeps_the_newer_cached_value():
+    backend = InMemoryStorage()
+    storage = CachedStorage(backend, max_entries=10)
+    storage.put("a", "0", 5)
+    storage.get("a")
+    real_put = backend.put
+
+    def put_then_race(key, value, modified_at):
+        applied = real_put(key, value, modified_at)
+        if modified_at == 10:
+            # a newer put lands and refreshes the cache before this one does
+            storage.put(key, "newer", 20)
+        return applied
+
+    backend.put = put_then_race
+    assert storage.put("a", "older", 10)
+    assert storage.get("a") == (b"newer", 20)
+
+
+def test_put_many_invalidates_cached_keys():
+    storage = CachedStorage(InMemoryStorage(), max_entries=10)
+    storage.put("a", "1", 10)
+    storage.get("a")
+
+    # repair / replicate batches go through put_many
+    assert storage.put_many([("a", "2", 20), ("b", "3", 20)]) == 2
+    assert storage.get("a") == (b"2", 20)
+    assert storage.get("b") == (b"3", 20)
+
+
+def test_negative_cache():
+    backend = _counted_backend()
+    storage = CachedStorage(backend, max_entries=10, negative_cache=True)
+
+    assert storage.get("missing") == (None, 0)
+    assert storage.get("missing") == (None, 0)
+    assert backend.get_with_expiry.call_count == 1
+
+    storage.put("missing", "now here", 10)
+    assert storage.get("missing") == (b"now here", 10)
+
+
+def test_misses_not_cached_by_default():
+    backend = _counted_backend()
+    storage = CachedStorage(backend, max_entries=10)
+
+    storage.get("missing")
+    storage.get("missing")
+    assert backend.get_with_expiry.call_count == 2
+
+
+def test_eviction_keeps_keys_hit_twice():
+    backend = _counted_backend()
+    storage = CachedStorage(backend, max_entries=4)
+    for i in range(10):
+        storage.put(f"k{i}", str(i), 10)
+
+    storage.get("hot")
+    storage.put("hot", "h", 10)
+    storage.get("hot")
+    storage.get("hot")  # promoted to the protected segment
+
+    evictions = cache_evictions._value.get()
+    for i in range(10):
+        storage.get(f"k{i}")  # one-off scan
+
+    assert len(storage) == 4
+    assert cache_evictions._value.get() > evictions
+
+    calls = backend.get_with_expiry.call_count
+    assert storage.get("hot") == (b"h", 10)
+    assert backend.get_with_expiry.call_count == calls
+
+
+def test_read_racing_a_write_does_not_fill_stale_value():
+    backend = InMemoryStorage()
+    backend.put("a", "old", 10)
+    storage = CachedStorage(backend, max_entries=10)
+
+    reading = threading.Event()
+    release = threading.Event()
+    real_get = backend.get_with_expiry
+
+    def slow_get(key):
+        result = real_get(key)
+        reading.set()
+        release.wait(5)
+        return result
+
+    backend.get_with_expiry = slow_get
+    reader = threading.Thread(target=storage.get, args=("a",))
+    reader.start()
+    reading.wait(5)
+
+    storage.put_many([("a", "new", 20)])
+    release.set()
+    reader.join()
+
+    backend.get_with_expiry = real_get
+    assert storage.get("a") == (b"new", 20)
+
+
+def test_passes_through_backend_extras():
+    backend = InMemoryStorage()
+    backend.close = MagicMock()
+    storage = CachedStorage(backend)
+
+    storage.close()
+    backend.close.assert_called_once()
+
+    with pytest.raises(ValueError):
+        CachedStorage(backend, max_entries=0)
+
+
+def test_purge_drops_cached_tombstones():
+    storage = CachedStorage(InMemoryStorage(), max_entries=10, negative_cache=True)
+    storage.put("k", "v", 10)
+    storage.delete("k", 20)
+    assert storage.get("k") == (None, 20)
+
+    assert storage.purge_tombstones(30) == 1
+    assert storage.get("k") == (None, 0)
+
+
+def test_cached_value_is_not_served_past_its_expiry():
+    backend = _counted_backend()
+    storage = CachedStorage(backend, max_entries=10)
+    now = int(time.time())
+    storage.put_expiring("session", "s", 100, now + 60)
+
+    assert storage.get("session") == (b"s", 100)
+    assert storage.get("session") == (b"s", 100)
+    assert backend.get_with_expiry.call_count == 1
+
+    # not swept yet: the cache alone must stop serving it
+    with patch("time.time", return_value=now + 61):
+        assert storage.get("session") == (None, 100)
+        assert storage.get_many(["session"]) == {"session": (None, 100)}
+    assert backend.get_with_expiry.call_count == 3
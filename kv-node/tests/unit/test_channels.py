@@ -0,0 +1,97 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import grpc
+import pytest
+
+from app.channels import AsyncChannelPool, ChannelPool, channel_options, server_options, compression_from_name
+from app.metrics import grpc_channels_created, grpc_channels_evicted, grpc_channel_ready, grpc_channel_failures
+
+
+@pytest.fixture
+def insecure_channel():
+    with patch("app.channels.grpc.insecure_channel", side_effect=lambda *args, **kwargs: MagicMock()) as mock_channel:
+        yield mock_channel
+
+
+def test_pool_opens_one_channel_per_peer(insecure_channel):
+    pool = ChannelPool(compression=grpc.Compression.Gzip)
+    created = grpc_channels_created._value.get()
+
+    stub = pool.stub("node2:50051")
+    assert pool.stub("node2:50051") is stub
+    assert pool.stub("node3:50051") is not stub
+    assert pool.channel("node2:50051") is not pool.channel("node3:50051")
+
+    assert insecure_channel.call_count == 2
+    assert insecure_channel.call_args.kwargs == {"options": channel_options(), "compression": grpc.Compression.Gzip}
+    assert grpc_channels_created._value.get() == created + 2
+    assert pool.peers() == ["node2:50051", "node3:50051"]
+
+
+def test_pool_evicts_peers_gossip_lost(insecure_channel):
+    pool = ChannelPool()
+    stub = pool.stub("node2:50051")
+    channel = pool.channel("node2:50051")
+    pool.stub("node3:50051")
+    evicted = grpc_channels_evicted._value.get()
+
+    assert pool.evict_dead(lambda peer: peer == "node3:50051") == ["node2:50051"]
+    assert channel.close.called
+    assert pool.peers() == ["node3:50051"]
+    assert grpc_channels_evicted._value.get() == evicted + 1
+    assert not pool.evict("node2:50051")
+
+    # the next call reconnects
+    assert pool.stub("node2:50051") is not stub
+
+    pool.close()
+    assert len(pool) == 0
+
+
+def test_async_pool_is_evicted_with_its_sync_pool():
+    pool = ChannelPool()
+
+    async def main():
+        peers = AsyncChannelPool(pool)
+        stub = peers.stub("node2:50051")
+        assert peers.stub("node2:50051") is stub
+        peers.stub("node3:50051")
+
+        # the eviction thread closes the channel on the loop that opened it
+        await asyncio.to_thread(peers.evict_dead, lambda peer: peer == "node3:50051")
+        assert len(peers) == 1
+        await peers.close()
+        assert len(peers) == 0 and peers not in pool._attached
+
+    asyncio.run(main())
+
+
+def test_pool_tracks_connection_state(insecure_channel):
+    pool = ChannelPool()
+    channel = pool.channel("node4:50051")
+    on_state = channel.subscribe.call_args.args[0]
+    failures = grpc_channel_failures.labels("node4:50051")._value.get()
+
+    on_state(grpc.ChannelConnectivity.READY)
+    assert grpc_channel_ready.labels("node4:50051")._value.get() == 1
+
+    on_state(grpc.ChannelConnectivity.TRANSIENT_FAILURE)
+    assert grpc_channel_ready.labels("node4:50051")._value.get() == 0
+    assert grpc_channel_failures.labels("node4:50051")._value.get() == failures + 1
+
+    pool.evict("node4:50051")
+    channel.unsubscribe.assert_called_once_with(on_state)
+
+
+def test_compression_from_name():
+    assert compression_from_name("GZIP") == grpc.Compression.Gzip
+    assert compression_from_name("none") == grpc.Compression.NoCompression
+    with pytest.raises(ValueError):
+        compression_from_name("brotli")
+
+
+def test_server_allows_pings_well_under_the_client_keepalive():
+    client = dict(channel_options(keepalive_ms=10_000))
+    server = dict(server_options(keepalive_ms=10_000))
+    assert server["grpc.http2.min_ping_interval_without_data_ms"] < client["grpc.keepalive_time_ms"]
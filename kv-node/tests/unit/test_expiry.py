@@ -0,0 +1,42 @@
+from app.memory_storage import InMemoryStorage
+from app.expiry import ExpirySweeper
+from app.metrics import keys_expired
+
+
+def test_run_once_expires_in_batches():
+    storage = InMemoryStorage()
+    for i in range(25):
+        storage.put_expiring(f"k{i}", "v", 10, 100)
+    storage.put_expiring("later", "v", 10, 500)
+
+    calls = []
+    original = storage.expire
+
+    def tracking_expire(now, limit):
+        expired = original(now, limit)
+        calls.append(len(expired))
+        return expired
+
+    storage.expire = tracking_expire
+    before = keys_expired._value.get()
+
+    assert ExpirySweeper(storage, batch_size=10).run_once(now=200) == 25
+    assert calls == [10, 10, 5]
+    assert keys_expired._value.get() == before + 25
+    assert storage.get_entry("k0")[0] is None
+    # not due at `now` yet, so not swept
+    assert storage.get_entry("later")[0] == b"v"
+
+
+def test_background_loop_runs_and_stops():
+    storage = InMemoryStorage()
+    storage.put_expiring("k", "v", 10, 20)
+
+    sweeper = ExpirySweeper(storage, interval=0.01)
+    sweeper.start()
+    sweeper._thread.join(0.5)
+    sweeper.stop()
+    sweeper._thread.join(1)
+
+    assert not sweeper._thread.is_alive()
+    assert storage.get_entry("k")[0] is None
@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
-from app.gossip import app, membership, ensure_self_in_membership
+from unittest.mock import patch
+from app.gossip import app, membership, ensure_self_in_membership, is_alive
 
 
 client = TestClient(app)
@@ -32,3 +33,17 @@ def test_gossip_endpoints():
 def test_ensure_self_in_membership():
     ensure_self_in_membership("node-1", "127.0.0.1:50051", 10)
     assert membership["node-1"]["hb"] == 10
+
+
+def test_is_alive_follows_gossip_from_restarted_nodes():
+    with patch.dict(membership, clear=True):
+        client.post("/gossip", json={"node_id": "node-3", "addr": "node3:50051", "heartbeat": 50})
+        assert is_alive("node3:50051")
+        assert not is_alive("node4:50051")
+
+        membership["node-3"]["seen"] -= 60
+        assert not is_alive("node3:50051")
+
+        # back from a restart, heartbeat counting from 1 again
+        client.post("/gossip", json={"node_id": "node-3", "addr": "node3:50051", "heartbeat": 1})
+        assert is_alive("node3:50051")
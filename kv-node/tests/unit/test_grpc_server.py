@@ -1,3 +1,6 @@
+import time
+import grpc
+import pytest
 from unittest.mock import MagicMock, patch
 from app.memory_storage import InMemoryStorage
 from app.grpc_server import (
@@ -8,9 +11,22 @@ from app.grpc_server import (
     log_read,
     log_replicate_send,
     log_replicate_recv,
+    log_delete,
     replicate_to_peer,
+    send_hints,
+    scan_peer_items,
+    required_acks,
+    replica_ring,
 )
 from app import kv_pb2
+from app.chunking import CHUNK_COUNT, LEAF_COUNT, chunk_for_key, leaf_for_key
+from app.storage import SQLiteStorage
+from app.value_codec import CODEC_NONE, CODEC_ZLIB, encode_value, decode_value
+from app.scan import encode_page_token
+from app.snapshot import receive_snapshot
+from app.hints import Hint
+from app.metrics import put_unavailable, get_unavailable, read_repairs, ring_rebuilds, read_hedges, read_hedge_wins
+from app.reads import ReplicaReader, PeerLatencies, HedgeBudget
 
 
 def test_logging_helpers():
@@ -20,6 +36,7 @@ def test_logging_helpers():
         log_read("node1:50051", "k", False)
         log_replicate_send("node1:50051", "node2:50051", "k")
         log_replicate_recv("node2:50051", "k", "v")
+        log_delete("node1:50051", "k", 100)
 
 
 def test_pick_replicas():
@@ -31,6 +48,9 @@ def test_pick_replicas():
         assert len(sorted_peers()) == 3
         replicas = pick_replicas_for_key("mykey", 2)
         assert len(replicas) == 2
+        assert replicas == pick_replicas_for_key("mykey", 2)
+        # distinct nodes, however large the replication factor
+        assert sorted(pick_replicas_for_key("mykey", 5)) == ["node1:50051", "node2:50051", "node3:50051"]
 
     with patch("app.grpc_server.membership", {}):
         assert pick_replicas_for_key("mykey", 2) == []
@@ -61,14 +81,14 @@ def test_grpc_servicer_replicate():
     storage = InMemoryStorage()
     servicer = KeyValueServicer(storage, own_addr="node2:50051", replication_factor=1)
 
-    req = kv_pb2.PutRequest(key="user:2", value="Bob", modified_at=200)
+    req = kv_pb2.ReplicateRequest(key="user:2", value=b"Bob", modified_at=200)
     context = MagicMock()
 
     resp = servicer.Replicate(req, context)
     assert resp.ok is True
 
     val, ts = storage.get("user:2")
-    assert val == "Bob"
+    assert val == b"Bob"
     assert ts == 200
 
 
@@ -87,16 +107,39 @@ def test_grpc_servicer_chunk_hash_and_fetch_range():
     assert isinstance(items, list)
 
 
-@patch("app.grpc_server.grpc.insecure_channel")
-def test_grpc_server_replicate_to_peer_helper(mock_channel):
-    mock_stub = MagicMock()
-    with patch("app.grpc_server.kv_pb2_grpc.KeyValueStub", return_value=mock_stub):
-        replicate_to_peer("node2:50051", "k", "v", 100, "node1:50051")
-        assert mock_stub.Replicate.called
+@patch("app.grpc_server.channel_pool")
+def test_grpc_server_replicate_to_peer_helper(mock_pool):
+    mock_stub = mock_pool.stub.return_value
+    replicate_to_peer("node2:50051", "k", b"v", 100, "node1:50051")
+    assert mock_stub.Replicate.called
+    mock_pool.stub.assert_called_with("node2:50051")
 
     mock_stub.Replicate.side_effect = Exception("gRPC error")
-    with patch("app.grpc_server.kv_pb2_grpc.KeyValueStub", return_value=mock_stub):
-        replicate_to_peer("node2:50051", "k", "v", 100, "node1:50051")
+    replicate_to_peer("node2:50051", "k", b"v", 100, "node1:50051")
+
+
+class Unimplemented(grpc.RpcError):
+    def code(self):
+        return grpc.StatusCode.UNIMPLEMENTED
+
+
+@patch("app.grpc_server.channel_pool")
+def test_send_hints_batches_and_falls_back_for_older_peers(mock_pool):
+    hints = [Hint(1, "a", CODEC_NONE, b"1", 100, None), Hint(2, "b", CODEC_NONE, None, 200, None)]
+    new_stub, old_stub = MagicMock(), MagicMock()
+    old_stub.ReplicateBatch.side_effect = Unimplemented()
+    mock_pool.stub.side_effect = {"new:1": new_stub, "old:1": old_stub}.get
+
+    send_hints("new:1", hints)
+    items = new_stub.ReplicateBatch.call_args.args[0].items
+    assert [(i.key, i.deleted) for i in items] == [("a", False), ("b", True)]
+    assert not new_stub.Replicate.called
+
+    # an older peer gets one Replicate per hint, and is not asked to batch again
+    send_hints("old:1", hints)
+    send_hints("old:1", hints)
+    assert old_stub.ReplicateBatch.call_count == 1
+    assert old_stub.Replicate.call_count == 4
 
 
 def test_grpc_servicer_put_replication():
@@ -105,9 +148,618 @@ def test_grpc_servicer_put_replication():
         "n1": {"addr": "node1:50051"},
         "n2": {"addr": "node2:50051"},
     }):
-        with patch("app.grpc_server.threading.Thread") as mock_thread:
-            servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=2)
-            req = kv_pb2.PutRequest(key="user:1", value="Alice", modified_at=100)
-            context = MagicMock()
-            servicer.Put(req, context)
-            assert mock_thread.called
+        replicator = MagicMock()
+        servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=2, replicator=replicator)
+        req = kv_pb2.PutRequest(key="user:1", value="Alice", modified_at=100)
+        context = MagicMock()
+        servicer.Put(req, context)
+        assert replicator.replicate.call_args.args == ("node2:50051", "user:1", b"Alice", 100, CODEC_NONE, None)
+
+
+def test_grpc_servicer_merkle_nodes_and_fetch_leaves():
+    storage = InMemoryStorage()
+    for i in range(50):
+        storage.put(f"key{i}", f"val{i}", 10)
+    servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=1)
+    context = MagicMock()
+
+    chunk_id = chunk_for_key("key1")
+    resp = servicer.GetMerkleNodes(kv_pb2.MerkleRequest(chunk_id=chunk_id, level=0, indices=[0]), context)
+    assert list(resp.hashes) == [storage.chunk_digest(chunk_id, 16)]
+
+    leaf_id = leaf_for_key("key1")
+    items = list(servicer.FetchLeaves(kv_pb2.LeafRequest(chunk_id=chunk_id, leaf_ids=[leaf_id]), context))
+    assert "key1" in {item.key for item in items}
+    assert all(leaf_for_key(item.key) == leaf_id for item in items)
+
+    context.abort.side_effect = Exception("aborted")
+    try:
+        servicer.GetMerkleNodes(kv_pb2.MerkleRequest(chunk_id=chunk_id, level=1, indices=[99]), context)
+    except Exception:
+        pass
+    assert context.abort.called
+
+    for request in (
+        kv_pb2.LeafRequest(chunk_id=CHUNK_COUNT, leaf_ids=[0]),
+        kv_pb2.LeafRequest(chunk_id=chunk_id, leaf_ids=[leaf_id, LEAF_COUNT]),
+    ):
+        context.abort.reset_mock()
+        with pytest.raises(Exception, match="aborted"):
+            list(servicer.FetchLeaves(request, context))
+        assert context.abort.call_args.args[0] == grpc.StatusCode.INVALID_ARGUMENT
+
+
+def test_fetch_range_passes_compressed_values_through(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "node.db"), codec=CODEC_ZLIB, compress_threshold=64)
+    big = b"z" * 4000
+    storage.put("big", big, 10)
+    servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=1)
+    chunk_id = chunk_for_key("big")
+
+    # callers that accept zlib get the stored bytes
+    [item] = servicer.FetchRange(kv_pb2.RangeRequest(chunk_id=chunk_id, accept_codecs=[CODEC_ZLIB]), MagicMock())
+    assert item.codec == CODEC_ZLIB
+    assert item.value == b""
+    assert decode_value(item.codec, item.compressed_value) == big
+
+    # older callers get plain values
+    [item] = servicer.FetchRange(kv_pb2.RangeRequest(chunk_id=chunk_id), MagicMock())
+    assert item.codec == CODEC_NONE
+    assert item.value == big
+
+
+@pytest.mark.parametrize("make_storage", [
+    lambda tmp_path: InMemoryStorage(),
+    lambda tmp_path: SQLiteStorage(str(tmp_path / "node.db")),
+])
+def test_fetch_range_ships_expires_at(tmp_path, make_storage):
+    storage = make_storage(tmp_path)
+    expires_at = int(time.time()) + 3600
+    storage.put_expiring("ttl", b"v", 10, expires_at)
+    storage.put("plain", b"v", 10)
+    servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=1)
+
+    for key, expected in (("ttl", expires_at), ("plain", 0)):
+        pairs = servicer.FetchRange(kv_pb2.RangeRequest(chunk_id=chunk_for_key(key)), MagicMock())
+        [item] = [pair for pair in pairs if pair.key == key]
+        assert item.expires_at == expected
+
+
+def test_replicate_stores_compressed_payload():
+    storage = InMemoryStorage()
+    servicer = KeyValueServicer(storage, own_addr="node2:50051", replication_factor=1)
+    big = b"w" * 4000
+    codec, payload = encode_value(big, CODEC_ZLIB, threshold=64)
+
+    req = kv_pb2.ReplicateRequest(key="big", modified_at=10, codec=codec, compressed_value=payload)
+    assert servicer.Replicate(req, MagicMock()).ok
+    assert storage.get("big") == (big, 10)
+
+
+def test_put_compresses_once_for_replicas():
+    storage = InMemoryStorage()
+    replicator = MagicMock()
+    servicer = KeyValueServicer(
+        storage,
+        own_addr="node1:50051",
+        replication_factor=2,
+        replicate_codec=CODEC_ZLIB,
+        compress_threshold=64,
+        replicator=replicator
+    )
+    big = b"q" * 4000
+
+    with patch("app.grpc_server.pick_replicas_for_key", return_value=["node1:50051", "node2:50051"]):
+        servicer.Put(kv_pb2.PutRequest(key="big", value_bytes=big, modified_at=10), MagicMock())
+
+    args = replicator.replicate.call_args.args
+    assert args[0] == "node2:50051"
+    assert args[4] == CODEC_ZLIB
+    assert decode_value(CODEC_ZLIB, args[2]) == big
+    assert storage.get("big") == (big, 10)
+
+
+def test_put_and_get_bytes_values():
+    storage = InMemoryStorage()
+    servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=1)
+    context = MagicMock()
+    binary = b"\xff\x00\xfe binary"
+
+    with patch("app.grpc_server.pick_replicas_for_key", return_value=[]):
+        servicer.Put(kv_pb2.PutRequest(key="bin", value_bytes=binary, modified_at=10), context)
+        servicer.Put(kv_pb2.PutRequest(key="text", value="héllo", modified_at=10), context)
+
+    assert storage.get("bin") == (binary, 10)
+    assert storage.get("text") == ("héllo".encode("utf-8"), 10)
+
+    # text clients get text back
+    resp = servicer.Get(kv_pb2.GetRequest(key="text"), context)
+    assert resp.WhichOneof("payload") == "value"
+    assert resp.value == "héllo"
+
+    # binary clients get the raw bytes
+    resp = servicer.Get(kv_pb2.GetRequest(key="text", want_bytes=True), context)
+    assert resp.value_bytes == "héllo".encode("utf-8")
+
+    # a value that is not UTF-8 is never mangled into text
+    resp = servicer.Get(kv_pb2.GetRequest(key="bin"), context)
+    assert resp.WhichOneof("payload") == "value_bytes"
+    assert resp.value_bytes == binary
+
+
+def test_delete_writes_and_replicates_a_tombstone():
+    storage = InMemoryStorage()
+    storage.put("user:1", "Alice", 100)
+    context = MagicMock()
+    with patch("app.grpc_server.membership", {
+        "n1": {"addr": "node1:50051"},
+        "n2": {"addr": "node2:50051"},
+    }):
+        replicator = MagicMock()
+        servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=2, replicator=replicator)
+        resp = servicer.Delete(kv_pb2.DeleteRequest(key="user:1", modified_at=200), context)
+
+    assert resp.ok is True
+    assert replicator.replicate.call_args.args == ("node2:50051", "user:1", None, 200)
+
+    get_resp = servicer.Get(kv_pb2.GetRequest(key="user:1"), context)
+    assert get_resp.found is False
+    assert get_resp.modified_at == 200
+
+    # tombstones take part in repair like values
+    pairs = list(servicer.FetchRange(kv_pb2.RangeRequest(chunk_id=chunk_for_key("user:1")), context))
+    assert [(p.key, p.deleted, p.modified_at) for p in pairs] == [("user:1", True, 200)]
+
+
+def test_replicate_applies_tombstones():
+    storage = InMemoryStorage()
+    storage.put("k", "v", 100)
+    servicer = KeyValueServicer(storage, own_addr="node2:50051", replication_factor=1)
+
+    servicer.Replicate(kv_pb2.ReplicateRequest(key="k", modified_at=200, deleted=True), MagicMock())
+    assert storage.get("k") == (None, 200)
+
+
+@patch("app.grpc_server.channel_pool")
+def test_replicate_to_peer_queues_a_hint_on_failure(mock_pool):
+    mock_pool.stub.return_value.Replicate.side_effect = Exception("unavailable")
+    hints = MagicMock()
+    replicate_to_peer("node2:50051", "k", b"z", 100, "node1:50051", CODEC_ZLIB, expires_at=160, hints=hints)
+    replicate_to_peer("node2:50051", "k", None, 200, "node1:50051", hints=hints)
+
+    assert [c.args for c in hints.add.call_args_list] == [
+        ("node2:50051", "k", b"z", 100, CODEC_ZLIB, 160),
+        ("node2:50051", "k", None, 200, CODEC_NONE, None),
+    ]
+
+
+@patch("app.grpc_server.channel_pool")
+def test_replicate_to_peer_sends_tombstone(mock_pool):
+    replicate_to_peer("node2:50051", "k", None, 100, "node1:50051")
+
+    req = mock_pool.stub.return_value.Replicate.call_args.args[0]
+    assert req.deleted is True
+    assert req.modified_at == 100
+
+
+def test_put_with_ttl_stores_and_replicates_expires_at():
+    storage = InMemoryStorage()
+    context = MagicMock()
+    with patch("app.grpc_server.membership", {
+        "n1": {"addr": "node1:50051"},
+        "n2": {"addr": "node2:50051"},
+    }):
+        replicator = MagicMock()
+        servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=2, replicator=replicator)
+        servicer.Put(kv_pb2.PutRequest(key="session", value="s", modified_at=100, ttl_seconds=60), context)
+
+    assert storage.get_with_expiry("session")[2] == 160
+    assert replicator.replicate.call_args.args[-1] == 160
+
+
+def test_replicate_with_expires_at():
+    storage = InMemoryStorage()
+    servicer = KeyValueServicer(storage, own_addr="node2:50051", replication_factor=1)
+    servicer.Replicate(kv_pb2.ReplicateRequest(key="k", value=b"v", modified_at=100, expires_at=160), MagicMock())
+    assert storage.get_with_expiry("k")[2] == 160
+
+
+def test_scan_local_only_streams_tombstones():
+    storage = InMemoryStorage()
+    for key in ["a", "user:1", "user:2", "user:3", "v"]:
+        storage.put(key, key.encode(), 100)
+    storage.delete("user:2", 200)
+    servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=1)
+
+    items = list(servicer.Scan(kv_pb2.ScanRequest(prefix="user:", local_only=True), MagicMock()))
+    assert [(i.key, i.deleted, i.modified_at) for i in items] == [
+        ("user:1", False, 100), ("user:2", True, 200), ("user:3", False, 100),
+    ]
+
+
+def test_scan_merges_peers_and_paginates():
+    storage = InMemoryStorage()
+    storage.put("k1", b"local", 100)
+    storage.put("k2", b"stale", 100)
+    storage.put("k4", b"deleted elsewhere", 100)
+    peer = [("k2", b"fresh", 200), ("k3", b"peer only", 100), ("k4", None, 200), ("k5", b"v5", 100)]
+    # one replica per key: each node holds keys the other does not
+    servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=1)
+    context = MagicMock()
+
+    with patch("app.grpc_server.membership", {
+        "n1": {"addr": "node1:50051"},
+        "n2": {"addr": "node2:50051"},
+    }), patch("app.grpc_server.scan_peer_items", side_effect=lambda p, start, end: iter(
+        item for item in peer if item[0] >= start and (end is None or item[0] < end)
+    )) as peer_scan:
+        page = list(servicer.Scan(kv_pb2.ScanRequest(limit=2), context))
+        assert [(i.key, i.value) for i in page] == [("k1", b"local"), ("k2", b"fresh")]
+        assert peer_scan.call_args.args == ("node2:50051", "", None)
+
+        rest = list(servicer.Scan(kv_pb2.ScanRequest(page_token=page[-1].page_token), context))
+        assert [(i.key, i.value) for i in rest] == [("k3", b"peer only"), ("k5", b"v5")]
+        assert rest[-1].page_token == encode_page_token("k5")
+
+    list(servicer.Scan(kv_pb2.ScanRequest(page_token="%%%"), context))
+    assert context.abort.call_args.args[0].name == "INVALID_ARGUMENT"
+
+
+def test_scan_reads_only_the_nodes_covering_every_replica_set():
+    membership = {f"n{i}": {"addr": f"node{i}:50051"} for i in (1, 2, 3)}
+    storage = InMemoryStorage()
+    storage.put("k", b"v", 100)
+    with patch("app.grpc_server.membership", membership), \
+            patch("app.grpc_server.scan_peer_items", side_effect=lambda p, start, end: (item for item in ())) as peer_scan:
+        # every node holds every key: this node alone covers the ring
+        servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=3)
+        assert [i.key for i in servicer.Scan(kv_pb2.ScanRequest(), MagicMock())] == ["k"]
+        assert not peer_scan.called
+
+        # a down peer is left out; the replicas it shares keys with cover for it
+        servicer = KeyValueServicer(
+            storage, own_addr="node1:50051", replication_factor=2, is_alive=lambda peer: peer != "node2:50051"
+        )
+        list(servicer.Scan(kv_pb2.ScanRequest(), MagicMock()))
+        assert [c.args[0] for c in peer_scan.call_args_list] == ["node3:50051"]
+        assert servicer.scan_owners() == ["node1:50051", "node3:50051"]
+
+
+@patch("app.grpc_server.channel_pool")
+def test_scan_peer_items_stops_on_peer_failure(mock_pool):
+    class FailingCall:
+        def __init__(self):
+            self.cancelled = False
+
+        def __iter__(self):
+            yield kv_pb2.ScanItem(key="a", value=b"1", modified_at=100)
+            yield kv_pb2.ScanItem(key="b", modified_at=200, deleted=True)
+            raise grpc.RpcError()
+
+        def cancel(self):
+            self.cancelled = True
+
+    call = FailingCall()
+    mock_stub = mock_pool.stub.return_value
+    mock_stub.Scan.return_value = call
+    items = list(scan_peer_items("node2:50051", "a", None))
+
+    assert items == [("a", b"1", 100), ("b", None, 200)]
+    assert mock_stub.Scan.call_args.args[0].local_only is True
+    assert call.cancelled
+    # the pooled channel stays open for the next call
+    assert not mock_pool.evict.called
+
+
+def test_snapshot_streams_a_restorable_copy(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "node.db"))
+    for i in range(200):
+        storage.put(f"key{i}", f"value{i}" * 50, 100)
+    snapshot_dir = tmp_path / "snapshots"
+    snapshot_dir.mkdir()
+    servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=1, snapshot_dir=str(snapshot_dir))
+
+    request = kv_pb2.SnapshotRequest(accept_formats=["sqlite", "records"], block_size=4096)
+    blocks = list(servicer.Snapshot(request, MagicMock()))
+    assert len(blocks) > 2
+    assert list(snapshot_dir.iterdir()) == []
+
+    path = str(tmp_path / "received")
+    assert receive_snapshot(iter(blocks), path) == "sqlite"
+    target = SQLiteStorage(str(tmp_path / "target.db"))
+    assert target.restore_from(path, "sqlite") == 200
+    assert target.get("key42") == storage.get("key42")
+
+    # a node that only reads records gets them instead
+    blocks = list(servicer.Snapshot(kv_pb2.SnapshotRequest(), MagicMock()))
+    assert receive_snapshot(iter(blocks), path) == "records"
+    restored = InMemoryStorage()
+    assert restored.restore_from(path, "records") == 200
+
+
+def test_replicate_batch_applies_every_kind_of_write():
+    storage = InMemoryStorage()
+    storage.put("gone", b"old", 100)
+    servicer = KeyValueServicer(storage, own_addr="node2:50051", replication_factor=1)
+    codec, payload = encode_value(b"z" * 4000, CODEC_ZLIB, 64)
+
+    resp = servicer.ReplicateBatch(kv_pb2.ReplicateBatchRequest(items=[
+        kv_pb2.ReplicateRequest(key="plain", value=b"v", modified_at=100),
+        kv_pb2.ReplicateRequest(key="big", codec=codec, compressed_value=payload, modified_at=100),
+        kv_pb2.ReplicateRequest(key="gone", modified_at=200, deleted=True),
+        kv_pb2.ReplicateRequest(key="session", value=b"s", modified_at=100, expires_at=160),
+        kv_pb2.ReplicateRequest(key="plain", value=b"older", modified_at=50),
+    ]), MagicMock())
+
+    assert resp.applied == 4
+    assert storage.get("plain") == (b"v", 100)
+    assert storage.get("big") == (b"z" * 4000, 100)
+    assert storage.get("gone") == (None, 200)
+    assert storage.get_with_expiry("session")[2] == 160
+
+
+def test_batch_put_stores_in_one_write_and_replicates_per_peer():
+    storage = InMemoryStorage()
+    storage.put_many = MagicMock(side_effect=storage.put_many)
+    replicator = MagicMock()
+    with patch("app.grpc_server.membership", {
+        "n1": {"addr": "node1:50051"},
+        "n2": {"addr": "node2:50051"},
+    }):
+        servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=2, replicator=replicator)
+        response = servicer.BatchPut(kv_pb2.BatchPutRequest(items=[
+            kv_pb2.PutRequest(key="a", value="1", modified_at=100),
+            kv_pb2.PutRequest(key="b", value_bytes=b"\xff", modified_at=100),
+            kv_pb2.PutRequest(key="session", value="s", modified_at=100, ttl_seconds=60),
+        ]), MagicMock())
+
+    assert response.ok and response.stored == 3
+    storage.put_many.assert_called_once_with([("a", b"1", 100), ("b", b"\xff", 100)])
+    assert storage.get_with_expiry("session")[2] == 160
+
+    replicator.replicate_many.assert_called_once()
+    peer, writes = replicator.replicate_many.call_args.args
+    assert peer == "node2:50051"
+    assert [(w[0], w[4]) for w in writes] == [("a", None), ("b", None), ("session", 160)]
+
+
+def test_batch_put_rejects_the_whole_batch_on_a_bad_item():
+    storage = InMemoryStorage()
+    context = MagicMock()
+    context.abort.side_effect = grpc.RpcError()
+    servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=1, replicator=MagicMock())
+
+    try:
+        servicer.BatchPut(kv_pb2.BatchPutRequest(items=[
+            kv_pb2.PutRequest(key="a", value="1", modified_at=100),
+            kv_pb2.PutRequest(key="b", value="2", modified_at=100, ttl_seconds=-1),
+        ]), context)
+    except grpc.RpcError:
+        pass
+
+    assert context.abort.call_args.args[0].name == "INVALID_ARGUMENT"
+    assert storage.get("a") == (None, 0)
+
+
+def test_multi_get_answers_in_request_order():
+    storage = InMemoryStorage()
+    storage.put("a", "1", 100)
+    storage.put("bin", b"\xff", 100)
+    storage.delete("gone", 200)
+    servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=1)
+
+    response = servicer.MultiGet(kv_pb2.MultiGetRequest(keys=["gone", "a", "missing", "bin", "a"]), MagicMock())
+
+    assert [(i.found, i.modified_at) for i in response.items] == [
+        (False, 200), (True, 100), (False, 0), (True, 100), (True, 100)
+    ]
+    assert response.items[1].value == "1"
+    assert response.items[3].value_bytes == b"\xff"
+
+    response = servicer.MultiGet(kv_pb2.MultiGetRequest(keys=["a"], want_bytes=True), MagicMock())
+    assert response.items[0].value_bytes == b"1"
+
+
+def put_stream_records(*records):
+    return iter([
+        kv_pb2.PutStreamRecord(seq=seq, item=kv_pb2.PutRequest(key=key, value=value, modified_at=100))
+        for seq, key, value in records
+    ])
+
+
+def test_put_stream_stores_in_batches_and_acks_committed_seq():
+    storage = InMemoryStorage()
+    storage.put_many = MagicMock(side_effect=storage.put_many)
+    servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=1, replicator=MagicMock())
+    records = put_stream_records(*[(seq, f"k{seq}", "v") for seq in (1, 2, 5, 6, 9)])
+
+    with patch("app.grpc_server.PUT_STREAM_BATCH_SIZE", 2):
+        acks = list(servicer.PutStream(records, MagicMock()))
+
+    assert [(a.committed_seq, a.stored) for a in acks] == [(2, 2), (6, 4), (9, 5)]
+    assert [len(c.args[0]) for c in storage.put_many.call_args_list] == [2, 2, 1]
+    assert storage.get("k9") == (b"v", 100)
+
+    # a slow stream is acked on the interval rather than the batch size
+    with patch("app.grpc_server.PUT_STREAM_ACK_INTERVAL", 0):
+        acks = list(servicer.PutStream(put_stream_records((1, "a", "1"), (2, "b", "2")), MagicMock()))
+    assert [a.committed_seq for a in acks] == [1, 2]
+
+
+def test_put_stream_rejects_out_of_order_seq_after_committing_earlier_batches():
+    storage = InMemoryStorage()
+    context = MagicMock()
+    context.abort.side_effect = grpc.RpcError()
+    servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=1, replicator=MagicMock())
+    records = put_stream_records((1, "a", "1"), (2, "b", "2"), (2, "c", "3"))
+
+    acks = []
+    with patch("app.grpc_server.PUT_STREAM_BATCH_SIZE", 2):
+        try:
+            for ack in servicer.PutStream(records, context):
+                acks.append(ack.committed_seq)
+        except grpc.RpcError:
+            pass
+
+    assert acks == [2]
+    assert context.abort.call_args.args[0].name == "INVALID_ARGUMENT"
+    assert storage.get("b") == (b"2", 100)
+    assert storage.get("c") == (None, 0)
+
+
+def test_required_acks():
+    assert [required_acks(kv_pb2.ONE, n) for n in (0, 1, 3)] == [0, 1, 1]
+    assert [required_acks(kv_pb2.QUORUM, n) for n in (1, 2, 3, 5)] == [1, 2, 2, 3]
+    assert [required_acks(kv_pb2.ALL, n) for n in (1, 3)] == [1, 3]
+
+
+def test_put_waits_for_the_acks_of_its_consistency_level():
+    storage = InMemoryStorage()
+    replicator = MagicMock()
+    context = MagicMock()
+    membership = {f"n{i}": {"addr": f"node{i}:50051"} for i in (1, 2, 3)}
+    with patch("app.grpc_server.membership", membership):
+        servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=3, replicator=replicator)
+
+        replicator.replicate_acked.return_value = 1
+        response = servicer.Put(kv_pb2.PutRequest(key="k", value="v", modified_at=100, consistency=kv_pb2.QUORUM), context)
+        assert response.ok and response.message == "stored on 2 replicas"
+        args = replicator.replicate_acked.call_args
+        assert sorted(args.args[0]) == ["node2:50051", "node3:50051"]
+        assert args.kwargs["needed"] == 1
+
+        unavailable = put_unavailable.labels("ALL")._value.get()
+        servicer.Put(kv_pb2.PutRequest(key="k", value="v", modified_at=200, consistency=kv_pb2.ALL), context)
+        assert replicator.replicate_acked.call_args.kwargs["needed"] == 2
+        assert context.abort.call_args.args[0] == grpc.StatusCode.UNAVAILABLE
+        assert put_unavailable.labels("ALL")._value.get() == unavailable + 1
+        # not rolled back: hints and repair still carry it to the other replicas
+        assert storage.get("k") == (b"v", 200)
+
+        replicator.reset_mock()
+        servicer.Put(kv_pb2.PutRequest(key="k", value="v", modified_at=300), context)
+        assert not replicator.replicate_acked.called
+        assert replicator.replicate.call_count == 2
+
+
+def test_quorum_get_returns_the_newest_version_and_repairs_stale_replicas():
+    storage = InMemoryStorage()
+    storage.put("k", b"old", 100)
+    replicator = MagicMock()
+    reader = MagicMock()
+    context = MagicMock()
+    membership = {f"n{i}": {"addr": f"node{i}:50051"} for i in (1, 2, 3)}
+    with patch("app.grpc_server.membership", membership):
+        servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=3, replicator=replicator, reader=reader)
+
+        reader.read.return_value = [("node2:50051", b"new", 200, None)]
+        repairs = read_repairs._value.get()
+        response = servicer.Get(kv_pb2.GetRequest(key="k", consistency=kv_pb2.QUORUM), context)
+        assert (response.found, response.value, response.modified_at) == (True, "new", 200)
+        assert sorted(reader.read.call_args.args[0]) == ["node2:50051", "node3:50051"]
+        assert reader.read.call_args.kwargs["needed"] == 1
+        # the coordinator's own copy was the stale one
+        assert storage.get("k") == (b"new", 200)
+        assert not replicator.replicate.called
+        assert read_repairs._value.get() == repairs + 1
+
+        # a newer delete on one replica wins over the value on the others
+        reader.read.return_value = [("node2:50051", b"new", 200, None), ("node3:50051", None, 300, None)]
+        response = servicer.Get(kv_pb2.GetRequest(key="k", consistency=kv_pb2.ALL), context)
+        assert not response.found and response.modified_at == 300
+        replicator.replicate.assert_called_once_with("node2:50051", "k", None, 300, CODEC_NONE, None)
+        assert storage.get("k") == (None, 300)
+
+        # ONE reads only the local store
+        reader.reset_mock()
+        servicer.Get(kv_pb2.GetRequest(key="k"), context)
+        assert not reader.read.called
+
+
+def test_one_get_on_a_non_replica_reads_from_a_replica():
+    storage = InMemoryStorage()
+    storage.put("k", b"stale", 100)
+    reader = MagicMock()
+    reader.read.return_value = [("node2:50051", b"v", 200, None)]
+    membership = {f"n{i}": {"addr": f"node{i}:50051"} for i in (1, 2, 3)}
+    with patch("app.grpc_server.membership", membership):
+        servicer = KeyValueServicer(storage, own_addr="node9:50051", replication_factor=2, replicator=MagicMock(), reader=reader)
+
+        response = servicer.Get(kv_pb2.GetRequest(key="k"), MagicMock())
+        assert (response.found, response.value, response.modified_at) == (True, "v", 200)
+        assert sorted(reader.read.call_args.args[0]) == sorted(pick_replicas_for_key("k", 2))
+        assert reader.read.call_args.kwargs["needed"] == 1
+        # nothing to repair on a node that holds no copy
+        assert storage.get("k") == (b"stale", 100)
+
+
+def test_one_get_on_a_non_replica_hedges_at_rf2():
+    fast = MagicMock()
+    fast.result.return_value = kv_pb2.GetResponse(value="v", found=True, modified_at=100)
+    fast.add_done_callback.side_effect = lambda fn: fn(fast)
+    membership = {f"n{i}": {"addr": f"node{i}:50051"} for i in (1, 2, 3)}
+    with patch("app.grpc_server.membership", membership):
+        primary, secondary = pick_replicas_for_key("k", 2)
+        own = next(addr for addr in sorted_peers() if addr not in (primary, secondary))
+        # the primary never answers; the other replica does at once
+        futures = {primary: MagicMock(), secondary: fast}
+        pool = MagicMock()
+        pool.stub.side_effect = lambda peer: MagicMock(Get=MagicMock(future=MagicMock(return_value=futures[peer])))
+        latencies = PeerLatencies(min_samples=1)
+        latencies.record(primary, 0.01)
+        reader = ReplicaReader(pool=pool, latencies=latencies, budget=HedgeBudget(ratio=1, burst=1))
+        servicer = KeyValueServicer(InMemoryStorage(), own_addr=own, replication_factor=2, replicator=MagicMock(), reader=reader)
+        hedges, wins = read_hedges._value.get(), read_hedge_wins._value.get()
+
+        response = servicer.Get(kv_pb2.GetRequest(key="k"), MagicMock())
+        assert (response.found, response.value, response.modified_at) == (True, "v", 100)
+        assert read_hedges._value.get() == hedges + 1
+        assert read_hedge_wins._value.get() == wins + 1
+
+
+def test_read_repair_keeps_the_ttl():
+    storage = InMemoryStorage()
+    storage.put("k", b"old", 100)
+    replicator = MagicMock()
+    reader = MagicMock()
+    expires_at = int(time.time()) + 3600
+    membership = {f"n{i}": {"addr": f"node{i}:50051"} for i in (1, 2, 3)}
+    with patch("app.grpc_server.membership", membership):
+        servicer = KeyValueServicer(storage, own_addr="node1:50051", replication_factor=3, replicator=replicator, reader=reader)
+
+        reader.read.return_value = [("node2:50051", b"new", 200, expires_at), ("node3:50051", b"old", 100, None)]
+        response = servicer.Get(kv_pb2.GetRequest(key="k", consistency=kv_pb2.ALL), MagicMock())
+        assert (response.value, response.expires_at) == ("new", expires_at)
+        assert storage.get_with_expiry("k") == (b"new", 200, expires_at)
+        replicator.replicate.assert_called_once_with("node3:50051", "k", b"new", 200, CODEC_NONE, expires_at)
+
+
+def test_quorum_get_fails_when_too_few_replicas_answer():
+    storage = InMemoryStorage()
+    reader = MagicMock()
+    reader.read.return_value = []
+    context = MagicMock()
+    membership = {f"n{i}": {"addr": f"node{i}:50051"} for i in (1, 2, 3)}
+    with patch("app.grpc_server.membership", membership):
+        # not one of the key's replicas: every answer comes from a peer
+        servicer = KeyValueServicer(storage, own_addr="node9:50051", replication_factor=3, replicator=MagicMock(), reader=reader)
+
+        unavailable = get_unavailable.labels("QUORUM")._value.get()
+        servicer.Get(kv_pb2.GetRequest(key="k", consistency=kv_pb2.QUORUM), context)
+        assert reader.read.call_args.kwargs["needed"] == 2
+        assert context.abort.call_args.args[0] == grpc.StatusCode.UNAVAILABLE
+        assert get_unavailable.labels("QUORUM")._value.get() == unavailable + 1
+
+
+def test_replica_ring_is_rebuilt_only_when_membership_changes():
+    membership = {f"n{i}": {"addr": f"node{i}:50051", "hb": 1} for i in (1, 2, 3)}
+    with patch("app.grpc_server.membership", membership):
+        ring = replica_ring()
+        membership["n1"] = {"addr": "node1:50051", "hb": 2}
+        assert replica_ring() is ring
+
+        rebuilds = ring_rebuilds._value.get()
+        membership["n4"] = {"addr": "node4:50051", "hb": 1}
+        assert replica_ring() is not ring
+        assert "node4:50051" in replica_ring()
+        assert ring_rebuilds._value.get() == rebuilds + 1
@@ -0,0 +1,83 @@
+from app.hints import HintStore, HintedHandoff
+from app.metrics import hints_dropped, hints_pending
+from app.value_codec import CODEC_NONE, CODEC_ZLIB
+
+
+def test_hint_store_keeps_newest_version_per_key(tmp_path):
+    hints = HintStore(str(tmp_path / "hints.db"))
+    hints.add("node2:50051", "k", b"v1", 100)
+    hints.add("node2:50051", "k", b"v2", 200)
+    hints.add("node2:50051", "k", b"stale", 150)
+    hints.add("node2:50051", "gone", None, 300)
+    hints.add("node3:50051", "k", b"z", 100, codec=CODEC_ZLIB, expires_at=160)
+
+    queued = hints.peek("node2:50051", 10)
+    assert [(h.key, h.payload, h.modified_at) for h in queued] == [("k", b"v2", 200), ("gone", None, 300)]
+    assert hints.peers() == ["node2:50051", "node3:50051"]
+    assert hints_pending.labels("node2:50051")._value.get() == 2
+
+    (h,) = hints.peek("node3:50051", 10)
+    assert (h.codec, h.expires_at) == (CODEC_ZLIB, 160)
+
+
+def test_hint_store_survives_restart_and_enforces_limit(tmp_path):
+    path = str(tmp_path / "hints.db")
+    hints = HintStore(path, max_per_peer=2)
+    assert hints.add("node2:50051", "a", b"1", 100)
+    assert hints.add("node2:50051", "b", b"2", 100)
+    dropped = hints_dropped._value.get()
+    assert not hints.add("node2:50051", "c", b"3", 100)
+    assert hints_dropped._value.get() == dropped + 1
+    # a newer version of a queued key still fits
+    assert hints.add("node2:50051", "a", b"4", 200)
+    hints.close()
+
+    hints = HintStore(path, max_per_peer=2)
+    assert hints.pending("node2:50051") == 2
+    assert [h.payload for h in hints.peek("node2:50051", 10)] == [b"4", b"2"]
+
+
+def test_remove_keeps_hints_rewritten_since_they_were_read(tmp_path):
+    hints = HintStore(str(tmp_path / "hints.db"))
+    hints.add("node2:50051", "a", b"1", 100)
+    hints.add("node2:50051", "b", b"2", 100)
+    batch = hints.peek("node2:50051", 10)
+    hints.add("node2:50051", "a", None, 100)
+
+    assert hints.remove("node2:50051", batch) == 1
+    assert [(h.key, h.payload) for h in hints.peek("node2:50051", 10)] == [("a", None)]
+
+
+def test_replay_delivers_to_live_peers_in_order(tmp_path):
+    hints = HintStore(str(tmp_path / "hints.db"))
+    for i in range(5):
+        hints.add("node2:50051", f"k{i}", b"v", 1000 + i)
+    hints.add("node3:50051", "k", b"v", 1000)
+
+    sent = []
+    handoff = HintedHandoff(
+        hints,
+        send=lambda peer, batch: sent.append((peer, [hint.key for hint in batch])),
+        is_alive=lambda peer: peer == "node2:50051",
+        batch_size=2
+    )
+
+    assert handoff.run_once(now=2000) == 5
+    # one call per batch
+    assert sent == [("node2:50051", ["k0", "k1"]), ("node2:50051", ["k2", "k3"]), ("node2:50051", ["k4"])]
+    assert hints.peers() == ["node3:50051"]
+
+
+def test_replay_stops_at_first_failure_and_drops_old_hints(tmp_path):
+    hints = HintStore(str(tmp_path / "hints.db"))
+    hints.add("node2:50051", "ancient", b"v", 10)
+    for key in ["a", "b", "c"]:
+        hints.add("node2:50051", key, b"v", 1000)
+
+    def send(peer, batch):
+        if "b" in [hint.key for hint in batch]:
+            raise ConnectionError("peer went away")
+
+    handoff = HintedHandoff(hints, send=send, is_alive=lambda peer: True, batch_size=1, max_age=500)
+    assert handoff.run_once(now=1200) == 1
+    assert [h.key for h in hints.peek("node2:50051", 10)] == ["b", "c"]
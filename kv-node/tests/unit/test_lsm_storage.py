@@ -0,0 +1,200 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from app import lsm_storage
+from app.lsm_storage import LSMStorage, SortedRun, BloomFilter, merge_sorted, WAL_NAME
+from app.chunking import CHUNK_COUNT, digest_of_items, digest_to_bytes
+
+
+def _run_files(path):
+    return sorted(name for name in os.listdir(path) if name.endswith(".sst"))
+
+
+def test_put_and_get_from_memtable(tmp_path):
+    storage = LSMStorage(str(tmp_path / "lsm"), background_compaction=False)
+
+    assert storage.put("user:1", "Anas", 100)
+    assert storage.get("user:1") == (b"Anas", 100)
+    assert storage.get("missing") == (None, 0)
+    assert storage.put("user:1", "older", 50) is False
+    assert _run_files(tmp_path / "lsm") == []
+
+
+def test_flush_writes_sorted_runs(tmp_path):
+    storage = LSMStorage(str(tmp_path / "lsm"), memtable_limit=200, background_compaction=False)
+
+    for i in range(50):
+        storage.put(f"k{i:03d}", f"v{i}", 10)
+
+    assert len(_run_files(tmp_path / "lsm")) > 1
+    for i in range(50):
+        assert storage.get(f"k{i:03d}") == (f"v{i}".encode(), 10)
+
+    assert storage.put("k001", "newer", 20)
+    assert storage.put("k001", "stale", 15) is False
+    assert storage.get("k001") == (b"newer", 20)
+
+
+def test_wal_replay_after_restart(tmp_path):
+    path = str(tmp_path / "lsm")
+    storage = LSMStorage(path, background_compaction=False)
+    storage.put("a", "1", 10)
+    storage.put_many([("b", "2", 10), ("c", "3", 10)])
+    storage.close()
+
+    reopened = LSMStorage(path, background_compaction=False)
+    assert reopened.get("a") == (b"1", 10)
+    assert reopened.get("c") == (b"3", 10)
+
+
+def test_torn_wal_tail_is_ignored(tmp_path):
+    path = str(tmp_path / "lsm")
+    storage = LSMStorage(path, background_compaction=False)
+    storage.put("a", "1", 10)
+    storage.put("b", "2", 10)
+    storage.close()
+
+    wal = os.path.join(path, WAL_NAME)
+    with open(wal, "r+b") as f:
+        f.truncate(os.path.getsize(wal) - 3)
+
+    reopened = LSMStorage(path, background_compaction=False)
+    assert reopened.get("a") == (b"1", 10)
+    assert reopened.get("b") == (None, 0)
+
+
+def test_compaction_merges_runs_and_keeps_newest(tmp_path):
+    path = str(tmp_path / "lsm")
+    storage = LSMStorage(path, memtable_limit=100, background_compaction=False)
+
+    for round_ts in (10, 20, 30):
+        for i in range(20):
+            storage.put(f"k{i}", f"v{i}-{round_ts}", round_ts)
+
+    assert len(_run_files(path)) > 1
+    storage.compact()
+    assert len(_run_files(path)) == 1
+
+    for i in range(20):
+        assert storage.get(f"k{i}") == (f"v{i}-30".encode(), 30)
+
+    storage.close()
+    reopened = LSMStorage(path, background_compaction=False)
+    for c in range(CHUNK_COUNT):
+        expected = digest_to_bytes(digest_of_items(reopened.scan_chunk_with_ts(c, CHUNK_COUNT)))
+        assert reopened.chunk_digest(c, CHUNK_COUNT) == expected
+
+
+def test_compaction_closes_inputs_after_running_scans_finish(tmp_path):
+    path = str(tmp_path / "lsm")
+    storage = LSMStorage(path, memtable_limit=100, background_compaction=False)
+    for i in range(60):
+        storage.put(f"k{i:03d}", f"v{i}", 10)
+    storage.flush()
+    inputs = list(storage._runs)
+
+    scan = storage.scan_range("k")
+    assert next(scan)[0] == "k000"
+    storage.compact()
+
+    assert not any(run._file.closed for run in inputs)
+    assert len(list(scan)) == 59
+    assert all(run._file.closed for run in inputs)
+
+    live = list(storage._runs)
+    storage.close()
+    assert all(run._file.closed for run in live)
+
+
+def test_background_compaction_runs(tmp_path):
+    path = str(tmp_path / "lsm")
+    storage = LSMStorage(path, memtable_limit=100, compaction_trigger=2)
+
+    for i in range(200):
+        storage.put(f"k{i}", f"v{i}", 10)
+    storage.flush()
+    storage.close()
+
+    assert len(_run_files(path)) < 10
+    reopened = LSMStorage(path, background_compaction=False)
+    assert reopened.get("k199") == (b"v199", 10)
+
+
+def test_sorted_run_lookup_and_bloom(tmp_path):
+    path = str(tmp_path / "run.sst")
+    items = [(f"key{i:04d}", f"val{i}".encode(), i, 1000 + i if i % 2 else None) for i in range(500)]
+    SortedRun.write(path, items, len(items))
+
+    run = SortedRun(path)
+    assert run.record_count == 500
+    assert run.get("key0000") == (b"val0", 0, None)
+    assert run.get("key0499") == (b"val499", 499, 1499)
+    assert run.get("key0250") == (b"val250", 250, None)
+    assert run.get("key9999") is None
+    assert run.get("a") is None
+    assert list(run.records()) == items
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000 * 10)
+    for i in range(1000):
+        bloom.add(f"k{i}")
+    assert all(bloom.might_contain(f"k{i}") for i in range(1000))
+
+    restored = BloomFilter.from_bytes(bloom.to_bytes())
+    assert restored.might_contain("k7")
+    false_positives = sum(restored.might_contain(f"other{i}") for i in range(1000))
+    assert false_positives < 50
+
+
+def test_merge_sorted_newest_stream_wins():
+    older = [("a", "old", 1), ("b", "old", 1)]
+    newer = [("b", "new", 2), ("c", "new", 2)]
+    assert list(merge_sorted([older, newer])) == [("a", "old", 1), ("b", "new", 2), ("c", "new", 2)]
+
+
+def test_purge_drops_tombstones_from_runs(tmp_path):
+    path = str(tmp_path / "lsm")
+    storage = LSMStorage(path, memtable_limit=200, background_compaction=False)
+    for i in range(30):
+        storage.put(f"k{i:03d}", f"v{i}", 10)
+    for i in range(10):
+        storage.delete(f"k{i:03d}", 20)
+    storage.flush()
+
+    assert storage.purge_tombstones(30) == 10
+    assert len(_run_files(path)) == 1
+    assert [key for key, _, _ in storage.scan_chunk_with_ts(0, 1)] == [f"k{i:03d}" for i in range(10, 30)]
+    digest = storage.chunk_digest(0, 1)
+    storage.close()
+
+    # neither the tombstones nor the values they shadowed come back
+    reopened = LSMStorage(path, background_compaction=False)
+    assert reopened.get("k000") == (None, 0)
+    assert reopened.get("k010") == (b"v10", 10)
+    assert reopened.chunk_digest(0, 1) == digest
+    # nothing left to purge: the single run is not rewritten
+    assert reopened.purge_tombstones(30) == 0
+
+
+def test_purging_compaction_interrupted_before_inputs_are_removed(tmp_path):
+    path = str(tmp_path / "lsm")
+    storage = LSMStorage(path, background_compaction=False)
+    storage.put("k", "v", 10)
+    storage.flush()
+    storage.delete("k", 20)
+    storage.flush()
+
+    # the process dies right after the merged run became visible
+    with patch.object(lsm_storage.os, "remove", side_effect=OSError("crash")):
+        with pytest.raises(OSError):
+            storage.purge_tombstones(30)
+    assert len(_run_files(path)) == 3
+    storage.close()
+
+    reopened = LSMStorage(path, background_compaction=False)
+    assert reopened.get("k") == (None, 0)
+    assert len(_run_files(path)) == 1
+    reopened.close()
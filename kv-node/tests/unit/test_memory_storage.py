@@ -0,0 +1,93 @@
+import threading
+
+from app import memory_storage
+from app.memory_storage import InMemoryStorage
+from app.chunking import CHUNK_COUNT, chunk_for_key, digest_of_items, digest_to_bytes
+
+
+def test_entries_are_packed_into_one_bytes_object():
+    storage = InMemoryStorage()
+    storage.put("empty", b"", 1)
+    storage.put_expiring("ttl", b"v", 2, 100)
+    storage.delete("gone", 3)
+
+    shard, chunk_id = storage._locate("empty")
+    assert type(shard.chunks[chunk_id]["empty"]) is bytes
+    assert storage.get_entry("empty") == (b"", 1, None)
+    assert storage.get_entry("ttl") == (b"v", 2, 100)
+    assert storage.get_entry("gone") == (None, 3, None)
+
+
+def test_concurrent_puts_keep_the_newest_version():
+    storage = InMemoryStorage(shard_count=4)
+    barrier = threading.Barrier(8)
+
+    def writer(offset):
+        barrier.wait()
+        for ts in range(offset, 400, 8):
+            storage.put("hot", f"v{ts}", ts)
+            storage.put(f"key-{ts}", "x", ts)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert storage.get("hot") == (b"v399", 399)
+    assert len(storage) == 401
+
+    # the digest must match a recompute: no lost or doubled deltas
+    chunk_id = chunk_for_key("hot")
+    items = list(storage.scan_chunk_with_ts(chunk_id, CHUNK_COUNT))
+    assert storage.chunk_digest(chunk_id, CHUNK_COUNT) == digest_to_bytes(digest_of_items(items))
+
+
+def test_chunk_scan_uses_index_without_hashing(monkeypatch):
+    storage = InMemoryStorage()
+    for i in range(100):
+        storage.put(f"k{i}", str(i), 1)
+
+    expected = {f"k{i}" for i in range(100) if chunk_for_key(f"k{i}") == 3}
+
+    calls = []
+    real_crc32 = memory_storage.zlib.crc32
+
+    class CountingZlib:
+        @staticmethod
+        def crc32(data):
+            calls.append(data)
+            return real_crc32(data)
+
+    monkeypatch.setattr(memory_storage, "zlib", CountingZlib)
+    assert {key for key, _, _ in storage.scan_chunk_with_ts(3, CHUNK_COUNT)} == expected
+    assert calls == []
+
+
+def test_expire_pops_only_due_keys():
+    storage = InMemoryStorage()
+    for i in range(10):
+        storage.put_expiring(f"k{i}", "v", 10, 100 + i)
+
+    assert sorted(storage.expire(104, 3)) == ["k0", "k1", "k2"]
+    assert sorted(storage.expire(104, 10)) == ["k3", "k4"]
+    # the heap only holds keys that are not due yet
+    assert len(storage._expiry) == 5
+
+
+def test_range_scan_merges_the_stripes_across_pages(monkeypatch):
+    monkeypatch.setattr(memory_storage, "SCAN_PAGE_SIZE", 7)
+    storage = InMemoryStorage(shard_count=4)
+    keys = [f"k{i:03d}" for i in range(100)]
+    for key in reversed(keys):
+        storage.put(key, "v", 1)
+    for key in keys[::3]:
+        storage.delete(key, 2)
+
+    assert [key for key, _, _ in storage.scan_range("k010", "k050")] == keys[10:50]
+    storage.purge_tombstones(3)
+    assert [key for key, _, _ in storage.scan_range("")] == [key for i, key in enumerate(keys) if i % 3]
+
+    # keys added after a scan are sorted in by the next one
+    storage.put("k0505", "v", 1)
+    assert [key for key, _, _ in storage.scan_range("k050", "k051")] == ["k050", "k0505"]
@@ -0,0 +1,67 @@
+from app.memory_storage import InMemoryStorage
+from app.chunking import (
+    CHUNK_COUNT,
+    MERKLE_DEPTH,
+    MERKLE_FANOUT,
+    LEAF_COUNT,
+    chunk_for_key,
+    leaf_for_key,
+    digest_to_bytes,
+)
+from app.merkle import level_nodes, node_hashes, valid_node_request, differing_leaves
+
+
+def _filled_storage(count=200):
+    storage = InMemoryStorage()
+    for i in range(count):
+        storage.put(f"key{i}", f"val{i}", 100)
+    return storage
+
+
+def test_level_zero_is_chunk_digest():
+    storage = _filled_storage()
+    for c in range(CHUNK_COUNT):
+        root = level_nodes(storage.leaf_digests(c), 0)
+        assert digest_to_bytes(root[0]) == storage.chunk_digest(c, CHUNK_COUNT)
+
+
+def test_level_widths():
+    leaves = [0] * LEAF_COUNT
+    for level in range(MERKLE_DEPTH + 1):
+        assert len(level_nodes(leaves, level)) == MERKLE_FANOUT ** level
+
+
+def test_valid_node_request():
+    assert valid_node_request(1, [0, 3])
+    assert not valid_node_request(1, [4])
+    assert not valid_node_request(MERKLE_DEPTH + 1, [0])
+    assert not valid_node_request(-1, [0])
+
+
+def test_differing_leaves_finds_only_changed_leaf():
+    local = _filled_storage()
+    remote = _filled_storage()
+    remote.put("key7", "changed", 200)
+
+    chunk_id = chunk_for_key("key7")
+    calls = []
+
+    def fetch_remote(level, indices):
+        calls.append(level)
+        return node_hashes(remote.leaf_digests(chunk_id), level, indices)
+
+    assert differing_leaves(local.leaf_digests(chunk_id), fetch_remote) == [leaf_for_key("key7")]
+    assert calls == list(range(1, MERKLE_DEPTH + 1))
+
+
+def test_differing_leaves_identical_trees():
+    local = _filled_storage()
+    chunk_id = 3
+    calls = []
+
+    def fetch_remote(level, indices):
+        calls.append(level)
+        return node_hashes(local.leaf_digests(chunk_id), level, indices)
+
+    assert differing_leaves(local.leaf_digests(chunk_id), fetch_remote) == []
+    assert calls == [1]
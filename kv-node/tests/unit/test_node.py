@@ -1,8 +1,28 @@
 from unittest.mock import patch
-from app.node import start_gossip_http_server
+from app import node
+from app.node import start_gossip_http_server, create_storage
 
 
 def test_start_gossip_http_server():
     with patch("threading.Thread") as mock_thread:
         start_gossip_http_server()
         assert mock_thread.called
+
+
+def test_create_storage_selects_backend(tmp_path):
+    with patch("app.node.DATA_DIR", str(tmp_path)):
+        with patch("app.node.STORAGE_BACKEND", "lsm"):
+            assert isinstance(create_storage(), node.LSMStorage)
+        with patch("app.node.STORAGE_BACKEND", "bitcask"):
+            assert isinstance(create_storage(), node.BitcaskStorage)
+        with patch("app.node.STORAGE_BACKEND", "sqlite"):
+            assert isinstance(create_storage(), node.SQLiteStorage)
+
+
+def test_create_storage_wraps_backend_in_read_cache(tmp_path):
+    with patch("app.node.DATA_DIR", str(tmp_path)), patch("app.node.READ_CACHE_ENTRIES", 10):
+        storage = create_storage()
+
+    assert isinstance(storage, node.CachedStorage)
+    assert isinstance(storage.backend, node.SQLiteStorage)
+    assert storage.max_entries == 10
@@ -6,9 +6,20 @@ from app.grpc_client import (
     replicate_to_peer,
     get_from_peer,
     get_chunk_hash,
-    fetch_range
+    fetch_range,
+    get_merkle_nodes,
+    fetch_leaves,
+    multi_get_from_peer,
+    batch_put_to_peer,
+    put_stream_to_peer,
+    replicas_for_key,
+    get_from_replicas,
 )
+from app.ring import ConsistentHashRing
+from app.reads import ReplicaReader, PeerLatencies, HedgeBudget
+from app.metrics import read_hedges
 from tests.fakes import FakePeerClient
+from app import kv_pb2
 
 
 def test_fake_peer_client():
@@ -49,22 +60,26 @@ def test_grpc_peer_client_delegation(mock_fetch, mock_hash, mock_get, mock_repli
     mock_fetch.assert_called_once_with("127.0.0.1:50051", 3, 10)
 
 
-@patch("app.grpc_client.kv_pb2_grpc.KeyValueStub")
-@patch("grpc.insecure_channel")
-def test_grpc_client_standalone_functions(mock_channel, mock_stub_class):
-    mock_stub = MagicMock()
-    mock_stub_class.return_value = mock_stub
+@patch("app.grpc_client.channel_pool")
+def test_grpc_client_standalone_functions(mock_pool):
+    mock_stub = mock_pool.stub.return_value
 
-    get_stub("127.0.0.1:50051")
-    mock_channel.assert_called_with("127.0.0.1:50051")
+    assert get_stub("127.0.0.1:50051") is mock_stub
+    mock_pool.stub.assert_called_with("127.0.0.1:50051")
 
     put_to_peer("127.0.0.1:50051", "k1", "v1", 100)
-    assert mock_stub.Put.called
+    assert mock_stub.Put.call_args.args[0].WhichOneof("payload") == "value"
+
+    put_to_peer("127.0.0.1:50051", "k1", b"\xff", 100, consistency=kv_pb2.QUORUM)
+    assert mock_stub.Put.call_args.args[0].value_bytes == b"\xff"
+    assert mock_stub.Put.call_args.args[0].consistency == kv_pb2.QUORUM
 
     replicate_to_peer("127.0.0.1:50051", "k1", "v1", 100)
     assert mock_stub.Replicate.called
 
     get_from_peer("127.0.0.1:50051", "k1")
+    get_from_peer("127.0.0.1:50051", "k1", consistency=kv_pb2.QUORUM)
+    assert mock_stub.Get.call_args.args[0].consistency == kv_pb2.QUORUM
     assert mock_stub.Get.called
 
     get_chunk_hash("127.0.0.1:50051", 2)
@@ -72,3 +87,69 @@ def test_grpc_client_standalone_functions(mock_channel, mock_stub_class):
 
     fetch_range("127.0.0.1:50051", 2)
     assert mock_stub.FetchRange.called
+
+    get_merkle_nodes("127.0.0.1:50051", 2, 1, [0, 1])
+    assert mock_stub.GetMerkleNodes.called
+
+    fetch_leaves("127.0.0.1:50051", 2, [5])
+    assert mock_stub.FetchLeaves.called
+
+    multi_get_from_peer("127.0.0.1:50051", ["k1", "k2"])
+    assert list(mock_stub.MultiGet.call_args.args[0].keys) == ["k1", "k2"]
+
+    batch_put_to_peer("127.0.0.1:50051", [("k1", "v1"), ("k2", b"\xff", 100)])
+    items = mock_stub.BatchPut.call_args.args[0].items
+    assert [(i.key, i.WhichOneof("payload"), i.modified_at) for i in items] == [
+        ("k1", "value", 0), ("k2", "value_bytes", 100)
+    ]
+
+    put_stream_to_peer("127.0.0.1:50051", [(1, "k1", "v1"), (2, "k2", b"\xff", 100)])
+    records = list(mock_stub.PutStream.call_args.args[0])
+    assert [(r.seq, r.item.key, r.item.modified_at) for r in records] == [(1, "k1", 0), (2, "k2", 100)]
+
+
+@patch("app.grpc_client.get_merkle_nodes")
+@patch("app.grpc_client.fetch_leaves")
+def test_grpc_peer_client_merkle_delegation(mock_leaves, mock_nodes):
+    client = GrpcPeerClient()
+
+    mock_nodes.return_value = [b"h0", b"h1"]
+    mock_leaves.return_value = [("k", "v", 10)]
+
+    assert client.get_merkle_nodes("127.0.0.1:50051", 3, 1, [0, 1]) == [b"h0", b"h1"]
+    mock_nodes.assert_called_once_with("127.0.0.1:50051", 3, 1, [0, 1], 5)
+
+    assert client.fetch_leaves("127.0.0.1:50051", 3, [7]) == [("k", "v", 10)]
+    mock_leaves.assert_called_once_with("127.0.0.1:50051", 3, [7], 10)
+
+
+def test_replicas_for_key_follows_the_node_ring():
+    nodes = [f"node{i}:50051" for i in range(5)]
+    ring = ConsistentHashRing(nodes)
+    for i in range(50):
+        assert replicas_for_key(nodes, f"k{i}", 3) == ring.get_nodes(f"k{i}", 3)
+    # membership changed: the ring is rebuilt
+    assert replicas_for_key(nodes[:1], "k0", 3) == ["node0:50051"]
+
+
+def test_get_from_replicas_hedges_a_slow_replica():
+    nodes = ["node1:50051", "node2:50051"]
+    primary, secondary = replicas_for_key(nodes, "k", 2)
+    # the primary never answers; the other replica does at once
+    fast = MagicMock()
+    fast.result.return_value = kv_pb2.GetResponse(value="v", found=True, modified_at=100)
+    fast.add_done_callback.side_effect = lambda fn: fn(fast)
+    futures = {primary: MagicMock(), secondary: fast}
+    pool = MagicMock()
+    pool.stub.side_effect = lambda peer: MagicMock(Get=MagicMock(future=MagicMock(return_value=futures[peer])))
+    latencies = PeerLatencies(min_samples=1)
+    latencies.record(primary, 0.01)
+    reader = ReplicaReader(pool=pool, latencies=latencies, budget=HedgeBudget(ratio=1, burst=1))
+    hedges = read_hedges._value.get()
+
+    assert get_from_replicas(nodes, "k", 2, timeout=5, reader=reader) == (secondary, b"v", 100, None)
+    assert read_hedges._value.get() == hedges + 1
+
+    # no replica answers in time
+    futures[secondary] = MagicMock()
+    assert get_from_replicas(nodes, "k", 2, timeout=0.05, reader=reader) is None
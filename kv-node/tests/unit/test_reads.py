@@ -0,0 +1,151 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import grpc
+
+from app import kv_pb2
+from app.reads import ReplicaReader, PeerLatencies, HedgeBudget, newest
+from app.metrics import read_hedges, read_hedge_wins, read_hedges_throttled
+
+
+class FakeFuture:
+    """
+    A Get future that answers at once, fails at once, or never answers.
+    """
+
+    def __init__(self, response=None, error=None, done=True):
+        self.response = response
+        self.error = error
+        self.is_done = done
+
+    def add_done_callback(self, fn):
+        if self.is_done:
+            fn(self)
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+class RpcError(grpc.RpcError):
+    def code(self):
+        return grpc.StatusCode.UNAVAILABLE
+
+
+def make_reader(futures, **kwargs):
+    stubs = {peer: MagicMock(Get=MagicMock(future=MagicMock(return_value=future))) for peer, future in futures.items()}
+    pool = MagicMock()
+    pool.stub.side_effect = stubs.get
+    return ReplicaReader(pool=pool, **kwargs)
+
+
+
+def test_read_returns_once_enough_replicas_answered():
+    futures = {
+        "text:1": FakeFuture(kv_pb2.GetResponse(value="v", found=True, modified_at=100)),
+        "bytes:1": FakeFuture(kv_pb2.GetResponse(value_bytes=b"\xff", found=True, modified_at=200, expires_at=900)),
+        "deleted:1": FakeFuture(kv_pb2.GetResponse(found=False, modified_at=300)),
+        "slow:1": FakeFuture(done=False),
+        "down:1": FakeFuture(error=RpcError()),
+    }
+    reader = make_reader(futures)
+
+    answers = reader.read(["text:1", "bytes:1", "deleted:1", "down:1"], "k", needed=3, timeout=5)
+    assert sorted(answers) == [("bytes:1", b"\xff", 200, 900), ("deleted:1", None, 300, None), ("text:1", b"v", 100, None)]
+
+    # peers are asked at ONE, for raw bytes
+    request = reader.pool.stub("text:1").Get.future.call_args.args[0]
+    assert request.want_bytes and request.consistency == kv_pb2.ONE
+    # only as many peers as the read needs are asked
+    assert not reader.pool.stub("down:1").Get.future.called
+
+    # a failed peer is replaced by the next one
+    answers = reader.read(["down:1", "text:1", "bytes:1"], "k", needed=2, timeout=5)
+    assert sorted(peer for peer, *_ in answers) == ["bytes:1", "text:1"]
+
+    # two answers are still possible until the slow replica times out
+    assert reader.read(["text:1", "slow:1"], "k", needed=2, timeout=0.05) == [("text:1", b"v", 100, None)]
+
+
+def test_slow_peer_is_hedged_within_the_budget():
+    futures = {
+        "slow:1": FakeFuture(done=False),
+        "fast:1": FakeFuture(kv_pb2.GetResponse(value="v", found=True, modified_at=100)),
+    }
+    latencies = PeerLatencies(min_samples=1)
+    latencies.record("slow:1", 0.01)
+    budget = HedgeBudget(ratio=1, burst=1)
+    reader = make_reader(futures, latencies=latencies, budget=budget)
+    hedges, wins = read_hedges._value.get(), read_hedge_wins._value.get()
+
+    assert reader.read(["slow:1", "fast:1"], "k", needed=1, timeout=5) == [("fast:1", b"v", 100, None)]
+    assert read_hedges._value.get() == hedges + 1
+    assert read_hedge_wins._value.get() == wins + 1
+
+    # the budget is spent: the read waits for the slow peer instead
+    budget.ratio = 0
+    throttled = read_hedges_throttled._value.get()
+    assert reader.read(["slow:1", "fast:1"], "k", needed=1, timeout=0.1) == []
+    assert read_hedges_throttled._value.get() == throttled + 1
+
+
+async def answer(response=None, error=None, delay=0):
+    await asyncio.sleep(delay)
+    if error is not None:
+        raise error
+    return response
+
+
+def test_read_aio_returns_once_enough_replicas_answered():
+    calls = {
+        "text:1": lambda: answer(kv_pb2.GetResponse(value="v", found=True, modified_at=100)),
+        "slow:1": lambda: answer(kv_pb2.GetResponse(value="s", found=True, modified_at=50), delay=10),
+        "down:1": lambda: answer(error=RpcError()),
+    }
+    pool = MagicMock()
+    pool.stub.side_effect = lambda peer: MagicMock(Get=lambda request, timeout: calls[peer]())
+    reader = ReplicaReader(pool=None)
+
+    async def main():
+        # the failed peer is replaced by the next one
+        first = await reader.read_aio(pool, ["down:1", "text:1"], "k", needed=1, timeout=5)
+        # two answers are still possible until the slow replica times out
+        second = await reader.read_aio(pool, ["text:1", "slow:1"], "k", needed=2, timeout=0.05)
+        return first, second
+
+    assert asyncio.run(main()) == ([("text:1", b"v", 100, None)], [("text:1", b"v", 100, None)])
+
+
+def test_peer_latencies_percentile():
+    latencies = PeerLatencies(window=100, percentile=95, min_samples=10)
+    for ms in range(1, 10):
+        latencies.record("a:1", ms / 1000)
+    assert latencies.hedge_delay("a:1") is None
+
+    for ms in range(10, 201):
+        latencies.record("a:1", ms / 1000)
+    # only the latest 100 reads count: 101..200 ms
+    assert latencies.hedge_delay("a:1") == 0.196
+    assert latencies.hedge_delay("b:1") is None
+
+
+def test_hedge_budget_refills_per_read():
+    budget = HedgeBudget(ratio=0.5, burst=1)
+    assert not budget.spend()
+    budget.deposit()
+    assert not budget.spend()
+    for _ in range(5):
+        budget.deposit()
+    assert budget.spend()
+    assert not budget.spend()
+
+
+def test_newest_prefers_the_tombstone_on_a_tie():
+    answers = [("a", b"old", 100, None), ("b", b"new", 200, None), ("c", None, 200, None), ("d", None, 0, None)]
+    winner, stale = newest(answers)
+    assert winner == ("c", None, 200, None)
+    assert [peer for peer, *_ in stale] == ["a", "b", "d"]
+
+    winner, stale = newest([("a", b"v", 100, None), ("b", b"v", 100, None)])
+    assert winner[2] == 100 and stale == []
@@ -0,0 +1,204 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock, patch
+
+import grpc
+import pytest
+
+from app.replication import PeerSender, ReplicationPipeline
+from app.metrics import replication_coalesced, replication_queue_full
+from app.value_codec import CODEC_NONE
+
+
+class FakeStub:
+    """
+    Records ReplicateBatch calls. The first call blocks until `release`
+    is set, so a test can queue writes behind an in-flight batch.
+    """
+
+    def __init__(self, batch_error=None):
+        self.batches = []
+        self.singles = []
+        self.batch_error = batch_error
+        self.in_flight = threading.Event()
+        self.release = threading.Event()
+
+    def ReplicateBatch(self, request, timeout=None):
+        self.in_flight.set()
+        self.release.wait(5)
+        if self.batch_error is not None:
+            raise self.batch_error
+        self.batches.append([(i.key, i.value, i.modified_at, i.deleted) for i in request.items])
+
+    def Replicate(self, request, timeout=None):
+        self.singles.append(request.key)
+
+
+class RpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+@pytest.fixture
+def make_sender():
+    senders = []
+
+    def make(stub, **kwargs):
+        pool = MagicMock()
+        pool.stub.return_value = stub
+        sender = PeerSender("node2:50051", pool=pool, **kwargs)
+        senders.append(sender)
+        return sender
+
+    yield make
+    for sender in senders:
+        sender.close()
+
+
+def test_sender_coalesces_and_batches_queued_writes(make_sender):
+    stub = FakeStub()
+    sender = make_sender(stub, batch_size=2)
+
+    sender.enqueue("first", b"1", 100)
+    assert stub.in_flight.wait(5)
+    coalesced = replication_coalesced._value.get()
+    sender.enqueue("k", b"v1", 100)
+    sender.enqueue("k", b"v2", 200)
+    sender.enqueue("k", b"stale", 150)
+    sender.enqueue("gone", None, 100)
+    sender.enqueue("last", b"3", 100)
+    assert replication_coalesced._value.get() == coalesced + 2
+    assert len(sender) == 3
+
+    stub.release.set()
+    sender.close()
+    assert stub.batches == [
+        [("first", b"1", 100, False)],
+        [("k", b"v2", 200, False), ("gone", b"", 100, True)],
+        [("last", b"3", 100, False)],
+    ]
+
+
+def test_full_queue_pushes_back_then_hints(make_sender):
+    stub = FakeStub()
+    hints = MagicMock()
+    sender = make_sender(stub, hints=hints, queue_size=1, enqueue_timeout=0.05)
+
+    sender.enqueue("in-flight", b"v", 100)
+    assert stub.in_flight.wait(5)
+    assert sender.enqueue("queued", b"v", 100)
+    full = replication_queue_full.labels("node2:50051")._value.get()
+
+    assert not sender.enqueue("overflow", b"v", 100)
+    assert replication_queue_full.labels("node2:50051")._value.get() == full + 1
+    hints.add.assert_called_once_with("node2:50051", "overflow", b"v", 100, CODEC_NONE, None)
+    stub.release.set()
+
+
+def test_enqueue_many_shares_one_wait_for_room(make_sender):
+    stub = FakeStub()
+    hints = MagicMock()
+    sender = make_sender(stub, hints=hints, queue_size=2, enqueue_timeout=0.05)
+
+    sender.enqueue("in-flight", b"v", 100)
+    assert stub.in_flight.wait(5)
+    writes = [(f"k{i}", b"v", 100, CODEC_NONE, None) for i in range(4)] + [("k0", b"newer", 200, CODEC_NONE, None)]
+
+    assert sender.enqueue_many(writes) == 3
+    assert [c.args[1] for c in hints.add.call_args_list] == ["k2", "k3"]
+    stub.release.set()
+    sender.close()
+    assert stub.batches[-1] == [("k0", b"newer", 200, False), ("k1", b"v", 100, False)]
+
+
+def test_failed_batch_goes_to_hints(make_sender):
+    stub = FakeStub(batch_error=RpcError(grpc.StatusCode.UNAVAILABLE))
+    stub.release.set()
+    hints = MagicMock()
+    sender = make_sender(stub, hints=hints)
+
+    sender.enqueue("k", None, 100)
+    sender.close()
+    hints.add.assert_called_once_with("node2:50051", "k", None, 100, CODEC_NONE, None)
+
+
+def test_sender_falls_back_to_replicate_for_older_peers(make_sender):
+    stub = FakeStub(batch_error=RpcError(grpc.StatusCode.UNIMPLEMENTED))
+    stub.release.set()
+    sender = make_sender(stub)
+
+    sender.enqueue("a", b"1", 100)
+    sender.enqueue("b", b"2", 100)
+    sender.close()
+    assert sorted(stub.singles) == ["a", "b"]
+
+
+class FakeFuture:
+    """
+    A Replicate future that is done at once (ok or failed) or never.
+    """
+
+    def __init__(self, error=None, done=True):
+        self.error = error
+        self.is_done = done
+
+    def add_done_callback(self, fn):
+        if self.is_done:
+            fn(self)
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+
+
+def test_replicate_acked_returns_once_enough_replicas_acked():
+    futures = {
+        "ok:1": FakeFuture(),
+        "slow:1": FakeFuture(done=False),
+        "down:1": FakeFuture(RpcError(grpc.StatusCode.UNAVAILABLE)),
+    }
+    pool = MagicMock()
+    pool.stub.side_effect = lambda peer: MagicMock(Replicate=MagicMock(future=MagicMock(return_value=futures[peer])))
+    hints = MagicMock()
+    pipeline = ReplicationPipeline(hints=hints, pool=pool)
+    peers = ["ok:1", "slow:1", "down:1"]
+
+    assert pipeline.replicate_acked(peers, "k", b"v", 100, needed=1, timeout=5) == 1
+    hints.add.assert_called_once_with("down:1", "k", b"v", 100, CODEC_NONE, None)
+
+    # two acks are still possible until the slow replica times out
+    assert pipeline.replicate_acked(peers, "k", b"v", 100, needed=2, timeout=0.05) == 1
+    # two failures make two acks impossible: no wait
+    futures["slow:1"] = FakeFuture(RpcError(grpc.StatusCode.DEADLINE_EXCEEDED))
+    assert pipeline.replicate_acked(peers, "k", b"v", 100, needed=2, timeout=5) == 1
+
+
+def test_replicate_acked_aio_awaits_only_the_acks_it_needs():
+    async def ack(error=None, delay=0):
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+
+    calls = {
+        "ok:1": lambda: ack(),
+        "slow:1": lambda: ack(delay=10),
+        "down:1": lambda: ack(RpcError(grpc.StatusCode.UNAVAILABLE)),
+    }
+    pool = MagicMock()
+    pool.stub.side_effect = lambda peer: MagicMock(Replicate=lambda request, timeout: calls[peer]())
+    hints = MagicMock()
+    pipeline = ReplicationPipeline(hints=hints, pool=MagicMock())
+    peers = ["ok:1", "slow:1", "down:1"]
+
+    async def main():
+        # two acks are still possible until the slow replica times out
+        assert await pipeline.replicate_acked_aio(pool, peers, "k", b"v", 100, needed=2, timeout=0.05) == 1
+        hints.add.assert_called_once_with("down:1", "k", b"v", 100, CODEC_NONE, None)
+        # two failures make two acks impossible: no wait
+        calls["slow:1"] = lambda: ack(RpcError(grpc.StatusCode.DEADLINE_EXCEEDED))
+        return await asyncio.wait_for(pipeline.replicate_acked_aio(pool, peers, "k", b"v", 100, needed=2, timeout=5), 1)
+
+    assert asyncio.run(main()) == 1
@@ -0,0 +1,81 @@
+from collections import Counter
+
+from app.ring import ConsistentHashRing, ring_hash
+
+KEYS = [f"user:{i}" for i in range(20_000)]
+
+
+def nodes(n):
+    return [f"node{i}:50051" for i in range(n)]
+
+
+def moved(before, after, count=1):
+    return sum(before.get_nodes(key, count) != after.get_nodes(key, count) for key in KEYS) / len(KEYS)
+
+
+def test_placement_is_the_same_in_every_process():
+    # fixed values: hash() would differ between runs
+    assert ring_hash("user:1") == 15310966450534750738
+    ring = ConsistentHashRing(nodes(4)[1:])
+    assert ring.get_nodes("user:1", 3) == ["node3:50051", "node1:50051", "node2:50051"]
+    assert ConsistentHashRing(reversed(nodes(4)[1:])).get_nodes("user:1", 3) == ring.get_nodes("user:1", 3)
+
+
+def test_get_nodes_returns_distinct_nodes_owner_first():
+    ring = ConsistentHashRing(nodes(3))
+    replicas = ring.get_nodes("k", 5)
+    assert sorted(replicas) == nodes(3)
+    assert replicas[0] == ring.get_node("k")
+    assert ring.get_nodes("k", 0) == []
+    assert ConsistentHashRing().get_nodes("k", 2) == []
+    assert ConsistentHashRing().get_node("k") is None
+
+
+def test_keys_spread_evenly():
+    ring = ConsistentHashRing(nodes(10))
+    owners = Counter(ring.get_node(key) for key in KEYS)
+    average = len(KEYS) / 10
+    assert max(owners.values()) < 1.25 * average
+    assert min(owners.values()) > 0.75 * average
+
+
+def test_join_moves_only_keys_to_the_new_node():
+    before = ConsistentHashRing(nodes(10))
+    after = before.with_node("node10:50051")
+
+    # ideal: 1/11 of the owners and 3/11 of the 3-replica sets change
+    assert 0.06 < moved(before, after) < 0.12
+    assert moved(before, after, count=3) < 0.35
+    for key in KEYS:
+        if before.get_node(key) != after.get_node(key):
+            assert after.get_node(key) == "node10:50051"
+
+
+def test_leave_moves_only_the_leaving_nodes_keys():
+    before = ConsistentHashRing(nodes(10))
+    after = before.without_node("node3:50051")
+
+    assert 0.06 < moved(before, after) < 0.14
+    for key in KEYS:
+        if before.get_node(key) == "node3:50051":
+            # the next replica takes over
+            assert after.get_node(key) == before.get_nodes(key, 2)[1]
+        else:
+            assert after.get_node(key) == before.get_node(key)
+
+
+def test_cover_holds_a_replica_of_every_key():
+    ring = ConsistentHashRing(nodes(8))
+    for count in (1, 2, 3):
+        cover = ring.cover(count, prefer="node5:50051")
+        assert cover[0] == "node5:50051"
+        assert all(set(ring.get_nodes(key, count)) & set(cover) for key in KEYS[:2000])
+        assert ring.cover(count, prefer="node5:50051") == cover
+    # every node holds every key
+    assert ring.cover(8, prefer="node2:50051") == ["node2:50051"]
+
+    # skipped nodes are never picked; their keys come from other replicas
+    cover = ring.cover(2, skip={"node0:50051"})
+    assert "node0:50051" not in cover
+    assert all(set(ring.get_nodes(key, 2)) & set(cover) for key in KEYS[:2000])
+    assert ConsistentHashRing().cover(2) == []
@@ -0,0 +1,52 @@
+import pytest
+from app.scan import (
+    key_successor,
+    prefix_end,
+    encode_page_token,
+    decode_page_token,
+    scan_bounds,
+    merge_scans,
+)
+
+
+def test_prefix_end():
+    assert prefix_end("user:") == "user;"
+    assert prefix_end("") is None
+    assert prefix_end("a\U0010ffff") == "b"
+    assert prefix_end("\U0010ffff\U0010ffff") is None
+    # never produces a lone surrogate
+    assert prefix_end("\ud7ff") == "\ue000"
+
+
+def test_page_tokens_round_trip():
+    for key in ["", "user:1", "héllo", "\U0010ffff"]:
+        assert decode_page_token(encode_page_token(key)) == key
+
+    with pytest.raises(ValueError):
+        decode_page_token("not base64!")
+
+
+def test_scan_bounds():
+    assert scan_bounds() == ("", None)
+    assert scan_bounds("b", "m") == ("b", "m")
+    assert scan_bounds(prefix="user:") == ("user:", "user;")
+    # the prefix only ever narrows an explicit range
+    assert scan_bounds("user:5", "user:7", prefix="user:") == ("user:5", "user:7")
+    assert scan_bounds("a", "z", prefix="user:") == ("user:", "user;")
+
+    token = encode_page_token("user:3")
+    assert scan_bounds(prefix="user:", page_token=token) == (key_successor("user:3"), "user;")
+
+
+def test_merge_scans_keeps_newest_version_in_key_order():
+    node1 = [("a", b"1", 100), ("c", b"old", 100), ("d", b"d", 100)]
+    node2 = [("b", b"2", 100), ("c", b"new", 200), ("d", None, 100)]
+    node3 = [("c", None, 150)]
+
+    assert list(merge_scans([node1, node2, node3])) == [
+        ("a", b"1", 100),
+        ("b", b"2", 100),
+        ("c", b"new", 200),
+        # a tombstone wins a tie, like everywhere else
+        ("d", None, 100),
+    ]
@@ -0,0 +1,93 @@
+import os
+import pytest
+from app import kv_pb2
+from app.memory_storage import InMemoryStorage
+from app.storage import SQLiteStorage, SNAPSHOT_SQLITE
+from app.snapshot import snapshot_blocks, receive_snapshot, bootstrap
+
+
+def write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def test_snapshot_blocks_round_trip(tmp_path):
+    data = os.urandom(10_000)
+    blocks = list(snapshot_blocks(write_file(tmp_path / "src", data), "records", block_size=4096))
+
+    assert [len(b.data) for b in blocks] == [4096, 4096, 1808, 0]
+    assert blocks[-1].done and blocks[-1].offset == len(data)
+
+    assert receive_snapshot(iter(blocks), str(tmp_path / "dst")) == "records"
+    assert (tmp_path / "dst").read_bytes() == data
+
+
+@pytest.mark.parametrize("damage", ["flip", "drop", "truncate", "digest"])
+def test_receive_snapshot_rejects_damaged_streams(tmp_path, damage):
+    blocks = list(snapshot_blocks(write_file(tmp_path / "src", os.urandom(10_000)), "records", block_size=4096))
+    if damage == "flip":
+        blocks[1] = kv_pb2.SnapshotBlock(offset=4096, data=b"x" + blocks[1].data[1:], crc32=blocks[1].crc32)
+    elif damage == "drop":
+        del blocks[1]
+    elif damage == "truncate":
+        blocks = blocks[:-1]
+    else:
+        blocks[-1].sha256 = b"\x00" * 32
+
+    with pytest.raises(IOError):
+        receive_snapshot(iter(blocks), str(tmp_path / "dst"))
+
+
+def test_sqlite_snapshot_keeps_payloads_and_ttls(tmp_path):
+    source = SQLiteStorage(str(tmp_path / "source.db"))
+    source.put("big", b"z" * 5000, 100)
+    source.put_expiring("session", b"s", 100, 4_000_000_000)
+
+    path = str(tmp_path / "snapshot")
+    assert source.snapshot_to(path, [SNAPSHOT_SQLITE]) == SNAPSHOT_SQLITE
+
+    target = SQLiteStorage(str(tmp_path / "target.db"))
+    assert target.restore_from(path, SNAPSHOT_SQLITE) == 2
+    assert target.get("big") == (b"z" * 5000, 100)
+    # stored as-is: still compressed, TTL intact
+    query = "SELECT key, codec, value, expires_at FROM kv ORDER BY key"
+    assert target._conn().execute(query).fetchall() == source._conn().execute(query).fetchall()
+
+
+def serve_snapshot(source, tmp_path):
+    def fetch(peer_addr, formats):
+        if peer_addr == "down:50051":
+            raise ConnectionError("peer down")
+        path = str(tmp_path / f"served-{peer_addr}")
+        return snapshot_blocks(path, source.snapshot_to(path, formats))
+    return fetch
+
+
+def test_bootstrap_fills_an_empty_store_from_the_first_working_peer(tmp_path):
+    source = InMemoryStorage()
+    source.put("a", b"1", 100)
+    source.delete("b", 200)
+    target = SQLiteStorage(str(tmp_path / "target.db"))
+
+    peer = bootstrap(
+        target, lambda: ["down:50051", "node2:50051"], serve_snapshot(source, tmp_path),
+        work_dir=str(tmp_path), wait=0
+    )
+
+    assert peer == "node2:50051"
+    assert target.get("a") == (b"1", 100)
+    assert target.get("b") == (None, 200)
+    # the temporary copies are gone
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("snapshot-")]
+
+
+def test_bootstrap_skips_a_store_with_data():
+    target = InMemoryStorage()
+    target.put("a", b"local", 100)
+
+    def fetch(peer_addr, formats):
+        raise AssertionError("no snapshot expected")
+
+    assert bootstrap(target, lambda: ["node2:50051"], fetch, wait=0) is None
+    assert bootstrap(InMemoryStorage(), lambda: [], fetch, wait=0) is None
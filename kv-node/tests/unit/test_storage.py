@@ -1,4 +1,12 @@
+import sqlite3
+import threading
+from unittest.mock import patch
+
+import pytest
+
 from app.storage import SQLiteStorage
+from app.chunking import CHUNK_COUNT, chunk_for_key, digest_of_items, digest_to_bytes
+from app.value_codec import CODEC_NONE, CODEC_ZLIB
 
 
 def test_put_and_get(tmp_path):
@@ -15,7 +23,7 @@ def test_put_and_get(tmp_path):
         "user:1"
     )
 
-    assert value == "Anas"
+    assert value == b"Anas"
     assert ts == 100
 
 
@@ -53,7 +61,7 @@ def test_rejects_stale_write(tmp_path):
         "user:1"
     )
 
-    assert value == "new-value"
+    assert value == b"new-value"
     assert ts == 200
 
 
@@ -66,7 +74,7 @@ def test_overwrite_with_equal_timestamp(tmp_path):
     assert result is False
 
     val, ts = storage.get("key1")
-    assert val == "val1"
+    assert val == b"val1"
     assert ts == 100
 
 
@@ -83,3 +91,348 @@ def test_scan_chunk_with_ts(tmp_path):
 
     scanned_keys = {item[0] for item in all_scanned}
     assert scanned_keys == {"k1", "k2"}
+
+
+def test_scan_chunk_uses_leaf_index(tmp_path):
+    db = tmp_path / "node.db"
+    storage = SQLiteStorage(str(db))
+    storage.put("k1", "v1", 10)
+
+    plan = storage._conn().execute(
+        "EXPLAIN QUERY PLAN SELECT key, value, modified_at FROM kv WHERE chunk_id = ?",
+        (chunk_for_key("k1"),)
+    ).fetchall()
+    assert any("idx_kv_leaf" in row[-1] for row in plan)
+
+    assert list(storage.scan_chunk_with_ts(chunk_for_key("k1"), CHUNK_COUNT)) == [("k1", b"v1", 10)]
+
+
+def test_scan_chunk_with_non_default_chunk_count(tmp_path):
+    db = tmp_path / "node.db"
+    storage = SQLiteStorage(str(db))
+
+    for i in range(20):
+        storage.put(f"k{i}", f"v{i}", i + 1)
+
+    found = []
+    for chunk_id in range(5):
+        for key, _, _ in storage.scan_chunk_with_ts(chunk_id, 5):
+            assert chunk_for_key(key, 5) == chunk_id
+            found.append(key)
+
+    assert len(found) == 20
+
+
+def test_migrates_database_without_chunk_id(tmp_path):
+    db = tmp_path / "old.db"
+    conn = sqlite3.connect(str(db))
+    conn.execute("CREATE TABLE kv (key TEXT PRIMARY KEY, value TEXT, modified_at INTEGER)")
+    conn.executemany(
+        "INSERT INTO kv (key, value, modified_at) VALUES (?, ?, ?)",
+        [(f"k{i}", f"v{i}", i + 1) for i in range(10)]
+    )
+    conn.commit()
+    conn.close()
+
+    storage = SQLiteStorage(str(db))
+
+    found = []
+    for chunk_id in range(CHUNK_COUNT):
+        found.extend(storage.scan_chunk_with_ts(chunk_id, CHUNK_COUNT))
+
+    assert {item[0] for item in found} == {f"k{i}" for i in range(10)}
+    assert storage.get("k3") == (b"v3", 4)
+
+
+def test_chunk_digests_survive_restart(tmp_path):
+    db = tmp_path / "node.db"
+    storage = SQLiteStorage(str(db))
+
+    for i in range(30):
+        storage.put(f"k{i}", f"v{i}", i + 1)
+    storage.put("k0", "v0-new", 100)
+
+    before = [storage.chunk_digest(c, CHUNK_COUNT) for c in range(CHUNK_COUNT)]
+
+    reopened = SQLiteStorage(str(db))
+    after = [reopened.chunk_digest(c, CHUNK_COUNT) for c in range(CHUNK_COUNT)]
+
+    assert before == after
+    for c in range(CHUNK_COUNT):
+        expected = digest_to_bytes(digest_of_items(reopened.scan_chunk_with_ts(c, CHUNK_COUNT)))
+        assert after[c] == expected
+
+
+def test_migration_rebuilds_chunk_digests(tmp_path):
+    db = tmp_path / "old.db"
+    conn = sqlite3.connect(str(db))
+    conn.execute("CREATE TABLE kv (key TEXT PRIMARY KEY, value TEXT, modified_at INTEGER)")
+    conn.executemany(
+        "INSERT INTO kv (key, value, modified_at) VALUES (?, ?, ?)",
+        [(f"k{i}", f"v{i}", i + 1) for i in range(10)]
+    )
+    conn.commit()
+    conn.close()
+
+    storage = SQLiteStorage(str(db))
+    storage.put("k11", "v11", 12)
+
+    for c in range(CHUNK_COUNT):
+        expected = digest_to_bytes(digest_of_items(storage.scan_chunk_with_ts(c, CHUNK_COUNT)))
+        assert storage.chunk_digest(c, CHUNK_COUNT) == expected
+
+
+def test_put_many_commits_once(tmp_path):
+    db = tmp_path / "node.db"
+    storage = SQLiteStorage(str(db))
+    conn = storage._conn()
+
+    items = [(f"k{i}", f"v{i}", i + 1) for i in range(1200)]
+    assert storage.put_many(items) == 1200
+
+    statements = []
+    conn.set_trace_callback(statements.append)
+    storage.put_many([(f"k{i}", f"v{i}-new", 5000) for i in range(1200)])
+    conn.set_trace_callback(None)
+
+    assert statements.count("COMMIT") == 1
+    assert storage.get("k1199") == (b"v1199-new", 5000)
+
+
+def test_group_commit_batches_concurrent_puts(tmp_path):
+    db = tmp_path / "node.db"
+    storage = SQLiteStorage(str(db), group_commit=True, group_commit_window=0.05, group_commit_max_batch=64)
+
+    commits = []
+    original = storage._write_batch
+
+    def tracking_write_batch(items):
+        commits.append(len(items))
+        return original(items)
+
+    storage._write_batch = tracking_write_batch
+
+    results = {}
+
+    def writer(i):
+        results[i] = storage.put(f"k{i}", f"v{i}", 100)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(32)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(results.values())
+    assert sum(commits) == 32
+    assert len(commits) < 32
+    assert storage.get("k31") == (b"v31", 100)
+
+    assert storage.put("k0", "stale", 50) is False
+    assert storage.put_many([("k0", "newer", 200), ("k1", "stale", 1)]) == 1
+    assert storage.get("k0") == (b"newer", 200)
+
+    storage.close()
+    assert storage.put("k2", "after-close", 300) is True
+
+
+def test_group_commit_propagates_errors(tmp_path):
+    db = tmp_path / "node.db"
+    storage = SQLiteStorage(str(db), group_commit=True)
+
+    def failing_write_batch(items):
+        raise sqlite3.OperationalError("database is locked")
+
+    storage._write_batch = failing_write_batch
+
+    with pytest.raises(sqlite3.OperationalError):
+        storage.put("k", "v", 1)
+
+    storage.close()
+
+
+def test_large_values_are_stored_compressed(tmp_path):
+    db = tmp_path / "node.db"
+    storage = SQLiteStorage(str(db), codec=CODEC_ZLIB, compress_threshold=64)
+    big = b"x" * 5000
+
+    storage.put("big", big, 10)
+    storage.put("small", "s", 10)
+
+    assert storage.get("big") == (big, 10)
+    assert storage.get("small") == (b"s", 10)
+
+    conn = sqlite3.connect(str(db))
+    rows = dict(conn.execute("SELECT key, codec FROM kv"))
+    size = conn.execute("SELECT length(value) FROM kv WHERE key = 'big'").fetchone()[0]
+    assert rows == {"big": CODEC_ZLIB, "small": CODEC_NONE}
+    assert size < 200
+
+    # digests are over the plain value, whatever the codec
+    plain = SQLiteStorage(str(tmp_path / "plain.db"), compress_threshold=None)
+    plain.put("big", big, 10)
+    plain.put("small", "s", 10)
+    for chunk_id in range(CHUNK_COUNT):
+        assert storage.chunk_digest(chunk_id, CHUNK_COUNT) == plain.chunk_digest(chunk_id, CHUNK_COUNT)
+
+
+def test_encoded_items_pass_through_untouched(tmp_path):
+    source = SQLiteStorage(str(tmp_path / "a.db"), codec=CODEC_ZLIB, compress_threshold=64)
+    target = SQLiteStorage(str(tmp_path / "b.db"), codec=CODEC_ZLIB, compress_threshold=64)
+    big = b"y" * 5000
+    source.put("big", big, 10)
+
+    shipped = [item[:4] for item in source.scan_chunk_encoded(chunk_for_key("big"), CHUNK_COUNT)]
+    assert shipped[0][1] == CODEC_ZLIB
+
+    with patch("app.storage.encode_value") as encode:
+        assert target.put_encoded_many(shipped) == 1
+        assert target.put_encoded_many(shipped) == 0
+    encode.assert_not_called()
+
+    assert target.get("big") == (big, 10)
+    chunk_id = chunk_for_key("big")
+    assert target.chunk_digest(chunk_id, CHUNK_COUNT) == source.chunk_digest(chunk_id, CHUNK_COUNT)
+
+
+def test_migration_adds_codec_column(tmp_path):
+    db = tmp_path / "node.db"
+    storage = SQLiteStorage(str(db))
+    storage.put("k", "v", 10)
+
+    conn = sqlite3.connect(str(db))
+    conn.execute("ALTER TABLE kv DROP COLUMN codec")
+    conn.commit()
+    conn.close()
+
+    reopened = SQLiteStorage(str(db))
+    assert reopened.get("k") == (b"v", 10)
+
+
+def test_text_values_are_migrated_to_blobs(tmp_path):
+    db = tmp_path / "node.db"
+    storage = SQLiteStorage(str(db))
+    storage.put("k", "v", 10)
+    digest = storage.chunk_digest(chunk_for_key("k"), CHUNK_COUNT)
+
+    # a database written before values were bytes
+    conn = sqlite3.connect(str(db))
+    conn.execute("UPDATE kv SET value = CAST(value AS TEXT)")
+    conn.execute("PRAGMA user_version = 0")
+    conn.commit()
+    conn.close()
+
+    reopened = SQLiteStorage(str(db))
+    assert reopened.get("k") == (b"v", 10)
+    assert reopened.chunk_digest(chunk_for_key("k"), CHUNK_COUNT) == digest
+
+    conn = sqlite3.connect(str(db))
+    assert conn.execute("SELECT typeof(value) FROM kv").fetchone()[0] == "blob"
+
+
+def test_purge_tombstones_reclaims_pages(tmp_path):
+    db = tmp_path / "node.db"
+    storage = SQLiteStorage(str(db))
+    storage.put_many([(f"k{i}", "x" * 2000, 10) for i in range(300)])
+    for i in range(300):
+        storage.delete(f"k{i}", 20)
+    size_with_tombstones = db.stat().st_size + (tmp_path / "node.db-wal").stat().st_size
+
+    conn = sqlite3.connect(str(db))
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    conn.close()
+
+    with patch("app.storage.PURGE_BATCH_SIZE", 100), patch("app.storage.VACUUM_PAGES", 1000):
+        assert storage.purge_tombstones(15) == 0
+        assert storage.purge_tombstones(30) == 300
+
+    conn = sqlite3.connect(str(db))
+    assert conn.execute("SELECT COUNT(*) FROM kv").fetchone()[0] == 0
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    assert db.stat().st_size < size_with_tombstones
+
+
+def test_existing_database_converts_to_incremental_vacuum_only_when_asked(tmp_path):
+    db = tmp_path / "node.db"
+    conn = sqlite3.connect(str(db))
+    conn.execute("CREATE TABLE kv (key TEXT PRIMARY KEY, value BLOB, modified_at INTEGER)")
+    conn.execute("INSERT INTO kv (key, value, modified_at) VALUES ('k', 'v', 10)")
+    conn.commit()
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    conn.close()
+
+    # left as it is unless asked: the conversion rewrites the whole file
+    storage = SQLiteStorage(str(db))
+    assert storage.get("k") == (b"v", 10)
+    assert sqlite3.connect(str(db)).execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    storage.close()
+
+    storage = SQLiteStorage(str(db), convert_auto_vacuum=True)
+    assert storage.get("k") == (b"v", 10)
+
+    conn = sqlite3.connect(str(db))
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    conn.close()
+
+
+def test_expiry_and_purge_use_partial_indexes(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "node.db"))
+    conn = storage._conn()
+
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT key FROM kv WHERE expires_at <= ? AND value IS NOT NULL ORDER BY expires_at LIMIT ?",
+        (100, 10)
+    ).fetchall()
+    assert any("idx_kv_expiry" in row[-1] for row in plan)
+
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT key FROM kv WHERE value IS NULL AND modified_at < ? LIMIT ?",
+        (100, 10)
+    ).fetchall()
+    assert any("idx_kv_tombstones" in row[-1] for row in plan)
+
+
+def test_migration_adds_expires_at_column(tmp_path):
+    db = tmp_path / "node.db"
+    storage = SQLiteStorage(str(db))
+    storage.put("k", "v", 10)
+
+    conn = sqlite3.connect(str(db))
+    conn.execute("DROP INDEX idx_kv_expiry")
+    conn.execute("ALTER TABLE kv DROP COLUMN expires_at")
+    conn.commit()
+    conn.close()
+
+    reopened = SQLiteStorage(str(db))
+    assert reopened.get("k") == (b"v", 10)
+    assert reopened.put_expiring("k", "v2", 20, 30)
+    assert reopened.get("k") == (None, 20)
+
+
+def test_scan_range_resumed_on_another_thread_uses_that_threads_connection(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.storage.SCAN_PAGE_SIZE", 2)
+    storage = SQLiteStorage(str(tmp_path / "node.db"))
+    storage.put_many([(f"k{i}", b"v", 100) for i in range(6)])
+
+    used = []
+    real_conn = storage._conn
+
+    def conn():
+        used.append(threading.get_ident())
+        return real_conn()
+
+    monkeypatch.setattr(storage, "_conn", conn)
+    scan = storage.scan_range("k")
+    assert next(scan)[0] == "k0"
+
+    # the aio server resumes a scan on whichever executor thread is free
+    rest = []
+    worker = threading.Thread(target=lambda: rest.extend(scan))
+    worker.start()
+    worker.join()
+
+    assert [key for key, _, _ in rest] == ["k1", "k2", "k3", "k4", "k5"]
+    assert used[0] == threading.get_ident()
+    assert set(used[1:]) == {worker.ident}
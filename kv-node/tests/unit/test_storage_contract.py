@@ -1,25 +1,47 @@
+import time
 import pytest
 from app.storage import SQLiteStorage
 from app.memory_storage import InMemoryStorage
+from app.lsm_storage import LSMStorage
+from app.bitcask_storage import BitcaskStorage
+from app.cached_storage import CachedStorage
+from app.chunking import (
+    CHUNK_COUNT,
+    chunk_for_key,
+    leaf_for_key,
+    digest_of_items,
+    digest_to_bytes,
+    leaf_digests_of_items,
+)
+
+
+STORAGE_TYPES = ["sqlite", "memory", "lsm", "bitcask", "cached"]
+
+
+def make_storage(storage_type, tmp_path, name):
+    if storage_type == "sqlite":
+        return SQLiteStorage(str(tmp_path / f"{name}.db"))
+    if storage_type == "lsm":
+        # tiny memtable so the contract also exercises sorted runs
+        return LSMStorage(str(tmp_path / name), memtable_limit=256, compaction_trigger=3)
+    if storage_type == "bitcask":
+        # tiny segments so the contract also crosses segment boundaries
+        return BitcaskStorage(str(tmp_path / name), segment_limit=256)
+    if storage_type == "cached":
+        # small cache over SQLite so reads mix hits, misses and evictions
+        return CachedStorage(SQLiteStorage(str(tmp_path / f"{name}.db")), max_entries=4, negative_cache=True)
+    return InMemoryStorage()
 
 
 @pytest.mark.parametrize(
     "storage_type",
-    [
-        "sqlite",
-        "memory"
-    ]
+    STORAGE_TYPES
 )
 def test_storage_contract(
     storage_type,
     tmp_path
 ):
-    if storage_type == "sqlite":
-        storage = SQLiteStorage(
-            str(tmp_path / "test.db")
-        )
-    else:
-        storage = InMemoryStorage()
+    storage = make_storage(storage_type, tmp_path, "test")
 
     assert storage.put(
         "name",
@@ -30,29 +52,45 @@ def test_storage_contract(
     assert storage.get(
         "name"
     ) == (
-        "anas",
+        b"anas",
         100
     )
 
 
-@pytest.mark.parametrize("storage_type", ["sqlite", "memory"])
+@pytest.mark.parametrize("storage_type", STORAGE_TYPES)
+def test_storage_bytes_values_contract(storage_type, tmp_path):
+    storage = make_storage(storage_type, tmp_path, "bytes")
+    binary = bytes(range(256)) * 8
+
+    assert storage.put("bin", binary, 100)
+    assert storage.put("view", memoryview(b"from a view"), 100)
+    assert storage.put("text", "h\u00e9llo", 100)
+
+    assert storage.get("bin") == (binary, 100)
+    assert storage.get("view") == (b"from a view", 100)
+    assert storage.get("text") == ("h\u00e9llo".encode("utf-8"), 100)
+
+    # a str and its UTF-8 bytes are the same value, digest included
+    other = make_storage(storage_type, tmp_path, "bytes-other")
+    other.put("bin", binary, 100)
+    other.put("view", b"from a view", 100)
+    other.put("text", "h\u00e9llo".encode("utf-8"), 100)
+    for c in range(CHUNK_COUNT):
+        assert storage.chunk_digest(c, CHUNK_COUNT) == other.chunk_digest(c, CHUNK_COUNT)
+
+
+@pytest.mark.parametrize("storage_type", STORAGE_TYPES)
 def test_storage_stale_write_contract(storage_type, tmp_path):
-    if storage_type == "sqlite":
-        storage = SQLiteStorage(str(tmp_path / "stale.db"))
-    else:
-        storage = InMemoryStorage()
+    storage = make_storage(storage_type, tmp_path, "stale")
 
     storage.put("k", "v1", 200)
     assert storage.put("k", "v0", 100) is False
-    assert storage.get("k") == ("v1", 200)
+    assert storage.get("k") == (b"v1", 200)
 
 
-@pytest.mark.parametrize("storage_type", ["sqlite", "memory"])
+@pytest.mark.parametrize("storage_type", STORAGE_TYPES)
 def test_storage_chunk_scan_contract(storage_type, tmp_path):
-    if storage_type == "sqlite":
-        storage = SQLiteStorage(str(tmp_path / "scan.db"))
-    else:
-        storage = InMemoryStorage()
+    storage = make_storage(storage_type, tmp_path, "scan")
 
     storage.put("item1", "val1", 50)
     storage.put("item2", "val2", 60)
@@ -64,3 +102,247 @@ def test_storage_chunk_scan_contract(storage_type, tmp_path):
     assert len(found) == 2
     keys = {item[0] for item in found}
     assert keys == {"item1", "item2"}
+
+
+@pytest.mark.parametrize("storage_type", STORAGE_TYPES)
+def test_storage_chunk_digest_matches_recompute_contract(storage_type, tmp_path):
+    storage = make_storage(storage_type, tmp_path, "digest")
+
+    for i in range(50):
+        storage.put(f"key{i}", f"val{i}", 100)
+    for i in range(0, 50, 3):
+        storage.put(f"key{i}", f"newer{i}", 200)
+    storage.put("key1", "stale", 50)
+
+    for c in range(CHUNK_COUNT):
+        expected = digest_to_bytes(digest_of_items(storage.scan_chunk_with_ts(c, CHUNK_COUNT)))
+        assert storage.chunk_digest(c, CHUNK_COUNT) == expected
+
+
+@pytest.mark.parametrize("storage_type", STORAGE_TYPES)
+def test_storage_leaf_scan_contract(storage_type, tmp_path):
+    storage = make_storage(storage_type, tmp_path, "leaves")
+
+    for i in range(100):
+        storage.put(f"key{i}", f"val{i}", 100)
+
+    chunk_id = chunk_for_key("key1")
+    leaf_id = leaf_for_key("key1")
+    found = list(storage.scan_leaves_with_ts(chunk_id, [leaf_id]))
+
+    expected = [item for item in storage.scan_chunk_with_ts(chunk_id, CHUNK_COUNT) if leaf_for_key(item[0]) == leaf_id]
+    assert sorted(found) == sorted(expected)
+    assert storage.leaf_digests(chunk_id) == leaf_digests_of_items(storage.scan_chunk_with_ts(chunk_id, CHUNK_COUNT))
+
+
+@pytest.mark.parametrize("storage_type", STORAGE_TYPES)
+def test_storage_put_many_contract(storage_type, tmp_path):
+    storage = make_storage(storage_type, tmp_path, "batch")
+
+    storage.put("existing", "newest", 500)
+
+    applied = storage.put_many([
+        ("a", "a1", 100),
+        ("b", "b1", 100),
+        ("a", "a2", 200),
+        ("a", "a0", 150),
+        ("existing", "older", 400),
+    ])
+
+    assert applied == 3
+    assert storage.get("a") == (b"a2", 200)
+    assert storage.get("b") == (b"b1", 100)
+    assert storage.get("existing") == (b"newest", 500)
+    assert storage.put_many([]) == 0
+
+    for c in range(CHUNK_COUNT):
+        expected = digest_to_bytes(digest_of_items(storage.scan_chunk_with_ts(c, CHUNK_COUNT)))
+        assert storage.chunk_digest(c, CHUNK_COUNT) == expected
+
+
+@pytest.mark.parametrize("storage_type", STORAGE_TYPES)
+def test_storage_get_many_contract(storage_type, tmp_path):
+    storage = make_storage(storage_type, tmp_path, "get_many")
+    storage.put_many([(f"k{i}", f"v{i}", 100 + i) for i in range(10)])
+    storage.delete("k3", 500)
+
+    keys = ["k9", "missing", "k3", "k0", "k9"] + [f"k{i}" for i in range(10)]
+    assert storage.get_many(keys) == {key: storage.get(key) for key in keys}
+    assert storage.get_many(["k9", "k3", "missing"]) == {
+        "k9": (b"v9", 109),
+        "k3": (None, 500),
+        "missing": (None, 0),
+    }
+    assert storage.get_many([]) == {}
+
+
+@pytest.mark.parametrize("storage_type", STORAGE_TYPES)
+def test_storage_delete_contract(storage_type, tmp_path):
+    storage = make_storage(storage_type, tmp_path, "delete")
+
+    storage.put("gone", "v1", 100)
+    storage.put("kept", "v1", 100)
+    assert storage.delete("gone", 200)
+    assert storage.get("gone") == (None, 200)
+    assert storage.get("never") == (None, 0)
+
+    # the tombstone is versioned: older writes lose, newer ones revive the key
+    assert storage.put("gone", "stale", 150) is False
+    assert storage.delete("kept", 50) is False
+    assert storage.get("kept") == (b"v1", 100)
+
+    # a delete wins a tie with the value it removes, not the other way round
+    storage.put("tie", "v1", 100)
+    assert storage.delete("tie", 100)
+    assert storage.put("tie", "v2", 100) is False
+    assert storage.get("tie") == (None, 100)
+
+    # tombstones are scanned and hashed, so anti-entropy repairs them
+    scanned = {key: (value, ts) for c in range(CHUNK_COUNT) for key, value, ts in storage.scan_chunk_with_ts(c, CHUNK_COUNT)}
+    assert scanned["gone"] == (None, 200)
+    for c in range(CHUNK_COUNT):
+        expected = digest_to_bytes(digest_of_items(storage.scan_chunk_with_ts(c, CHUNK_COUNT)))
+        assert storage.chunk_digest(c, CHUNK_COUNT) == expected
+
+    assert storage.put("gone", "back", 300)
+    assert storage.get("gone") == (b"back", 300)
+
+
+@pytest.mark.parametrize("storage_type", STORAGE_TYPES)
+def test_storage_purge_tombstones_contract(storage_type, tmp_path):
+    storage = make_storage(storage_type, tmp_path, "purge")
+    empty = make_storage(storage_type, tmp_path, "purge-empty")
+
+    for i in range(20):
+        storage.put(f"key{i}", f"val{i}", 100)
+        if i >= 10:
+            empty.put(f"key{i}", f"val{i}", 100)
+    for i in range(10):
+        storage.delete(f"key{i}", 200)
+    storage.delete("key10", 400)
+    empty.delete("key10", 400)
+    if hasattr(storage, "flush"):
+        storage.flush()
+
+    assert storage.purge_tombstones(300) == 10
+    assert storage.purge_tombstones(300) == 0
+
+    assert storage.get("key0") == (None, 0)
+    assert storage.get("key10") == (None, 400)
+    assert storage.get("key11") == (b"val11", 100)
+    # as if the purged keys had never existed
+    for c in range(CHUNK_COUNT):
+        assert storage.chunk_digest(c, CHUNK_COUNT) == empty.chunk_digest(c, CHUNK_COUNT)
+        expected = digest_to_bytes(digest_of_items(storage.scan_chunk_with_ts(c, CHUNK_COUNT)))
+        assert storage.chunk_digest(c, CHUNK_COUNT) == expected
+
+
+@pytest.mark.parametrize("storage_type", STORAGE_TYPES)
+def test_storage_scan_range_contract(storage_type, tmp_path, monkeypatch):
+    # tiny pages so the scan has to resume across page boundaries
+    for module in ("app.storage", "app.memory_storage", "app.bitcask_storage"):
+        monkeypatch.setattr(f"{module}.SCAN_PAGE_SIZE", 3)
+    storage = make_storage(storage_type, tmp_path, "scan")
+
+    keys = [f"user:{i:02d}" for i in range(20)] + ["a", "user", "user;", "z\u00e9"]
+    for key in reversed(keys):
+        storage.put(key, key.encode("utf-8"), 100)
+    storage.delete("user:05", 200)
+    storage.put("user:07", b"newer", 300)
+
+    items = list(storage.scan_range("user:", "user;"))
+    assert [key for key, _, _ in items] == [f"user:{i:02d}" for i in range(20)]
+    assert items[5] == ("user:05", None, 200)
+    assert items[7] == ("user:07", b"newer", 300)
+
+    assert [key for key, _, _ in storage.scan_range("user:18")] == ["user:18", "user:19", "user;", "z\u00e9"]
+    assert [key for key, _, _ in storage.scan_range("", "user")] == ["a"]
+    assert list(storage.scan_range("user:03", "user:03")) == []
+
+
+@pytest.mark.parametrize("storage_type", STORAGE_TYPES)
+@pytest.mark.parametrize("target_type", ["same", "memory"])
+def test_storage_snapshot_restore_contract(storage_type, target_type, tmp_path):
+    source = make_storage(storage_type, tmp_path, "source")
+    for i in range(30):
+        source.put(f"key{i}", f"value{i}" * (i % 3 * 400 + 1), 100 + i)
+    source.delete("key7", 500)
+
+    target = make_storage(storage_type if target_type == "same" else target_type, tmp_path, "target")
+    target.put("key3", b"newer than the snapshot", 900)
+
+    path = str(tmp_path / "snapshot")
+    fmt = source.snapshot_to(path, target.snapshot_formats())
+    assert fmt in target.snapshot_formats()
+    assert target.restore_from(path, fmt) == 29
+
+    assert target.get("key1") == source.get("key1")
+    assert target.get("key7") == (None, 500)
+    assert target.get("key3") == (b"newer than the snapshot", 900)
+
+    # with that write on both sides the stores are identical
+    source.put("key3", b"newer than the snapshot", 900)
+    for chunk_id in range(CHUNK_COUNT):
+        assert target.chunk_digest(chunk_id, CHUNK_COUNT) == source.chunk_digest(chunk_id, CHUNK_COUNT)
+
+
+@pytest.mark.parametrize("storage_type", STORAGE_TYPES)
+def test_storage_ttl_contract(storage_type, tmp_path):
+    storage = make_storage(storage_type, tmp_path, "ttl")
+    now = int(time.time())
+
+    assert storage.put_expiring("due", "v", 100, now - 1)
+    assert storage.put_expiring("later", "v", 100, now + 3600)
+    assert storage.put_expiring("rewritten", "v", 100, now - 1)
+    assert storage.put("rewritten", "newer", 200)
+    storage.put("plain", "v", 100)
+
+    # get honours the TTL before any sweep
+    assert storage.get("due") == (None, 100)
+    assert storage.get("later") == (b"v", 100)
+
+    assert storage.expire(now, 10) == ["due"]
+    assert storage.expire(now, 10) == []
+    assert storage.get("due") == (None, 100)
+    assert storage.get("rewritten") == (b"newer", 200)
+
+    # the expiry is an ordinary tombstone: scanned, hashed, and it beats a
+    # late replica of the same version
+    for c in range(CHUNK_COUNT):
+        expected = digest_to_bytes(digest_of_items(storage.scan_chunk_with_ts(c, CHUNK_COUNT)))
+        assert storage.chunk_digest(c, CHUNK_COUNT) == expected
+    assert storage.put("due", "v", 100) is False
+
+    # grace runs from the expiry, not from modified_at
+    if hasattr(storage, "flush"):
+        storage.flush()
+    assert storage.purge_tombstones(now - 1) == 0
+    assert storage.purge_tombstones(now + 1) == 1
+    assert storage.get("due") == (None, 0)
+
+
+@pytest.mark.parametrize("storage_type", ["lsm", "bitcask"])
+def test_storage_ttl_survives_restart(storage_type, tmp_path):
+    storage = make_storage(storage_type, tmp_path, "ttl-restart")
+    now = int(time.time())
+    storage.put_expiring("due", "v", 100, now - 1)
+    storage.put_expiring("later", "v", 100, now + 3600)
+    for i in range(20):
+        # pushes the TTL keys out of the memtable / active segment
+        storage.put(f"filler{i}", "x" * 20, 100)
+    storage.close()
+
+    reopened = make_storage(storage_type, tmp_path, "ttl-restart")
+    assert reopened.get("due") == (None, 100)
+    assert reopened.get("later") == (b"v", 100)
+    assert reopened.expire(now, 10) == ["due"]
+    reopened.close()
+
+    reopened = make_storage(storage_type, tmp_path, "ttl-restart")
+    assert reopened.expire(now, 10) == []
+    if hasattr(reopened, "flush"):
+        reopened.flush()
+    assert reopened.purge_tombstones(now - 1) == 0
+    assert reopened.purge_tombstones(now + 1) == 1
+    assert reopened.get("due") == (None, 0)
+    reopened.close()
@@ -0,0 +1,35 @@
+from app.memory_storage import InMemoryStorage
+from app.tombstone_gc import TombstoneGC
+from app.metrics import tombstones_purged
+
+
+def test_run_once_purges_only_past_the_grace_period():
+    storage = InMemoryStorage()
+    storage.put("old", "v", 100)
+    storage.put("recent", "v", 100)
+    storage.put("live", "v", 100)
+    storage.delete("old", 1000)
+    storage.delete("recent", 1900)
+
+    gc = TombstoneGC(storage, grace=500)
+    before = tombstones_purged._value.get()
+
+    assert gc.run_once(now=2000) == 1
+    assert storage.get("old") == (None, 0)
+    assert storage.get("recent") == (None, 1900)
+    assert storage.get("live") == (b"v", 100)
+    assert tombstones_purged._value.get() == before + 1
+
+
+def test_background_loop_runs_and_stops():
+    storage = InMemoryStorage()
+    storage.delete("k", 1)
+
+    gc = TombstoneGC(storage, grace=0, interval=0.01)
+    gc.start()
+    gc._thread.join(0.5)
+    gc.stop()
+    gc._thread.join(1)
+
+    assert not gc._thread.is_alive()
+    assert storage.get("k") == (None, 0)
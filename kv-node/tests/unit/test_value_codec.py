@@ -0,0 +1,74 @@
+from unittest.mock import patch
+
+import pytest
+
+from app import value_codec
+from app.value_codec import (
+    CODEC_NONE,
+    CODEC_ZLIB,
+    CODEC_ZSTD,
+    as_buffer,
+    as_bytes,
+    available_codecs,
+    codec_from_name,
+    decode_value,
+    encode_value,
+)
+from app.metrics import compression_input_bytes, compression_output_bytes
+
+
+BIG_JSON = ('{"user": "anas", "tags": [' + ", ".join(f'"tag-{i}"' for i in range(200)) + "]}").encode()
+
+
+def test_small_values_stay_plain():
+    assert encode_value(b"tiny", CODEC_ZLIB, threshold=1024) == (CODEC_NONE, b"tiny")
+    assert encode_value(BIG_JSON, CODEC_NONE) == (CODEC_NONE, BIG_JSON)
+    assert encode_value(BIG_JSON, CODEC_ZLIB, threshold=None) == (CODEC_NONE, BIG_JSON)
+
+
+def test_zlib_round_trip_and_metrics():
+    before_in = compression_input_bytes.labels("zlib")._value.get()
+    before_out = compression_output_bytes.labels("zlib")._value.get()
+
+    codec, payload = encode_value(BIG_JSON, CODEC_ZLIB, threshold=64)
+
+    assert codec == CODEC_ZLIB
+    assert isinstance(payload, bytes)
+    assert len(payload) < len(BIG_JSON)
+    assert decode_value(codec, payload) == BIG_JSON
+    assert compression_input_bytes.labels("zlib")._value.get() == before_in + len(BIG_JSON)
+    assert compression_output_bytes.labels("zlib")._value.get() == before_out + len(payload)
+
+
+def test_incompressible_values_stay_plain():
+    # zlib framing alone is longer than this
+    assert encode_value(b"abc", CODEC_ZLIB, threshold=1) == (CODEC_NONE, b"abc")
+
+
+@pytest.mark.skipif(value_codec.zstandard is None, reason="zstandard not installed")
+def test_zstd_round_trip():
+    codec, payload = encode_value(BIG_JSON, CODEC_ZSTD, threshold=64)
+    assert codec == CODEC_ZSTD
+    assert decode_value(codec, payload) == BIG_JSON
+    assert CODEC_ZSTD in available_codecs()
+
+
+def test_codec_names_fall_back_without_zstd():
+    assert codec_from_name("none") == CODEC_NONE
+    assert codec_from_name("ZLIB") == CODEC_ZLIB
+    with patch.object(value_codec, "zstandard", None):
+        assert codec_from_name("zstd") == CODEC_ZLIB
+        assert available_codecs() == [CODEC_ZLIB]
+    with pytest.raises(ValueError):
+        codec_from_name("lz4")
+
+
+def test_memoryview_values_are_not_copied_before_compression():
+    view = memoryview(BIG_JSON)
+    codec, payload = encode_value(view, CODEC_ZLIB, threshold=64)
+    assert codec == CODEC_ZLIB
+    assert decode_value(codec, payload) == BIG_JSON
+
+    assert as_buffer(view) is view
+    assert as_buffer("téxt") == "téxt".encode("utf-8")
+    assert as_bytes(bytearray(b"abc")) == b"abc"
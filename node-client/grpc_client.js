@@ -40,4 +40,42 @@ function get(address, key, cb) {
   });
 }
 
-module.exports = { put, get };
+// one round trip for many keys; items come back in the order of keys
+function multiGet(address, keys, cb) {
+  const client = makeClient(address);
+  client.MultiGet({ keys }, (err, resp) => {
+    if (err) return cb(err, null);
+    cb(null, resp.items);
+  });
+}
+
+// items: [{ key, value }]; stored in one storage transaction
+function batchPut(address, items, cb) {
+  const client = makeClient(address);
+  const modified_at = Date.now();
+  const request = { items: items.map(({ key, value }) => ({ key, value, modified_at })) };
+  client.BatchPut(request, (err, resp) => {
+    if (err) return cb(err, null);
+    cb(null, resp);
+  });
+}
+
+function del(address, key, cb) {
+  const client = makeClient(address);
+  client.Delete({ key, modified_at: Date.now() }, (err, resp) => {
+    if (err) return cb(err, null);
+    cb(null, resp);
+  });
+}
+
+// request: { start, end, prefix, limit, page_token }; cb(err, items)
+function scan(address, request, cb) {
+  const client = makeClient(address);
+  const items = [];
+  const call = client.Scan(request);
+  call.on('data', (item) => items.push(item));
+  call.on('error', (err) => cb(err, null));
+  call.on('end', () => cb(null, items));
+}
+
+module.exports = { put, get, multiGet, batchPut, del, scan };